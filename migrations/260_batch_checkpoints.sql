@@ -0,0 +1,37 @@
+-- Migration: Create batch_checkpoints table for resumable brain batches
+-- Purpose: agent-brain batch scheduler records every completed account task,
+-- so a batch restarted after a crash skips accounts already processed today.
+-- Also keeps queue wait / run time per account for monitoring.
+
+CREATE TABLE IF NOT EXISTS public.batch_checkpoints (
+  batch_key TEXT NOT NULL,
+  execution_date DATE NOT NULL,
+  task_key TEXT NOT NULL,
+  queue_wait_ms INTEGER,
+  run_ms INTEGER,
+  completed_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (batch_key, execution_date, task_key)
+);
+
+-- Index for cleanup of old checkpoints
+CREATE INDEX IF NOT EXISTS idx_batch_checkpoints_execution_date ON public.batch_checkpoints(execution_date);
+
+COMMENT ON TABLE public.batch_checkpoints IS 'Completed tasks of agent-brain batches (resume after crash + per-account timings)';
+COMMENT ON COLUMN public.batch_checkpoints.batch_key IS 'Batch identifier (e.g., "daily_batch", "hourly_batch_5")';
+COMMENT ON COLUMN public.batch_checkpoints.task_key IS 'Task identifier: user_account_id or user_account_id:ad_account UUID';
+COMMENT ON COLUMN public.batch_checkpoints.queue_wait_ms IS 'Time the task waited in scheduler queue before start';
+COMMENT ON COLUMN public.batch_checkpoints.run_ms IS 'Task execution time';
+
+-- Cleanup helper: checkpoints older than N days are not needed for resume
+CREATE OR REPLACE FUNCTION public.cleanup_old_batch_checkpoints(p_keep_days INTEGER DEFAULT 14)
+RETURNS INTEGER AS $$
+DECLARE
+  deleted_count INTEGER;
+BEGIN
+  DELETE FROM public.batch_checkpoints
+  WHERE execution_date < CURRENT_DATE - p_keep_days;
+
+  GET DIAGNOSTICS deleted_count = ROW_COUNT;
+  RETURN deleted_count;
+END;
+$$ LANGUAGE plpgsql;
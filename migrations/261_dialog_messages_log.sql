@@ -0,0 +1,122 @@
+-- Migration 261: Append-only message log for chatbot dialogs
+-- Purpose: chatbot-service reads/writes dialog history through dialog_messages
+-- instead of reading and rewriting the whole dialog_analysis.messages JSONB array
+-- on every message. Each row stores a precomputed token estimate, so history
+-- trimming by history_token_limit does not re-estimate the same messages.
+--
+-- dialog_analysis.messages stays as a mirror of the last N messages for
+-- existing readers (CRM UI, analysis crons) and is maintained by
+-- append_dialog_messages() on the database side.
+
+CREATE TABLE IF NOT EXISTS public.dialog_messages (
+  id BIGSERIAL PRIMARY KEY,
+  dialog_analysis_id UUID NOT NULL REFERENCES public.dialog_analysis(id) ON DELETE CASCADE,
+  role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+  content TEXT NOT NULL DEFAULT '',
+  token_count INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  meta JSONB
+);
+
+-- Окно последних сообщений лида = range scan по индексу
+CREATE INDEX IF NOT EXISTS idx_dialog_messages_dialog_id
+ON public.dialog_messages(dialog_analysis_id, id DESC);
+
+COMMENT ON TABLE public.dialog_messages IS 'Append-only лог сообщений диалога (источник истории для chatbot-service)';
+COMMENT ON COLUMN public.dialog_messages.role IS 'Роль для LLM: assistant (sender bot/assistant) или user';
+COMMENT ON COLUMN public.dialog_messages.token_count IS 'Оценка токенов контента: ceil(length / 4), считается один раз при записи';
+COMMENT ON COLUMN public.dialog_messages.created_at IS 'Время сообщения (timestamp из исходного сообщения)';
+COMMENT ON COLUMN public.dialog_messages.meta IS 'Остальные поля исходного сообщения (sender, debug, type, from_me, ...)';
+
+-- Роль сообщения в формате JSONB [{sender, content, timestamp}, ...]
+CREATE OR REPLACE FUNCTION public.dialog_message_role(p_message JSONB)
+RETURNS TEXT AS $$
+  SELECT CASE
+    WHEN lower(COALESCE(p_message->>'sender', p_message->>'from', 'user')) IN ('bot', 'assistant')
+      THEN 'assistant'
+    ELSE 'user'
+  END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Время сообщения; битые/пустые значения → epoch (как new Date(0) в JS)
+CREATE OR REPLACE FUNCTION public.dialog_message_time(p_message JSONB)
+RETURNS TIMESTAMPTZ AS $$
+BEGIN
+  RETURN COALESCE(
+    COALESCE(NULLIF(p_message->>'timestamp', ''), NULLIF(p_message->>'created_at', ''))::timestamptz,
+    to_timestamp(0)
+  );
+EXCEPTION WHEN others THEN
+  RETURN to_timestamp(0);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Добавить сообщения в лог и обновить зеркало dialog_analysis.messages (последние p_mirror_limit)
+CREATE OR REPLACE FUNCTION public.append_dialog_messages(
+  p_dialog_analysis_id UUID,
+  p_messages JSONB,
+  p_mirror_limit INTEGER DEFAULT 100
+)
+RETURNS TABLE (id BIGINT, role TEXT, content TEXT, token_count INTEGER, created_at TIMESTAMPTZ) AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  INSERT INTO public.dialog_messages AS dm (dialog_analysis_id, role, content, token_count, created_at, meta)
+  SELECT
+    p_dialog_analysis_id,
+    public.dialog_message_role(t.e),
+    COALESCE(t.e->>'content', t.e->>'text', ''),
+    CEIL(char_length(COALESCE(t.e->>'content', t.e->>'text', '')) / 4.0)::INTEGER,
+    public.dialog_message_time(t.e),
+    t.e - 'content' - 'text'
+  FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS t(e, ord)
+  ORDER BY t.ord
+  RETURNING dm.id, dm.role, dm.content, dm.token_count, dm.created_at;
+
+  UPDATE public.dialog_analysis da
+  SET messages = (
+    SELECT COALESCE(jsonb_agg(w.e ORDER BY w.ord), '[]'::jsonb)
+    FROM (
+      SELECT m.e, m.ord
+      FROM jsonb_array_elements(
+        CASE WHEN jsonb_typeof(da.messages) = 'array' THEN da.messages ELSE '[]'::jsonb END || p_messages
+      ) WITH ORDINALITY AS m(e, ord)
+      ORDER BY m.ord DESC
+      LIMIT p_mirror_limit
+    ) w
+  )
+  WHERE da.id = p_dialog_analysis_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Перенос истории из dialog_analysis.messages в лог (только для диалогов без записей в логе).
+-- p_dialog_analysis_id = NULL — все диалоги.
+CREATE OR REPLACE FUNCTION public.backfill_dialog_messages(p_dialog_analysis_id UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+  inserted_count INTEGER;
+BEGIN
+  INSERT INTO public.dialog_messages (dialog_analysis_id, role, content, token_count, created_at, meta)
+  SELECT
+    da.id,
+    public.dialog_message_role(t.e),
+    COALESCE(t.e->>'content', t.e->>'text', ''),
+    CEIL(char_length(COALESCE(t.e->>'content', t.e->>'text', '')) / 4.0)::INTEGER,
+    public.dialog_message_time(t.e),
+    t.e - 'content' - 'text'
+  FROM public.dialog_analysis da
+  CROSS JOIN LATERAL jsonb_array_elements(da.messages) WITH ORDINALITY AS t(e, ord)
+  WHERE jsonb_typeof(da.messages) = 'array'
+    AND (p_dialog_analysis_id IS NULL OR da.id = p_dialog_analysis_id)
+    AND NOT EXISTS (
+      SELECT 1 FROM public.dialog_messages dm WHERE dm.dialog_analysis_id = da.id
+    )
+  ORDER BY da.id, t.ord;
+
+  GET DIAGNOSTICS inserted_count = ROW_COUNT;
+  RETURN inserted_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill существующих диалогов
+SELECT public.backfill_dialog_messages();
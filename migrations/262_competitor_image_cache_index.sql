@@ -0,0 +1,38 @@
+-- Миграция: Content-addressed кэш изображений креативов конкурентов
+-- Проблема: cacheImageToStorage скачивал и загружал в Storage каждое изображение
+-- под случайным UUID — одинаковые креативы копировались заново при каждом обходе.
+--
+-- competitor_image_cache      — файлы в Storage по sha256 содержимого (один файл на контент)
+-- competitor_image_cache_keys — индекс поиска до скачивания:
+--   'ad:<fb_ad_archive_id>' и 'url:<fingerprint пути CDN URL без query>'
+
+CREATE TABLE IF NOT EXISTS competitor_image_cache (
+  content_hash TEXT PRIMARY KEY,
+  storage_path TEXT NOT NULL,
+  public_url TEXT NOT NULL,
+  content_type TEXT,
+  size_bytes INTEGER NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS competitor_image_cache_keys (
+  lookup_key TEXT PRIMARY KEY,
+  public_url TEXT NOT NULL,
+  content_hash TEXT REFERENCES competitor_image_cache(content_hash) ON DELETE SET NULL,
+  size_bytes INTEGER,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_competitor_image_cache_keys_hash
+ON competitor_image_cache_keys(content_hash);
+
+COMMENT ON TABLE competitor_image_cache IS 'Изображения конкурентов в Storage, адресуемые по sha256 содержимого';
+COMMENT ON TABLE competitor_image_cache_keys IS 'Индекс поиска кэша до скачивания: ad:<fb_ad_archive_id> / url:<fingerprint>';
+COMMENT ON COLUMN competitor_image_cache_keys.content_hash IS 'NULL для ключей, перенесённых из cached_thumbnail_url до миграции';
+
+-- Уже закэшированные превью доступны по ad-ключу (без повторного скачивания)
+INSERT INTO competitor_image_cache_keys (lookup_key, public_url)
+SELECT 'ad:' || fb_ad_archive_id, cached_thumbnail_url
+FROM competitor_creatives
+WHERE cached_thumbnail_url IS NOT NULL
+ON CONFLICT (lookup_key) DO NOTHING;
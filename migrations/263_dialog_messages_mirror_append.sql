@@ -0,0 +1,51 @@
+-- Migration 263: Cheaper JSONB mirror update in append_dialog_messages
+-- Problem: append_dialog_messages (migration 261) unpacked the whole
+-- dialog_analysis.messages array and re-aggregated it with jsonb_agg on every
+-- append, so each message still paid for the full history.
+-- Now the new messages are concatenated (messages || p_messages) and the array
+-- is cut to the last p_mirror_limit elements only when it is over the cap
+-- (one jsonpath slice, no unnest/aggregate).
+--
+-- CRM writers (consultant messages, dialogs send, chats send) also go through
+-- this function now instead of rewriting dialog_analysis.messages themselves,
+-- so the log stays the complete source of history for chatbot-service.
+
+-- Последние p_limit элементов JSONB-массива (массив без изменений, если он не длиннее)
+CREATE OR REPLACE FUNCTION public.dialog_messages_tail(p_messages JSONB, p_limit INTEGER)
+RETURNS JSONB AS $$
+  SELECT CASE
+    WHEN jsonb_array_length(p_messages) <= p_limit THEN p_messages
+    WHEN p_limit <= 0 THEN '[]'::jsonb
+    ELSE jsonb_path_query_array(p_messages, '$[last - $n + 1 to last]', jsonb_build_object('n', p_limit))
+  END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION public.append_dialog_messages(
+  p_dialog_analysis_id UUID,
+  p_messages JSONB,
+  p_mirror_limit INTEGER DEFAULT 100
+)
+RETURNS TABLE (id BIGINT, role TEXT, content TEXT, token_count INTEGER, created_at TIMESTAMPTZ) AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  INSERT INTO public.dialog_messages AS dm (dialog_analysis_id, role, content, token_count, created_at, meta)
+  SELECT
+    p_dialog_analysis_id,
+    public.dialog_message_role(t.e),
+    COALESCE(t.e->>'content', t.e->>'text', ''),
+    CEIL(char_length(COALESCE(t.e->>'content', t.e->>'text', '')) / 4.0)::INTEGER,
+    public.dialog_message_time(t.e),
+    t.e - 'content' - 'text'
+  FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS t(e, ord)
+  ORDER BY t.ord
+  RETURNING dm.id, dm.role, dm.content, dm.token_count, dm.created_at;
+
+  UPDATE public.dialog_analysis da
+  SET messages = public.dialog_messages_tail(
+    CASE WHEN jsonb_typeof(da.messages) = 'array' THEN da.messages ELSE '[]'::jsonb END || p_messages,
+    p_mirror_limit
+  )
+  WHERE da.id = p_dialog_analysis_id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,10 @@
+-- Миграция: Удаление ключей кэша, перенесённых из cached_thumbnail_url
+-- Проблема: миграция 262 заполняла competitor_image_cache_keys ad-ключами,
+-- указывающими на старые файлы в папке конкурента (<competitor_id>/<uuid>.jpg).
+-- Эти файлы удаляются вместе с конкурентом (deleteCompetitorImages), и кэш
+-- отдавал бы ссылки на несуществующие файлы; размер у таких ключей неизвестен.
+-- Теперь ключи есть только у файлов by-hash/ (content_hash NOT NULL),
+-- перенесённые записи заполнятся заново при следующем обходе.
+
+DELETE FROM competitor_image_cache_keys
+WHERE content_hash IS NULL;
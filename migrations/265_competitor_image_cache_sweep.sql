@@ -0,0 +1,47 @@
+-- Миграция: Очистка файлов кэша изображений конкурентов, на которые никто не ссылается
+-- Проблема: файлы by-hash/ общие для всех конкурентов и не удаляются вместе
+-- с конкурентом или креативом — competitor_image_cache и bucket росли без ограничений.
+--
+-- sweep_competitor_image_cache:
+-- 1. удаляет ключи индекса старше p_key_ttl_days, чей файл не указан
+--    в competitor_creatives (cached_thumbnail_url / cached_media_urls);
+-- 2. удаляет строки competitor_image_cache старше p_min_age_hours, на которые
+--    не ссылаются ни ключи индекса, ни креативы, и возвращает их storage_path —
+--    файлы из Storage удаляет вызывающий (sweepUnreferencedImages в imageCache.ts).
+-- p_min_age_hours защищает файлы, загруженные во время обхода, ключи которых ещё не записаны.
+
+CREATE OR REPLACE FUNCTION public.sweep_competitor_image_cache(
+  p_key_ttl_days INTEGER DEFAULT 90,
+  p_min_age_hours INTEGER DEFAULT 24
+)
+RETURNS TABLE (storage_path TEXT) AS $$
+#variable_conflict use_column
+BEGIN
+  DELETE FROM public.competitor_image_cache_keys k
+  WHERE k.created_at < NOW() - make_interval(days => p_key_ttl_days)
+    AND NOT EXISTS (
+      SELECT 1 FROM public.competitor_creatives cc
+      WHERE cc.cached_thumbnail_url = k.public_url
+         OR k.public_url = ANY(cc.cached_media_urls)
+    );
+
+  RETURN QUERY
+  DELETE FROM public.competitor_image_cache c
+  WHERE c.created_at < NOW() - make_interval(hours => p_min_age_hours)
+    AND NOT EXISTS (
+      SELECT 1 FROM public.competitor_image_cache_keys k
+      WHERE k.content_hash = c.content_hash
+    )
+    AND NOT EXISTS (
+      SELECT 1 FROM public.competitor_creatives cc
+      WHERE cc.cached_thumbnail_url = c.public_url
+         OR c.public_url = ANY(cc.cached_media_urls)
+    )
+  RETURNING c.storage_path;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Поиск креативов по кэшированному превью при очистке
+CREATE INDEX IF NOT EXISTS idx_competitor_creatives_cached_thumbnail_url
+ON competitor_creatives(cached_thumbnail_url)
+WHERE cached_thumbnail_url IS NOT NULL;
@@ -0,0 +1,427 @@
+/**
+ * Синтетические аккаунты для replay-бенчмарка scoring/brain.
+ *
+ * Основа — записанные фикстуры из корня репозитория:
+ * - llm-input.json   — реальные адсеты (окна метрик, actions, бюджеты) → шаблоны адсетов;
+ * - run-latest.json  — trace brain run (hs, решения) → ответ заглушки LLM;
+ * - greenapi_*.json  — дампы входящих WhatsApp сообщений → строки leads.
+ *
+ * Из шаблонов детерминированно (seeded PRNG) строится аккаунт на N адсетов:
+ * ответы Graph API (daily/actions/today/yesterday/config/ads/diagnostics)
+ * и таблицы Supabase (directions, creatives, mappings, leads, ad_accounts).
+ */
+
+import { readFileSync, readdirSync } from 'fs';
+import { fileURLToPath } from 'url';
+import { dirname, join, resolve } from 'path';
+
+const __dirname = dirname(fileURLToPath(import.meta.url));
+export const REPO_ROOT = resolve(__dirname, '../../../..');
+
+const ADSETS_PER_CAMPAIGN = 10;
+const ADS_PER_ADSET = 3;
+const DAYS = 14;
+const OBJECTIVES = ['whatsapp', 'whatsapp', 'whatsapp', 'site_leads', 'lead_forms', 'instagram_traffic'];
+const RANKINGS = ['above_average', 'average', 'average', 'below_average_35', 'below_average_20', 'below_average_10'];
+
+function readJson(name) {
+  return JSON.parse(readFileSync(join(REPO_ROOT, name), 'utf8'));
+}
+
+/**
+ * mulberry32 — детерминированный PRNG, чтобы прогоны были сравнимы между собой
+ */
+function createRandom(seed) {
+  let a = seed >>> 0;
+  return function random() {
+    a = (a + 0x6D2B79F5) >>> 0;
+    let t = a;
+    t = Math.imul(t ^ (t >>> 15), t | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+function dateStr(daysAgo) {
+  const d = new Date();
+  d.setUTCDate(d.getUTCDate() - daysAgo);
+  return d.toISOString().split('T')[0];
+}
+
+function scaleActions(actions, factor) {
+  return (actions || []).map(a => ({
+    action_type: a.action_type,
+    value: String(Math.max(0, Math.round(parseFloat(a.value || '0') * factor)))
+  }));
+}
+
+function actionValue(actions, type) {
+  const action = (actions || []).find(a => a.action_type === type);
+  return action ? parseFloat(action.value || '0') : 0;
+}
+
+/**
+ * Загрузить фикстуры один раз
+ * @returns {{ adsetTemplates: Array, runTrace: Object, whatsappChats: Array }}
+ */
+export function loadFixtures() {
+  const llmInput = readJson('llm-input.json');
+  const runLatest = readJson('run-latest.json');
+
+  // Шаблоны: адсеты с ненулевыми показами за 7д; нулевые оставляем как "простаивающие"
+  const adsetTemplates = (llmInput.analysis?.adsets || []).map(a => ({
+    name: a.name,
+    daily_budget_cents: a.daily_budget_cents || 1000,
+    last_7d: a.windows?.last_7d || {},
+    yesterday: a.windows?.yesterday || {}
+  }));
+
+  if (adsetTemplates.length === 0) {
+    throw new Error('llm-input.json: analysis.adsets is empty');
+  }
+
+  // Все уникальные входящие чаты из дампов Green API
+  const chats = new Map();
+  for (const file of readdirSync(REPO_ROOT).filter(f => /^greenapi_.*\.json$/.test(f))) {
+    let data;
+    try {
+      data = readJson(file);
+    } catch {
+      continue;
+    }
+    if (!Array.isArray(data)) continue;
+    for (const msg of data) {
+      if (msg?.type !== 'incoming' || !msg.chatId?.endsWith('@c.us')) continue;
+      const prev = chats.get(msg.chatId);
+      if (!prev || msg.timestamp < prev.timestamp) {
+        chats.set(msg.chatId, { chatId: msg.chatId, timestamp: msg.timestamp, name: msg.senderName || null });
+      }
+    }
+  }
+
+  return {
+    adsetTemplates,
+    runTrace: {
+      planNote: runLatest.planNote || null,
+      adsets: runLatest.trace?.adsets || []
+    },
+    whatsappChats: [...chats.values()]
+  };
+}
+
+/**
+ * Построить синтетический аккаунт
+ * @param {Object} fixtures - из loadFixtures()
+ * @param {Object} params
+ * @param {number} params.adsets - Количество адсетов
+ * @param {number} [params.index=0] - Номер аккаунта (для уникальных id)
+ * @param {number} [params.seed=1] - Seed PRNG
+ * @returns {{ userAccount: Object, graph: Object, tables: Object }}
+ */
+export function buildSyntheticAccount(fixtures, { adsets: adsetCount, index = 0, seed = 1 }) {
+  const random = createRandom(seed * 7919 + index * 104729 + adsetCount);
+  const { adsetTemplates, whatsappChats } = fixtures;
+
+  const prefix = `9${String(index).padStart(3, '0')}${String(adsetCount).padStart(5, '0')}`;
+  const userAccountId = `00000000-0000-4000-8000-${String(index).padStart(4, '0')}${String(adsetCount).padStart(8, '0')}`;
+  const adAccountId = `act_${prefix}`;
+
+  const graph = {
+    adsetsConfig: [],
+    daily: [],
+    actions: [],
+    today: [],
+    yesterday: [],
+    adsInsights: [],
+    ads: [],
+    diagnostics: []
+  };
+  const tables = {
+    account_directions: [],
+    user_creatives: [],
+    ad_creative_mapping: [],
+    creative_metrics_history: [],
+    leads: [],
+    ad_accounts: [],
+    scoring_executions: [],
+    brain_executions: [],
+    user_accounts: []
+  };
+
+  const campaignCount = Math.ceil(adsetCount / ADSETS_PER_CAMPAIGN);
+  const campaigns = [];
+  for (let c = 0; c < campaignCount; c++) {
+    const campaignId = `${prefix}${String(c).padStart(4, '0')}`;
+    const objective = OBJECTIVES[c % OBJECTIVES.length];
+    const directionId = `10000000-0000-4000-8000-${campaignId.slice(-12).padStart(12, '0')}`;
+    campaigns.push({ campaignId, name: `Campaign ${c + 1}`, objective, directionId });
+
+    tables.account_directions.push({
+      id: directionId,
+      user_account_id: userAccountId,
+      account_id: null,
+      name: `Направление ${c + 1}`,
+      fb_campaign_id: campaignId,
+      objective,
+      daily_budget_cents: ADSETS_PER_CAMPAIGN * 1000,
+      target_cpl_cents: 200 + Math.round(random() * 300),
+      is_active: true,
+      created_at: new Date(Date.now() - 30 * 86400000).toISOString()
+    });
+  }
+
+  const adIds = [];
+
+  for (let i = 0; i < adsetCount; i++) {
+    const template = adsetTemplates[i % adsetTemplates.length];
+    const campaign = campaigns[Math.floor(i / ADSETS_PER_CAMPAIGN)];
+    const adsetId = `${prefix}${String(i).padStart(6, '0')}1`;
+    const adsetName = `${template.name} #${i + 1}`;
+    const factor = 0.5 + random();
+    // Простаивающие шаблоны (0 показов) оставляем с минимальным трафиком
+    const weekSpend = Math.max(template.last_7d.spend || 0, 3) * factor;
+    const cpm = (template.last_7d.cpm || 6) * (0.8 + random() * 0.4);
+    const ctr = (template.last_7d.ctr || 1.2) * (0.8 + random() * 0.4);
+    const frequency = template.last_7d.frequency || 1.1;
+    const weekActions = scaleActions(template.last_7d.actions, factor);
+
+    graph.adsetsConfig.push({
+      id: adsetId,
+      name: adsetName,
+      campaign_id: campaign.campaignId,
+      daily_budget: String(template.daily_budget_cents),
+      status: 'ACTIVE',
+      effective_status: 'ACTIVE',
+      optimization_goal: campaign.objective === 'whatsapp' ? 'CONVERSATIONS' : 'OFFSITE_CONVERSIONS'
+    });
+
+    // 14 дней daily breakdown (от старых к новым)
+    for (let d = DAYS; d >= 1; d--) {
+      const spend = (weekSpend / 7) * (0.7 + random() * 0.6);
+      const impressions = Math.round(spend / cpm * 1000);
+      const dayCtr = ctr * (0.85 + random() * 0.3);
+      graph.daily.push({
+        adset_id: adsetId,
+        adset_name: adsetName,
+        campaign_id: campaign.campaignId,
+        campaign_name: campaign.name,
+        date_start: dateStr(d),
+        date_stop: dateStr(d),
+        spend: spend.toFixed(2),
+        impressions: String(impressions),
+        clicks: String(Math.round(impressions * dayCtr / 100)),
+        ctr: dayCtr.toFixed(6),
+        cpm: cpm.toFixed(6),
+        cpp: (cpm * frequency).toFixed(6),
+        cpc: (dayCtr > 0 ? cpm / (10 * dayCtr) : 0).toFixed(6),
+        frequency: frequency.toFixed(6),
+        reach: String(Math.round(impressions / frequency))
+      });
+    }
+
+    graph.actions.push({ adset_id: adsetId, actions: weekActions });
+
+    for (const [bucket, share] of [['today', 0.4 + random() * 0.4], ['yesterday', 1]]) {
+      const spend = (weekSpend / 7) * share;
+      const impressions = Math.round(spend / cpm * 1000);
+      graph[bucket].push({
+        adset_id: adsetId,
+        adset_name: adsetName,
+        campaign_id: campaign.campaignId,
+        campaign_name: campaign.name,
+        spend: spend.toFixed(2),
+        impressions: String(impressions),
+        clicks: String(Math.round(impressions * ctr / 100)),
+        ctr: ctr.toFixed(6),
+        cpm: cpm.toFixed(6),
+        cpp: (cpm * frequency).toFixed(6),
+        cpc: (ctr > 0 ? cpm / (10 * ctr) : 0).toFixed(6),
+        frequency: frequency.toFixed(6),
+        reach: String(Math.round(impressions / frequency)),
+        actions: scaleActions(weekActions, share / 7)
+      });
+    }
+
+    // Объявления: расход делится неравномерно, последнее часто без лидов (кандидат в пожиратели)
+    const weekLeads = actionValue(weekActions, 'onsite_conversion.total_messaging_connection') +
+      actionValue(weekActions, 'offsite_conversion.fb_pixel_lead') +
+      actionValue(weekActions, 'onsite_conversion.lead_grouped');
+    const shares = [0.55, 0.3, 0.15];
+    for (let a = 0; a < ADS_PER_ADSET; a++) {
+      const adId = `${prefix}${String(i).padStart(6, '0')}${a + 2}`;
+      const creativeId = `${prefix}${String(i).padStart(6, '0')}${a + 5}`;
+      const adSpend = weekSpend * shares[a];
+      const adImpressions = Math.round(adSpend / cpm * 1000);
+      const adLeads = a === 0 && random() < 0.3 ? 0 : Math.round(weekLeads * shares[a]);
+      adIds.push(adId);
+
+      graph.ads.push({
+        id: adId,
+        name: `${adsetName} / ad ${a + 1}`,
+        status: 'ACTIVE',
+        effective_status: 'ACTIVE',
+        adset_id: adsetId,
+        creative: { id: creativeId }
+      });
+      graph.adsInsights.push({
+        ad_id: adId,
+        ad_name: `${adsetName} / ad ${a + 1}`,
+        adset_id: adsetId,
+        adset_name: adsetName,
+        campaign_id: campaign.campaignId,
+        campaign_name: campaign.name,
+        spend: adSpend.toFixed(2),
+        impressions: String(adImpressions),
+        clicks: String(Math.round(adImpressions * ctr / 100)),
+        ctr: ctr.toFixed(6),
+        actions: [
+          { action_type: 'link_click', value: String(Math.round(adImpressions * ctr / 100)) },
+          { action_type: 'onsite_conversion.total_messaging_connection', value: String(adLeads) }
+        ]
+      });
+      graph.diagnostics.push({
+        ad_id: adId,
+        ad_name: `${adsetName} / ad ${a + 1}`,
+        adset_id: adsetId,
+        quality_ranking: RANKINGS[Math.floor(random() * RANKINGS.length)],
+        engagement_rate_ranking: RANKINGS[Math.floor(random() * RANKINGS.length)],
+        conversion_rate_ranking: RANKINGS[Math.floor(random() * RANKINGS.length)]
+      });
+
+      // Один креатив пользователя на объявление (как после загрузки через платформу)
+      const userCreativeId = `20000000-0000-4000-8000-${adId.slice(-12).padStart(12, '0')}`;
+      tables.user_creatives.push({
+        id: userCreativeId,
+        user_id: userAccountId,
+        account_id: null,
+        title: `${template.name} — креатив ${a + 1}`,
+        fb_video_id: null,
+        fb_creative_id: campaign.objective === 'lead_forms' ? creativeId : null,
+        fb_creative_id_whatsapp: campaign.objective === 'whatsapp' ? creativeId : null,
+        fb_creative_id_instagram_traffic: campaign.objective === 'instagram_traffic' ? creativeId : null,
+        fb_creative_id_site_leads: campaign.objective === 'site_leads' ? creativeId : null,
+        fb_creative_id_lead_forms: null,
+        is_active: true,
+        status: 'ready',
+        created_at: new Date(Date.now() - 20 * 86400000).toISOString(),
+        direction_id: campaign.directionId,
+        account_directions: { is_active: true, account_id: null }
+      });
+      tables.ad_creative_mapping.push({
+        ad_id: adId,
+        adset_id: adsetId,
+        campaign_id: campaign.campaignId,
+        fb_creative_id: creativeId,
+        user_creative_id: userCreativeId,
+        account_id: null
+      });
+    }
+  }
+
+  // Лиды из реальных WhatsApp чатов, распределённые по объявлениям
+  whatsappChats.forEach((chat, n) => {
+    tables.leads.push({
+      id: n + 1,
+      user_account_id: userAccountId,
+      account_id: null,
+      chat_id: chat.chatId.replace('@c.us', ''),
+      source_type: 'whatsapp',
+      source_id: adIds[n % adIds.length],
+      is_qualified: n % 3 === 0,
+      is_paid: n % 11 === 0,
+      whatsapp_label_synced: n % 3 === 0,
+      whatsapp_paid_label_synced: n % 11 === 0,
+      created_at: new Date(chat.timestamp * 1000).toISOString()
+    });
+  });
+
+  tables.ad_accounts.push({
+    id: null,
+    user_account_id: userAccountId,
+    ad_account_id: adAccountId,
+    default_cpl_target_cents: 300,
+    plan_daily_budget_cents: adsetCount * 1000
+  });
+
+  const userAccount = {
+    id: userAccountId,
+    username: `bench_${adsetCount}_${index}`,
+    ad_account_id: adAccountId,
+    access_token: `bench-token-${index}-${adsetCount}`,
+    autopilot: true,
+    tarif_expires: null
+  };
+
+  // Legacy-пользователь под фильтр getActiveUsers (lib/dailyBatch.js)
+  tables.user_accounts.push({
+    ...userAccount,
+    is_active: true,
+    optimization: 'agent2',
+    multi_account_enabled: false,
+    account_timezone: null
+  });
+
+  return { userAccount, graph, tables };
+}
+
+/**
+ * Ответ заглушки LLM (OpenAI Responses API) для payload Interactive Brain.
+ * Решения строятся по trace из run-latest.json: "плохим" адсетам — снижение бюджета,
+ * адсетам с решением PauseAd в trace — пауза первого объявления.
+ *
+ * @param {Object} runTrace - fixtures.runTrace
+ * @param {Object} payload - llmPayload из runInteractiveBrain
+ * @returns {Object} JSON ответа Responses API
+ */
+export function buildLlmResponse(runTrace, payload) {
+  const traceAdsets = runTrace.adsets.length > 0 ? runTrace.adsets : [{ hs: 0, decisions: [], reasons: [] }];
+  const proposals = [];
+
+  (payload?.adsets || []).forEach((adset, i) => {
+    const trace = traceAdsets[i % traceAdsets.length];
+    const pauseDecision = (trace.decisions || []).find(d => d.action === 'PauseAd');
+
+    if (pauseDecision && adset.ads?.length > 1) {
+      proposals.push({
+        action: 'pauseAd',
+        entity_type: 'ad',
+        entity_id: adset.ads[0].ad_id,
+        entity_name: adset.ads[0].ad_name,
+        adset_id: adset.adset_id,
+        direction_id: adset.direction_id,
+        health_score: typeof adset.health_score === 'number' ? adset.health_score : trace.hs,
+        reason: pauseDecision.reason,
+        priority: 'high'
+      });
+    } else if (trace.cls === 'bad' && adset.current_budget_cents) {
+      proposals.push({
+        action: 'updateBudget',
+        entity_type: 'adset',
+        entity_id: adset.adset_id,
+        entity_name: adset.adset_name,
+        direction_id: adset.direction_id,
+        health_score: typeof adset.health_score === 'number' ? adset.health_score : trace.hs,
+        reason: (trace.reasons || []).join(', ') || 'poor_cpl',
+        priority: 'medium',
+        suggested_action_params: {
+          current_budget_cents: adset.current_budget_cents,
+          new_budget_cents: Math.max(300, Math.round(adset.current_budget_cents * 0.7))
+        }
+      });
+    }
+  });
+
+  const text = JSON.stringify({
+    planNote: runTrace.planNote,
+    summary: `replay: ${proposals.length} proposals`,
+    proposals
+  });
+
+  return {
+    id: 'resp_replay',
+    object: 'response',
+    model: 'replay-stub',
+    output: [{ type: 'message', role: 'assistant', content: [{ type: 'output_text', text }] }],
+    usage: { input_tokens: 0, output_tokens: 0, total_tokens: 0 }
+  };
+}
@@ -0,0 +1,210 @@
+/**
+ * Локальная подмена fetch для replay-бенчмарка.
+ *
+ * Отвечает на запросы scoring.js / fbGraph.js данными синтетических аккаунтов
+ * (см. fixtures.mjs) вместо graph.facebook.com, а на OpenAI Responses API —
+ * заглушкой LLM, на логирование ошибок в agent-service (REPLAY_AGENT_SERVICE_URL) —
+ * успешным ответом. Любой другой внешний хост — ошибка: бенчмарк не ходит в сеть.
+ *
+ * Соблюдает limit/after как Graph API (пагинация видна в счётчиках запросов),
+ * поддерживает batch-запросы (POST с параметром batch).
+ */
+
+import { buildLlmResponse } from './fixtures.mjs';
+
+// AGENT_SERVICE_URL для бенчмарка (lib/errorLogger.js читает его при импорте)
+const REPLAY_AGENT_SERVICE_HOST = 'agent-service.replay';
+export const REPLAY_AGENT_SERVICE_URL = `http://${REPLAY_AGENT_SERVICE_HOST}`;
+
+function jsonResponse(body, status = 200) {
+  return new Response(JSON.stringify(body), {
+    status,
+    headers: { 'content-type': 'application/json' }
+  });
+}
+
+function page(rows, params, url) {
+  const limit = Math.max(1, parseInt(params.get('limit') || '25', 10));
+  const offset = parseInt(params.get('after') || '0', 10) || 0;
+  const data = rows.slice(offset, offset + limit);
+  const body = { data };
+
+  if (offset + limit < rows.length) {
+    const next = new URL(url);
+    next.searchParams.set('after', String(offset + limit));
+    body.paging = { cursors: { after: String(offset + limit) }, next: next.toString() };
+  }
+  return body;
+}
+
+function filteredIds(params, field) {
+  try {
+    const filtering = JSON.parse(params.get('filtering') || '[]');
+    const filter = filtering.find(f => f.field === field && f.operator === 'IN');
+    return filter ? new Set(filter.value.map(String)) : null;
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * Создать replay fetch
+ * @param {Object} params
+ * @param {Map<string, Object>} params.accounts - ad_account_id (act_...) → graph из buildSyntheticAccount
+ * @param {Object} params.fixtures - из loadFixtures()
+ * @param {number} [params.latencyMs=0] - Искусственная задержка на каждый HTTP ответ
+ * @returns {{ fetch: Function, stats: Function, reset: Function }}
+ */
+export function createReplayFetch({ accounts, fixtures, latencyMs = 0 }) {
+  const adIndex = new Map();
+  const diagnosticsIndex = new Map();
+  for (const graph of accounts.values()) {
+    for (const row of graph.adsInsights) adIndex.set(row.ad_id, row);
+    for (const row of graph.diagnostics) diagnosticsIndex.set(row.ad_id, row);
+  }
+
+  let counts = {};
+  let httpRequests = 0;
+  let bytes = 0;
+
+  function count(key) {
+    counts[key] = (counts[key] || 0) + 1;
+  }
+
+  /**
+   * Маршрутизация GET запроса Graph API
+   * @returns {{ status: number, body: Object }}
+   */
+  function routeGraph(path, params, url) {
+    const [node, edge] = path.split('/');
+    const graph = accounts.get(node);
+
+    if (graph && edge === 'adsets') {
+      count('graph:adsets');
+      return { status: 200, body: page(graph.adsetsConfig, params, url) };
+    }
+
+    if (graph && edge === 'ads') {
+      count('graph:ads');
+      return { status: 200, body: page(graph.ads, params, url) };
+    }
+
+    if (graph && edge === 'insights') {
+      const level = params.get('level');
+      const fields = params.get('fields') || '';
+
+      if (level === 'ad') {
+        const ids = filteredIds(params, 'ad.id');
+        if (ids) {
+          // Insights по креативам (fbBatch.fetchAdLevelInsights) — с рейтингами качества
+          count('graph:insights:ad:by_id');
+          const rows = graph.adsInsights
+            .filter(r => ids.has(r.ad_id))
+            .map(r => ({ ...r, ...diagnosticsIndex.get(r.ad_id) }));
+          return { status: 200, body: page(rows, params, url) };
+        }
+        if (fields.includes('quality_ranking')) {
+          count('graph:insights:ad:diagnostics');
+          return { status: 200, body: page(graph.diagnostics, params, url) };
+        }
+        count('graph:insights:ad');
+        return { status: 200, body: page(graph.adsInsights, params, url) };
+      }
+
+      if (level === 'adset') {
+        if (params.get('time_increment')) {
+          count('graph:insights:adset:daily');
+          return { status: 200, body: page(graph.daily, params, url) };
+        }
+        if (fields === 'adset_id,actions') {
+          count('graph:insights:adset:actions');
+          return { status: 200, body: page(graph.actions, params, url) };
+        }
+        const preset = params.get('date_preset') || 'range';
+        count(`graph:insights:adset:${preset}`);
+        return { status: 200, body: page(preset === 'today' ? graph.today : graph.yesterday, params, url) };
+      }
+    }
+
+    if (edge === 'insights' && adIndex.has(node)) {
+      count('graph:insights:single_ad');
+      return { status: 200, body: { data: [adIndex.get(node)] } };
+    }
+
+    count('graph:unrouted');
+    return {
+      status: 400,
+      body: { error: { message: `replay: no recorded response for ${path}`, type: 'ReplayError', code: 100 } }
+    };
+  }
+
+  async function replayFetch(input, init = {}) {
+    const url = new URL(typeof input === 'string' ? input : input.url);
+    const method = (init.method || 'GET').toUpperCase();
+    httpRequests++;
+
+    if (latencyMs > 0) {
+      await new Promise(resolve => setTimeout(resolve, latencyMs));
+    }
+
+    let response;
+
+    if (url.hostname === 'graph.facebook.com') {
+      const path = url.pathname.split('/').filter(Boolean).slice(1).join('/');
+      const bodyParams = method === 'GET' ? null : new URLSearchParams(String(init.body || ''));
+
+      if (bodyParams?.has('batch')) {
+        count('graph:batch');
+        const batch = JSON.parse(bodyParams.get('batch'));
+        const results = batch.map(sub => {
+          const subUrl = new URL(`https://graph.facebook.com/v0/${sub.relative_url}`);
+          const subPath = subUrl.pathname.split('/').filter(Boolean).slice(1).join('/');
+          const { status, body } = routeGraph(subPath, subUrl.searchParams, subUrl.toString());
+          return { code: status, body: JSON.stringify(body) };
+        });
+        response = jsonResponse(results);
+      } else {
+        const params = bodyParams || url.searchParams;
+        const { status, body } = routeGraph(path, params, url.toString());
+        response = jsonResponse(body, status);
+      }
+    } else if (url.hostname === 'api.openai.com') {
+      count('openai:responses');
+      const request = JSON.parse(String(init.body || '{}'));
+      const userText = (request.input || [])
+        .find(m => m.role === 'user')?.content?.find(c => c.type === 'input_text')?.text || '{}';
+      let payload = {};
+      try {
+        payload = JSON.parse(userText);
+      } catch {
+        payload = {};
+      }
+      response = jsonResponse(buildLlmResponse(fixtures.runTrace, payload));
+    } else if (url.hostname === 'api.telegram.org') {
+      count('telegram');
+      response = jsonResponse({ ok: true, result: {} });
+    } else if (url.hostname === REPLAY_AGENT_SERVICE_HOST) {
+      // lib/errorLogger.js → POST /admin/errors/log
+      count('agent_service:error_log');
+      response = jsonResponse({ success: true });
+    } else {
+      count('blocked');
+      throw new Error(`replay: network access blocked (${url.hostname})`);
+    }
+
+    const text = await response.clone().text();
+    bytes += text.length;
+    return response;
+  }
+
+  return {
+    fetch: replayFetch,
+    // requests — по эндпоинтам (включая под-запросы batch), http — фактические HTTP вызовы
+    stats: () => ({ requests: { ...counts }, http: httpRequests, bytes }),
+    reset: () => {
+      counts = {};
+      httpRequests = 0;
+      bytes = 0;
+    }
+  };
+}
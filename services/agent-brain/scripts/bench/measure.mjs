@@ -0,0 +1,152 @@
+/**
+ * Измерения для replay-бенчмарка: wall time, аллокации, GC, тайминги фаз.
+ */
+
+import { performance, PerformanceObserver } from 'perf_hooks';
+
+/**
+ * Перцентиль по отсортированному массиву (как в lib/batchScheduler.js)
+ */
+function percentile(sorted, p) {
+  if (sorted.length === 0) return 0;
+  const idx = Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1);
+  return sorted[Math.max(0, idx)];
+}
+
+function round(value, digits = 2) {
+  const k = 10 ** digits;
+  return Math.round(value * k) / k;
+}
+
+/**
+ * Сводка по выборке замеров
+ * @param {number[]} samples
+ * @returns {{ n: number, median: number, p95: number, min: number, max: number }}
+ */
+export function summarize(samples) {
+  const sorted = [...samples].sort((a, b) => a - b);
+  return {
+    n: sorted.length,
+    median: round(percentile(sorted, 50)),
+    p95: round(percentile(sorted, 95)),
+    min: round(sorted[0] ?? 0),
+    max: round(sorted[sorted.length - 1] ?? 0)
+  };
+}
+
+/**
+ * Счётчик сборок мусора (PerformanceObserver 'gc')
+ * @returns {{ snapshot: Function, stop: Function }}
+ */
+export function createGcCounter() {
+  let count = 0;
+  let totalMs = 0;
+  const observer = new PerformanceObserver(list => {
+    for (const entry of list.getEntries()) {
+      count++;
+      totalMs += entry.duration;
+    }
+  });
+  observer.observe({ entryTypes: ['gc'] });
+
+  return {
+    snapshot: () => ({ count, totalMs }),
+    stop: () => observer.disconnect()
+  };
+}
+
+/**
+ * Один замер async функции
+ *
+ * heapDeltaBytes — прирост heapUsed после прогона относительно состояния
+ * до него (с --expose-gc перед замером делается полная сборка, так что это
+ * удержанная память, а не мусор предыдущих итераций).
+ *
+ * @param {Function} fn - async () => result
+ * @param {Object} gcCounter - из createGcCounter()
+ * @returns {Promise<{ result: *, wallMs: number, heapDeltaBytes: number, gcCount: number, gcMs: number }>}
+ */
+export async function measureOnce(fn, gcCounter) {
+  if (global.gc) global.gc();
+
+  const heapBefore = process.memoryUsage().heapUsed;
+  const gcBefore = gcCounter.snapshot();
+  const start = performance.now();
+
+  const result = await fn();
+
+  const wallMs = performance.now() - start;
+  // Наблюдатель GC получает записи асинхронно
+  await new Promise(resolve => setImmediate(resolve));
+  const gcAfter = gcCounter.snapshot();
+
+  return {
+    result,
+    wallMs,
+    heapDeltaBytes: process.memoryUsage().heapUsed - heapBefore,
+    gcCount: gcAfter.count - gcBefore.count,
+    gcMs: gcAfter.totalMs - gcBefore.totalMs
+  };
+}
+
+/**
+ * Logger, записывающий метки { where, phase } с временем.
+ * Совместим с pino-интерфейсом, который ожидают scoring.js и batchScheduler
+ * (info/warn/error/debug/child); сообщения никуда не выводятся.
+ *
+ * Длительность фазы = время до следующей метки того же logger —
+ * поэтому на каждый прогон аккаунта создаётся свой logger.
+ *
+ * @returns {Object} logger + phaseDurations()
+ */
+export function createPhaseLogger() {
+  const marks = [];
+
+  const record = level => (obj) => {
+    if (obj && typeof obj === 'object' && obj.where) {
+      marks.push({ key: obj.phase ? `${obj.where}:${obj.phase}` : obj.where, at: performance.now(), level });
+    }
+  };
+
+  const log = {
+    info: record('info'),
+    warn: record('warn'),
+    error: record('error'),
+    debug: record('debug'),
+    trace: () => {},
+    fatal: record('fatal'),
+    child: () => log,
+
+    /**
+     * Суммарная длительность по фазам
+     * @returns {Object<string, number>} key → ms
+     */
+    phaseDurations() {
+      const durations = {};
+      for (let i = 0; i < marks.length - 1; i++) {
+        const { key, at } = marks[i];
+        durations[key] = (durations[key] || 0) + (marks[i + 1].at - at);
+      }
+      return durations;
+    },
+
+    errors: () => marks.filter(m => m.level === 'error').map(m => m.key)
+  };
+
+  return log;
+}
+
+/**
+ * Сложить тайминги фаз нескольких прогонов
+ * @param {Array<Object<string, number>>} list
+ * @returns {Object<string, number>}
+ */
+export function mergePhases(list) {
+  const merged = {};
+  for (const durations of list) {
+    for (const [key, ms] of Object.entries(durations)) {
+      merged[key] = (merged[key] || 0) + ms;
+    }
+  }
+  return merged;
+}
@@ -0,0 +1,23 @@
+/**
+ * node-fetch → globalThis.fetch для бенчмарка.
+ *
+ * lib/errorLogger.js (logScoringError) и lib/logAlerts.js ходят в сеть через
+ * node-fetch, минуя globalThis.fetch, который подменяет graphReplay.mjs.
+ * replay.mjs регистрирует этот файл как module hook (module.register):
+ * импорт 'node-fetch' резолвится сюда, и все HTTP вызовы src/ идут в replay.
+ */
+
+// Module hook (выполняется в потоке загрузчика)
+export async function resolve(specifier, context, nextResolve) {
+  if (specifier === 'node-fetch') {
+    return { url: import.meta.url, shortCircuit: true };
+  }
+  return nextResolve(specifier, context);
+}
+
+// Подмена модуля node-fetch: fetch читается при вызове, уже после подмены на replay
+export default function fetch(input, init) {
+  return globalThis.fetch(input, init);
+}
+
+export const { Headers, Request, Response } = globalThis;
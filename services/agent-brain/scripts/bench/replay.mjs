@@ -0,0 +1,342 @@
+#!/usr/bin/env node
+/**
+ * Offline replay-бенчмарк scoring/brain pipeline.
+ *
+ * Прогоняет на синтетических аккаунтах (10/100/1000 адсетов, см. fixtures.mjs):
+ * - calculateMultiPeriodTrends — тренды 1d/3d/7d по 14-дневному daily breakdown;
+ * - analyzeAdsForEaters — поиск ads-пожирателей;
+ * - daily batch — runDailyBatch из lib/dailyBatch.js (его же вызывает processDailyBatch
+ *   в server.js): getActiveUsers → expandDailyBatchTasks → runBatchScheduler → processUser.
+ *   POST /api/brain/run, который processUser отправляет в server.js, обслуживается
+ *   в процессе бенчмарка: runScoringAgent + runInteractiveBrain (LLM-режим).
+ *
+ * Всё идёт поверх replay Graph API (graphReplay.mjs) и in-memory Supabase
+ * (supabaseStandIn.mjs) — без сети и БД.
+ * node-fetch (lib/errorLogger.js: logScoringError) подменяется на globalThis.fetch
+ * через module hook (nodeFetchReplay.mjs), AGENT_SERVICE_URL указывает на replay —
+ * логи ошибок scoring видны в счётчике agent_service:error_log, а не уходят в сеть.
+ *
+ * Для каждого размера: wall time (median/p95 по итерациям), прирост heap,
+ * число/время GC, запросы к Graph API / Supabase и тайминги фаз
+ * (по меткам { where, phase } в логах scoring.js).
+ *
+ * Usage:
+ *   npm run bench
+ *   node --expose-gc scripts/bench/replay.mjs
+ *
+ * Optional:
+ *   BENCH_SIZES=10,100,1000        — размеры аккаунтов (адсетов)
+ *   BENCH_ACCOUNTS=3               — аккаунтов в batch
+ *   BENCH_ITERATIONS=5             — замеров на размер (плюс BENCH_WARMUP прогревочных)
+ *   BENCH_WARMUP=1
+ *   BENCH_CONCURRENCY=5            — concurrency scheduler (задаёт BRAIN_BATCH_CONCURRENCY)
+ *   BENCH_LATENCY_MS=0             — искусственная задержка Graph API / Supabase
+ *   BENCH_OUT=bench.json           — сохранить результат в JSON
+ *   BENCH_BASELINE=bench.json      — сравнить с прошлым результатом, exit 1 при регрессии
+ *   BENCH_MAX_REGRESSION=0.2       — допустимый рост median wall time (доля)
+ */
+
+import { readFileSync, writeFileSync } from 'fs';
+import { register } from 'module';
+import { loadFixtures, buildSyntheticAccount } from './fixtures.mjs';
+import { createReplayFetch, REPLAY_AGENT_SERVICE_URL } from './graphReplay.mjs';
+import { createSupabaseStandIn } from './supabaseStandIn.mjs';
+import { createGcCounter, createPhaseLogger, measureOnce, mergePhases, summarize } from './measure.mjs';
+
+// До импорта scoring.js: глобальный logger (lib/logger.js) читает LOG_LEVEL при загрузке
+process.env.LOG_LEVEL = process.env.LOG_LEVEL || 'silent';
+// До импорта scoring.js: errorLogger читает AGENT_SERVICE_URL при загрузке и шлёт через node-fetch
+process.env.AGENT_SERVICE_URL = REPLAY_AGENT_SERVICE_URL;
+register('./nodeFetchReplay.mjs', import.meta.url);
+// До импорта lib/dailyBatch.js: supabaseClient завершает процесс без конфигурации.
+// Клиент не используется — runDailyBatch получает in-memory Supabase
+process.env.SUPABASE_URL = process.env.SUPABASE_URL || 'http://supabase.replay.local';
+process.env.SUPABASE_SERVICE_ROLE_KEY = process.env.SUPABASE_SERVICE_ROLE_KEY || 'bench';
+
+const SIZES = (process.env.BENCH_SIZES || '10,100,1000')
+  .split(',')
+  .map(s => parseInt(s.trim(), 10))
+  .filter(n => n > 0);
+const ACCOUNTS = Math.max(1, parseInt(process.env.BENCH_ACCOUNTS || '3', 10));
+const ITERATIONS = Math.max(1, parseInt(process.env.BENCH_ITERATIONS || '5', 10));
+const WARMUP = Math.max(0, parseInt(process.env.BENCH_WARMUP || '1', 10));
+const CONCURRENCY = Math.max(1, parseInt(process.env.BENCH_CONCURRENCY || '5', 10));
+const LATENCY_MS = Math.max(0, parseInt(process.env.BENCH_LATENCY_MS || '0', 10));
+const OUT = process.env.BENCH_OUT || null;
+const BASELINE = process.env.BENCH_BASELINE || null;
+const MAX_REGRESSION = parseFloat(process.env.BENCH_MAX_REGRESSION || '0.2');
+
+// brainBatchSchedulerOptions читает concurrency из env при каждом запуске batch
+process.env.BRAIN_BATCH_CONCURRENCY = String(CONCURRENCY);
+
+const {
+  calculateMultiPeriodTrends,
+  analyzeAdsForEaters,
+  runScoringAgent,
+  runInteractiveBrain
+} = await import('../../src/scoring.js');
+const { runDailyBatch, BRAIN_RUN_URL } = await import('../../src/lib/dailyBatch.js');
+
+/**
+ * Объединить таблицы нескольких аккаунтов в один набор
+ */
+function mergeTables(accounts) {
+  const tables = {};
+  for (const { tables: accountTables } of accounts) {
+    for (const [name, rows] of Object.entries(accountTables)) {
+      tables[name] = (tables[name] || []).concat(rows);
+    }
+  }
+  return tables;
+}
+
+/**
+ * Входные параметры analyzeAdsForEaters — так же, как их собирает runInteractiveBrain
+ */
+function eatersOptions(account) {
+  const adsetSpendMap = new Map();
+  const adsetActiveAdsCount = new Map();
+  for (const ad of account.graph.adsInsights) {
+    adsetSpendMap.set(ad.adset_id, (adsetSpendMap.get(ad.adset_id) || 0) + parseFloat(ad.spend || 0));
+    adsetActiveAdsCount.set(ad.adset_id, (adsetActiveAdsCount.get(ad.adset_id) || 0) + 1);
+  }
+  const target = account.tables.ad_accounts[0]?.default_cpl_target_cents;
+  return {
+    targetCPL: target ? target / 100 : null,
+    adsetSpendMap,
+    adsetActiveAdsCount,
+    earlyStageAdsetIds: new Set()
+  };
+}
+
+/**
+ * Прогнать fn: WARMUP прогревочных + ITERATIONS замеров.
+ * setup() выполняется перед каждым прогоном и в замер не входит.
+ */
+async function bench(gcCounter, setup, fn) {
+  const runs = [];
+  for (let i = 0; i < WARMUP + ITERATIONS; i++) {
+    const context = await setup();
+    const run = await measureOnce(() => fn(context), gcCounter);
+    if (i >= WARMUP) runs.push(run);
+  }
+  return {
+    wallMs: summarize(runs.map(r => r.wallMs)),
+    heapDeltaKb: summarize(runs.map(r => r.heapDeltaBytes / 1024)),
+    gcCount: summarize(runs.map(r => r.gcCount)),
+    gcMs: summarize(runs.map(r => r.gcMs)),
+    last: runs[runs.length - 1].result
+  };
+}
+
+/**
+ * Daily batch через lib/dailyBatch.js. Запросы processUser к /api/brain/run
+ * выполняются в процессе (scoring → interactive brain), остальное — replay.
+ */
+async function benchDailyBatch({ accounts, supabase, replay }) {
+  const phaseLogs = [];
+  const userAccounts = new Map(accounts.map(a => [a.userAccount.id, a.userAccount]));
+
+  async function brainRun(init) {
+    const { userAccountId } = JSON.parse(String(init.body || '{}'));
+    const userAccount = userAccounts.get(userAccountId);
+    const log = createPhaseLogger();
+    phaseLogs.push(log);
+
+    await runScoringAgent(userAccount, { supabase, logger: log });
+    const brain = await runInteractiveBrain(userAccount, {
+      supabase,
+      logger: log,
+      useLLM: true,
+      openaiApiKey: 'bench'
+    });
+
+    const success = brain?.success === true;
+    return new Response(JSON.stringify({ actions: brain?.proposals || [], dispatched: false }), {
+      status: success ? 200 : 500,
+      headers: { 'content-type': 'application/json' }
+    });
+  }
+
+  globalThis.fetch = (input, init = {}) => {
+    const url = typeof input === 'string' ? input : input.url;
+    return url === BRAIN_RUN_URL ? brainRun(init) : replay.fetch(input, init);
+  };
+
+  let run;
+  try {
+    run = await runDailyBatch({ resume: false, supabase });
+  } finally {
+    globalThis.fetch = replay.fetch;
+  }
+
+  return {
+    scheduler: run.scheduler,
+    succeeded: run.results.filter(r => r.success).length,
+    failed: run.results.filter(r => !r.success).map(r => r.error || 'unsuccessful'),
+    proposals: run.results.reduce((sum, r) => sum + (r.actionsCount || 0), 0),
+    phases: mergePhases(phaseLogs.map(log => log.phaseDurations())),
+    errors: [...new Set(phaseLogs.flatMap(log => log.errors()))],
+    graph: replay.stats(),
+    db: supabase.stats()
+  };
+}
+
+function formatRow(cells, widths) {
+  return cells.map((cell, i) => String(cell).padEnd(widths[i])).join('  ');
+}
+
+function printReport(result) {
+  const header = ['size', 'bench', 'wall median ms', 'wall p95 ms', 'heap Δ KB', 'GC', 'graph http', 'db queries'];
+  const rows = [];
+
+  for (const [size, entry] of Object.entries(result.sizes)) {
+    for (const name of ['trends', 'eaters', 'batch']) {
+      const b = entry[name];
+      rows.push([
+        size,
+        name,
+        b.wallMs.median,
+        b.wallMs.p95,
+        b.heapDeltaKb.median,
+        b.gcCount.median,
+        name === 'batch' ? entry.batch.graph.http : '-',
+        name === 'batch' ? entry.batch.db.total : '-'
+      ]);
+    }
+  }
+
+  const widths = header.map((h, i) => Math.max(h.length, ...rows.map(r => String(r[i]).length)));
+  console.log(formatRow(header, widths));
+  console.log(widths.map(w => '-'.repeat(w)).join('  '));
+  rows.forEach(row => console.log(formatRow(row, widths)));
+
+  for (const [size, entry] of Object.entries(result.sizes)) {
+    const top = Object.entries(entry.batch.phases)
+      .sort((a, b) => b[1] - a[1])
+      .slice(0, 5)
+      .map(([key, ms]) => `${key}=${Math.round(ms)}ms`);
+    console.log(`\n[${size} adsets] top phases: ${top.join(', ')}`);
+    console.log(`[${size} adsets] graph requests: ${JSON.stringify(entry.batch.graph.requests)}`);
+    if (entry.batch.failed.length || entry.batch.errors.length) {
+      console.log(`[${size} adsets] failed: ${JSON.stringify(entry.batch.failed)} errors: ${JSON.stringify(entry.batch.errors)}`);
+    }
+  }
+}
+
+/**
+ * Сравнение с baseline: рост median wall time batch > MAX_REGRESSION
+ * или рост числа запросов к Graph API / Supabase
+ * @returns {string[]} Описания регрессий
+ */
+function compareWithBaseline(result, baseline) {
+  const regressions = [];
+  for (const [size, entry] of Object.entries(result.sizes)) {
+    const base = baseline.sizes?.[size];
+    if (!base) continue;
+
+    for (const name of ['trends', 'eaters', 'batch']) {
+      const before = base[name]?.wallMs?.median;
+      const after = entry[name].wallMs.median;
+      if (before > 0 && after > before * (1 + MAX_REGRESSION)) {
+        regressions.push(`${size}/${name}: wall median ${before}ms → ${after}ms`);
+      }
+    }
+    if (base.batch?.graph?.http !== undefined && entry.batch.graph.http > base.batch.graph.http) {
+      regressions.push(`${size}/batch: graph http ${base.batch.graph.http} → ${entry.batch.graph.http}`);
+    }
+    if (base.batch?.db?.total !== undefined && entry.batch.db.total > base.batch.db.total) {
+      regressions.push(`${size}/batch: db queries ${base.batch.db.total} → ${entry.batch.db.total}`);
+    }
+  }
+  return regressions;
+}
+
+async function main() {
+  const fixtures = loadFixtures();
+  const gcCounter = createGcCounter();
+  const originalFetch = globalThis.fetch;
+
+  const result = {
+    meta: {
+      node: process.version,
+      date: new Date().toISOString(),
+      accounts: ACCOUNTS,
+      iterations: ITERATIONS,
+      warmup: WARMUP,
+      concurrency: CONCURRENCY,
+      latencyMs: LATENCY_MS,
+      exposeGc: typeof global.gc === 'function'
+    },
+    sizes: {}
+  };
+
+  if (!result.meta.exposeGc) {
+    console.warn('Запуск без --expose-gc: heap Δ включает мусор предыдущих итераций');
+  }
+
+  try {
+    for (const size of SIZES) {
+      const accounts = Array.from({ length: ACCOUNTS }, (_, index) =>
+        buildSyntheticAccount(fixtures, { adsets: size, index })
+      );
+      const replay = createReplayFetch({
+        accounts: new Map(accounts.map(a => [a.userAccount.ad_account_id, a.graph])),
+        fixtures,
+        latencyMs: LATENCY_MS
+      });
+      globalThis.fetch = replay.fetch;
+
+      const first = accounts[0];
+      const objectives = new Map(first.tables.account_directions.map(d => [d.fb_campaign_id, d.objective]));
+      const options = eatersOptions(first);
+      const tables = mergeTables(accounts);
+
+      const trends = await bench(gcCounter, () => null, () =>
+        calculateMultiPeriodTrends(first.graph.daily, first.graph.actions, objectives)
+      );
+      const eaters = await bench(gcCounter, () => null, () =>
+        analyzeAdsForEaters(first.graph.adsInsights, options)
+      );
+      const batch = await bench(
+        gcCounter,
+        () => {
+          replay.reset();
+          return { accounts, replay, supabase: createSupabaseStandIn(tables, { latencyMs: LATENCY_MS }) };
+        },
+        benchDailyBatch
+      );
+
+      result.sizes[size] = {
+        trends: { ...trends, last: undefined, adsets: trends.last.length },
+        eaters: { ...eaters, last: undefined, eaters: eaters.last.length },
+        batch: { ...batch, ...batch.last, last: undefined }
+      };
+    }
+  } finally {
+    globalThis.fetch = originalFetch;
+    gcCounter.stop();
+  }
+
+  printReport(result);
+
+  if (OUT) {
+    writeFileSync(OUT, JSON.stringify(result, null, 2));
+    console.log(`\nSaved: ${OUT}`);
+  }
+
+  if (BASELINE) {
+    const regressions = compareWithBaseline(result, JSON.parse(readFileSync(BASELINE, 'utf8')));
+    if (regressions.length > 0) {
+      console.error(`\nRegressions vs ${BASELINE}:`);
+      regressions.forEach(r => console.error(`  ${r}`));
+      process.exit(1);
+    }
+    console.log(`\nNo regressions vs ${BASELINE}`);
+  }
+}
+
+main().catch(err => {
+  console.error('Bench failed:', err);
+  process.exit(1);
+});
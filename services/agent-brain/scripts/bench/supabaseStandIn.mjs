@@ -0,0 +1,353 @@
+/**
+ * In-memory замена Supabase клиента для replay-бенчмарка.
+ *
+ * Поддерживает подмножество PostgREST query builder, которое используют
+ * scoring.js и runInteractiveBrain: select (count/head), eq/neq/in/is/not,
+ * gt/gte/lt/lte, or (простые условия), order/limit/range, single/maybeSingle,
+ * insert/upsert/update/delete и rpc. Вставленные строки сохраняются —
+ * scoring_executions из scoring доступны interactive brain в том же прогоне.
+ *
+ * Фильтры по встроенным связям ('account_directions.is_active') применяются,
+ * если связь есть в строке (см. fixtures.mjs), иначе пропускаются.
+ */
+
+function readColumn(row, column) {
+  if (!column.includes('.')) return { present: true, value: row[column] };
+  const [relation, field] = column.split('.');
+  const embedded = row[relation];
+  if (embedded === undefined) return { present: false };
+  return { present: true, value: embedded?.[field] ?? null };
+}
+
+function sameValue(a, b) {
+  if (a === null || a === undefined || b === null || b === undefined) return a == b;
+  return String(a) === String(b);
+}
+
+function compare(a, b) {
+  if (typeof a === 'number' || typeof b === 'number') return Number(a) - Number(b);
+  return String(a) < String(b) ? -1 : String(a) > String(b) ? 1 : 0;
+}
+
+function parseLiteral(raw) {
+  if (raw === 'null') return null;
+  if (raw === 'true') return true;
+  if (raw === 'false') return false;
+  return raw;
+}
+
+function parseList(raw) {
+  return String(raw).replace(/^\(|\)$/g, '').split(',').map(v => parseLiteral(v.trim().replace(/^"|"$/g, '')));
+}
+
+/**
+ * Предикат для оператора PostgREST
+ */
+function predicate(column, op, value) {
+  return row => {
+    const { present, value: actual } = readColumn(row, column);
+    if (!present) return true;
+
+    switch (op) {
+      case 'eq': return sameValue(actual, value);
+      case 'neq': return !sameValue(actual, value);
+      case 'gt': return actual !== null && actual !== undefined && compare(actual, value) > 0;
+      case 'gte': return actual !== null && actual !== undefined && compare(actual, value) >= 0;
+      case 'lt': return actual !== null && actual !== undefined && compare(actual, value) < 0;
+      case 'lte': return actual !== null && actual !== undefined && compare(actual, value) <= 0;
+      case 'in': return value.some(v => sameValue(actual, v));
+      case 'is': return value === null ? actual === null || actual === undefined : actual === value;
+      case 'like':
+      case 'ilike': {
+        const pattern = new RegExp(`^${String(value).replace(/[.*+?^${}()|[\]\\]/g, '\\$&').replace(/%/g, '.*')}$`, op === 'ilike' ? 'i' : '');
+        return pattern.test(String(actual ?? ''));
+      }
+      default: return true;
+    }
+  };
+}
+
+/**
+ * or('a.eq.1,b.is.null') → предикат "любое из"
+ */
+function orPredicate(expression) {
+  const parts = String(expression).split(/,(?![^(]*\))/);
+  const checks = parts.map(part => {
+    const match = part.trim().match(/^([\w.]+?)\.(not\.)?(eq|neq|gt|gte|lt|lte|in|is|like|ilike)\.(.*)$/);
+    if (!match) return () => true;
+    const [, column, negate, op, raw] = match;
+    const check = predicate(column, op, op === 'in' ? parseList(raw) : parseLiteral(raw));
+    return negate ? row => !check(row) : check;
+  });
+  return row => checks.some(check => check(row));
+}
+
+class StandInQuery {
+  constructor(db, table) {
+    this.db = db;
+    this.table = table;
+    this.op = 'select';
+    this.filters = [];
+    this.orderBy = [];
+    this.limitCount = null;
+    this.rangeBounds = null;
+    this.singleMode = null;
+    this.countMode = null;
+    this.headOnly = false;
+    this.payload = null;
+    this.upsertOptions = {};
+  }
+
+  select(_columns, options = {}) {
+    if (this.op === 'select') {
+      this.countMode = options.count || null;
+      this.headOnly = Boolean(options.head);
+    }
+    return this;
+  }
+
+  insert(rows) {
+    this.op = 'insert';
+    this.payload = Array.isArray(rows) ? rows : [rows];
+    return this;
+  }
+
+  upsert(rows, options = {}) {
+    this.op = 'upsert';
+    this.payload = Array.isArray(rows) ? rows : [rows];
+    this.upsertOptions = options;
+    return this;
+  }
+
+  update(patch) {
+    this.op = 'update';
+    this.payload = patch;
+    return this;
+  }
+
+  delete() {
+    this.op = 'delete';
+    return this;
+  }
+
+  eq(column, value) { this.filters.push(predicate(column, 'eq', value)); return this; }
+  neq(column, value) { this.filters.push(predicate(column, 'neq', value)); return this; }
+  gt(column, value) { this.filters.push(predicate(column, 'gt', value)); return this; }
+  gte(column, value) { this.filters.push(predicate(column, 'gte', value)); return this; }
+  lt(column, value) { this.filters.push(predicate(column, 'lt', value)); return this; }
+  lte(column, value) { this.filters.push(predicate(column, 'lte', value)); return this; }
+  in(column, values) { this.filters.push(predicate(column, 'in', values || [])); return this; }
+  is(column, value) { this.filters.push(predicate(column, 'is', value)); return this; }
+  like(column, value) { this.filters.push(predicate(column, 'like', value)); return this; }
+  ilike(column, value) { this.filters.push(predicate(column, 'ilike', value)); return this; }
+
+  not(column, op, value) {
+    const check = predicate(column, op, op === 'in' ? parseList(value) : value);
+    this.filters.push(row => !readColumn(row, column).present || !check(row));
+    return this;
+  }
+
+  match(values) {
+    for (const [column, value] of Object.entries(values || {})) this.eq(column, value);
+    return this;
+  }
+
+  filter(column, op, value) {
+    this.filters.push(predicate(column, op, op === 'in' ? parseList(value) : parseLiteral(String(value))));
+    return this;
+  }
+
+  or(expression) {
+    this.filters.push(orPredicate(expression));
+    return this;
+  }
+
+  // Операторы без влияния на результат в replay
+  contains() { return this; }
+  overlaps() { return this; }
+  textSearch() { return this; }
+  returns() { return this; }
+  abortSignal() { return this; }
+
+  order(column, { ascending = true } = {}) {
+    this.orderBy.push({ column, ascending });
+    return this;
+  }
+
+  limit(count) {
+    this.limitCount = count;
+    return this;
+  }
+
+  range(from, to) {
+    this.rangeBounds = [from, to];
+    return this;
+  }
+
+  single() {
+    this.singleMode = 'single';
+    return this;
+  }
+
+  maybeSingle() {
+    this.singleMode = 'maybe';
+    return this;
+  }
+
+  then(resolve, reject) {
+    return this.db.execute(this).then(resolve, reject);
+  }
+
+  catch(reject) {
+    return this.then(undefined, reject);
+  }
+}
+
+/**
+ * Создать in-memory Supabase
+ * @param {Object<string, Array>} tables - Начальные строки по таблицам (копируются)
+ * @param {Object} [options]
+ * @param {number} [options.latencyMs=0] - Искусственная задержка на каждый запрос
+ * @param {Object<string, Function>} [options.rpc] - Обработчики rpc: name → (args, tables) => data
+ * @returns {Object} Клиент с from()/rpc() и stats()/reset()
+ */
+export function createSupabaseStandIn(tables, { latencyMs = 0, rpc = {} } = {}) {
+  const data = {};
+  for (const [name, rows] of Object.entries(tables || {})) {
+    data[name] = rows.map(row => ({ ...row }));
+  }
+
+  let counts = {};
+
+  function count(key) {
+    counts[key] = (counts[key] || 0) + 1;
+  }
+
+  function rowsOf(table) {
+    if (!data[table]) data[table] = [];
+    return data[table];
+  }
+
+  function applyReadModifiers(query, rows) {
+    let result = rows;
+    for (const { column, ascending } of [...query.orderBy].reverse()) {
+      result = [...result].sort((a, b) => {
+        const av = readColumn(a, column).value;
+        const bv = readColumn(b, column).value;
+        if (av === bv) return 0;
+        if (av === null || av === undefined) return 1;
+        if (bv === null || bv === undefined) return -1;
+        return ascending ? compare(av, bv) : compare(bv, av);
+      });
+    }
+    if (query.rangeBounds) {
+      result = result.slice(query.rangeBounds[0], query.rangeBounds[1] + 1);
+    }
+    if (query.limitCount !== null) {
+      result = result.slice(0, query.limitCount);
+    }
+    return result;
+  }
+
+  function upsertRows(table, payload, { onConflict, ignoreDuplicates }) {
+    const rows = rowsOf(table);
+    const columns = (onConflict || 'id').split(',').map(c => c.trim());
+    const keyOf = row => columns.map(c => String(row[c] ?? '')).join('|');
+
+    const index = new Map();
+    rows.forEach((row, i) => index.set(keyOf(row), i));
+
+    const written = [];
+    for (const item of payload) {
+      const key = keyOf(item);
+      const existing = index.get(key);
+      if (existing === undefined) {
+        index.set(key, rows.length);
+        rows.push({ ...item });
+        written.push(rows[rows.length - 1]);
+      } else if (!ignoreDuplicates) {
+        rows[existing] = { ...rows[existing], ...item };
+        written.push(rows[existing]);
+      }
+    }
+    return written;
+  }
+
+  async function execute(query) {
+    count(`${query.table}:${query.op}`);
+    if (latencyMs > 0) {
+      await new Promise(resolve => setTimeout(resolve, latencyMs));
+    }
+
+    const matches = row => query.filters.every(filter => filter(row));
+    let result;
+
+    switch (query.op) {
+      case 'insert': {
+        const rows = rowsOf(query.table);
+        result = query.payload.map(item => {
+          const row = { id: item.id ?? `${query.table}-${rows.length + 1}`, created_at: new Date().toISOString(), ...item };
+          rows.push(row);
+          return row;
+        });
+        break;
+      }
+      case 'upsert':
+        result = upsertRows(query.table, query.payload, query.upsertOptions);
+        break;
+      case 'update':
+        result = rowsOf(query.table).filter(matches);
+        result.forEach(row => Object.assign(row, query.payload));
+        break;
+      case 'delete': {
+        const rows = rowsOf(query.table);
+        result = rows.filter(matches);
+        data[query.table] = rows.filter(row => !matches(row));
+        break;
+      }
+      default:
+        result = rowsOf(query.table).filter(matches);
+    }
+
+    const total = result.length;
+    result = applyReadModifiers(query, result);
+
+    if (query.singleMode) {
+      if (result.length > 1 || (result.length === 0 && query.singleMode === 'single')) {
+        return {
+          data: null,
+          error: { code: 'PGRST116', message: `replay: ${result.length} rows for single() on ${query.table}` },
+          count: null
+        };
+      }
+      return { data: result[0] ?? null, error: null, count: null };
+    }
+
+    return {
+      data: query.headOnly ? null : result,
+      error: null,
+      count: query.countMode ? total : null
+    };
+  }
+
+  const db = { execute };
+
+  return {
+    from: table => new StandInQuery(db, table),
+
+    rpc: async (name, args) => {
+      count(`rpc:${name}`);
+      if (latencyMs > 0) {
+        await new Promise(resolve => setTimeout(resolve, latencyMs));
+      }
+      const handler = rpc[name];
+      return { data: handler ? handler(args, data) : null, error: null };
+    },
+
+    rows: table => rowsOf(table),
+    stats: () => ({ requests: { ...counts }, total: Object.values(counts).reduce((s, n) => s + n, 0) }),
+    reset: () => {
+      counts = {};
+    }
+  };
+}
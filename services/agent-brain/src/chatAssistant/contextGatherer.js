@@ -13,6 +13,8 @@ import { unifiedStore } from './stores/unifiedStore.js';
 import { TokenBudget } from './shared/tokenBudget.js';
 import { formatBrainActionsForNotes } from './shared/brainRules.js';
 import { shouldFilterByAccountId } from '../lib/multiAccountHelper.js';
+import { memoryStore } from './stores/memoryStore.js';
+import { createContextScope, loadBlock } from './shared/contextCache.js';
 
 /**
  * Gather all context needed for the chat assistant with token budgeting
@@ -25,6 +27,9 @@ import { shouldFilterByAccountId } from '../lib/multiAccountHelper.js';
  */
 export async function gatherContext({ userAccountId, adAccountId, conversationId, budget = {} }) {
   const tokenBudget = new TokenBudget(budget);
+  const startTime = Date.now();
+  const requestScope = createContextScope({ userAccountId, adAccountId });
+  const cacheKey = { userAccountId, adAccountId };
 
   try {
     // Run queries in parallel for speed
@@ -37,11 +42,11 @@ export async function gatherContext({ userAccountId, adAccountId, conversationId
       adAccountPrompts
     ] = await Promise.allSettled([
       getChatHistory(conversationId),
-      getBusinessProfile(userAccountId, adAccountId),
-      getTodayMetrics(userAccountId, adAccountId),
-      getActiveContexts(userAccountId, adAccountId),
-      getDirections(userAccountId, adAccountId),
-      getAdAccountPrompts(userAccountId, adAccountId)
+      loadBlock(requestScope, 'businessProfile', cacheKey, () => getBusinessProfile(userAccountId, adAccountId)),
+      loadBlock(requestScope, 'todayMetrics', cacheKey, () => getTodayMetrics(userAccountId, adAccountId)),
+      loadBlock(requestScope, 'activeContexts', cacheKey, () => getActiveContexts(userAccountId, adAccountId)),
+      loadBlock(requestScope, 'directions', cacheKey, () => getDirections(userAccountId, adAccountId)),
+      loadBlock(requestScope, 'adAccountPrompts', cacheKey, () => getAdAccountPrompts(userAccountId, adAccountId))
     ]);
 
     // Add blocks with priorities (higher = more important, kept first)
@@ -68,7 +73,7 @@ export async function gatherContext({ userAccountId, adAccountId, conversationId
     tokenBudget.addBlock('isManualMode', isManualMode, 9);
 
     if (isManualMode) {
-      const campaignMapping = await getCampaignMappingFromNotes(userAccountId, adAccountId);
+      const campaignMapping = await getCampaignMappingFromNotes(userAccountId, adAccountId, requestScope);
       if (campaignMapping?.length > 0) {
         tokenBudget.addBlock('campaignMapping', campaignMapping, 9);
       }
@@ -100,7 +105,9 @@ export async function gatherContext({ userAccountId, adAccountId, conversationId
         budget: stats.budget,
         utilization: stats.utilization + '%',
         blocks: stats.blocksIncluded
-      }
+      },
+      latencyMs: Date.now() - startTime,
+      blockLatencyMs: requestScope.timings
     }, 'Context gathered with token budgeting');
 
     return context;
@@ -161,7 +168,7 @@ async function getBusinessProfile(userAccountId, adAccountId) {
 
   if (error) {
     logger.warn({ error: error.message }, 'Failed to get business profile');
-    return null;
+    throw new Error(`Failed to get business profile: ${error.message}`);
   }
 
   return data;
@@ -190,8 +197,7 @@ async function getTodayMetrics(userAccountId, adAccountId) {
     const { data: execution, error } = await query.maybeSingle();
 
     if (error) {
-      logger.warn({ error: error.message }, 'Failed to get scoring_executions');
-      return null;
+      throw new Error(`Failed to get scoring_executions: ${error.message}`);
     }
 
     if (!execution?.scoring_output) {
@@ -239,7 +245,7 @@ async function getTodayMetrics(userAccountId, adAccountId) {
 
   } catch (error) {
     logger.warn({ error: error.message }, 'Error getting today metrics from scoring_executions');
-    return null;
+    throw error;
   }
 }
 
@@ -264,7 +270,7 @@ async function getActiveContexts(userAccountId, adAccountId) {
 
   if (error) {
     logger.warn({ error: error.message }, 'Failed to get active contexts');
-    return [];
+    throw new Error(`Failed to get active contexts: ${error.message}`);
   }
 
   return data || [];
@@ -285,6 +291,8 @@ async function getActiveContexts(userAccountId, adAccountId) {
  */
 export async function getBusinessSnapshot({ userAccountId, adAccountId }) {
   const startTime = Date.now();
+  const requestScope = createContextScope({ userAccountId, adAccountId });
+  const cacheKey = { userAccountId, adAccountId };
 
   try {
     // Run all queries in parallel
@@ -294,10 +302,10 @@ export async function getBusinessSnapshot({ userAccountId, adAccountId }) {
       creativesResult,
       notesResult
     ] = await Promise.allSettled([
-      getAdsSnapshot(userAccountId, adAccountId),
-      getDirectionsSnapshot(userAccountId, adAccountId),
-      getCreativesSnapshot(userAccountId, adAccountId),
-      getNotesSnapshot(userAccountId, adAccountId)
+      loadBlock(requestScope, 'adsSnapshot', cacheKey, () => getAdsSnapshot(userAccountId, adAccountId)),
+      loadBlock(requestScope, 'directionsSnapshot', cacheKey, () => getDirectionsSnapshot(userAccountId, adAccountId)),
+      loadBlock(requestScope, 'creativesSnapshot', cacheKey, () => getCreativesSnapshot(userAccountId, adAccountId)),
+      getNotesSnapshot(userAccountId, adAccountId, requestScope)
     ]);
 
     // Build snapshot
@@ -316,6 +324,7 @@ export async function getBusinessSnapshot({ userAccountId, adAccountId }) {
     logger.debug({
       userAccountId,
       latencyMs: snapshot.latencyMs,
+      blockLatencyMs: requestScope.timings,
       freshness: snapshot.freshness
     }, 'Business snapshot generated');
 
@@ -355,7 +364,11 @@ async function getAdsSnapshot(userAccountId, adAccountId) {
 
   const { data: execution, error } = await query.maybeSingle();
 
-  if (error || !execution?.scoring_output) {
+  if (error) {
+    throw new Error(`Failed to get ads snapshot: ${error.message}`);
+  }
+
+  if (!execution?.scoring_output) {
     return null;
   }
 
@@ -429,7 +442,11 @@ async function getDirectionsSnapshot(userAccountId, adAccountId) {
 
   const { data, error } = await query;
 
-  if (error || !data?.length) {
+  if (error) {
+    throw new Error(`Failed to get directions snapshot: ${error.message}`);
+  }
+
+  if (!data?.length) {
     return null;
   }
 
@@ -483,7 +500,11 @@ async function getCreativesSnapshot(userAccountId, adAccountId) {
 
   const { data: scores, error } = await scoresQuery;
 
-  if (error || !scores?.length) {
+  if (error) {
+    throw new Error(`Failed to get creatives snapshot: ${error.message}`);
+  }
+
+  if (!scores?.length) {
     return null;
   }
 
@@ -513,12 +534,21 @@ async function getCreativesSnapshot(userAccountId, adAccountId) {
   };
 }
 
+/**
+ * Load agent_notes once per request (cached across requests, invalidated by memoryStore on save)
+ * Shared by notes snapshot and campaign mapping
+ */
+function getAgentNotes(userAccountId, adAccountId, scope = null) {
+  return loadBlock(scope, 'agentNotes', { userAccountId, adAccountId },
+    () => memoryStore.getAllNotes(userAccountId, adAccountId, { throwOnError: true }));
+}
+
 /**
  * Get notes snapshot from agent_notes
  */
-async function getNotesSnapshot(userAccountId, adAccountId) {
-  const { memoryStore } = await import('./stores/memoryStore.js');
-  return memoryStore.getNotesDigest(userAccountId, adAccountId, ['ads', 'creative'], 3);
+async function getNotesSnapshot(userAccountId, adAccountId, scope = null) {
+  const allNotes = await getAgentNotes(userAccountId, adAccountId, scope);
+  return memoryStore.buildNotesDigest(allNotes, ['ads', 'creative'], 3);
 }
 
 /**
@@ -527,12 +557,13 @@ async function getNotesSnapshot(userAccountId, adAccountId) {
  * Deduplicates by campaign_id, keeping the latest mapping (last in notes array)
  * @param {string} userAccountId
  * @param {string|null} adAccountId
+ * @param {Object} [scope] - Request scope from createContextScope()
  * @returns {Promise<Array<{campaign_id, campaign_name, direction_name, goal, target_cpl_cents}>>}
  */
-async function getCampaignMappingFromNotes(userAccountId, adAccountId) {
+async function getCampaignMappingFromNotes(userAccountId, adAccountId, scope = null) {
   try {
-    const { memoryStore } = await import('./stores/memoryStore.js');
-    const notes = await memoryStore.getNotes(userAccountId, adAccountId, 'ads');
+    const allNotes = await getAgentNotes(userAccountId, adAccountId, scope);
+    const notes = allNotes.ads?.notes || [];
 
     // Use Map for deduplication by campaign_id (later entries override earlier)
     const mappingsByCampaignId = new Map();
@@ -595,7 +626,7 @@ async function getDirections(userAccountId, adAccountId) {
 
   if (error) {
     logger.warn({ error: error.message }, 'Failed to get directions');
-    return [];
+    throw new Error(`Failed to get directions: ${error.message}`);
   }
 
   // Format for context - include all relevant fields for domain agents
@@ -626,7 +657,7 @@ async function getAdAccountPrompts(userAccountId, adAccountId) {
 
   if (error) {
     logger.warn({ error: error.message }, 'Failed to get ad account prompts');
-    return null;
+    throw new Error(`Failed to get ad account prompts: ${error.message}`);
   }
 
   if (!data) return null;
@@ -838,7 +869,6 @@ export async function deleteConversation(conversationId, userAccountId) {
  * @deprecated Use memoryStore.getSpecs() directly
  */
 export async function getSpecs(userAccountId, accountId = null) {
-  const { memoryStore } = await import('./stores/memoryStore.js');
   return memoryStore.getSpecs(userAccountId, accountId);
 }
 
@@ -849,8 +879,8 @@ export async function getSpecs(userAccountId, accountId = null) {
  * @returns {Promise<Object>} { ads: [...], creative: [...], ... }
  */
 export async function getNotesDigest(userAccountId, accountId = null) {
-  const { memoryStore } = await import('./stores/memoryStore.js');
-  return memoryStore.getNotesDigest(userAccountId, accountId);
+  const allNotes = await getAgentNotes(userAccountId, accountId);
+  return memoryStore.buildNotesDigest(allNotes);
 }
 
 // ============================================================
@@ -867,39 +897,42 @@ export async function getNotesDigest(userAccountId, accountId = null) {
  */
 export async function getRecentBrainActions(userAccountId, adAccountId) {
   try {
-    const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000).toISOString();
-
-    let query = supabase
-      .from('brain_executions')
-      .select('actions_json, plan_json, created_at, status')
-      .eq('user_account_id', userAccountId)
-      .gte('created_at', threeDaysAgo)
-      .order('created_at', { ascending: false })
-      .limit(5);
+    return await loadBlock(null, 'brainActions', { userAccountId, adAccountId },
+      () => loadRecentBrainActions(userAccountId, adAccountId));
+  } catch (error) {
+    logger.warn({ error: error.message }, 'Error getting recent brain actions');
+    return [];
+  }
+}
 
-    // Фильтр по account_id ТОЛЬКО в multi-account режиме (см. MULTI_ACCOUNT_GUIDE.md)
-    if (await shouldFilterByAccountId(userAccountId, adAccountId)) {
-      query = query.eq('account_id', adAccountId);
-    }
+async function loadRecentBrainActions(userAccountId, adAccountId) {
+  const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000).toISOString();
 
-    const { data, error } = await query;
+  let query = supabase
+    .from('brain_executions')
+    .select('actions_json, plan_json, created_at, status')
+    .eq('user_account_id', userAccountId)
+    .gte('created_at', threeDaysAgo)
+    .order('created_at', { ascending: false })
+    .limit(5);
 
-    if (error) {
-      logger.warn({ error: error.message }, 'Failed to get brain executions');
-      return [];
-    }
+  // Фильтр по account_id ТОЛЬКО в multi-account режиме (см. MULTI_ACCOUNT_GUIDE.md)
+  if (await shouldFilterByAccountId(userAccountId, adAccountId)) {
+    query = query.eq('account_id', adAccountId);
+  }
 
-    if (!data?.length) {
-      return [];
-    }
+  const { data, error } = await query;
 
-    // Format using shared function from brainRules.js
-    return formatBrainActionsForNotes(data);
+  if (error) {
+    throw new Error(`Failed to get brain executions: ${error.message}`);
+  }
 
-  } catch (error) {
-    logger.warn({ error: error.message }, 'Error getting recent brain actions');
+  if (!data?.length) {
     return [];
   }
+
+  // Format using shared function from brainRules.js
+  return formatBrainActionsForNotes(data);
 }
 
 // ============================================================
@@ -917,65 +950,11 @@ export async function getRecentBrainActions(userAccountId, adAccountId) {
  */
 export async function getIntegrations(userAccountId, adAccountId, hasFbToken = false) {
   try {
-    const [leadsResult, purchasesResult, waResult, amoAdAccountResult, amoUserAccountResult] = await Promise.allSettled([
-      // Check CRM: has any leads?
-      supabase
-        .from('leads')
-        .select('id', { count: 'exact', head: true })
-        .eq('user_account_id', userAccountId)
-        .limit(1),
-      // Check ROI: has any purchases?
-      supabase
-        .from('purchases')
-        .select('id', { count: 'exact', head: true })
-        .eq('user_account_id', userAccountId)
-        .limit(1),
-      // Check WhatsApp: has active WhatsApp phone numbers?
-      supabase
-        .from('whatsapp_phone_numbers')
-        .select('id', { count: 'exact', head: true })
-        .eq('user_account_id', userAccountId)
-        .eq('is_active', true)
-        .limit(1),
-      // Check AmoCRM in ad_accounts (multi-account mode)
-      adAccountId
-        ? supabase
-            .from('ad_accounts')
-            .select('amocrm_access_token')
-            .eq('id', adAccountId)
-            .maybeSingle()
-        : Promise.resolve({ data: null }),
-      // Check AmoCRM in user_accounts (legacy mode)
-      supabase
-        .from('user_accounts')
-        .select('amocrm_access_token')
-        .eq('id', userAccountId)
-        .maybeSingle()
-    ]);
-
-    const hasCRM = leadsResult.status === 'fulfilled' &&
-      (leadsResult.value?.count > 0 || leadsResult.value?.data?.length > 0);
-
-    const hasROI = purchasesResult.status === 'fulfilled' &&
-      (purchasesResult.value?.count > 0 || purchasesResult.value?.data?.length > 0);
-
-    const hasWhatsApp = waResult.status === 'fulfilled' &&
-      (waResult.value?.count > 0 || waResult.value?.data?.length > 0);
+    // DB checks are cached (5 min); the FB flag comes from the caller's token
+    const flags = await loadBlock(null, 'integrations', { userAccountId, adAccountId },
+      () => loadIntegrationFlags(userAccountId, adAccountId));
 
-    // AmoCRM: check ad_accounts first, then fallback to user_accounts
-    const amoInAdAccount = amoAdAccountResult.status === 'fulfilled' &&
-      amoAdAccountResult.value?.data?.amocrm_access_token;
-    const amoInUserAccount = amoUserAccountResult.status === 'fulfilled' &&
-      amoUserAccountResult.value?.data?.amocrm_access_token;
-    const hasAmoCRM = !!(amoInAdAccount || amoInUserAccount);
-
-    return {
-      fb: hasFbToken,           // Facebook Ads connected
-      crm: hasCRM,              // Has leads data
-      roi: hasROI,              // Has purchases (for ROI calc)
-      whatsapp: hasWhatsApp,    // WhatsApp integration active
-      amocrm: hasAmoCRM         // AmoCRM integration active
-    };
+    return { fb: hasFbToken, ...flags };
 
   } catch (error) {
     logger.warn({ error: error.message }, 'Failed to check integrations');
@@ -989,6 +968,78 @@ export async function getIntegrations(userAccountId, adAccountId, hasFbToken = f
   }
 }
 
+/**
+ * Check CRM / ROI / WhatsApp / AmoCRM integrations in DB
+ * @returns {Promise<Object>} { crm, roi, whatsapp, amocrm }
+ */
+async function loadIntegrationFlags(userAccountId, adAccountId) {
+  const [leadsResult, purchasesResult, waResult, amoAdAccountResult, amoUserAccountResult] = await Promise.allSettled([
+    // Check CRM: has any leads?
+    supabase
+      .from('leads')
+      .select('id', { count: 'exact', head: true })
+      .eq('user_account_id', userAccountId)
+      .limit(1),
+    // Check ROI: has any purchases?
+    supabase
+      .from('purchases')
+      .select('id', { count: 'exact', head: true })
+      .eq('user_account_id', userAccountId)
+      .limit(1),
+    // Check WhatsApp: has active WhatsApp phone numbers?
+    supabase
+      .from('whatsapp_phone_numbers')
+      .select('id', { count: 'exact', head: true })
+      .eq('user_account_id', userAccountId)
+      .eq('is_active', true)
+      .limit(1),
+    // Check AmoCRM in ad_accounts (multi-account mode)
+    adAccountId
+      ? supabase
+          .from('ad_accounts')
+          .select('amocrm_access_token')
+          .eq('id', adAccountId)
+          .maybeSingle()
+      : Promise.resolve({ data: null }),
+    // Check AmoCRM in user_accounts (legacy mode)
+    supabase
+      .from('user_accounts')
+      .select('amocrm_access_token')
+      .eq('id', userAccountId)
+      .maybeSingle()
+  ]);
+
+  // Failed checks throw so partial flags are not cached; getIntegrations falls back to false
+  const failed = [leadsResult, purchasesResult, waResult, amoAdAccountResult, amoUserAccountResult]
+    .find(result => result.status === 'rejected' || result.value?.error);
+  if (failed) {
+    throw new Error(`Integration check failed: ${failed.reason?.message || failed.value?.error?.message}`);
+  }
+
+  const hasCRM = leadsResult.status === 'fulfilled' &&
+    (leadsResult.value?.count > 0 || leadsResult.value?.data?.length > 0);
+
+  const hasROI = purchasesResult.status === 'fulfilled' &&
+    (purchasesResult.value?.count > 0 || purchasesResult.value?.data?.length > 0);
+
+  const hasWhatsApp = waResult.status === 'fulfilled' &&
+    (waResult.value?.count > 0 || waResult.value?.data?.length > 0);
+
+  // AmoCRM: check ad_accounts first, then fallback to user_accounts
+  const amoInAdAccount = amoAdAccountResult.status === 'fulfilled' &&
+    amoAdAccountResult.value?.data?.amocrm_access_token;
+  const amoInUserAccount = amoUserAccountResult.status === 'fulfilled' &&
+    amoUserAccountResult.value?.data?.amocrm_access_token;
+  const hasAmoCRM = !!(amoInAdAccount || amoInUserAccount);
+
+  return {
+    crm: hasCRM,              // Has leads data
+    roi: hasROI,              // Has purchases (for ROI calc)
+    whatsapp: hasWhatsApp,    // WhatsApp integration active
+    amocrm: hasAmoCRM         // AmoCRM integration active
+  };
+}
+
 /**
  * Определить стек интеграций клиента
  * @param {Object} integrations - { fb, crm, roi, whatsapp }
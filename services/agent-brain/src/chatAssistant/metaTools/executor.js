@@ -12,6 +12,7 @@ import { supportHandlers } from '../agents/support/handlers.js';
 import { toolRegistry } from '../shared/toolRegistry.js';
 import { withTimeout } from '../shared/retryUtils.js';
 import { executeWithIdempotency } from '../shared/idempotentExecutor.js';
+import { invalidateContextForTool } from '../shared/contextCache.js';
 import { findTool, getDomainForTool } from './formatters.js';
 import { logger } from '../../lib/logger.js';
 
@@ -104,6 +105,11 @@ export async function executeToolByName(toolName, args, context) {
     const latency = Date.now() - startTime;
     logger.info({ tool: toolName, domain, latency, cached: result.already_applied || false }, 'Tool executed');
 
+    // Write tools make cached chat context stale (directions, snapshots, notes)
+    if (!result.dry_run) {
+      invalidateContextForTool(toolName, context?.userAccountId);
+    }
+
     // Add metadata to result
     return {
       ...result,
@@ -121,6 +127,9 @@ export async function executeToolByName(toolName, args, context) {
 
     logger.error({ tool: toolName, domain, error: error.message, latency, isTimeout }, 'Tool execution failed');
 
+    // Timed-out write may still have been applied
+    invalidateContextForTool(toolName, context?.userAccountId);
+
     return {
       success: false,
       error: isTimeout
@@ -0,0 +1,267 @@
+/**
+ * Context Cache for Chat Assistant
+ *
+ * Two layers in front of the context loaders (contextGatherer.js):
+ * - request scope — one load per block within a turn (e.g. agent notes for both
+ *   the notes snapshot and the manual-mode campaign mapping)
+ * - cross-request cache — short per-block TTL keyed by user + ad account,
+ *   so consecutive Telegram turns skip the Supabase round trips entirely
+ *
+ * Write tools invalidate the blocks they affect (invalidateContextForTool),
+ * agent notes are invalidated by memoryStore on every save.
+ * Concurrent loads of the same block share one in-flight promise; a load that
+ * started before an invalidation is returned to its caller but not stored.
+ * Loaders throw on query errors so only real results are cached — callers
+ * apply the fallback (empty block) outside loadBlock.
+ */
+
+import { logger } from '../../lib/logger.js';
+import { ADS_WRITE_TOOLS } from '../agents/ads/tools.js';
+import { CREATIVE_WRITE_TOOLS } from '../agents/creative/toolDefs.js';
+import { CRM_WRITE_TOOLS } from '../agents/crm/toolDefs.js';
+
+const CACHE_ENABLED = process.env.CHAT_CONTEXT_CACHE_ENABLED !== 'false';
+
+const SHORT_TTL = 60 * 1000;       // metrics, directions, notes — change during the day
+const LONG_TTL = 5 * 60 * 1000;    // profile, prompts, integrations — change rarely
+
+/**
+ * Cross-request TTL per block (0 = request scope only)
+ */
+const BLOCK_TTL_MS = {
+  businessProfile: LONG_TTL,
+  adAccountPrompts: LONG_TTL,
+  integrations: LONG_TTL,
+  directions: SHORT_TTL,
+  todayMetrics: SHORT_TTL,
+  activeContexts: SHORT_TTL,
+  agentNotes: SHORT_TTL,
+  adsSnapshot: SHORT_TTL,
+  directionsSnapshot: SHORT_TTL,
+  creativesSnapshot: SHORT_TTL,
+  brainActions: SHORT_TTL
+};
+
+// Upper bound on cached entries (oldest evicted first)
+const MAX_ENTRIES = 2000;
+
+/**
+ * Blocks affected by each group of write tools
+ */
+const ADS_BLOCKS = ['directions', 'directionsSnapshot', 'adsSnapshot', 'todayMetrics', 'brainActions'];
+
+const TOOL_INVALIDATIONS = [
+  {
+    tools: new Set(ADS_WRITE_TOOLS),
+    blocks: ADS_BLOCKS
+  },
+  // Ads tools that write but are not in ADS_WRITE_TOOLS:
+  // approveBrainActions executes brain proposals, aiLaunch creates/pauses ad sets via agent-service
+  {
+    tools: new Set(['approveBrainActions']),
+    blocks: ADS_BLOCKS
+  },
+  {
+    tools: new Set(['aiLaunch']),
+    blocks: [...ADS_BLOCKS, 'creativesSnapshot']
+  },
+  // Campaign mapping is stored in agent_notes (manual mode)
+  {
+    tools: new Set(['saveCampaignMapping']),
+    blocks: ['agentNotes']
+  },
+  {
+    tools: new Set(CREATIVE_WRITE_TOOLS),
+    blocks: ['creativesSnapshot', 'directionsSnapshot', 'adsSnapshot']
+  },
+  {
+    tools: new Set(CRM_WRITE_TOOLS),
+    blocks: ['integrations']
+  }
+];
+
+// key → { value, expires }
+const entries = new Map();
+// key → Promise (loads in progress)
+const inFlight = new Map();
+// userAccountId → generation, bumped on invalidation
+const generations = new Map();
+
+const stats = { hits: 0, misses: 0, shared: 0, invalidations: 0 };
+
+function cacheKey(block, userAccountId, adAccountId) {
+  return `${userAccountId}:${adAccountId || '-'}:${block}`;
+}
+
+function generationOf(userAccountId) {
+  return generations.get(userAccountId) || 0;
+}
+
+function store(key, value, ttl) {
+  if (entries.size >= MAX_ENTRIES) {
+    entries.delete(entries.keys().next().value);
+  }
+  entries.set(key, { value, expires: Date.now() + ttl });
+}
+
+/**
+ * Create a request scope for one assistant turn
+ * @param {Object} params
+ * @param {string} params.userAccountId
+ * @param {string} [params.adAccountId]
+ * @returns {Object} scope — pass to loadBlock(); scope.timings holds per-block latency
+ */
+export function createContextScope({ userAccountId, adAccountId }) {
+  return {
+    userAccountId,
+    adAccountId: adAccountId || null,
+    memo: new Map(),
+    timings: {}
+  };
+}
+
+/**
+ * Load a context block through the request scope and the cross-request cache
+ *
+ * @param {Object|null} scope - From createContextScope(); null = cross-request cache only
+ * @param {string} block - Block name (see BLOCK_TTL_MS)
+ * @param {Object} key
+ * @param {string} key.userAccountId
+ * @param {string} [key.adAccountId]
+ * @param {Function} loader - async () => value; throws on errors (a returned fallback would be cached)
+ * @returns {Promise<*>} Block value
+ */
+export function loadBlock(scope, block, { userAccountId, adAccountId }, loader) {
+  const key = cacheKey(block, userAccountId, adAccountId);
+
+  if (scope?.memo.has(key)) {
+    return scope.memo.get(key);
+  }
+
+  const startTime = Date.now();
+  const promise = resolveBlock(block, key, userAccountId, loader).then(({ value, source }) => {
+    if (scope) {
+      scope.timings[block] = { ms: Date.now() - startTime, source };
+    }
+    return value;
+  });
+
+  if (scope) {
+    scope.memo.set(key, promise);
+    // Failed loads are not memoized — next caller within the turn retries
+    promise.catch(() => scope.memo.delete(key));
+  }
+
+  return promise;
+}
+
+async function resolveBlock(block, key, userAccountId, loader) {
+  const ttl = CACHE_ENABLED ? (BLOCK_TTL_MS[block] || 0) : 0;
+
+  if (ttl > 0) {
+    const cached = entries.get(key);
+    if (cached && cached.expires > Date.now()) {
+      stats.hits++;
+      return { value: cached.value, source: 'cache' };
+    }
+    if (cached) entries.delete(key);
+
+    const pending = inFlight.get(key);
+    if (pending) {
+      stats.shared++;
+      return { value: await pending, source: 'shared' };
+    }
+  }
+
+  stats.misses++;
+  if (ttl === 0) {
+    return { value: await loader(), source: 'db' };
+  }
+
+  const generation = generationOf(userAccountId);
+  const pending = Promise.resolve().then(loader);
+  inFlight.set(key, pending);
+
+  try {
+    const value = await pending;
+    // Skip the store if the block was invalidated while loading
+    if (generationOf(userAccountId) === generation) {
+      store(key, value, ttl);
+    }
+    return { value, source: 'db' };
+  } finally {
+    if (inFlight.get(key) === pending) {
+      inFlight.delete(key);
+    }
+  }
+}
+
+/**
+ * Drop cached context blocks for a user (all ad accounts)
+ * @param {Object} params
+ * @param {string} params.userAccountId
+ * @param {string[]} [params.blocks] - Blocks to drop; omit to drop everything for the user
+ */
+export function invalidateContextCache({ userAccountId, blocks } = {}) {
+  if (!userAccountId) return;
+
+  generations.set(userAccountId, generationOf(userAccountId) + 1);
+
+  const prefix = `${userAccountId}:`;
+  const blockSet = blocks ? new Set(blocks) : null;
+  let removed = 0;
+
+  for (const key of entries.keys()) {
+    if (!key.startsWith(prefix)) continue;
+    if (blockSet && !blockSet.has(key.slice(key.lastIndexOf(':') + 1))) continue;
+    entries.delete(key);
+    removed++;
+  }
+
+  // In-flight loads for these blocks must not be reused by new callers
+  for (const key of inFlight.keys()) {
+    if (!key.startsWith(prefix)) continue;
+    if (blockSet && !blockSet.has(key.slice(key.lastIndexOf(':') + 1))) continue;
+    inFlight.delete(key);
+  }
+
+  stats.invalidations++;
+  logger.debug({ userAccountId, blocks: blocks || 'all', removed }, 'Context cache invalidated');
+}
+
+/**
+ * Invalidate blocks affected by a write tool (no-op for read tools)
+ * @param {string} toolName
+ * @param {string} userAccountId
+ */
+export function invalidateContextForTool(toolName, userAccountId) {
+  if (!userAccountId) return;
+
+  const blocks = new Set();
+  for (const group of TOOL_INVALIDATIONS) {
+    if (group.tools.has(toolName)) {
+      group.blocks.forEach(b => blocks.add(b));
+    }
+  }
+
+  if (blocks.size > 0) {
+    invalidateContextCache({ userAccountId, blocks: [...blocks] });
+  }
+}
+
+/**
+ * Cache counters since process start
+ * @returns {{ hits: number, misses: number, shared: number, invalidations: number, size: number }}
+ */
+export function getContextCacheStats() {
+  return { ...stats, size: entries.size };
+}
+
+/**
+ * Clear all cached context (tests)
+ */
+export function clearContextCache() {
+  entries.clear();
+  inFlight.clear();
+  generations.clear();
+}
@@ -0,0 +1,244 @@
+/**
+ * Batched Facebook Graph API fetch layer
+ *
+ * Replaces one-request-per-object loops with:
+ * - fbGraphBatch() — Graph `batch` requests (up to 50 sub-requests per HTTP call)
+ * - fetchAdLevelInsights() — account-level `level=ad` insights with `filtering` by ad.id,
+ *   falling back to batched `/{ad_id}/insights` when the account-level query is too
+ *   large or times out
+ *
+ * All HTTP calls go through fbGraph(), so they share its retry, circuit breaker
+ * and per-token concurrency budget.
+ */
+
+import { fbGraph } from './fbGraph.js';
+import { logger } from '../../lib/logger.js';
+
+// Graph API hard limit for sub-requests in one batch call
+const FB_BATCH_MAX = 50;
+
+// ad.id values per account-level insights query (keeps GET URL well under limits)
+const AD_FILTER_CHUNK = 100;
+
+const AD_INSIGHTS_PAGE_LIMIT = 500;
+
+/**
+ * Split array into chunks
+ * @private
+ */
+function chunk(items, size) {
+  const chunks = [];
+  for (let i = 0; i < items.length; i += size) {
+    chunks.push(items.slice(i, i + size));
+  }
+  return chunks;
+}
+
+/**
+ * Build relative URL for a batch sub-request
+ * @private
+ */
+function buildRelativeUrl(path, params = {}) {
+  const usp = new URLSearchParams();
+  for (const [k, v] of Object.entries(params)) {
+    if (v !== undefined && v !== null) {
+      usp.set(k, typeof v === 'object' ? JSON.stringify(v) : String(v));
+    }
+  }
+  const qs = usp.toString();
+  return qs ? `${path}?${qs}` : path;
+}
+
+/**
+ * Execute GET requests via Graph `batch` endpoint
+ *
+ * @param {Array<{path: string, params?: object}>} requests - Sub-requests (relative paths)
+ * @param {string} accessToken - Facebook access token
+ * @param {object} options - Passed through to fbGraph (timeout, maxRetries, ...)
+ * @returns {Promise<Array<{ok: boolean, status: number, body: object|null, error?: object}>>}
+ *   Results in the same order as requests
+ */
+export async function fbGraphBatch(requests, accessToken, options = {}) {
+  if (!requests || requests.length === 0) return [];
+
+  const chunks = chunk(requests, FB_BATCH_MAX);
+
+  // Chunks run in parallel; fbGraph's per-token budget bounds actual concurrency
+  const chunkResults = await Promise.all(chunks.map(async (part) => {
+    const batch = part.map(req => ({
+      method: 'GET',
+      relative_url: buildRelativeUrl(req.path, req.params)
+    }));
+
+    const response = await fbGraph('POST', '', accessToken, { batch, include_headers: false }, options);
+
+    return (response || []).map(item => {
+      if (!item) {
+        // Graph returns null for sub-requests that timed out inside the batch
+        return { ok: false, status: 0, body: null, error: { message: 'Batch sub-request timed out' } };
+      }
+      let body = null;
+      try {
+        body = item.body ? JSON.parse(item.body) : null;
+      } catch {
+        body = null;
+      }
+      const ok = item.code >= 200 && item.code < 300;
+      return ok
+        ? { ok, status: item.code, body }
+        : { ok, status: item.code, body, error: body?.error || { message: `HTTP ${item.code}` } };
+    });
+  }));
+
+  return chunkResults.flat();
+}
+
+/**
+ * Build time params for insights requests
+ * @private
+ */
+function insightsTimeParams({ date_preset, time_range } = {}) {
+  if (time_range) return { time_range };
+  return { date_preset: date_preset || 'last_7d' };
+}
+
+/**
+ * Load all pages of account-level ad insights for a chunk of ad IDs
+ * @private
+ */
+async function fetchAccountAdInsightsChunk(normalizedAccountId, accessToken, adIds, fields, timeParams, graphOptions) {
+  const rows = [];
+  let after;
+
+  do {
+    const json = await fbGraph('GET', `${normalizedAccountId}/insights`, accessToken, {
+      level: 'ad',
+      fields,
+      filtering: [{ field: 'ad.id', operator: 'IN', value: adIds }],
+      limit: AD_INSIGHTS_PAGE_LIMIT,
+      after,
+      ...timeParams
+    }, graphOptions);
+
+    rows.push(...(json?.data || []));
+    after = json?.paging?.next ? json?.paging?.cursors?.after : undefined;
+  } while (after);
+
+  return rows;
+}
+
+/**
+ * Account-level query failed because of its size (FB "reduce the amount of data",
+ * code 1/2, 5xx) or a timeout — smaller per-ad requests can still succeed.
+ * Auth/permission/validation errors would fail the same way per ad, so they are
+ * not retried through the batch path (and don't add failures to the circuit breaker).
+ * @private
+ */
+function isOversizeOrTimeoutError(error) {
+  const code = error?.fbError?.code;
+  const message = (error?.message || '').toLowerCase();
+
+  return code === 1 ||
+    code === 2 ||
+    (error?.status >= 500) ||
+    message.includes('reduce the amount of data') ||
+    message.includes('timed out') ||
+    message.includes('timeout');
+}
+
+/**
+ * Fallback: per-ad insights through Graph batch requests
+ * @private
+ */
+async function fetchAdInsightsViaBatch(accessToken, adIds, fields, timeParams, graphOptions) {
+  const results = await fbGraphBatch(
+    adIds.map(adId => ({ path: `${adId}/insights`, params: { fields, ...timeParams } })),
+    accessToken,
+    graphOptions
+  );
+
+  const rows = [];
+  results.forEach((res, idx) => {
+    const row = res.ok ? res.body?.data?.[0] : null;
+    if (row) {
+      rows.push({ ...row, ad_id: row.ad_id || adIds[idx] });
+    } else if (!res.ok && res.status !== 400) {
+      // 400 = ad без показов или удалён, это нормально
+      logger.warn({
+        where: 'fetchAdLevelInsights',
+        ad_id: adIds[idx],
+        status: res.status,
+        error: res.error?.message
+      }, 'Batch sub-request for ad insights failed');
+    }
+  });
+  return rows;
+}
+
+/**
+ * Fetch insights for many ads with a few HTTP round trips
+ *
+ * Uses `{act}/insights?level=ad&filtering=[ad.id IN ...]`, one query per
+ * AD_FILTER_CHUNK ads (paginated). If an account-level query for a chunk is too
+ * large or times out, that chunk is re-fetched via Graph batch of `/{ad_id}/insights`;
+ * other errors (auth, permissions, circuit open) are thrown.
+ *
+ * @param {string} adAccountId - Ad account ID (act_xxx or numeric)
+ * @param {string} accessToken - Facebook access token
+ * @param {string[]} adIds - Ad IDs
+ * @param {object} options - { fields, date_preset, time_range, version }
+ *   - version: Graph API version, passed to fbGraph (defaults to its FB_API_VERSION)
+ * @returns {Promise<Map<string, object>>} ad_id -> insights row (ads without data are absent)
+ */
+export async function fetchAdLevelInsights(adAccountId, accessToken, adIds, options = {}) {
+  const uniqueIds = [...new Set((adIds || []).filter(Boolean).map(String))];
+  const result = new Map();
+  if (uniqueIds.length === 0) return result;
+
+  const id = String(adAccountId || '').trim();
+  const normalizedAccountId = id.startsWith('act_') ? id : `act_${id}`;
+
+  // ad_id нужен в ответе для сопоставления строк
+  const requested = (options.fields || 'impressions,spend').split(',').map(f => f.trim());
+  const fields = [...new Set(['ad_id', ...requested])].join(',');
+  const timeParams = insightsTimeParams(options);
+  const graphOptions = options.version ? { version: options.version } : {};
+
+  const started = Date.now();
+  let fallbackChunks = 0;
+
+  const chunkRows = await Promise.all(chunk(uniqueIds, AD_FILTER_CHUNK).map(async (ids) => {
+    try {
+      return await fetchAccountAdInsightsChunk(normalizedAccountId, accessToken, ids, fields, timeParams, graphOptions);
+    } catch (error) {
+      if (error.isCircuitOpen || !isOversizeOrTimeoutError(error)) throw error;
+      fallbackChunks++;
+      logger.warn({
+        where: 'fetchAdLevelInsights',
+        ad_account_id: normalizedAccountId,
+        ads_in_chunk: ids.length,
+        error: error.message
+      }, 'Account-level ad insights failed, falling back to batch requests');
+      return fetchAdInsightsViaBatch(accessToken, ids, fields, timeParams, graphOptions);
+    }
+  }));
+
+  for (const rows of chunkRows) {
+    for (const row of rows) {
+      if (row?.ad_id) result.set(String(row.ad_id), row);
+    }
+  }
+
+  logger.debug({
+    where: 'fetchAdLevelInsights',
+    ad_account_id: normalizedAccountId,
+    ads_requested: uniqueIds.length,
+    ads_with_data: result.size,
+    fallback_chunks: fallbackChunks,
+    duration_ms: Date.now() - started
+  }, 'Fetched ad-level insights');
+
+  return result;
+}
+
+export default fetchAdLevelInsights;
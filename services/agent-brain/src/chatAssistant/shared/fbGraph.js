@@ -3,6 +3,7 @@
  * Shared across all agents that need Facebook API access
  */
 
+import crypto from 'crypto';
 import { withRetry, isRetryableError } from './retryUtils.js';
 import { withCircuitBreaker, CircuitOpenError } from './circuitBreaker.js';
 import { logger } from '../../lib/logger.js';
@@ -15,6 +16,87 @@ const DEFAULT_MAX_RETRIES = 2;
 // Circuit breaker name for Facebook API
 const FB_CIRCUIT_NAME = 'facebook-graph-api';
 
+// Max in-flight Graph requests per access token (shared by fbGraph and fbGraphBatch)
+const FB_TOKEN_CONCURRENCY = Math.max(1, parseInt(process.env.FB_TOKEN_CONCURRENCY || '4', 10) || 4);
+
+// Long-timeout calls (video uploads) have a separate pool so they never hold regular slots
+const FB_TOKEN_UPLOAD_CONCURRENCY = Math.max(1, parseInt(process.env.FB_TOKEN_UPLOAD_CONCURRENCY || '2', 10) || 2);
+
+const POOL_LIMITS = {
+  default: FB_TOKEN_CONCURRENCY,
+  upload: FB_TOKEN_UPLOAD_CONCURRENCY
+};
+
+// pool:tokenKey -> { active, queue }
+const tokenBudgets = new Map();
+
+/**
+ * Stable key for a token (raw tokens are not kept in memory as map keys)
+ * @private
+ */
+function tokenKey(accessToken) {
+  return crypto.createHash('sha1').update(String(accessToken || '')).digest('hex').slice(0, 16);
+}
+
+/**
+ * Run fn within the per-token concurrency budget.
+ * Requests over the limit wait in FIFO order until a slot is released.
+ * @param {string} accessToken - Facebook access token
+ * @param {Function} fn - Async function to execute (one HTTP attempt)
+ * @param {object} options - { pool: 'default' | 'upload' }
+ * @returns {Promise<any>}
+ */
+export async function withTokenBudget(accessToken, fn, { pool = 'default' } = {}) {
+  const limit = POOL_LIMITS[pool] || FB_TOKEN_CONCURRENCY;
+  const key = `${pool}:${tokenKey(accessToken)}`;
+  let budget = tokenBudgets.get(key);
+  if (!budget) {
+    budget = { active: 0, queue: [] };
+    tokenBudgets.set(key, budget);
+  }
+
+  if (budget.active >= limit) {
+    // Slot is handed over by the releasing request, active stays the same
+    await new Promise(resolve => budget.queue.push(resolve));
+  } else {
+    budget.active++;
+  }
+
+  try {
+    return await fn();
+  } finally {
+    const next = budget.queue.shift();
+    if (next) {
+      next();
+    } else {
+      budget.active--;
+      if (budget.active === 0) {
+        tokenBudgets.delete(key);
+      }
+    }
+  }
+}
+
+/**
+ * Current per-token budget usage (for monitoring)
+ * @returns {{ limit: number, uploadLimit: number, tokens: number, active: number, queued: number }}
+ */
+export function getTokenBudgetStats() {
+  let active = 0;
+  let queued = 0;
+  for (const budget of tokenBudgets.values()) {
+    active += budget.active;
+    queued += budget.queue.length;
+  }
+  return {
+    limit: FB_TOKEN_CONCURRENCY,
+    uploadLimit: FB_TOKEN_UPLOAD_CONCURRENCY,
+    tokens: tokenBudgets.size,
+    active,
+    queued
+  };
+}
+
 /**
  * Check if Facebook error is retryable
  * @param {Error} error
@@ -35,13 +117,17 @@ function isFbRetryable(error) {
 }
 
 /**
- * Execute a Facebook Graph API call with circuit breaker and retry
+ * Execute a Facebook Graph API call with circuit breaker and retry.
+ * Each HTTP attempt holds a per-token budget slot (FB_TOKEN_CONCURRENCY);
+ * backoff sleeps between retries don't. Long-timeout calls use the separate
+ * upload pool (FB_TOKEN_UPLOAD_CONCURRENCY).
  * @param {string} method - HTTP method (GET, POST, DELETE)
  * @param {string} path - API path (e.g., 'act_123/campaigns')
  * @param {string} accessToken - Facebook access token
  * @param {object} params - Query/body parameters
- * @param {object} options - { timeout, longTimeout, maxRetries, skipCircuitBreaker }
+ * @param {object} options - { timeout, longTimeout, maxRetries, skipCircuitBreaker, version }
  *   - longTimeout: Set to true for video uploads (uses 10 minute timeout)
+ *   - version: Graph API version (e.g. 'v23.0'), defaults to FB_API_VERSION
  * @returns {Promise<object>} API response
  */
 export async function fbGraph(method, path, accessToken, params = {}, options = {}) {
@@ -49,7 +135,8 @@ export async function fbGraph(method, path, accessToken, params = {}, options =
     timeout = DEFAULT_TIMEOUT,
     longTimeout = false,
     maxRetries = DEFAULT_MAX_RETRIES,
-    skipCircuitBreaker = false
+    skipCircuitBreaker = false,
+    version = FB_API_VERSION
   } = options;
 
   // Use long timeout for video operations (10 minutes instead of 25 seconds)
@@ -59,12 +146,18 @@ export async function fbGraph(method, path, accessToken, params = {}, options =
   const pathSegment = path.split('/')[0] || path;
   const operationName = `fb:${method}:${pathSegment}`;
 
-  // Inner function: retry with backoff
+  const pool = longTimeout ? 'upload' : 'default';
+
+  // Inner function: retry with backoff; the timeout starts once the budget slot is taken
   const retryableFn = () => withRetry(
-    () => fbGraphInternal(method, path, accessToken, params),
+    () => withTokenBudget(
+      accessToken,
+      () => fbGraphAttempt(method, path, accessToken, params, effectiveTimeout, operationName, version),
+      { pool }
+    ),
     {
       maxRetries,
-      timeoutMs: effectiveTimeout,
+      timeoutMs: 0,
       operationName,
       shouldRetry: isFbRetryable
     }
@@ -75,6 +168,35 @@ export async function fbGraph(method, path, accessToken, params = {}, options =
     return retryableFn();
   }
 
+  return fbGraphWithCircuit(retryableFn, path);
+}
+
+/**
+ * Single HTTP attempt with timeout; the request is aborted on timeout,
+ * so the budget slot is released together with the connection
+ * @private
+ */
+async function fbGraphAttempt(method, path, accessToken, params, timeoutMs, operationName, version) {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), timeoutMs);
+
+  try {
+    return await fbGraphInternal(method, path, accessToken, params, controller.signal, version);
+  } catch (error) {
+    if (controller.signal.aborted) {
+      throw new Error(`${operationName} timed out after ${timeoutMs}ms`);
+    }
+    throw error;
+  } finally {
+    clearTimeout(timer);
+  }
+}
+
+/**
+ * Run retryable Graph call through the shared Facebook circuit breaker
+ * @private
+ */
+async function fbGraphWithCircuit(retryableFn, path) {
   try {
     return await withCircuitBreaker(FB_CIRCUIT_NAME, retryableFn, {
       failureThreshold: 5,
@@ -107,7 +229,7 @@ export async function fbGraph(method, path, accessToken, params = {}, options =
  * Internal Facebook Graph API call (without retry)
  * @private
  */
-async function fbGraphInternal(method, path, accessToken, params = {}) {
+async function fbGraphInternal(method, path, accessToken, params = {}, signal, version = FB_API_VERSION) {
   const usp = new URLSearchParams();
   usp.set('access_token', accessToken);
 
@@ -119,13 +241,14 @@ async function fbGraphInternal(method, path, accessToken, params = {}) {
   }
 
   const url = method === 'GET'
-    ? `https://graph.facebook.com/${FB_API_VERSION}/${path}?${usp.toString()}`
-    : `https://graph.facebook.com/${FB_API_VERSION}/${path}`;
+    ? `https://graph.facebook.com/${version}/${path}?${usp.toString()}`
+    : `https://graph.facebook.com/${version}/${path}`;
 
   const res = await fetch(url, {
     method,
     headers: { 'content-type': 'application/x-www-form-urlencoded' },
     body: method === 'GET' ? undefined : usp.toString(),
+    signal
   });
 
   const json = await res.json();
@@ -2,7 +2,8 @@
  * Shared utilities for Chat Assistant agents
  */
 
-export { fbGraph } from './fbGraph.js';
+export { fbGraph, withTokenBudget, getTokenBudgetStats } from './fbGraph.js';
+export { fbGraphBatch, fetchAdLevelInsights } from './fbBatch.js';
 export { getDateRange, formatDate, parsePeriod } from './dateUtils.js';
 export { formatSpecsContext, formatNotesContext, formatDomainNotes } from './memoryFormat.js';
 export { resolveContext, resolveContextAsync, getUserMode } from './resolveContext.js';
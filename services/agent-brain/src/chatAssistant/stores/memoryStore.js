@@ -6,6 +6,7 @@
 import { supabase } from '../../lib/supabaseClient.js';
 import { logger } from '../../lib/logger.js';
 import { v4 as uuidv4 } from 'uuid';
+import { invalidateContextCache } from '../shared/contextCache.js';
 
 const MAX_NOTES_PER_DOMAIN = 20;
 const DOMAINS = ['ads', 'creative', 'whatsapp', 'crm'];
@@ -103,9 +104,11 @@ export class MemoryStore {
    * Get all agent notes for user/account
    * @param {string} userAccountId
    * @param {string|null} accountId
+   * @param {Object} [options]
+   * @param {boolean} [options.throwOnError] - Throw instead of returning empty notes (cached loads)
    * @returns {Promise<Object>} { ads: { notes: [...] }, creative: {...}, ... }
    */
-  async getAllNotes(userAccountId, accountId = null) {
+  async getAllNotes(userAccountId, accountId = null, { throwOnError = false } = {}) {
     let query = supabase
       .from('user_briefing_responses')
       .select('agent_notes')
@@ -121,6 +124,7 @@ export class MemoryStore {
 
     if (error) {
       logger.warn({ error: error.message, userAccountId }, 'Failed to get agent notes');
+      if (throwOnError) throw new Error(`Failed to get agent notes: ${error.message}`);
       return this._emptyNotes();
     }
 
@@ -150,12 +154,24 @@ export class MemoryStore {
    */
   async getNotesDigest(userAccountId, accountId, domains = DOMAINS, maxPerDomain = 10) {
     const allNotes = await this.getAllNotes(userAccountId, accountId);
+    return this.buildNotesDigest(allNotes, domains, maxPerDomain);
+  }
+
+  /**
+   * Build notes digest from already loaded notes (see getAllNotes)
+   * Does not mutate allNotes — it may be shared through the context cache
+   * @param {Object} allNotes - { ads: { notes: [...] }, ... }
+   * @param {string[]} domains
+   * @param {number} maxPerDomain
+   * @returns {Object} { ads: [...], creative: [...], ... }
+   */
+  buildNotesDigest(allNotes, domains = DOMAINS, maxPerDomain = 10) {
     const digest = {};
 
     for (const domain of domains) {
-      const notes = allNotes[domain]?.notes || [];
+      const notes = allNotes?.[domain]?.notes || [];
       // Sort by importance desc, then by date desc
-      const sorted = notes
+      const sorted = [...notes]
         .sort((a, b) => {
           if (b.importance !== a.importance) return b.importance - a.importance;
           return new Date(b.created_at) - new Date(a.created_at);
@@ -356,6 +372,8 @@ export class MemoryStore {
       logger.error({ error: error.message, userAccountId }, 'Failed to save agent notes');
       throw error;
     }
+
+    invalidateContextCache({ userAccountId, blocks: ['agentNotes'] });
   }
 }
 
@@ -7,6 +7,7 @@ import { supabase, supabaseQuery } from '../lib/supabaseClient.js';
 import { logger } from '../lib/logger.js';
 import { logErrorToAdmin } from '../lib/errorLogger.js';
 import { shouldFilterByAccountId } from '../lib/multiAccountHelper.js';
+import { invalidateContextForTool } from './shared/contextCache.js';
 
 const FB_API_VERSION = process.env.FB_API_VERSION || 'v20.0';
 const AGENT_SERVICE_URL = process.env.AGENT_SERVICE_URL || 'http://localhost:8082';
@@ -732,6 +733,7 @@ export async function executeTool(toolName, params, context) {
     logger.info({ tool: toolName, params }, 'Executing chat tool');
     const result = await handler(params, context);
     logger.info({ tool: toolName, success: true }, 'Tool executed successfully');
+    invalidateContextForTool(toolName, context?.userAccountId);
     return result;
   } catch (error) {
     logger.error({ tool: toolName, error: error.message }, 'Tool execution failed');
@@ -0,0 +1,337 @@
+/**
+ * Планировщик batch-задач agent-brain (daily/hourly batch).
+ *
+ * Вместо фиксированных срезов по BATCH_CONCURRENCY + sleep между ними:
+ * - задачи поступают потоком (массив или async iterable) в общую очередь;
+ * - пул воркеров берёт следующую задачу, как только освобождается слот —
+ *   медленный аккаунт занимает один слот, а не весь срез;
+ * - приоритеты: задача с большим priority берётся раньше (при равенстве — FIFO);
+ *   массив задач ставится в очередь целиком до старта воркеров, для async
+ *   iterable приоритет действует среди уже поступивших задач;
+ * - rate budget: не больше budgetLimit задач одновременно на один budgetKey
+ *   (Facebook app), остальные задачи того же app ждут в очереди;
+ * - таймаут на задачу: по истечении worker получает abort через signal, но слот
+ *   и budget остаются занятыми, пока задача фактически не завершится, —
+ *   иначе зависшая задача продолжала бы работать сверх лимитов конкурентности;
+ * - checkpoint: уже выполненные сегодня задачи пропускаются после рестарта;
+ * - для каждой задачи фиксируются queueWaitMs и runMs.
+ */
+
+import { logger } from './logger.js';
+
+const DEFAULT_TASK_TIMEOUT_MS = 10 * 60 * 1000; // 10 минут на аккаунт
+
+/**
+ * Выполнить worker с дедлайном
+ *
+ * Promise.race не отменяет задачу, поэтому по дедлайну задаче отправляется
+ * abort через signal (worker проверяет его перед побочными эффектами),
+ * а результат возвращается только после её фактического завершения.
+ * @private
+ * @returns {Promise<{ value?: *, error?: Error, timeoutError: Error|null }>}
+ */
+async function runWithDeadline(fn, timeoutMs, onDeadline) {
+  const controller = new AbortController();
+  let timeoutError = null;
+  let timer = null;
+
+  if (timeoutMs && timeoutMs > 0) {
+    timer = setTimeout(() => {
+      timeoutError = new Error(`Task timed out after ${timeoutMs}ms`);
+      timeoutError.isTaskTimeout = true;
+      controller.abort(timeoutError);
+      onDeadline(timeoutError);
+    }, timeoutMs);
+  }
+
+  try {
+    const value = await fn(controller.signal);
+    return { value, timeoutError };
+  } catch (error) {
+    return { error, timeoutError };
+  } finally {
+    clearTimeout(timer);
+  }
+}
+
+/**
+ * Перцентиль по отсортированному массиву
+ * @private
+ */
+function percentile(sorted, p) {
+  if (sorted.length === 0) return 0;
+  const idx = Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1);
+  return sorted[Math.max(0, idx)];
+}
+
+/**
+ * Запустить задачи через bounded worker pool
+ *
+ * @param {Array|AsyncIterable} tasks - Задачи (можно async generator — обработка начнётся до окончания загрузки)
+ * @param {Function} worker - async (task, { signal }) => result; result.success === false считается неуспехом.
+ *   signal срабатывает по taskTimeoutMs — worker должен проверять его перед побочными эффектами
+ * @param {Object} options
+ * @param {number} [options.concurrency=5] - Размер пула воркеров
+ * @param {Function} [options.taskKey] - (task) => string, уникальный ключ задачи (для checkpoint и метрик)
+ * @param {Function} [options.priority] - (task) => number, больше = раньше
+ * @param {Function} [options.budgetKey] - (task) => string, ключ rate budget (Facebook app)
+ * @param {number} [options.budgetLimit] - Максимум одновременных задач на budgetKey (по умолчанию = concurrency)
+ * @param {number} [options.taskTimeoutMs] - Таймаут одной задачи
+ * @param {Object} [options.checkpoint] - { load(): Promise<Set<string>>, save(key, record): Promise<void> }
+ * @param {Function} [options.onTimeout] - (task, err) => result, результат для задачи, упавшей по таймауту/исключению.
+ *   Если задача после дедлайна всё же завершилась, в результат идёт её собственный ответ с timedOut: true
+ * @param {string} [options.where='batchScheduler'] - Метка для логов
+ * @returns {Promise<{ results: Array, stats: Object }>}
+ */
+export async function runBatchScheduler(tasks, worker, options = {}) {
+  const {
+    concurrency = 5,
+    taskKey = (task, seq) => String(seq),
+    priority = () => 0,
+    budgetKey = () => 'default',
+    budgetLimit,
+    taskTimeoutMs = DEFAULT_TASK_TIMEOUT_MS,
+    checkpoint = null,
+    onTimeout = (task, err) => ({ success: false, error: String(err?.message || err) }),
+    where = 'batchScheduler'
+  } = options;
+
+  const poolSize = Math.max(1, Number(concurrency) || 1);
+  const perBudget = Math.max(1, Number(budgetLimit) || poolSize);
+  const batchStart = Date.now();
+
+  // Задачи, уже выполненные до рестарта
+  let completedKeys = new Set();
+  if (checkpoint) {
+    try {
+      completedKeys = await checkpoint.load();
+    } catch (err) {
+      logger.warn({ where, phase: 'checkpoint_load_failed', error: String(err) });
+    }
+  }
+
+  const queue = [];          // { task, key, priority, budget, seq, enqueuedAt }
+  const activeByBudget = new Map();
+  const results = [];
+  const timings = [];
+  let producerDone = false;
+  let producerError = null;
+  let skipped = 0;
+  let timedOut = 0;
+  let seq = 0;
+
+  // Воркеры, ожидающие новую задачу или освобождение budget
+  let wakeups = [];
+  const wakeAll = () => {
+    const pending = wakeups;
+    wakeups = [];
+    pending.forEach(resolve => resolve());
+  };
+  const waitForChange = () => new Promise(resolve => wakeups.push(resolve));
+
+  const enqueue = (task) => {
+    const currentSeq = seq++;
+    const key = taskKey(task, currentSeq);
+    if (completedKeys.has(key)) {
+      skipped++;
+      return;
+    }
+    queue.push({
+      task,
+      key,
+      priority: Number(priority(task)) || 0,
+      budget: budgetKey(task),
+      seq: currentSeq,
+      enqueuedAt: Date.now()
+    });
+  };
+
+  const isStream = typeof tasks?.[Symbol.asyncIterator] === 'function';
+
+  // Массив ставим в очередь целиком до старта воркеров — иначе первая задача
+  // уходит в работу раньше, чем появятся более приоритетные
+  if (!isStream) {
+    try {
+      for (const task of tasks) enqueue(task);
+    } catch (err) {
+      producerError = err;
+      logger.error({ where, phase: 'task_producer_failed', error: String(err) });
+    }
+    producerDone = true;
+  }
+
+  // Producer: читает async iterable потоком и кладёт в очередь
+  const producer = isStream ? (async () => {
+    try {
+      for await (const task of tasks) {
+        enqueue(task);
+        wakeAll();
+      }
+    } catch (err) {
+      producerError = err;
+      logger.error({ where, phase: 'task_producer_failed', error: String(err) });
+    } finally {
+      producerDone = true;
+      wakeAll();
+    }
+  })() : Promise.resolve();
+
+  // Следующая задача: максимальный приоритет среди тех, чей budget не исчерпан
+  const takeNext = () => {
+    let bestIdx = -1;
+    for (let i = 0; i < queue.length; i++) {
+      const item = queue[i];
+      if ((activeByBudget.get(item.budget) || 0) >= perBudget) continue;
+      if (bestIdx === -1 ||
+          item.priority > queue[bestIdx].priority ||
+          (item.priority === queue[bestIdx].priority && item.seq < queue[bestIdx].seq)) {
+        bestIdx = i;
+      }
+    }
+    return bestIdx === -1 ? null : queue.splice(bestIdx, 1)[0];
+  };
+
+  const runItem = async (item) => {
+    const startedAt = Date.now();
+    const queueWaitMs = startedAt - item.enqueuedAt;
+    activeByBudget.set(item.budget, (activeByBudget.get(item.budget) || 0) + 1);
+
+    // Слот и budget освобождаются только после фактического завершения задачи
+    const outcome = await runWithDeadline(
+      signal => worker(item.task, { signal }),
+      taskTimeoutMs,
+      (err) => {
+        timedOut++;
+        logger.error({
+          where,
+          phase: 'task_timeout',
+          taskKey: item.key,
+          error: err.message
+        });
+      }
+    );
+
+    const left = (activeByBudget.get(item.budget) || 1) - 1;
+    if (left > 0) activeByBudget.set(item.budget, left);
+    else activeByBudget.delete(item.budget);
+
+    let result;
+    if ('error' in outcome) {
+      if (!outcome.timeoutError) {
+        logger.error({
+          where,
+          phase: 'task_failed',
+          taskKey: item.key,
+          error: String(outcome.error?.message || outcome.error)
+        });
+      }
+      result = onTimeout(item.task, outcome.timeoutError || outcome.error);
+    } else {
+      result = outcome.value;
+    }
+    if (outcome.timeoutError) {
+      result = { ...result, timedOut: true };
+    }
+
+    const runMs = Date.now() - startedAt;
+    const enriched = { ...result, queueWaitMs, runMs };
+    results.push(enriched);
+    timings.push({ key: item.key, queueWaitMs, runMs });
+
+    logger.info({
+      where,
+      phase: 'task_completed',
+      taskKey: item.key,
+      success: enriched.success !== false,
+      queueWaitMs,
+      runMs,
+      queued: queue.length
+    });
+
+    if (checkpoint && enriched.success !== false) {
+      try {
+        await checkpoint.save(item.key, { queueWaitMs, runMs, result: enriched });
+      } catch (err) {
+        logger.warn({ where, phase: 'checkpoint_save_failed', taskKey: item.key, error: String(err) });
+      }
+    }
+
+    wakeAll();
+  };
+
+  const workerLoop = async () => {
+    while (true) {
+      const item = takeNext();
+      if (item) {
+        await runItem(item);
+        continue;
+      }
+      if (producerDone && queue.length === 0) return;
+      await waitForChange();
+    }
+  };
+
+  await Promise.all([producer, ...Array.from({ length: poolSize }, workerLoop)]);
+
+  const waits = timings.map(t => t.queueWaitMs).sort((a, b) => a - b);
+  const runs = timings.map(t => t.runMs).sort((a, b) => a - b);
+  const stats = {
+    total: results.length,
+    skipped,
+    timedOut,
+    wallMs: Date.now() - batchStart,
+    queueWaitP50Ms: percentile(waits, 50),
+    queueWaitP95Ms: percentile(waits, 95),
+    runP50Ms: percentile(runs, 50),
+    runP95Ms: percentile(runs, 95),
+    runMaxMs: runs.length ? runs[runs.length - 1] : 0,
+    producerError: producerError ? String(producerError) : undefined
+  };
+
+  logger.info({ where, phase: 'scheduler_completed', concurrency: poolSize, budgetLimit: perBudget, ...stats });
+
+  return { results, stats, timings };
+}
+
+/**
+ * Checkpoint в таблице batch_checkpoints (см. migrations/260_batch_checkpoints.sql)
+ *
+ * @param {Object} supabase - Supabase client
+ * @param {string} batchKey - Идентификатор batch (например 'daily_batch' или 'hourly_batch_5')
+ * @param {Object} [options]
+ * @param {boolean} [options.resume=true] - false = не пропускать выполненные задачи (ручной перезапуск), только записывать
+ * @param {string} [options.executionDate] - Дата выполнения YYYY-MM-DD (по умолчанию сегодня UTC)
+ */
+export function createSupabaseCheckpoint(supabase, batchKey, options = {}) {
+  const {
+    resume = true,
+    executionDate = new Date().toISOString().split('T')[0]
+  } = options;
+
+  return {
+    async load() {
+      if (!resume) return new Set();
+      const { data, error } = await supabase
+        .from('batch_checkpoints')
+        .select('task_key')
+        .eq('batch_key', batchKey)
+        .eq('execution_date', executionDate);
+      if (error) throw error;
+      return new Set((data || []).map(row => row.task_key));
+    },
+
+    async save(taskKey, { queueWaitMs, runMs }) {
+      const { error } = await supabase
+        .from('batch_checkpoints')
+        .upsert({
+          batch_key: batchKey,
+          execution_date: executionDate,
+          task_key: taskKey,
+          queue_wait_ms: queueWaitMs,
+          run_ms: runMs,
+          completed_at: new Date().toISOString()
+        }, { onConflict: 'batch_key,execution_date,task_key' });
+      if (error) throw error;
+    }
+  };
+}
@@ -0,0 +1,383 @@
+/**
+ * Daily batch agent-brain: выборка пользователей, разворот по ad_accounts
+ * и запуск brain run для каждого аккаунта через batchScheduler.
+ *
+ * Вынесено из server.js, чтобы batch можно было вызвать без Fastify и cron:
+ * server.js (processDailyBatch) добавляет leader lock и сохранение результатов,
+ * scripts/bench/replay.mjs гоняет тот же код поверх replay Graph API и
+ * in-memory Supabase. Опции приоритетов/rate budget/таймаутов общие
+ * с hourly batch (brainBatchSchedulerOptions).
+ */
+
+import { logger } from './logger.js';
+import { supabase, supabaseQuery } from './supabaseClient.js';
+import { runBatchScheduler, createSupabaseCheckpoint } from './batchScheduler.js';
+
+// Эндпоинт brain run этого же процесса (server.js)
+export const BRAIN_RUN_URL = 'http://localhost:7080/api/brain/run';
+
+const BATCH_TASK_TIMEOUT_MS = Number(process.env.BRAIN_BATCH_TASK_TIMEOUT_MS || '600000'); // 10 минут на аккаунт
+// Лимит одновременных задач на один Facebook app (0 = равен BRAIN_BATCH_CONCURRENCY)
+const BATCH_APP_CONCURRENCY = Number(process.env.BRAIN_BATCH_APP_CONCURRENCY || '0');
+// Пользователей в одном запросе ad_accounts (.in по user_account_id) при развороте daily batch
+const DAILY_BATCH_USERS_PER_QUERY = 200;
+
+/**
+ * Приоритет задачи batch: autopilot-аккаунты первыми, затем оплаченные тарифы
+ */
+export function batchTaskPriority(task) {
+  const today = new Date().toISOString().split('T')[0];
+  const isAutopilot = task.brain_mode ? task.brain_mode === 'autopilot' : task.autopilot !== false;
+  const isPaying = !!task.tarif_expires && String(task.tarif_expires).slice(0, 10) >= today;
+  return (isAutopilot ? 2 : 0) + (isPaying ? 1 : 0);
+}
+
+/**
+ * Ключ rate budget: все аккаунты ходят в Graph API через один Facebook app (FB_APP_ID)
+ */
+export function batchTaskBudgetKey(task) {
+  return task.fb_app_id || process.env.FB_APP_ID || 'default';
+}
+
+/**
+ * Общие опции планировщика для brain batch (daily и hourly)
+ * @param {Object} [options]
+ * @param {boolean} [options.resume=true] - пропускать задачи, уже выполненные сегодня
+ * @param {Object} [options.supabase] - клиент Supabase для checkpoint
+ */
+export function brainBatchSchedulerOptions(where, batchKey, taskKey, onTimeout, { resume = true, supabase: db = supabase } = {}) {
+  const concurrency = Number(process.env.BRAIN_BATCH_CONCURRENCY || '5');
+  return {
+    where,
+    concurrency,
+    budgetLimit: BATCH_APP_CONCURRENCY || concurrency,
+    budgetKey: batchTaskBudgetKey,
+    priority: batchTaskPriority,
+    taskTimeoutMs: BATCH_TASK_TIMEOUT_MS,
+    taskKey,
+    onTimeout,
+    checkpoint: db ? createSupabaseCheckpoint(db, batchKey, { resume }) : null
+  };
+}
+
+/**
+ * Получить всех активных пользователей из Supabase
+ *
+ * ВАЖНО: Для мультиаккаунтного режима НЕ проверяем user_accounts.autopilot!
+ * Вместо этого проверка autopilot происходит в processDailyBatch по ad_accounts.autopilot
+ *
+ * - Legacy пользователи: multi_account_enabled = false/null, autopilot = true
+ * - Мультиаккаунтные: multi_account_enabled = true (autopilot проверяется в processDailyBatch)
+ * @param {Object} [options]
+ * @param {Object} [options.supabase] - клиент Supabase (по умолчанию общий из supabaseClient.js)
+ */
+export async function getActiveUsers({ supabase: db = supabase } = {}) {
+  try {
+    // 1. Legacy пользователи (multi_account_enabled = false/null)
+    // Включаем всех активных — autopilot определяет режим (dispatch или report)
+    const legacyUsers = await supabaseQuery('user_accounts_legacy',
+      async () => await db
+        .from('user_accounts')
+        .select('id, username, telegram_id, telegram_id_2, telegram_id_3, telegram_id_4, telegram_bot_token, account_timezone, multi_account_enabled, ad_account_id, autopilot, autopilot_tiktok, tiktok_access_token, tiktok_business_id, tiktok_account_id, tarif_expires')
+        .eq('is_active', true)
+        .eq('optimization', 'agent2')
+        .or('multi_account_enabled.eq.false,multi_account_enabled.is.null')
+        .is('account_timezone', null),  // timezone-aware legacy юзеры → hourly schedule batch
+      { where: 'getActiveUsers_legacy' }
+    );
+
+    // Multi-account пользователи обрабатываются ТОЛЬКО через schedule batch (getAccountsForCurrentHour)
+    // Legacy с account_timezone → через hourly schedule batch (getLegacyUsersForCurrentHour)
+    // Legacy batch — только для пользователей без multi_account_enabled и без account_timezone
+    const allUsers = legacyUsers || [];
+
+    logger.info({
+      where: 'getActiveUsers',
+      legacyCount: legacyUsers?.length || 0,
+      totalCount: allUsers.length,
+      filter: 'legacy only: multi_account_enabled=false/null, account_timezone=null (timezone-aware → hourly schedule batch)'
+    });
+
+    return allUsers;
+  } catch (err) {
+    logger.error({ where: 'getActiveUsers', err: String(err) });
+    return [];
+  }
+}
+
+/**
+ * Обработать одного пользователя: собрать данные, выполнить действия, отправить отчет
+ * Для мультиаккаунтного режима user.accountId содержит UUID из ad_accounts.id
+ * signal — abort от batch-планировщика по таймауту (см. batchScheduler.js)
+ */
+export async function processUser(user, { signal } = {}) {
+  const startTime = Date.now();
+  const accountId = user.accountId || null;  // UUID из ad_accounts.id или null для legacy
+
+  // Определяем режим: autopilot=true → dispatch, иначе → только отчёт
+  // Для multi-account режим определяется в processAccountBrain по brain_mode
+  const isAutopilot = user.autopilot !== false;
+  const inputs = isAutopilot
+    ? { dispatch: true }
+    : { dispatch: false, sendReport: true };
+
+  logger.info({
+    where: 'processUser',
+    userId: user.id,
+    username: user.username,
+    accountId: accountId || 'legacy',
+    accountName: user.accountName || null,
+    mode: isAutopilot ? 'autopilot' : 'report',
+    status: 'started'
+  });
+
+  try {
+    // Задача уже снята планировщиком по таймауту — не запускаем brain run с dispatch
+    signal?.throwIfAborted();
+
+    // Вызываем основной эндпоинт /api/brain/run
+    // Передаём accountId для мультиаккаунтного режима.
+    // По таймауту запрос прерывается: /api/brain/run видит закрытое соединение
+    // и не отправляет действия и отчёт, а слот планировщика освобождается сразу
+    const response = await fetch(BRAIN_RUN_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        userAccountId: user.id,
+        accountId: accountId,  // UUID из ad_accounts.id для мультиаккаунтности
+        inputs
+      }),
+      signal
+    });
+
+    if (!response.ok) {
+      throw new Error(`Brain run failed: ${response.status}`);
+    }
+
+    const result = await response.json();
+
+    // Telegram уже отправлен внутри /api/brain/run, не дублируем отправку
+    // (telegramSent уже есть в result)
+
+    const duration = Date.now() - startTime;
+    logger.info({
+      where: 'processUser',
+      userId: user.id,
+      username: user.username,
+      accountId: accountId || 'legacy',
+      status: 'completed',
+      duration,
+      actionsCount: result.actions?.length || 0,
+      dispatched: result.dispatched,
+      telegramSent: result.telegramSent || false
+    });
+
+    return {
+      userId: user.id,
+      username: user.username,
+      accountId: accountId,
+      success: true,
+      actionsCount: result.actions?.length || 0,
+      telegramSent: result.telegramSent || false,
+      duration
+    };
+  } catch (err) {
+    const duration = Date.now() - startTime;
+    logger.error({
+      where: 'processUser',
+      userId: user.id,
+      username: user.username,
+      accountId: accountId || 'legacy',
+      status: 'failed',
+      duration,
+      error: String(err?.message || err)
+    });
+
+    return {
+      userId: user.id,
+      username: user.username,
+      accountId: accountId,
+      success: false,
+      error: String(err?.message || err),
+      duration
+    };
+  }
+}
+
+/**
+ * Развернуть пользователей daily batch в задачи: для multi_account_enabled —
+ * отдельная задача на каждый ad_account с автопилотом, для legacy — одна задача.
+ * ad_accounts всех мультиаккаунтных пользователей загружаются одним запросом
+ * (порциями по DAILY_BATCH_USERS_PER_QUERY), поэтому планировщик получает
+ * весь список задач сразу и приоритеты действуют на весь batch.
+ * @param {Array<Object>} users - из getActiveUsers()
+ * @param {Object} [options]
+ * @param {Object} [options.supabase] - клиент Supabase
+ * @returns {Promise<Array<Object>>}
+ */
+export async function expandDailyBatchTasks(users, { supabase: db = supabase } = {}) {
+  const multiAccountUsers = users.filter(user => user.multi_account_enabled);
+  const adAccountsByUser = new Map();
+  const failedUserIds = new Set();
+
+  for (let i = 0; i < multiAccountUsers.length; i += DAILY_BATCH_USERS_PER_QUERY) {
+    const userIds = multiAccountUsers.slice(i, i + DAILY_BATCH_USERS_PER_QUERY).map(user => user.id);
+
+    // Загружаем только активные ad_accounts с включённым автопилотом
+    const { data: adAccounts, error: adAccountsError } = await db
+      .from('ad_accounts')
+      .select('id, user_account_id, ad_account_id, name, autopilot, default_cpl_target_cents, plan_daily_budget_cents, tarif_expires')
+      .in('user_account_id', userIds)
+      .eq('is_active', true)
+      .eq('autopilot', true);  // ← КРИТИЧНО: только аккаунты с включённым автопилотом!
+
+    if (adAccountsError) {
+      logger.error({
+        where: 'processDailyBatch',
+        phase: 'load_ad_accounts',
+        userIds,
+        error: String(adAccountsError)
+      });
+      // Пропускаем пользователей, для которых не удалось загрузить аккаунты
+      userIds.forEach(id => failedUserIds.add(id));
+      continue;
+    }
+
+    for (const adAccount of adAccounts || []) {
+      const list = adAccountsByUser.get(adAccount.user_account_id) || [];
+      list.push(adAccount);
+      adAccountsByUser.set(adAccount.user_account_id, list);
+    }
+  }
+
+  const tasks = [];
+  for (const user of users) {
+    if (user.multi_account_enabled) {
+      if (failedUserIds.has(user.id)) continue;
+
+      const adAccounts = adAccountsByUser.get(user.id) || [];
+      if (adAccounts.length === 0) {
+        logger.info({
+          where: 'processDailyBatch',
+          phase: 'no_autopilot_accounts',
+          userId: user.id,
+          username: user.username,
+          message: 'Multi-account user has no ad_accounts with autopilot=true'
+        });
+        continue;
+      }
+
+      // Создаём отдельную задачу для каждого ad_account
+      for (const adAccount of adAccounts) {
+        // telegram_id берём из user (user_accounts) — shared, верхний уровень
+        const hasTelegramIds = !!(user.telegram_id || user.telegram_id_2 || user.telegram_id_3 || user.telegram_id_4);
+
+        logger.info({
+          where: 'processDailyBatch',
+          phase: 'expand_ad_account',
+          userId: user.id,
+          username: user.username,
+          accountId: adAccount.id,
+          accountName: adAccount.name || adAccount.ad_account_id,
+          hasTelegramIds,
+          telegramIdCount: [user.telegram_id, user.telegram_id_2, user.telegram_id_3, user.telegram_id_4].filter(Boolean).length,
+          defaultCplCents: adAccount.default_cpl_target_cents || null,
+          planBudgetCents: adAccount.plan_daily_budget_cents || null,
+          autopilot: adAccount.autopilot
+        });
+
+        tasks.push({
+          ...user,
+          accountId: adAccount.id,  // UUID из ad_accounts.id
+          accountName: adAccount.name || adAccount.ad_account_id,
+          // telegram_id остаётся из ...user (user_accounts, shared)
+          // Добавляем CPL и budget из ad_accounts
+          default_cpl_target_cents: adAccount.default_cpl_target_cents,
+          plan_daily_budget_cents: adAccount.plan_daily_budget_cents,
+          tarif_expires: adAccount.tarif_expires ?? user.tarif_expires
+        });
+      }
+
+      logger.info({
+        where: 'processDailyBatch',
+        phase: 'expanded_multi_account_complete',
+        userId: user.id,
+        username: user.username,
+        adAccountsCount: adAccounts.length,
+        accountNames: adAccounts.map(a => a.name || a.ad_account_id),
+        accountIds: adAccounts.map(a => a.id)
+      });
+    } else {
+      // Legacy режим: один пользователь = одна задача
+      logger.info({
+        where: 'processDailyBatch',
+        phase: 'expand_legacy_user',
+        userId: user.id,
+        username: user.username,
+        mode: 'legacy',
+        hasTelegramIds: !!(user.telegram_id || user.telegram_id_2 || user.telegram_id_3 || user.telegram_id_4),
+        telegramIdCount: [user.telegram_id, user.telegram_id_2, user.telegram_id_3, user.telegram_id_4].filter(Boolean).length
+      });
+
+      tasks.push({
+        ...user,
+        accountId: null,  // NULL для legacy режима
+        accountName: null
+      });
+    }
+  }
+
+  return tasks;
+}
+
+/**
+ * Daily batch без leader lock: пользователи → задачи по аккаунтам → пул воркеров
+ * с приоритетами, rate budget, таймаутом и checkpoint (см. batchScheduler.js)
+ * @param {Object} [options]
+ * @param {boolean} [options.resume=true] - пропускать задачи, уже выполненные сегодня (после падения/рестарта)
+ * @param {Object} [options.supabase] - клиент Supabase (по умолчанию общий из supabaseClient.js)
+ * @returns {Promise<{ usersCount: number, tasksCount: number, results: Array<Object>, scheduler: Object|null }>}
+ */
+export async function runDailyBatch({ resume = true, supabase: db = supabase } = {}) {
+  const users = await getActiveUsers({ supabase: db });
+
+  if (users.length === 0) {
+    logger.info({ where: 'processDailyBatch', status: 'no_active_users' });
+    return { usersCount: 0, tasksCount: 0, results: [], scheduler: null };
+  }
+
+  logger.info({ where: 'processDailyBatch', usersCount: users.length });
+
+  // ========================================
+  // Мультиаккаунтность: разворачиваем пользователей по ad_accounts
+  // ========================================
+  const tasks = await expandDailyBatchTasks(users, { supabase: db });
+
+  // Пул воркеров с приоритетами, rate budget, таймаутом и checkpoint (см. batchScheduler.js)
+  const { results, stats: schedulerStats } = await runBatchScheduler(
+    tasks,
+    (user, { signal }) => processUser(user, { signal }),
+    brainBatchSchedulerOptions(
+      'processDailyBatch',
+      'daily_batch',
+      user => user.accountId ? `account:${user.accountId}` : `user:${user.id}`,
+      (user, err) => ({
+        userId: user.id,
+        username: user.username,
+        accountId: user.accountId || null,
+        success: false,
+        error: String(err?.message || err)
+      }),
+      { resume, supabase: db }
+    )
+  );
+
+  logger.info({
+    where: 'processDailyBatch',
+    originalUsersCount: users.length,
+    expandedTasksCount: tasks.length,
+    ...schedulerStats
+  });
+
+  return { usersCount: users.length, tasksCount: tasks.length, results, scheduler: schedulerStats };
+}
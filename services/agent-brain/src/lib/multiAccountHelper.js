@@ -21,6 +21,8 @@ import { supabase } from './supabaseClient.js';
 // Кэш для multi_account_enabled (TTL 5 минут)
 const cache = new Map();
 const CACHE_TTL_MS = 5 * 60 * 1000; // 5 минут
+// Запросы в процессе — параллельные загрузчики контекста ждут один запрос к БД
+const inFlight = new Map();
 
 /**
  * Проверяет, включён ли режим мультиаккаунтности для пользователя.
@@ -37,6 +39,21 @@ export async function isMultiAccountEnabled(userAccountId) {
     return cached.value;
   }
 
+  const pending = inFlight.get(userAccountId);
+  if (pending) {
+    return pending;
+  }
+
+  const request = fetchMultiAccountEnabled(userAccountId);
+  inFlight.set(userAccountId, request);
+  try {
+    return await request;
+  } finally {
+    inFlight.delete(userAccountId);
+  }
+}
+
+async function fetchMultiAccountEnabled(userAccountId) {
   try {
     const { data, error } = await supabase
       .from('user_accounts')
@@ -50,7 +67,7 @@ export async function isMultiAccountEnabled(userAccountId) {
     }
 
     const enabled = !!data?.multi_account_enabled;
-    cache.set(userAccountId, { value: enabled, expires: now + CACHE_TTL_MS });
+    cache.set(userAccountId, { value: enabled, expires: Date.now() + CACHE_TTL_MS });
     return enabled;
   } catch (e) {
     console.error('[multiAccountHelper] Exception:', e);
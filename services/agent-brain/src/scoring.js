@@ -23,6 +23,7 @@ import {
   computeHealthScoreForAdset
 } from './chatAssistant/shared/brainRules.js';
 import { buildBrainPrompt } from './brainPrompt.js';
+import { fetchAdLevelInsights } from './chatAssistant/shared/fbBatch.js';
 
 const FB_API_VERSION = 'v23.0';
 
@@ -653,55 +654,11 @@ function normalizeAdAccountId(adAccountId) {
   return id.startsWith('act_') ? id : `act_${id}`;
 }
 
-/**
- * Fetch insights для конкретного Facebook Ad
- * Используется для получения метрик на уровне Ad (не AdSet)
- */
-async function fetchAdInsights(adAccountId, accessToken, adId, datePresetOrRange = 'last_7d') {
-  const url = `https://graph.facebook.com/${FB_API_VERSION}/${adId}/insights`;
-  const params = new URLSearchParams({
-    fields: 'impressions,reach,spend,clicks,actions,ctr,cpm,frequency,quality_ranking,engagement_rate_ranking,conversion_rate_ranking,video_play_actions,video_avg_time_watched_actions,video_p25_watched_actions,video_p50_watched_actions,video_p75_watched_actions,video_p95_watched_actions',
-    access_token: accessToken
-  });
+// Поля insights на уровне Ad (для fetchAdLevelInsights)
+const AD_INSIGHTS_FIELDS = 'impressions,reach,spend,clicks,actions,ctr,cpm,frequency,quality_ranking,engagement_rate_ranking,conversion_rate_ranking,video_play_actions,video_avg_time_watched_actions,video_p25_watched_actions,video_p50_watched_actions,video_p75_watched_actions,video_p95_watched_actions';
 
-  // Поддержка как строки date_preset, так и объекта с time_range
-  if (typeof datePresetOrRange === 'string') {
-    params.set('date_preset', datePresetOrRange);
-  } else if (datePresetOrRange && datePresetOrRange.time_range) {
-    params.set('time_range', JSON.stringify(datePresetOrRange.time_range));
-  } else {
-    // fallback на default
-    params.set('date_preset', 'last_7d');
-  }
-
-  try {
-    const res = await fetch(`${url}?${params.toString()}`);
-    if (!res.ok) {
-      if (res.status === 400) {
-        // Ad не имеет показов или удален
-        return null;
-      }
-      const err = await res.text();
-      logger.warn({ 
-        where: 'fetchAdInsights',
-        ad_id: adId,
-        status: res.status,
-        error: err
-      }, 'Failed to fetch ad insights');
-      return null;
-    }
-
-    const json = await res.json();
-    return json.data?.[0] || null;
-  } catch (error) {
-    logger.warn({ 
-      where: 'fetchAdInsights',
-      ad_id: adId,
-      error: error.message
-    }, 'Error fetching ad insights');
-    return null;
-  }
-}
+// Сколько user_creative_id передавать в одном .in() запросе к ad_creative_mapping
+const MAPPING_QUERY_CHUNK = 200;
 
 /**
  * Извлечь лиды сайта из actions (fb_pixel_lead с fallback на custom)
@@ -1277,7 +1234,7 @@ async function fetchAdsInsights(adAccountId, accessToken, maxRetries = 2) {
  * @param {Object} options.thresholds - Пороги из AD_EATER_THRESHOLDS
  * @returns {Array} Массив "пожирателей" с причинами и приоритетом
  */
-function analyzeAdsForEaters(adsInsights, options = {}) {
+export function analyzeAdsForEaters(adsInsights, options = {}) {
   const {
     targetCPL,
     adsetSpendMap,
@@ -1459,7 +1416,7 @@ function analyzeAdsForEaters(adsInsights, options = {}) {
  * @param {Array} actionsData - агрегированные actions
  * @param {Map} campaignObjectives - Map<campaign_id, objective>
  */
-function calculateMultiPeriodTrends(dailyData, actionsData = [], campaignObjectives = new Map()) {
+export function calculateMultiPeriodTrends(dailyData, actionsData = [], campaignObjectives = new Map()) {
   // Группируем по adset_id
   const byAdset = new Map();
   
@@ -2047,6 +2004,8 @@ async function saveMetricsSnapshot(supabase, userAccountId, adsets, accountUUID
  * Получает метрики на уровне Ad (не AdSet) для каждого креатива
  * Использует ad_creative_mapping для точного мэтчинга
  * Собирает инкрементальные данные за вчерашний день
+ * Insights для всех ads грузятся через fetchAdLevelInsights (account-level level=ad
+ * с filtering по ad.id, fallback на Graph batch) — десятки запросов вместо сотен
  *
  * @param {Object} supabase - Supabase client
  * @param {string} userAccountId - ID пользователя
@@ -2080,160 +2039,161 @@ export async function saveCreativeMetricsToHistory(supabase, userAccountId, read
     date: yesterdayStr
   }, 'Starting to save creative metrics to history');
 
-  for (const creative of readyCreatives) {
-    try {
-      // Получить список ads через ad_creative_mapping
-      // КРИТИЧНО: Фильтрация по account_id для мультиаккаунтности
-      const filterMode = accountUUID ? 'multi_account' : 'legacy';
-
-      let mappingsQuery = supabase
-        .from('ad_creative_mapping')
-        .select('ad_id, adset_id, campaign_id, fb_creative_id')
-        .eq('user_creative_id', creative.id);
+  // ============================================
+  // ШАГ 1: ad_creative_mapping для всех креативов (чанками, а не по одному запросу на креатив)
+  // ============================================
+  // КРИТИЧНО: Фильтрация по account_id для мультиаккаунтности
+  const filterMode = accountUUID ? 'multi_account' : 'legacy';
+  const creativeIds = readyCreatives.map(c => c.id).filter(Boolean);
+  const mappings = [];
 
-      if (accountUUID) {
-        mappingsQuery = mappingsQuery.eq('account_id', accountUUID);
-      } else {
-        mappingsQuery = mappingsQuery.is('account_id', null);
-      }
+  for (let i = 0; i < creativeIds.length; i += MAPPING_QUERY_CHUNK) {
+    const idsChunk = creativeIds.slice(i, i + MAPPING_QUERY_CHUNK);
 
-      logger.debug({
-        where: 'saveCreativeMetricsToHistory',
-        creative_id: creative.id,
-        accountUUID,
-        filterMode
-      }, `Загрузка ad_creative_mapping в режиме ${filterMode}`);
-
-      const { data: mappings, error } = await mappingsQuery;
+    let mappingsQuery = supabase
+      .from('ad_creative_mapping')
+      .select('ad_id, adset_id, campaign_id, fb_creative_id, user_creative_id')
+      .in('user_creative_id', idsChunk);
 
-      if (error) {
-        logger.warn({ 
-          where: 'saveCreativeMetricsToHistory',
-          creative_id: creative.id,
-          error: error.message 
-        }, 'Failed to fetch ad mappings');
-        continue;
-      }
+    if (accountUUID) {
+      mappingsQuery = mappingsQuery.eq('account_id', accountUUID);
+    } else {
+      mappingsQuery = mappingsQuery.is('account_id', null);
+    }
 
-      if (!mappings || mappings.length === 0) {
-        logger.debug({ 
-          where: 'saveCreativeMetricsToHistory',
-          creative_id: creative.id 
-        }, 'No ad mappings found for creative');
-        continue;
-      }
+    const { data, error } = await mappingsQuery;
 
-      logger.debug({ 
+    if (error) {
+      logger.warn({ 
         where: 'saveCreativeMetricsToHistory',
-        creative_id: creative.id,
-        ads_count: mappings.length 
-      }, 'Found ad mappings');
-
-      // Получить метрики для каждого ad за вчерашний день
-      for (const mapping of mappings) {
-        try {
-          const insights = await fetchAdInsights(adAccountId, accessToken, mapping.ad_id, {
-            time_range: {
-              since: yesterdayStr,
-              until: yesterdayStr
-            }
-          });
-          
-          if (!insights) {
-            logger.debug({ 
-              where: 'saveCreativeMetricsToHistory',
-              ad_id: mapping.ad_id,
-              date: yesterdayStr
-            }, 'No insights for ad');
-            continue;
-          }
+        creatives_in_chunk: idsChunk.length,
+        filterMode,
+        error: error.message 
+      }, 'Failed to fetch ad mappings');
+      continue;
+    }
 
-          // Пропускаем если нет показов (ad не показывался вчера)
-          const impressions = parseInt(insights.impressions || 0);
-          if (impressions === 0) {
-            logger.debug({ 
-              where: 'saveCreativeMetricsToHistory',
-              ad_id: mapping.ad_id,
-              date: yesterdayStr
-            }, 'No impressions, skipping');
-            continue;
-          }
+    mappings.push(...(data || []));
+  }
 
-          // Извлекаем метрики
-          const leads = extractLeads(insights.actions);
-          const linkClicks = extractLinkClicks(insights.actions);
-          const spend = parseFloat(insights.spend || 0);
-          const videoMetrics = extractVideoMetrics(insights);
-          
-          // Вычисляем CPL (если есть лиды)
-          const cpl = leads > 0 ? (spend / leads) : null;
-
-          records.push({
-            user_account_id: userAccountId,
-            account_id: accountUUID || null,  // UUID для мультиаккаунтности, NULL для legacy
-            // user_creative_id заполнится автоматически через триггер на основе ad_id
-            date: yesterdayStr,  // Вчерашний день
-            ad_id: mapping.ad_id,
-            creative_id: mapping.fb_creative_id,
-            adset_id: mapping.adset_id,
-            campaign_id: mapping.campaign_id,
-            platform: 'facebook',  // Для уникального индекса
-
-            // Абсолютные метрики
-            impressions: impressions,
-            reach: parseInt(insights.reach || 0),
-            spend: spend,
-            clicks: parseInt(insights.clicks || 0),
-            link_clicks: linkClicks,
-            leads: leads,
-
-            // Вычисляемые метрики (сохраняем сразу)
-            ctr: parseFloat(insights.ctr || 0),
-            cpm: parseFloat(insights.cpm || 0),
-            cpl: cpl,
-            frequency: parseFloat(insights.frequency || 0),
-
-            // Видео метрики
-            video_views: videoMetrics.video_views,
-            video_views_25_percent: videoMetrics.video_views_25_percent,
-            video_views_50_percent: videoMetrics.video_views_50_percent,
-            video_views_75_percent: videoMetrics.video_views_75_percent,
-            video_views_95_percent: videoMetrics.video_views_95_percent,
-            video_avg_watch_time_sec: videoMetrics.video_avg_watch_time_sec,
-
-            // Diagnostics (на уровне ad)
-            quality_ranking: insights.quality_ranking || null,
-            engagement_rate_ranking: insights.engagement_rate_ranking || null,
-            conversion_rate_ranking: insights.conversion_rate_ranking || null,
-
-            source: 'production'
-          });
+  logger.debug({ 
+    where: 'saveCreativeMetricsToHistory',
+    creatives_count: creativeIds.length,
+    ads_count: mappings.length,
+    accountUUID,
+    filterMode
+  }, `Загружены ad_creative_mapping в режиме ${filterMode}`);
 
-          logger.debug({ 
-            where: 'saveCreativeMetricsToHistory',
-            ad_id: mapping.ad_id,
-            date: yesterdayStr,
-            impressions: impressions,
-            leads: leads 
-          }, 'Collected metrics for ad');
-
-        } catch (err) {
-          logger.warn({ 
-            where: 'saveCreativeMetricsToHistory',
-            ad_id: mapping.ad_id,
-            error: err.message 
-          }, 'Failed to fetch ad insights');
+  // ============================================
+  // ШАГ 2: insights для всех ads за день — account-level level=ad (batch fallback)
+  // ============================================
+  let insightsByAd = new Map();
+  if (mappings.length > 0) {
+    try {
+      insightsByAd = await fetchAdLevelInsights(
+        adAccountId,
+        accessToken,
+        mappings.map(m => m.ad_id),
+        {
+          fields: AD_INSIGHTS_FIELDS,
+          time_range: { since: yesterdayStr, until: yesterdayStr },
+          version: FB_API_VERSION
         }
-      }
+      );
     } catch (err) {
       logger.warn({ 
         where: 'saveCreativeMetricsToHistory',
-        creative_id: creative.id,
+        ads_count: mappings.length,
         error: err.message 
-      }, 'Failed to process creative');
+      }, 'Failed to fetch ad insights');
     }
   }
 
+  // ============================================
+  // ШАГ 3: записи для creative_metrics_history
+  // ============================================
+  for (const mapping of mappings) {
+    const insights = insightsByAd.get(String(mapping.ad_id));
+
+    if (!insights) {
+      logger.debug({ 
+        where: 'saveCreativeMetricsToHistory',
+        ad_id: mapping.ad_id,
+        date: yesterdayStr
+      }, 'No insights for ad');
+      continue;
+    }
+
+    // Пропускаем если нет показов (ad не показывался вчера)
+    const impressions = parseInt(insights.impressions || 0);
+    if (impressions === 0) {
+      logger.debug({ 
+        where: 'saveCreativeMetricsToHistory',
+        ad_id: mapping.ad_id,
+        date: yesterdayStr
+      }, 'No impressions, skipping');
+      continue;
+    }
+
+    // Извлекаем метрики
+    const leads = extractLeads(insights.actions);
+    const linkClicks = extractLinkClicks(insights.actions);
+    const spend = parseFloat(insights.spend || 0);
+    const videoMetrics = extractVideoMetrics(insights);
+    
+    // Вычисляем CPL (если есть лиды)
+    const cpl = leads > 0 ? (spend / leads) : null;
+
+    records.push({
+      user_account_id: userAccountId,
+      account_id: accountUUID || null,  // UUID для мультиаккаунтности, NULL для legacy
+      // user_creative_id заполнится автоматически через триггер на основе ad_id
+      date: yesterdayStr,  // Вчерашний день
+      ad_id: mapping.ad_id,
+      creative_id: mapping.fb_creative_id,
+      adset_id: mapping.adset_id,
+      campaign_id: mapping.campaign_id,
+      platform: 'facebook',  // Для уникального индекса
+
+      // Абсолютные метрики
+      impressions: impressions,
+      reach: parseInt(insights.reach || 0),
+      spend: spend,
+      clicks: parseInt(insights.clicks || 0),
+      link_clicks: linkClicks,
+      leads: leads,
+
+      // Вычисляемые метрики (сохраняем сразу)
+      ctr: parseFloat(insights.ctr || 0),
+      cpm: parseFloat(insights.cpm || 0),
+      cpl: cpl,
+      frequency: parseFloat(insights.frequency || 0),
+
+      // Видео метрики
+      video_views: videoMetrics.video_views,
+      video_views_25_percent: videoMetrics.video_views_25_percent,
+      video_views_50_percent: videoMetrics.video_views_50_percent,
+      video_views_75_percent: videoMetrics.video_views_75_percent,
+      video_views_95_percent: videoMetrics.video_views_95_percent,
+      video_avg_watch_time_sec: videoMetrics.video_avg_watch_time_sec,
+
+      // Diagnostics (на уровне ad)
+      quality_ranking: insights.quality_ranking || null,
+      engagement_rate_ranking: insights.engagement_rate_ranking || null,
+      conversion_rate_ranking: insights.conversion_rate_ranking || null,
+
+      source: 'production'
+    });
+  }
+
+  logger.debug({ 
+    where: 'saveCreativeMetricsToHistory',
+    date: yesterdayStr,
+    ads_requested: mappings.length,
+    ads_with_insights: insightsByAd.size,
+    records: records.length
+  }, 'Collected metrics for ads');
+
   // Сохраняем все записи одним batch запросом
   if (records.length > 0) {
     try {
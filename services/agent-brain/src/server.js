@@ -21,6 +21,13 @@ import { getUsdToKzt, convertUsdToKzt } from './chatAssistant/shared/currencyRat
 import { collectTikTokMetricsForDays } from './tiktokMetricsCollector.js';
 import { collectTikTokLeads } from './tiktokLeadsCollector.js';
 import { uploadVideoToFacebook } from './lib/videoUpload.js';
+import { runBatchScheduler } from './lib/batchScheduler.js';
+import {
+  getActiveUsers,
+  processUser,
+  brainBatchSchedulerOptions,
+  runDailyBatch
+} from './lib/dailyBatch.js';
 
 // Основной бот для отправки отчётов клиентам и в мониторинг
 const TELEGRAM_BOT_TOKEN = process.env.TELEGRAM_BOT_TOKEN;
@@ -3372,6 +3379,11 @@ fastify.post('/api/brain/run', async (request, reply) => {
   let userAccountId = null;
   let accountId = null;
   let inputs = null;
+  // Клиент закрыл соединение до ответа (processUser прервал запрос по таймауту batch)
+  let clientAborted = false;
+  reply.raw.once('close', () => {
+    if (!reply.raw.writableFinished) clientAborted = true;
+  });
   try {
     const { idempotencyKey, userAccountId: reqUserAccountId, accountId: reqAccountId, inputs: reqInputs } = request.body || {};
     userAccountId = reqUserAccountId || null;
@@ -3970,7 +3982,8 @@ fastify.post('/api/brain/run', async (request, reply) => {
         ? inputs.sendReport 
         : (inputs?.dispatch === true);
       
-      if (shouldSendTelegram && ua.telegram_id) {
+      // clientAborted: задача batch снята по таймауту — отчёт не отправляем
+      if (shouldSendTelegram && ua.telegram_id && !clientAborted) {
         try {
           const clientResult = await sendToMultipleTelegramIds(ua, reportText);
           telegramSent = clientResult.success;
@@ -4409,6 +4422,18 @@ fastify.post('/api/brain/run', async (request, reply) => {
     let agentResponse = null;
     let dispatchFailed = false;
 
+    // Задача batch снята по таймауту — действия и отчёт не отправляем
+    if (clientAborted) {
+      fastify.log.warn({
+        where: 'brain_run_client_aborted',
+        userAccountId,
+        accountId,
+        actions_count: actions?.length || 0,
+        duration: Date.now() - started
+      }, 'Client aborted brain run before dispatch, skipping actions and report');
+      return reply.code(499).send({ error: 'client_aborted' });
+    }
+
     fastify.log.info({
       where: 'before_actions_dispatch',
       dispatch_requested: !!inputs?.dispatch,
@@ -5528,49 +5553,6 @@ fastify.post('/api/brain/decide', async (request, reply) => {
 // CRON: Ежедневный запуск для всех активных пользователей
 // ========================================
 
-/**
- * Получить всех активных пользователей из Supabase
- *
- * ВАЖНО: Для мультиаккаунтного режима НЕ проверяем user_accounts.autopilot!
- * Вместо этого проверка autopilot происходит в processDailyBatch по ad_accounts.autopilot
- *
- * - Legacy пользователи: multi_account_enabled = false/null, autopilot = true
- * - Мультиаккаунтные: multi_account_enabled = true (autopilot проверяется в processDailyBatch)
- */
-async function getActiveUsers() {
-  try {
-    // 1. Legacy пользователи (multi_account_enabled = false/null)
-    // Включаем всех активных — autopilot определяет режим (dispatch или report)
-    const legacyUsers = await supabaseQuery('user_accounts_legacy',
-      async () => await supabase
-        .from('user_accounts')
-        .select('id, username, telegram_id, telegram_id_2, telegram_id_3, telegram_id_4, telegram_bot_token, account_timezone, multi_account_enabled, ad_account_id, autopilot, autopilot_tiktok, tiktok_access_token, tiktok_business_id, tiktok_account_id')
-        .eq('is_active', true)
-        .eq('optimization', 'agent2')
-        .or('multi_account_enabled.eq.false,multi_account_enabled.is.null')
-        .is('account_timezone', null),  // timezone-aware legacy юзеры → hourly schedule batch
-      { where: 'getActiveUsers_legacy' }
-    );
-
-    // Multi-account пользователи обрабатываются ТОЛЬКО через schedule batch (getAccountsForCurrentHour)
-    // Legacy с account_timezone → через hourly schedule batch (getLegacyUsersForCurrentHour)
-    // Legacy batch — только для пользователей без multi_account_enabled и без account_timezone
-    const allUsers = legacyUsers || [];
-
-    fastify.log.info({
-      where: 'getActiveUsers',
-      legacyCount: legacyUsers?.length || 0,
-      totalCount: allUsers.length,
-      filter: 'legacy only: multi_account_enabled=false/null, account_timezone=null (timezone-aware → hourly schedule batch)'
-    });
-
-    return allUsers;
-  } catch (err) {
-    fastify.log.error({ where: 'getActiveUsers', err: String(err) });
-    return [];
-  }
-}
-
 /**
  * Получить всех активных пользователей с TikTok (legacy)
  */
@@ -5615,98 +5597,6 @@ async function sendTelegramReport(telegramId, botToken, reportText) {
   }
 }
 
-/**
- * Обработать одного пользователя: собрать данные, выполнить действия, отправить отчет
- * Для мультиаккаунтного режима user.accountId содержит UUID из ad_accounts.id
- */
-async function processUser(user) {
-  const startTime = Date.now();
-  const accountId = user.accountId || null;  // UUID из ad_accounts.id или null для legacy
-
-  // Определяем режим: autopilot=true → dispatch, иначе → только отчёт
-  // Для multi-account режим определяется в processAccountBrain по brain_mode
-  const isAutopilot = user.autopilot !== false;
-  const inputs = isAutopilot
-    ? { dispatch: true }
-    : { dispatch: false, sendReport: true };
-
-  fastify.log.info({
-    where: 'processUser',
-    userId: user.id,
-    username: user.username,
-    accountId: accountId || 'legacy',
-    accountName: user.accountName || null,
-    mode: isAutopilot ? 'autopilot' : 'report',
-    status: 'started'
-  });
-
-  try {
-    // Вызываем основной эндпоинт /api/brain/run
-    // Передаём accountId для мультиаккаунтного режима
-    const response = await fetch('http://localhost:7080/api/brain/run', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        userAccountId: user.id,
-        accountId: accountId,  // UUID из ad_accounts.id для мультиаккаунтности
-        inputs
-      })
-    });
-
-    if (!response.ok) {
-      throw new Error(`Brain run failed: ${response.status}`);
-    }
-
-    const result = await response.json();
-
-    // Telegram уже отправлен внутри /api/brain/run, не дублируем отправку
-    // (telegramSent уже есть в result)
-
-    const duration = Date.now() - startTime;
-    fastify.log.info({
-      where: 'processUser',
-      userId: user.id,
-      username: user.username,
-      accountId: accountId || 'legacy',
-      status: 'completed',
-      duration,
-      actionsCount: result.actions?.length || 0,
-      dispatched: result.dispatched,
-      telegramSent: result.telegramSent || false
-    });
-
-    return {
-      userId: user.id,
-      username: user.username,
-      accountId: accountId,
-      success: true,
-      actionsCount: result.actions?.length || 0,
-      telegramSent: result.telegramSent || false,
-      duration
-    };
-  } catch (err) {
-    const duration = Date.now() - startTime;
-    fastify.log.error({
-      where: 'processUser',
-      userId: user.id,
-      username: user.username,
-      accountId: accountId || 'legacy',
-      status: 'failed',
-      duration,
-      error: String(err?.message || err)
-    });
-
-    return {
-      userId: user.id,
-      username: user.username,
-      accountId: accountId,
-      success: false,
-      error: String(err?.message || err),
-      duration
-    };
-  }
-}
-
 /**
  * Обработать одного пользователя TikTok (legacy)
  */
@@ -5933,7 +5823,7 @@ async function getAccountsForCurrentHour(utcHour) {
       id, user_account_id, name, ad_account_id, page_id, access_token,
       brain_mode, brain_schedule_hour, brain_timezone, autopilot,
       default_cpl_target_cents, plan_daily_budget_cents,
-      last_brain_batch_run_at,
+      last_brain_batch_run_at, tarif_expires,
       prompt3, whatsapp_phone_number, ig_seed_audience_id,
       openai_api_key,
       user_accounts!inner(
@@ -6973,9 +6863,12 @@ _Режим: полуавтоматический_`;
  * - semi_auto: Brain Mini → сохранение метрик + proposals + Telegram уведомление
  * - report: Основной Brain (/api/brain/run dispatch=false) → только отчёт
  *
+ * signal — abort от batch-планировщика по таймауту: проверяется перед fallback
+ * Brain Mini и сохранением proposals, уже запущенный /api/brain/run не прерывается.
+ *
  * @returns {Object} { success, accountId, brain_mode, duration, proposalsCount?, error?, details? }
  */
-async function processAccountBrain(account) {
+async function processAccountBrain(account, { signal } = {}) {
   const { brain_mode, id: accountId, name: accountName, user_account_id } = account;
   const userAccount = account.user_accounts;
   const startTime = Date.now();
@@ -7072,6 +6965,7 @@ async function processAccountBrain(account) {
           accountId
         });
 
+        signal?.throwIfAborted();
         const result = await runInteractiveBrain(userAccountForBrain, {
           accountUUID: accountId,
           supabase,
@@ -7177,6 +7071,7 @@ async function processAccountBrain(account) {
         const userAccountForBrain = buildUserAccountForBrain(account, userAccount);
         const { runInteractiveBrain } = await import('./scoring.js');
 
+        signal?.throwIfAborted();
         const result = await runInteractiveBrain(userAccountForBrain, {
           accountUUID: accountId,
           supabase,
@@ -7217,6 +7112,7 @@ async function processAccountBrain(account) {
       const userAccountForBrain = buildUserAccountForBrain(account, userAccount);
       const { runInteractiveBrain } = await import('./scoring.js');
 
+      signal?.throwIfAborted();
       const result = await runInteractiveBrain(userAccountForBrain, {
         accountUUID: accountId,
         supabase,
@@ -7283,6 +7179,7 @@ async function processAccountBrain(account) {
 
       // Шаг 2: Сохраняем proposals (изолировано от ошибок)
       try {
+        signal?.throwIfAborted();
         const proposalsSaveResult = await savePendingProposals(result, account);
         details.proposalsSaved = proposalsSaveResult?.proposalSaved || false;
         details.proposalId = proposalsSaveResult?.proposalId || null;
@@ -7674,25 +7571,27 @@ async function processDailyBatchBySchedule(utcHour) {
   }
 
   const results = [];
-  const BATCH_CONCURRENCY = Number(process.env.BRAIN_BATCH_CONCURRENCY || '5');
 
   // ========================================
   // 1. Multi-account аккаунты (processAccountBrain)
   // ========================================
-  for (let i = 0; i < accountsToProcess.length; i += BATCH_CONCURRENCY) {
-    const batch = accountsToProcess.slice(i, i + BATCH_CONCURRENCY);
-
-    const batchResults = await Promise.all(
-      batch.map(account => processAccountBrain(account))
-    );
-
-    results.push(...batchResults);
-
-    // Пауза между батчами
-    if (i + BATCH_CONCURRENCY < accountsToProcess.length) {
-      await new Promise(resolve => setTimeout(resolve, 2000));
-    }
-  }
+  const multiAccountRun = await runBatchScheduler(
+    accountsToProcess,
+    (account, { signal }) => processAccountBrain(account, { signal }),
+    brainBatchSchedulerOptions(
+      'processDailyBatchBySchedule',
+      `hourly_batch_${utcHour}`,
+      account => `account:${account.id}`,
+      (account, err) => ({
+        success: false,
+        accountId: account.id,
+        accountName: account.name,
+        brain_mode: account.brain_mode,
+        error: String(err?.message || err)
+      })
+    )
+  );
+  results.push(...multiAccountRun.results);
 
   // ========================================
   // 2. Legacy timezone-aware юзеры (processUser)
@@ -7706,44 +7605,48 @@ async function processDailyBatchBySchedule(utcHour) {
       usernames: legacyTimezoneUsers.map(u => u.username)
     });
 
-    for (let i = 0; i < legacyTimezoneUsers.length; i += BATCH_CONCURRENCY) {
-      const batch = legacyTimezoneUsers.slice(i, i + BATCH_CONCURRENCY);
-
-      const batchResults = await Promise.all(
-        batch.map(async (user) => {
-          const result = await processUser({
-            ...user,
-            accountId: null,
-            accountName: null
-          });
-
-          // Обновляем timestamp для дедупликации
-          if (supabase) {
-            try {
-              await supabase
-                .from('user_accounts')
-                .update({ last_brain_batch_run_at: new Date().toISOString() })
-                .eq('id', user.id);
-            } catch (updateErr) {
-              fastify.log.warn({
-                where: 'processDailyBatchBySchedule',
-                phase: 'legacy_update_timestamp',
-                userId: user.id,
-                error: String(updateErr)
-              });
-            }
+    const legacyRun = await runBatchScheduler(
+      legacyTimezoneUsers,
+      async (user, { signal }) => {
+        const result = await processUser({
+          ...user,
+          accountId: null,
+          accountName: null
+        }, { signal });
+
+        // Обновляем timestamp для дедупликации
+        if (supabase) {
+          try {
+            await supabase
+              .from('user_accounts')
+              .update({ last_brain_batch_run_at: new Date().toISOString() })
+              .eq('id', user.id);
+          } catch (updateErr) {
+            fastify.log.warn({
+              where: 'processDailyBatchBySchedule',
+              phase: 'legacy_update_timestamp',
+              userId: user.id,
+              error: String(updateErr)
+            });
           }
+        }
 
-          return result;
+        return result;
+      },
+      brainBatchSchedulerOptions(
+        'processDailyBatchBySchedule',
+        `hourly_batch_${utcHour}`,
+        user => `user:${user.id}`,
+        (user, err) => ({
+          userId: user.id,
+          username: user.username,
+          accountId: null,
+          success: false,
+          error: String(err?.message || err)
         })
-      );
-
-      results.push(...batchResults);
-
-      if (i + BATCH_CONCURRENCY < legacyTimezoneUsers.length) {
-        await new Promise(resolve => setTimeout(resolve, 2000));
-      }
-    }
+      )
+    );
+    results.push(...legacyRun.results);
   }
 
   const totalProcessed = accountsToProcess.length + legacyTimezoneUsers.length;
@@ -7862,9 +7765,12 @@ async function processDailyBatchByScheduleTikTok(utcHour) {
 // ============================================================================
 
 /**
- * Batch-обработка всех активных пользователей (параллельно с ограничением concurrency)
+ * Batch-обработка всех активных пользователей: leader lock, runDailyBatch
+ * (lib/dailyBatch.js) и сохранение результатов в batch_execution_results
+ * @param {Object} [options]
+ * @param {boolean} [options.resume=true] - пропускать задачи, уже выполненные сегодня (после падения/рестарта)
  */
-async function processDailyBatch() {
+async function processDailyBatch({ resume = true } = {}) {
   const batchStartTime = Date.now();
   const lockKey = 'daily_batch_lock';
   const instanceId = process.env.HOSTNAME || 'unknown';
@@ -7938,145 +7844,18 @@ async function processDailyBatch() {
   }
   
   try {
-    const users = await getActiveUsers();
+    // Выборка пользователей, разворот по ad_accounts и пул воркеров — lib/dailyBatch.js
+    const {
+      usersCount,
+      tasksCount: expandedTasksCount,
+      results,
+      scheduler: schedulerStats
+    } = await runDailyBatch({ resume });
 
-    if (users.length === 0) {
-      fastify.log.info({ where: 'processDailyBatch', status: 'no_active_users' });
+    if (usersCount === 0) {
       return { success: true, usersProcessed: 0, results: [] };
     }
 
-    fastify.log.info({ where: 'processDailyBatch', usersCount: users.length });
-
-    // ========================================
-    // Мультиаккаунтность: разворачиваем пользователей по ad_accounts
-    // Для multi_account_enabled=true создаём отдельную задачу для каждого ad_account
-    // ВАЖНО: Проверяем ad_accounts.autopilot для каждого аккаунта!
-    // ========================================
-    const expandedUsers = [];
-    for (const user of users) {
-      if (user.multi_account_enabled) {
-        // Загружаем только активные ad_accounts с включённым автопилотом
-        const { data: adAccounts, error: adAccountsError } = await supabase
-          .from('ad_accounts')
-          .select('id, ad_account_id, name, autopilot, default_cpl_target_cents, plan_daily_budget_cents')
-          .eq('user_account_id', user.id)
-          .eq('is_active', true)
-          .eq('autopilot', true);  // ← КРИТИЧНО: только аккаунты с включённым автопилотом!
-
-        if (adAccountsError) {
-          fastify.log.error({
-            where: 'processDailyBatch',
-            phase: 'load_ad_accounts',
-            userId: user.id,
-            error: String(adAccountsError)
-          });
-          // Пропускаем пользователя если не удалось загрузить аккаунты
-          continue;
-        }
-
-        if (!adAccounts || adAccounts.length === 0) {
-          fastify.log.info({
-            where: 'processDailyBatch',
-            phase: 'no_autopilot_accounts',
-            userId: user.id,
-            username: user.username,
-            message: 'Multi-account user has no ad_accounts with autopilot=true'
-          });
-          continue;
-        }
-
-        // Создаём отдельную задачу для каждого ad_account
-        for (const adAccount of adAccounts) {
-          // telegram_id берём из user (user_accounts) — shared, верхний уровень
-          const hasTelegramIds = !!(user.telegram_id || user.telegram_id_2 || user.telegram_id_3 || user.telegram_id_4);
-
-          fastify.log.info({
-            where: 'processDailyBatch',
-            phase: 'expand_ad_account',
-            userId: user.id,
-            username: user.username,
-            accountId: adAccount.id,
-            accountName: adAccount.name || adAccount.ad_account_id,
-            hasTelegramIds,
-            telegramIdCount: [user.telegram_id, user.telegram_id_2, user.telegram_id_3, user.telegram_id_4].filter(Boolean).length,
-            defaultCplCents: adAccount.default_cpl_target_cents || null,
-            planBudgetCents: adAccount.plan_daily_budget_cents || null,
-            autopilot: adAccount.autopilot
-          });
-
-          expandedUsers.push({
-            ...user,
-            accountId: adAccount.id,  // UUID из ad_accounts.id
-            accountName: adAccount.name || adAccount.ad_account_id,
-            // telegram_id остаётся из ...user (user_accounts, shared)
-            // Добавляем CPL и budget из ad_accounts
-            default_cpl_target_cents: adAccount.default_cpl_target_cents,
-            plan_daily_budget_cents: adAccount.plan_daily_budget_cents
-          });
-        }
-
-        fastify.log.info({
-          where: 'processDailyBatch',
-          phase: 'expanded_multi_account_complete',
-          userId: user.id,
-          username: user.username,
-          adAccountsCount: adAccounts.length,
-          accountNames: adAccounts.map(a => a.name || a.ad_account_id),
-          accountIds: adAccounts.map(a => a.id)
-        });
-      } else {
-        // Legacy режим: один пользователь = одна задача
-        fastify.log.info({
-          where: 'processDailyBatch',
-          phase: 'expand_legacy_user',
-          userId: user.id,
-          username: user.username,
-          mode: 'legacy',
-          hasTelegramIds: !!(user.telegram_id || user.telegram_id_2 || user.telegram_id_3 || user.telegram_id_4),
-          telegramIdCount: [user.telegram_id, user.telegram_id_2, user.telegram_id_3, user.telegram_id_4].filter(Boolean).length
-        });
-
-        expandedUsers.push({
-          ...user,
-          accountId: null,  // NULL для legacy режима
-          accountName: null
-        });
-      }
-    }
-
-    fastify.log.info({
-      where: 'processDailyBatch',
-      originalUsersCount: users.length,
-      expandedTasksCount: expandedUsers.length,
-      message: 'Users expanded by ad_accounts for multi-account mode'
-    });
-
-    // Параллельная обработка с ограничением concurrency
-    const BATCH_CONCURRENCY = Number(process.env.BRAIN_BATCH_CONCURRENCY || '5'); // 5 задач одновременно
-    const results = [];
-
-    // Разбиваем на батчи по BATCH_CONCURRENCY
-    for (let i = 0; i < expandedUsers.length; i += BATCH_CONCURRENCY) {
-      const batch = expandedUsers.slice(i, i + BATCH_CONCURRENCY);
-      fastify.log.info({
-        where: 'processDailyBatch',
-        batchNumber: Math.floor(i / BATCH_CONCURRENCY) + 1,
-        batchSize: batch.length,
-        totalBatches: Math.ceil(expandedUsers.length / BATCH_CONCURRENCY)
-      });
-
-      // Обрабатываем батч параллельно
-      const batchResults = await Promise.all(
-        batch.map(user => processUser(user))
-      );
-      results.push(...batchResults);
-
-      // Небольшая пауза между батчами (не между пользователями!)
-      if (i + BATCH_CONCURRENCY < expandedUsers.length) {
-        await new Promise(resolve => setTimeout(resolve, 2000)); // 2 секунды между батчами
-      }
-    }
-    
     const batchDuration = Date.now() - batchStartTime;
     const successCount = results.filter(r => r.success).length;
     const failureCount = results.filter(r => !r.success).length;
@@ -8084,7 +7863,7 @@ async function processDailyBatch() {
     fastify.log.info({
       where: 'processDailyBatch',
       status: 'completed',
-      totalUsers: users.length,
+      totalUsers: usersCount,
       successCount,
       failureCount,
       totalDuration: batchDuration
@@ -8097,7 +7876,7 @@ async function processDailyBatch() {
           execution_date: new Date().toISOString().split('T')[0],
           started_at: new Date(batchStartTime).toISOString(),
           completed_at: new Date().toISOString(),
-          total_users: expandedUsers.length,
+          total_users: expandedTasksCount,
           success_count: successCount,
           failure_count: failureCount,
           total_duration_ms: batchDuration,
@@ -8120,10 +7899,11 @@ async function processDailyBatch() {
 
     return {
       success: true,
-      usersProcessed: users.length,
+      usersProcessed: usersCount,
       successCount,
       failureCount,
       results,
+      scheduler: schedulerStats,
       totalDuration: batchDuration
     };
   } catch (err) {
@@ -8392,9 +8172,10 @@ fastify.get('/api/brain/cron/check-schedule', async (request, reply) => {
 });
 
 // Эндпоинт для ручного запуска batch-обработки
+// body.resume=true — продолжить прерванный batch (пропустить уже обработанные сегодня аккаунты)
 fastify.post('/api/brain/cron/run-batch', async (request, reply) => {
   try {
-    const result = await processDailyBatch();
+    const result = await processDailyBatch({ resume: request.body?.resume === true });
     return reply.send(result);
   } catch (err) {
     fastify.log.error(err);
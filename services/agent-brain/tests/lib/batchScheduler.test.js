@@ -0,0 +1,157 @@
+/**
+ * Batch Scheduler Tests
+ * Tests for worker pool, priorities, rate budgets, timeouts and checkpoints
+ */
+
+import { describe, it, expect, afterEach, vi } from 'vitest';
+import { runBatchScheduler } from '../../src/lib/batchScheduler.js';
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+const waitForAbort = (signal) => new Promise((_, reject) => {
+  signal.addEventListener('abort', () => reject(signal.reason), { once: true });
+});
+
+describe('runBatchScheduler', () => {
+  afterEach(() => {
+    vi.useRealTimers();
+  });
+
+  it('does not let a slow task stall the rest of the pool', async () => {
+    vi.useFakeTimers();
+    const tasks = [{ id: 'slow', ms: 80 }, ...Array.from({ length: 6 }, (_, i) => ({ id: `fast${i}`, ms: 10 }))];
+    let done = false;
+
+    const run = runBatchScheduler(
+      tasks,
+      async (task) => { await sleep(task.ms); return { success: true, id: task.id }; },
+      { concurrency: 2, taskKey: t => t.id }
+    ).then(value => { done = true; return value; });
+
+    // Срезы по 2 + slow заняли бы 80 + 3*10; пул укладывается во время slow-задачи
+    await vi.advanceTimersByTimeAsync(80);
+    expect(done).toBe(true);
+
+    const { results, stats } = await run;
+    expect(results).toHaveLength(7);
+    expect(stats.wallMs).toBe(80);
+    expect(results.every(r => typeof r.queueWaitMs === 'number' && typeof r.runMs === 'number')).toBe(true);
+  });
+
+  it('runs higher priority tasks first', async () => {
+    const order = [];
+    await runBatchScheduler(
+      [{ id: 'a', p: 0 }, { id: 'b', p: 3 }, { id: 'c', p: 1 }],
+      async (task) => { order.push(task.id); return { success: true }; },
+      { concurrency: 1, taskKey: t => t.id, priority: t => t.p }
+    );
+
+    expect(order).toEqual(['b', 'c', 'a']);
+  });
+
+  it('respects per-budget concurrency', async () => {
+    let active = 0;
+    let maxActive = 0;
+    const tasks = Array.from({ length: 6 }, (_, i) => ({ id: `t${i}`, app: 'app1' }));
+
+    await runBatchScheduler(
+      tasks,
+      async () => {
+        active++;
+        maxActive = Math.max(maxActive, active);
+        await sleep(5);
+        active--;
+        return { success: true };
+      },
+      { concurrency: 4, budgetLimit: 2, budgetKey: t => t.app, taskKey: t => t.id }
+    );
+
+    expect(maxActive).toBe(2);
+  });
+
+  it('fails a task on timeout and keeps going', async () => {
+    const { results, stats } = await runBatchScheduler(
+      [{ id: 'hang' }, { id: 'ok' }],
+      async (task, { signal }) => {
+        if (task.id === 'hang') await waitForAbort(signal);
+        return { success: true, id: task.id };
+      },
+      {
+        concurrency: 2,
+        taskKey: t => t.id,
+        taskTimeoutMs: 20,
+        onTimeout: (task, err) => ({ success: false, id: task.id, error: err.message })
+      }
+    );
+
+    expect(stats.timedOut).toBe(1);
+    expect(results.find(r => r.id === 'hang')).toMatchObject({ success: false, timedOut: true });
+    expect(results.find(r => r.id === 'ok').success).toBe(true);
+  });
+
+  it('holds the slot of a timed out task until it settles', async () => {
+    vi.useFakeTimers();
+    const started = [];
+    let aborted = false;
+
+    const run = runBatchScheduler(
+      [{ id: 'stuck' }, { id: 'next' }],
+      async (task, { signal }) => {
+        started.push(task.id);
+        if (task.id === 'stuck') {
+          signal.addEventListener('abort', () => { aborted = true; });
+          await sleep(100);
+        }
+        return { success: true, id: task.id };
+      },
+      { concurrency: 1, taskKey: t => t.id, taskTimeoutMs: 20 }
+    );
+
+    await vi.advanceTimersByTimeAsync(50);
+    expect(aborted).toBe(true);
+    expect(started).toEqual(['stuck']);
+
+    await vi.advanceTimersByTimeAsync(50);
+    const { results, stats } = await run;
+
+    expect(started).toEqual(['stuck', 'next']);
+    expect(stats.timedOut).toBe(1);
+    // Задача завершилась после дедлайна — в результате её собственный ответ
+    expect(results.find(r => r.id === 'stuck')).toMatchObject({ success: true, timedOut: true, runMs: 100 });
+  });
+
+  it('skips tasks from checkpoint and saves successful ones', async () => {
+    const saved = [];
+    const checkpoint = {
+      load: async () => new Set(['done']),
+      save: async (key) => { saved.push(key); }
+    };
+
+    const { results, stats } = await runBatchScheduler(
+      [{ id: 'done' }, { id: 'new' }, { id: 'broken' }],
+      async (task) => ({ success: task.id !== 'broken' }),
+      { concurrency: 2, taskKey: t => t.id, checkpoint }
+    );
+
+    expect(stats.skipped).toBe(1);
+    expect(results).toHaveLength(2);
+    expect(saved).toEqual(['new']);
+  });
+
+  it('consumes async iterables as a stream', async () => {
+    async function* produce() {
+      for (let i = 0; i < 3; i++) {
+        await sleep(2);
+        yield { id: `s${i}` };
+      }
+    }
+
+    const { results } = await runBatchScheduler(
+      produce(),
+      async (task) => ({ success: true, id: task.id }),
+      { concurrency: 2, taskKey: t => t.id }
+    );
+
+    expect(results.map(r => r.id).sort()).toEqual(['s0', 's1', 's2']);
+  });
+});
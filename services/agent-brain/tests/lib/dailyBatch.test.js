@@ -0,0 +1,80 @@
+/**
+ * dailyBatch Tests
+ * Tests for daily batch task expansion and brain run dispatch
+ */
+
+import { describe, it, expect, afterEach, vi } from 'vitest';
+
+vi.mock('../../src/lib/supabaseClient.js', () => ({
+  supabase: null,
+  supabaseQuery: async (_table, operation) => {
+    const { data, error } = await operation();
+    if (error) throw new Error(error.message);
+    return data;
+  }
+}));
+
+import { BRAIN_RUN_URL, expandDailyBatchTasks, runDailyBatch } from '../../src/lib/dailyBatch.js';
+import { createSupabaseStandIn } from '../../scripts/bench/supabaseStandIn.mjs';
+
+const legacyUser = (id) => ({
+  id,
+  username: id,
+  is_active: true,
+  optimization: 'agent2',
+  multi_account_enabled: false,
+  account_timezone: null,
+  autopilot: true
+});
+
+describe('dailyBatch', () => {
+  afterEach(() => {
+    vi.unstubAllGlobals();
+  });
+
+  it('expands multi-account users into autopilot ad accounts with one query', async () => {
+    const db = createSupabaseStandIn({
+      ad_accounts: [
+        { id: 'acc-1', user_account_id: 'multi-1', name: 'A', is_active: true, autopilot: true },
+        { id: 'acc-2', user_account_id: 'multi-1', name: 'B', is_active: true, autopilot: true },
+        { id: 'acc-3', user_account_id: 'multi-2', name: 'C', is_active: true, autopilot: false }
+      ]
+    });
+    const users = [
+      legacyUser('legacy-1'),
+      { id: 'multi-1', username: 'multi-1', multi_account_enabled: true },
+      { id: 'multi-2', username: 'multi-2', multi_account_enabled: true }
+    ];
+
+    const tasks = await expandDailyBatchTasks(users, { supabase: db });
+
+    expect(tasks.map(t => [t.id, t.accountId])).toEqual([
+      ['legacy-1', null],
+      ['multi-1', 'acc-1'],
+      ['multi-1', 'acc-2']
+    ]);
+    expect(db.stats().requests).toEqual({ 'ad_accounts:select': 1 });
+  });
+
+  it('runs a brain run per active user and collects the results', async () => {
+    const db = createSupabaseStandIn({
+      user_accounts: [legacyUser('u1'), legacyUser('u2'), { ...legacyUser('u3'), is_active: false }]
+    });
+    const fetchMock = vi.fn(async () => ({
+      ok: true,
+      json: async () => ({ actions: [{}, {}], telegramSent: true })
+    }));
+    vi.stubGlobal('fetch', fetchMock);
+
+    const { usersCount, tasksCount, results, scheduler } = await runDailyBatch({ resume: false, supabase: db });
+
+    expect(usersCount).toBe(2);
+    expect(tasksCount).toBe(2);
+    expect(scheduler).toMatchObject({ total: 2, skipped: 0, timedOut: 0 });
+    expect(results.map(r => [r.userId, r.success, r.actionsCount])).toEqual(
+      expect.arrayContaining([['u1', true, 2], ['u2', true, 2]])
+    );
+    expect(fetchMock).toHaveBeenCalledWith(BRAIN_RUN_URL, expect.objectContaining({ method: 'POST' }));
+    expect(JSON.parse(fetchMock.mock.calls[0][1].body)).toMatchObject({ accountId: null, inputs: { dispatch: true } });
+  });
+});
@@ -0,0 +1,117 @@
+/**
+ * contextCache Tests
+ * Tests for request-scoped and cross-request caching of chat context blocks
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest';
+import {
+  createContextScope,
+  loadBlock,
+  invalidateContextCache,
+  invalidateContextForTool,
+  clearContextCache
+} from '../../src/chatAssistant/shared/contextCache.js';
+
+const key = { userAccountId: 'user-1', adAccountId: 'acc-1' };
+
+function delayedLoader(values) {
+  let i = 0;
+  return vi.fn(async () => {
+    await new Promise(resolve => setTimeout(resolve, 5));
+    return values[Math.min(i++, values.length - 1)];
+  });
+}
+
+describe('contextCache', () => {
+  beforeEach(() => {
+    clearContextCache();
+  });
+
+  it('loads a block once per request scope', async () => {
+    const scope = createContextScope(key);
+    const loader = delayedLoader([['d1']]);
+
+    const [a, b] = await Promise.all([
+      loadBlock(scope, 'directions', key, loader),
+      loadBlock(scope, 'directions', key, loader)
+    ]);
+
+    expect(a).toEqual(['d1']);
+    expect(b).toBe(a);
+    expect(loader).toHaveBeenCalledTimes(1);
+    expect(scope.timings.directions.source).toBe('db');
+  });
+
+  it('serves the next request from the cross-request cache', async () => {
+    const loader = delayedLoader([['d1']]);
+
+    await loadBlock(createContextScope(key), 'directions', key, loader);
+    const scope = createContextScope(key);
+    const value = await loadBlock(scope, 'directions', key, loader);
+
+    expect(value).toEqual(['d1']);
+    expect(loader).toHaveBeenCalledTimes(1);
+    expect(scope.timings.directions.source).toBe('cache');
+  });
+
+  it('keys the cache by ad account', async () => {
+    const loader = delayedLoader([['d1'], ['d2']]);
+
+    await loadBlock(null, 'directions', key, loader);
+    const other = await loadBlock(null, 'directions', { ...key, adAccountId: 'acc-2' }, loader);
+
+    expect(other).toEqual(['d2']);
+    expect(loader).toHaveBeenCalledTimes(2);
+  });
+
+  it('invalidates blocks touched by write tools only', async () => {
+    const loader = delayedLoader([['d1'], ['d2']]);
+    await loadBlock(null, 'directions', key, loader);
+
+    invalidateContextForTool('getDirections', key.userAccountId);
+    expect(await loadBlock(null, 'directions', key, loader)).toEqual(['d1']);
+
+    invalidateContextForTool('updateDirectionBudget', key.userAccountId);
+    expect(await loadBlock(null, 'directions', key, loader)).toEqual(['d2']);
+    expect(loader).toHaveBeenCalledTimes(2);
+  });
+
+  it('invalidates blocks for ads write tools outside ADS_WRITE_TOOLS', async () => {
+    const cases = [
+      ['approveBrainActions', ['adsSnapshot', 'directionsSnapshot', 'brainActions']],
+      ['aiLaunch', ['adsSnapshot', 'directionsSnapshot', 'creativesSnapshot']],
+      ['saveCampaignMapping', ['agentNotes']]
+    ];
+
+    for (const [toolName, blocks] of cases) {
+      clearContextCache();
+      const loaders = blocks.map(() => delayedLoader([['old'], ['new']]));
+      await Promise.all(blocks.map((block, i) => loadBlock(null, block, key, loaders[i])));
+
+      invalidateContextForTool(toolName, key.userAccountId);
+
+      for (const [i, block] of blocks.entries()) {
+        expect(await loadBlock(null, block, key, loaders[i])).toEqual(['new']);
+      }
+    }
+  });
+
+  it('does not store a load that was invalidated while in flight', async () => {
+    const loader = delayedLoader([['stale'], ['fresh']]);
+
+    const pending = loadBlock(null, 'agentNotes', key, loader);
+    invalidateContextCache({ userAccountId: key.userAccountId, blocks: ['agentNotes'] });
+
+    expect(await pending).toEqual(['stale']);
+    expect(await loadBlock(null, 'agentNotes', key, loader)).toEqual(['fresh']);
+  });
+
+  it('does not memoize failed loads', async () => {
+    const scope = createContextScope(key);
+    const failing = vi.fn().mockRejectedValue(new Error('db down'));
+    const loader = vi.fn().mockResolvedValue({ spend: 10 });
+
+    await expect(loadBlock(scope, 'todayMetrics', key, failing)).rejects.toThrow('db down');
+    expect(await loadBlock(scope, 'todayMetrics', key, loader)).toEqual({ spend: 10 });
+  });
+});
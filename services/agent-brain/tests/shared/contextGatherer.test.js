@@ -0,0 +1,83 @@
+/**
+ * contextGatherer Tests
+ * Tests that loader fallbacks after Supabase errors are not cached
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest';
+
+const { responses, supabase } = vi.hoisted(() => {
+  // table → queue of { data, error, count }; the last response repeats
+  const responses = new Map();
+
+  function query(table) {
+    const respond = () => {
+      const queue = responses.get(table) || [{ data: null, error: null }];
+      return Promise.resolve(queue.length > 1 ? queue.shift() : queue[0]);
+    };
+    const builder = {
+      maybeSingle: respond,
+      then: (resolve, reject) => respond().then(resolve, reject)
+    };
+    for (const method of ['select', 'eq', 'is', 'gte', 'order', 'limit', 'in']) {
+      builder[method] = () => builder;
+    }
+    return builder;
+  }
+
+  return { responses, supabase: { from: vi.fn(table => query(table)) } };
+});
+
+vi.mock('../../src/lib/supabaseClient.js', () => ({ supabase, supabaseQuery: vi.fn() }));
+vi.mock('../../src/lib/multiAccountHelper.js', () => ({ shouldFilterByAccountId: async () => false }));
+vi.mock('../../src/lib/errorLogger.js', () => ({ logErrorToAdmin: vi.fn(async () => {}) }));
+
+import {
+  gatherContext,
+  getIntegrations,
+  getRecentBrainActions
+} from '../../src/chatAssistant/contextGatherer.js';
+import { clearContextCache } from '../../src/chatAssistant/shared/contextCache.js';
+
+const dbError = { data: null, error: { message: 'connection reset' } };
+
+function callsTo(table) {
+  return supabase.from.mock.calls.filter(([name]) => name === table).length;
+}
+
+describe('contextGatherer', () => {
+  beforeEach(() => {
+    clearContextCache();
+    responses.clear();
+    supabase.from.mockClear();
+  });
+
+  it('falls back on integration errors without caching the fallback', async () => {
+    responses.set('leads', [dbError, { count: 3, error: null }]);
+
+    expect(await getIntegrations('user-1', 'acc-1', true)).toMatchObject({ fb: true, crm: false });
+    expect(await getIntegrations('user-1', 'acc-1', true)).toMatchObject({ fb: true, crm: true });
+    expect(await getIntegrations('user-1', 'acc-1', true)).toMatchObject({ crm: true });
+    expect(callsTo('leads')).toBe(2);
+  });
+
+  it('returns no brain actions on error and queries again next time', async () => {
+    responses.set('brain_executions', [dbError, { data: [], error: null }]);
+
+    expect(await getRecentBrainActions('user-1', 'acc-1')).toEqual([]);
+    expect(await getRecentBrainActions('user-1', 'acc-1')).toEqual([]);
+    expect(await getRecentBrainActions('user-1', 'acc-1')).toEqual([]);
+    expect(callsTo('brain_executions')).toBe(2);
+  });
+
+  it('drops a failed block from the context and reloads it on the next turn', async () => {
+    const direction = { id: 'dir-1', name: 'Клиника', is_active: true };
+    responses.set('account_directions', [dbError, { data: [direction], error: null }]);
+
+    const first = await gatherContext({ userAccountId: 'user-1', adAccountId: 'acc-1' });
+    const second = await gatherContext({ userAccountId: 'user-1', adAccountId: 'acc-1' });
+
+    expect(first.directions).toBeUndefined();
+    expect(second.directions).toEqual([expect.objectContaining({ id: 'dir-1' })]);
+    expect(callsTo('account_directions')).toBe(2);
+  });
+});
@@ -0,0 +1,153 @@
+/**
+ * fbBatch Tests
+ * Tests for batched ad insights fetching and per-token concurrency budget
+ */
+
+import { describe, it, expect, beforeEach, afterEach, vi } from 'vitest';
+import { fetchAdLevelInsights, fbGraphBatch } from '../../src/chatAssistant/shared/fbBatch.js';
+import { withTokenBudget } from '../../src/chatAssistant/shared/fbGraph.js';
+
+function jsonResponse(body, status = 200) {
+  return { ok: status >= 200 && status < 300, status, json: async () => body };
+}
+
+describe('fbBatch', () => {
+  let fetchMock;
+
+  beforeEach(() => {
+    fetchMock = vi.fn();
+    vi.stubGlobal('fetch', fetchMock);
+  });
+
+  afterEach(() => {
+    vi.unstubAllGlobals();
+  });
+
+  describe('fetchAdLevelInsights', () => {
+    it('fetches many ads with one account-level request per chunk', async () => {
+      const adIds = Array.from({ length: 150 }, (_, i) => `ad_${i}`);
+      fetchMock.mockImplementation(async (url) => {
+        const filtering = JSON.parse(new URL(url).searchParams.get('filtering'));
+        const ids = filtering[0].value;
+        return jsonResponse({ data: ids.map(id => ({ ad_id: id, impressions: '10' })) });
+      });
+
+      const result = await fetchAdLevelInsights('123', 'token', adIds, {
+        fields: 'impressions',
+        time_range: { since: '2025-01-01', until: '2025-01-01' }
+      });
+
+      expect(fetchMock).toHaveBeenCalledTimes(2);
+      expect(result.size).toBe(150);
+      expect(result.get('ad_42').impressions).toBe('10');
+
+      const url = new URL(fetchMock.mock.calls[0][0]);
+      expect(url.pathname).toContain('/act_123/insights');
+      expect(url.searchParams.get('level')).toBe('ad');
+      expect(url.searchParams.get('fields')).toBe('ad_id,impressions');
+    });
+
+    it('follows paging cursors', async () => {
+      fetchMock
+        .mockResolvedValueOnce(jsonResponse({
+          data: [{ ad_id: '1' }],
+          paging: { cursors: { after: 'c1' }, next: 'https://next' }
+        }))
+        .mockResolvedValueOnce(jsonResponse({ data: [{ ad_id: '2' }] }));
+
+      const result = await fetchAdLevelInsights('act_1', 'token', ['1', '2']);
+
+      expect(fetchMock).toHaveBeenCalledTimes(2);
+      expect(new URL(fetchMock.mock.calls[1][0]).searchParams.get('after')).toBe('c1');
+      expect([...result.keys()]).toEqual(['1', '2']);
+    });
+
+    it('falls back to batch requests when account-level query is too large', async () => {
+      fetchMock
+        .mockResolvedValueOnce(jsonResponse({
+          error: { message: 'Please reduce the amount of data you\'re asking for, then retry your request', code: 1 }
+        }, 400))
+        .mockResolvedValueOnce(jsonResponse([
+          { code: 200, body: JSON.stringify({ data: [{ impressions: '5' }] }) },
+          { code: 400, body: JSON.stringify({ error: { message: 'no data' } }) }
+        ]));
+
+      const result = await fetchAdLevelInsights('act_1', 'token', ['a', 'b']);
+
+      expect(fetchMock).toHaveBeenCalledTimes(2);
+      expect(fetchMock.mock.calls[1][1].method).toBe('POST');
+      expect(result.get('a').impressions).toBe('5');
+      expect(result.has('b')).toBe(false);
+    });
+
+    it('uses the requested Graph API version for both paths', async () => {
+      fetchMock
+        .mockResolvedValueOnce(jsonResponse({ error: { message: 'Please reduce the amount of data', code: 1 } }, 400))
+        .mockResolvedValueOnce(jsonResponse([{ code: 200, body: JSON.stringify({ data: [{ ad_id: '1' }] }) }]));
+
+      await fetchAdLevelInsights('1', 'token', ['1'], { version: 'v23.0' });
+
+      expect(fetchMock).toHaveBeenCalledTimes(2);
+      for (const [url] of fetchMock.mock.calls) {
+        expect(new URL(url).pathname.startsWith('/v23.0/')).toBe(true);
+      }
+    });
+
+    it('does not fall back on auth errors', async () => {
+      fetchMock.mockResolvedValueOnce(jsonResponse({
+        error: { message: 'Error validating access token', code: 190 }
+      }, 400));
+
+      await expect(fetchAdLevelInsights('act_1', 'token', ['a', 'b'])).rejects.toThrow('access token');
+      expect(fetchMock).toHaveBeenCalledTimes(1);
+    });
+  });
+
+  describe('fbGraphBatch', () => {
+    it('splits requests into batches of 50', async () => {
+      fetchMock.mockImplementation(async (_url, init) => {
+        const batch = JSON.parse(new URLSearchParams(init.body).get('batch'));
+        return jsonResponse(batch.map(() => ({ code: 200, body: '{"ok":true}' })));
+      });
+
+      const requests = Array.from({ length: 120 }, (_, i) => ({ path: `${i}/insights` }));
+      const results = await fbGraphBatch(requests, 'token');
+
+      expect(fetchMock).toHaveBeenCalledTimes(3);
+      expect(results).toHaveLength(120);
+      expect(results.every(r => r.ok && r.body.ok)).toBe(true);
+    });
+  });
+
+  describe('withTokenBudget', () => {
+    it('limits concurrent calls per token', async () => {
+      let active = 0;
+      let maxActive = 0;
+      const task = () => withTokenBudget('same-token', async () => {
+        active++;
+        maxActive = Math.max(maxActive, active);
+        await new Promise(resolve => setTimeout(resolve, 5));
+        active--;
+      });
+
+      await Promise.all(Array.from({ length: 12 }, task));
+
+      expect(maxActive).toBeLessThanOrEqual(4);
+      expect(maxActive).toBeGreaterThan(1);
+    });
+
+    it('keeps the upload pool separate from regular calls', async () => {
+      let releaseUploads;
+      const uploadsDone = new Promise(resolve => { releaseUploads = resolve; });
+      const uploads = Array.from({ length: 4 }, () =>
+        withTokenBudget('upload-token', () => uploadsDone, { pool: 'upload' })
+      );
+
+      // Обычный вызов не ждёт зависшие загрузки
+      await expect(withTokenBudget('upload-token', async () => 'ok')).resolves.toBe('ok');
+
+      releaseUploads();
+      await Promise.all(uploads);
+    });
+  });
+});
@@ -773,97 +773,128 @@ export async function uploadVideo(
     throw new Error('Invalid video source: must be URL or Buffer');
   }
 
-  const tmpPath = path.join(os.tmpdir(), `tt_video_${randomUUID()}.mp4`);
-  const fileSizeMB = Math.round(videoSource.length / 1024 / 1024);
-
-  // Вычисляем MD5 хеш из buffer напрямую (без повторного чтения файла)
-  const videoSignature = createHash('md5').update(videoSource).digest('hex');
-
-  log.info({
-    advertiserId,
-    file_size_bytes: videoSource.length,
-    file_size_mb: fileSizeMB,
-    video_signature: videoSignature
-  }, '[TikTok:uploadVideo] Подготовка к загрузке файла');
-
   // Записываем временный файл для streaming upload
+  const tmpPath = path.join(os.tmpdir(), `tt_video_${randomUUID()}.mp4`);
   fs.writeFileSync(tmpPath, videoSource);
   log.debug({ advertiserId, tmp_path: tmpPath }, '[TikTok:uploadVideo] Временный файл создан');
 
   try {
-    const formData = new FormData();
-    formData.append('advertiser_id', advertiserId);
-    formData.append('upload_type', 'UPLOAD_BY_FILE');
-    formData.append('video_signature', videoSignature);
-    formData.append('video_file', fs.createReadStream(tmpPath));
+    return await uploadVideoFile(advertiserId, accessToken, tmpPath);
+  } finally {
+    if (fs.existsSync(tmpPath)) {
+      fs.unlinkSync(tmpPath);
+      log.debug({ advertiserId, tmp_path: tmpPath }, '[TikTok:uploadVideo] Временный файл удалён');
+    }
+  }
+}
 
-    log.info({
-      advertiserId,
-      video_signature: videoSignature,
-      file_size_mb: fileSizeMB
-    }, '[TikTok:uploadVideo] Отправка файла в TikTok API...');
+/**
+ * MD5 файла потоковым чтением (без загрузки файла в память)
+ */
+async function md5File(filePath: string): Promise<string> {
+  const hash = createHash('md5');
+  for await (const chunk of fs.createReadStream(filePath)) {
+    hash.update(chunk as Buffer);
+  }
+  return hash.digest('hex');
+}
 
-    // Увеличенный timeout для больших файлов (5 минут)
-    const uploadTimeout = Math.max(300000, fileSizeMB * 10000); // минимум 5 мин или 10сек/МБ
+/**
+ * Загрузить видео с диска в TikTok (UPLOAD_BY_FILE).
+ * Файл читается потоком дважды (MD5 и отправка) — память не зависит от размера видео.
+ */
+export async function uploadVideoFile(
+  advertiserId: string,
+  accessToken: string,
+  filePath: string
+): Promise<{ video_id: string }> {
+  const startTime = Date.now();
+  const { size: fileSize } = await fs.promises.stat(filePath);
+  const fileSizeMB = Math.round(fileSize / 1024 / 1024);
 
-    const response = await axios.post(
-      `${TIKTOK_BASE_URL}/file/video/ad/upload/`,
-      formData,
-      {
-        headers: {
-          'Access-Token': accessToken,
-          ...formData.getHeaders()
-        },
-        maxBodyLength: Infinity,
-        maxContentLength: Infinity,
-        timeout: uploadTimeout
-      }
-    );
+  const videoSignature = await md5File(filePath);
 
-    // Логируем полный ответ для отладки
-    log.info({
-      advertiserId,
-      response_code: response.data.code,
-      response_message: response.data.message,
-      response_data: JSON.stringify(response.data.data || response.data)
-    }, '[TikTok:uploadVideo] Ответ от TikTok API');
+  log.info({
+    advertiserId,
+    file_size_bytes: fileSize,
+    file_size_mb: fileSizeMB,
+    video_signature: videoSignature
+  }, '[TikTok:uploadVideo] Подготовка к загрузке файла');
 
-    if (response.data.code !== 0) {
-      log.error({
-        advertiserId,
-        code: response.data.code,
-        message: response.data.message
-      }, '[TikTok:uploadVideo] ❌ Ошибка загрузки');
-      throw new Error(response.data.message || 'Video upload failed');
+  const formData = new FormData();
+  formData.append('advertiser_id', advertiserId);
+  formData.append('upload_type', 'UPLOAD_BY_FILE');
+  formData.append('video_signature', videoSignature);
+  // TUS сохраняет файлы без расширения — указываем filename явно
+  formData.append('video_file', fs.createReadStream(filePath), {
+    filename: 'video.mp4',
+    contentType: 'video/mp4',
+    knownLength: fileSize
+  });
+
+  log.info({
+    advertiserId,
+    video_signature: videoSignature,
+    file_size_mb: fileSizeMB
+  }, '[TikTok:uploadVideo] Отправка файла в TikTok API...');
+
+  // Увеличенный timeout для больших файлов (5 минут)
+  const uploadTimeout = Math.max(300000, fileSizeMB * 10000); // минимум 5 мин или 10сек/МБ
+
+  const response = await axios.post(
+    `${TIKTOK_BASE_URL}/file/video/ad/upload/`,
+    formData,
+    {
+      headers: {
+        'Access-Token': accessToken,
+        ...formData.getHeaders()
+      },
+      maxBodyLength: Infinity,
+      maxContentLength: Infinity,
+      // Без редиректов axios отправляет тело напрямую через http/https:
+      // follow-redirects буферизует все чанки запроса для повтора, и видео оказалось бы в памяти целиком
+      maxRedirects: 0,
+      timeout: uploadTimeout
     }
+  );
 
-    // TikTok возвращает data как массив: data[0].video_id
-    const dataArray = response.data.data;
-    const videoId = Array.isArray(dataArray)
-      ? dataArray[0]?.video_id
-      : dataArray?.video_id;
+  // Логируем полный ответ для отладки
+  log.info({
+    advertiserId,
+    response_code: response.data.code,
+    response_message: response.data.message,
+    response_data: JSON.stringify(response.data.data || response.data)
+  }, '[TikTok:uploadVideo] Ответ от TikTok API');
 
-    const duration = Date.now() - startTime;
-    log.info({
+  if (response.data.code !== 0) {
+    log.error({
       advertiserId,
-      video_id: videoId,
-      upload_type: 'UPLOAD_BY_FILE',
-      duration_ms: duration
-    }, '[TikTok:uploadVideo] ✅ Видео загружено из файла');
-
-    if (!videoId) {
-      log.error({ advertiserId, response_data: response.data }, '[TikTok:uploadVideo] ❌ video_id не найден в ответе');
-      throw new Error('TikTok API did not return video_id');
-    }
+      code: response.data.code,
+      message: response.data.message
+    }, '[TikTok:uploadVideo] ❌ Ошибка загрузки');
+    throw new Error(response.data.message || 'Video upload failed');
+  }
 
-    return { video_id: videoId };
+  // TikTok возвращает data как массив: data[0].video_id
+  const dataArray = response.data.data;
+  const videoId = Array.isArray(dataArray)
+    ? dataArray[0]?.video_id
+    : dataArray?.video_id;
 
-  } finally {
-    if (fs.existsSync(tmpPath)) {
-      fs.unlinkSync(tmpPath);
-      log.debug({ advertiserId, tmp_path: tmpPath }, '[TikTok:uploadVideo] Временный файл удалён');
-    }
+  const duration = Date.now() - startTime;
+  log.info({
+    advertiserId,
+    video_id: videoId,
+    upload_type: 'UPLOAD_BY_FILE',
+    duration_ms: duration
+  }, '[TikTok:uploadVideo] ✅ Видео загружено из файла');
+
+  if (!videoId) {
+    log.error({ advertiserId, response_data: response.data }, '[TikTok:uploadVideo] ❌ video_id не найден в ответе');
+    throw new Error('TikTok API did not return video_id');
   }
+
+  return { video_id: videoId };
 }
 
 /**
@@ -17,7 +17,7 @@ import { supabase } from '../lib/supabase.js';
 import { fetchCompetitorCreatives, type CompetitorCreativeData } from '../lib/apifyAdLibrary.js';
 import { calculateCreativeScore } from '../lib/competitorScoring.js';
 import { processVideoTranscription } from '../lib/transcription.js';
-import { cacheImageToStorage } from '../lib/imageCache.js';
+import { cacheImagesToStorage, getImageCacheStats, sweepUnreferencedImages, type ImageCacheStats } from '../lib/imageCache.js';
 import { createWriteStream, promises as fs } from 'fs';
 import { pipeline } from 'stream/promises';
 import path from 'path';
@@ -60,6 +60,21 @@ function scoreCreatives(creatives: CompetitorCreativeData[]): ScoredCreative[] {
   });
 }
 
+/**
+ * Залогировать счётчики кэша изображений за обход (разница с моментом старта)
+ */
+function logImageCacheStats(log: any, before: ImageCacheStats): void {
+  const after = getImageCacheStats();
+  log.info({
+    hits: after.hits - before.hits,
+    misses: after.misses - before.misses,
+    dedupedUploads: after.dedupedUploads - before.dedupedUploads,
+    errors: after.errors - before.errors,
+    downloadedMB: Math.round((after.bytesDownloaded - before.bytesDownloaded) / 1024 / 1024 * 10) / 10,
+    savedMB: Math.round((after.bytesSaved - before.bytesSaved) / 1024 / 1024 * 10) / 10,
+  }, '[CompetitorCron] Image cache stats');
+}
+
 /**
  * Получить текущий ТОП-10 из БД
  */
@@ -97,7 +112,14 @@ async function saveCreativesWithScoring(
     .update({ is_top10: false })
     .eq('competitor_id', competitorId);
 
-  // 2. Upsert ТОП-10 креативов
+  // 2. Кэшируем thumbnails новых в ТОП-10 в Supabase Storage (параллельно, с дедупликацией)
+  const toCache = top10.filter(c => !currentTop10Ids.has(c.fb_ad_archive_id) && c.thumbnail_url);
+  const cachedUrls = await cacheImagesToStorage(
+    toCache.map(c => ({ imageUrl: c.thumbnail_url!, competitorId, adArchiveId: c.fb_ad_archive_id }))
+  );
+  const cachedThumbnails = new Map(toCache.map((c, i) => [c.fb_ad_archive_id, cachedUrls[i]]));
+
+  // 3. Upsert ТОП-10 креативов
   for (const creative of top10) {
     const isNewInTop = !currentTop10Ids.has(creative.fb_ad_archive_id);
     if (isNewInTop) {
@@ -105,11 +127,7 @@ async function saveCreativesWithScoring(
     }
 
     try {
-      // Кэшируем thumbnail в Supabase Storage (только для новых)
-      let cachedThumbnailUrl: string | null = null;
-      if (isNewInTop && creative.thumbnail_url) {
-        cachedThumbnailUrl = await cacheImageToStorage(creative.thumbnail_url, competitorId);
-      }
+      const cachedThumbnailUrl = cachedThumbnails.get(creative.fb_ad_archive_id) || null;
 
       const { error } = await supabase
         .from('competitor_creatives')
@@ -150,7 +168,7 @@ async function saveCreativesWithScoring(
     }
   }
 
-  // 3. Также сохраняем остальные креативы (не топ-10), но только до лимита 50
+  // 4. Также сохраняем остальные креативы (не топ-10), но только до лимита 50
   const remainingCreatives = sortedCreatives.slice(TOP_CREATIVES_LIMIT);
 
   // Получаем текущее количество креативов
@@ -412,7 +430,8 @@ export function startCompetitorCrawlerCron(app: FastifyInstance) {
   app.log.info('📅 Competitor crawler cron started (ТОП-10 + лимит 50)');
   app.log.info('   - Weekly crawl: every Sunday at 03:00 UTC');
   app.log.info('   - Pending check: every 6 hours');
-  app.log.info('   - Image caching: enabled (lazy init)');
+  app.log.info('   - Image caching: enabled (content-addressed, lazy init)');
+  app.log.info('   - Image cache sweep: every Saturday at 04:00 UTC');
 
   // Каждое воскресенье в 03:00 UTC
   cron.schedule('0 3 * * 0', async () => {
@@ -438,6 +457,8 @@ export function startCompetitorCrawlerCron(app: FastifyInstance) {
 
       app.log.info(`[CompetitorCron] Found ${competitors.length} competitor(s) to process`);
 
+      const cacheStatsBefore = getImageCacheStats();
+
       // Обрабатываем последовательно с паузой между запросами
       for (const competitor of competitors) {
         await processCompetitor(competitor, app.log);
@@ -446,6 +467,7 @@ export function startCompetitorCrawlerCron(app: FastifyInstance) {
         await new Promise(resolve => setTimeout(resolve, 2000));
       }
 
+      logImageCacheStats(app.log, cacheStatsBefore);
       app.log.info('[CompetitorCron] Weekly ТОП-10 crawl completed');
     } catch (error) {
       app.log.error({ error }, '[CompetitorCron] Cron job failed');
@@ -466,15 +488,30 @@ export function startCompetitorCrawlerCron(app: FastifyInstance) {
 
       app.log.info(`[CompetitorCron] Processing ${pendingCompetitors.length} pending competitor(s)`);
 
+      const cacheStatsBefore = getImageCacheStats();
+
       for (const competitor of pendingCompetitors) {
         await processCompetitor(competitor, app.log);
         await new Promise(resolve => setTimeout(resolve, 2000));
       }
+
+      logImageCacheStats(app.log, cacheStatsBefore);
     } catch (error) {
       app.log.error({ error }, '[CompetitorCron] Pending check failed');
     }
   });
 
+  // Каждую субботу в 04:00 UTC удаляем файлы кэша, на которые никто не ссылается
+  // (не пересекается с воскресным обходом)
+  cron.schedule('0 4 * * 6', async () => {
+    try {
+      const removed = await sweepUnreferencedImages();
+      app.log.info({ removed }, '[CompetitorCron] Image cache sweep completed');
+    } catch (error) {
+      app.log.error({ error }, '[CompetitorCron] Image cache sweep failed');
+    }
+  });
+
   // Каждые 30 минут обрабатываем pending анализы (OCR/транскрипция)
   cron.schedule('*/30 * * * *', async () => {
     try {
@@ -0,0 +1,151 @@
+/**
+ * Статистика по колонкам (typed arrays) для аналитики insights.
+ *
+ * Все функции — один-два прохода по Float64Array без промежуточных
+ * массивов объектов. Пропуски (null) в колонках кодируются как NaN
+ * и пропускаются там, где это указано.
+ */
+
+export type NumericColumn = ArrayLike<number>;
+
+/**
+ * Копирует значения в Float64Array (опционально только конечные)
+ */
+function toSortedFloat64(values: NumericColumn, skipNaN: boolean): Float64Array {
+  let count = 0;
+  const buffer = new Float64Array(values.length);
+  for (let i = 0; i < values.length; i++) {
+    const v = values[i];
+    if (skipNaN && Number.isNaN(v)) continue;
+    buffer[count++] = v;
+  }
+  // Float64Array.sort сортирует численно без comparator-колбэка
+  return buffer.subarray(0, count).sort();
+}
+
+/**
+ * Медиана (NaN пропускаются). Для пустого набора — null.
+ */
+export function median(values: NumericColumn): number | null {
+  const sorted = toSortedFloat64(values, true);
+  const n = sorted.length;
+  if (n === 0) return null;
+
+  const mid = n >> 1;
+  return n % 2 !== 0 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
+}
+
+/**
+ * Slope (наклон тренда) методом линейной регрессии по индексу 0..n-1.
+ * NaN пропускаются, x остаётся индексом точки — пропуск не сдвигает время.
+ */
+export function slope(values: NumericColumn): number | null {
+  let n = 0;
+  let sumX = 0, sumY = 0, sumXY = 0, sumX2 = 0;
+  for (let i = 0; i < values.length; i++) {
+    const y = values[i];
+    if (Number.isNaN(y)) continue;
+    n++;
+    sumX += i;
+    sumY += y;
+    sumXY += i * y;
+    sumX2 += i * i;
+  }
+  if (n < 2) return null;
+
+  const denominator = n * sumX2 - sumX * sumX;
+  if (denominator === 0) return null;
+
+  return (n * sumXY - sumX * sumY) / denominator;
+}
+
+/**
+ * Квантили с линейной интерполяцией (NaN пропускаются)
+ */
+export function quantiles(values: NumericColumn, probs: number[]): number[] {
+  const sorted = toSortedFloat64(values, true);
+  const last = sorted.length - 1;
+
+  return probs.map(p => {
+    if (last < 0) return NaN;
+    const idx = p * last;
+    const lower = Math.floor(idx);
+    const upper = Math.ceil(idx);
+    if (lower === upper) return sorted[lower];
+    return sorted[lower] * (upper - idx) + sorted[upper] * (idx - lower);
+  });
+}
+
+/**
+ * Коэффициент корреляции Пирсона по двум колонкам одинаковой длины.
+ * Пары, где хотя бы одно значение NaN, пропускаются.
+ *
+ * @param minPairs - минимум валидных пар, иначе 0
+ */
+export function pearsonCorrelation(xs: NumericColumn, ys: NumericColumn, minPairs: number = 3): number {
+  const len = Math.min(xs.length, ys.length);
+  let n = 0;
+  let sumX = 0, sumY = 0, sumXY = 0, sumX2 = 0, sumY2 = 0;
+
+  for (let i = 0; i < len; i++) {
+    const x = xs[i];
+    const y = ys[i];
+    if (Number.isNaN(x) || Number.isNaN(y)) continue;
+    n++;
+    sumX += x;
+    sumY += y;
+    sumXY += x * y;
+    sumX2 += x * x;
+    sumY2 += y * y;
+  }
+
+  if (n < Math.max(3, minPairs)) return 0;
+
+  const numerator = n * sumXY - sumX * sumY;
+  const denominator = Math.sqrt((n * sumX2 - sumX * sumX) * (n * sumY2 - sumY * sumY));
+
+  if (denominator === 0) return 0;
+  return numerator / denominator;
+}
+
+/**
+ * Среднее (NaN пропускаются). Для пустого набора — 0.
+ */
+export function mean(values: NumericColumn): number {
+  let n = 0;
+  let sum = 0;
+  for (let i = 0; i < values.length; i++) {
+    const v = values[i];
+    if (Number.isNaN(v)) continue;
+    sum += v;
+    n++;
+  }
+  return n > 0 ? sum / n : 0;
+}
+
+/**
+ * Коэффициент вариации (std / mean), population variance (NaN пропускаются)
+ */
+export function coefficientOfVariation(values: NumericColumn): number {
+  let n = 0;
+  let sum = 0;
+  for (let i = 0; i < values.length; i++) {
+    const v = values[i];
+    if (Number.isNaN(v)) continue;
+    sum += v;
+    n++;
+  }
+  if (n < 2) return 0;
+
+  const avg = sum / n;
+  if (avg === 0) return 0;
+
+  let sq = 0;
+  for (let i = 0; i < values.length; i++) {
+    const v = values[i];
+    if (Number.isNaN(v)) continue;
+    const d = v - avg;
+    sq += d * d;
+  }
+  return Math.sqrt(sq / n) / avg;
+}
@@ -28,3 +28,97 @@ export async function withConcurrencyLimit<T, R>(
   await Promise.all(workers);
   return results;
 }
+
+/**
+ * Ошибка ограничителя: очередь переполнена или задача слишком долго ждала слот.
+ * statusCode = 503 — вызывающий код отдаёт его клиенту как "повторите позже".
+ */
+export class ConcurrencyLimitError extends Error {
+  readonly statusCode = 503;
+
+  constructor(readonly reason: 'queue_full' | 'queue_timeout', message: string) {
+    super(message);
+    this.name = 'ConcurrencyLimitError';
+  }
+}
+
+export interface ConcurrencyLimiterOptions {
+  /** Максимум задач в очереди ожидания (по умолчанию без ограничения) */
+  maxQueue?: number;
+  /** Сколько задача может ждать слот, мс (по умолчанию без ограничения) */
+  queueTimeoutMs?: number;
+}
+
+/**
+ * Ограничитель параллельных задач для потока входящих задач (а не массива):
+ * не более `limit` задач выполняются одновременно, остальные ждут в FIFO-очереди.
+ *
+ * Очередь ограничена maxQueue и queueTimeoutMs: при переполнении или по таймауту
+ * ожидания run() отклоняется с ConcurrencyLimitError, задача не запускается.
+ *
+ * Используется для тяжёлых задач (обработка видео), где параллельность
+ * ограничивает пиковое потребление памяти/CPU процесса.
+ */
+export function createConcurrencyLimiter(limit: number, options: ConcurrencyLimiterOptions = {}) {
+  const effectiveLimit = Math.max(1, limit);
+  const maxQueue = options.maxQueue ?? Infinity;
+  const queueTimeoutMs = options.queueTimeoutMs ?? 0;
+  const queue: Array<{ start: () => void; timer: ReturnType<typeof setTimeout> | null }> = [];
+  let active = 0;
+
+  function next() {
+    if (active >= effectiveLimit) return;
+    const entry = queue.shift();
+    if (entry) {
+      if (entry.timer) clearTimeout(entry.timer);
+      active++;
+      entry.start();
+    }
+  }
+
+  return {
+    run<R>(fn: () => Promise<R>): Promise<R> {
+      return new Promise<R>((resolve, reject) => {
+        if (active >= effectiveLimit && queue.length >= maxQueue) {
+          reject(new ConcurrencyLimitError('queue_full', `Queue is full (${queue.length} waiting)`));
+          return;
+        }
+
+        const entry = {
+          start: () => {
+            Promise.resolve()
+              .then(fn)
+              .then(resolve, reject)
+              .finally(() => {
+                active--;
+                next();
+              });
+          },
+          timer: null as ReturnType<typeof setTimeout> | null
+        };
+
+        if (queueTimeoutMs > 0) {
+          entry.timer = setTimeout(() => {
+            const idx = queue.indexOf(entry);
+            if (idx === -1) return;
+            queue.splice(idx, 1);
+            reject(new ConcurrencyLimitError('queue_timeout', `Waited for a free slot longer than ${queueTimeoutMs}ms`));
+          }, queueTimeoutMs);
+        }
+
+        queue.push(entry);
+        next();
+      });
+    },
+    get active() {
+      return active;
+    },
+    get pending() {
+      return queue.length;
+    },
+    /** Примет ли run() новую задачу без отказа queue_full */
+    get canAccept() {
+      return active < effectiveLimit || queue.length < maxQueue;
+    }
+  };
+}
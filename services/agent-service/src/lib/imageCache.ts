@@ -1,36 +1,223 @@
 /**
  * Модуль для кэширования изображений в Supabase Storage
  * Решает проблему истекающих URL Facebook CDN
+ *
+ * Изображения конкурентов хранятся по sha256 содержимого (by-hash/ab/<sha256>.<ext>),
+ * перед скачиванием проверяется индекс competitor_image_cache_keys:
+ * ad:<fb_ad_archive_id> и url:<fingerprint пути CDN URL>.
+ * Файлы без ссылок удаляет sweepUnreferencedImages (еженедельно из competitorCrawler).
+ * См. migrations/262_competitor_image_cache_index.sql, 265_competitor_image_cache_sweep.sql
  */
 
 import { supabase } from './supabase.js';
-import { randomUUID } from 'crypto';
+import { createHash } from 'crypto';
+import { withConcurrencyLimit } from './concurrency.js';
 
 const BUCKET_NAME = 'competitor-creatives';
 const AVATARS_BUCKET_NAME = 'account-avatars';
 const FETCH_TIMEOUT_MS = 30000; // 30 секунд таймаут
 const MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024; // 10MB лимит
+const HASH_DIR = 'by-hash';
+// Параллельные скачивания/загрузки при пакетном кэшировании
+const IMAGE_CACHE_CONCURRENCY = parseInt(process.env.IMAGE_CACHE_CONCURRENCY || '6', 10) || 6;
+// In-process копия индекса (lookup_key → URL), чтобы не ходить в БД за повторами
+const LOOKUP_MEMO_MAX_SIZE = 5000;
 
 // Флаги для ленивой инициализации buckets
 let bucketInitialized = false;
 let avatarsBucketInitialized = false;
 
+export interface ImageCacheStats {
+  hits: number;             // найдено по индексу, скачивание пропущено
+  misses: number;           // пришлось скачивать
+  dedupedUploads: number;   // скачано, но такой контент уже в Storage — загрузка пропущена
+  errors: number;
+  bytesDownloaded: number;
+  bytesUploaded: number;
+  bytesSaved: number;       // не скачано + не загружено благодаря кэшу
+}
+
+interface CachedImageRef {
+  publicUrl: string;
+  sizeBytes: number;
+  contentHash: string;
+}
+
+const stats: ImageCacheStats = {
+  hits: 0,
+  misses: 0,
+  dedupedUploads: 0,
+  errors: 0,
+  bytesDownloaded: 0,
+  bytesUploaded: 0,
+  bytesSaved: 0,
+};
+
+const lookupMemo = new Map<string, CachedImageRef>();
+const inFlight = new Map<string, Promise<string | null>>();
+
+/**
+ * Счётчики кэша с момента старта процесса
+ */
+export function getImageCacheStats(): ImageCacheStats {
+  return { ...stats };
+}
+
+function rememberLookup(key: string, ref: CachedImageRef): void {
+  if (lookupMemo.size >= LOOKUP_MEMO_MAX_SIZE && !lookupMemo.has(key)) {
+    // Map хранит порядок вставки — удаляем самый старый ключ
+    const oldest = lookupMemo.keys().next().value;
+    if (oldest !== undefined) lookupMemo.delete(oldest);
+  }
+  lookupMemo.set(key, ref);
+}
+
+/**
+ * Fingerprint CDN URL: путь без query (подписи oh/oe и хост CDN меняются, путь к файлу — нет)
+ */
+export function urlFingerprint(imageUrl: string): string | null {
+  try {
+    const { pathname } = new URL(imageUrl);
+    if (!pathname || pathname === '/') return null;
+    return createHash('sha1').update(pathname).digest('hex');
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * Ключи индекса для изображения: ad:<fb_ad_archive_id> и url:<fingerprint>
+ */
+export function getLookupKeys(imageUrl: string, adArchiveId?: string): string[] {
+  const keys: string[] = [];
+  if (adArchiveId) keys.push(`ad:${adArchiveId}`);
+  const fingerprint = urlFingerprint(imageUrl);
+  if (fingerprint) keys.push(`url:${fingerprint}`);
+  return keys;
+}
+
+/**
+ * Загружает ключи индекса из БД в память одним запросом.
+ * Строки без content_hash (старые ссылки не из by-hash/) не используются —
+ * такие файлы могли быть удалены вместе с папкой конкурента.
+ */
+async function prefetchLookupKeys(keys: string[]): Promise<void> {
+  const missing = [...new Set(keys)].filter(key => !lookupMemo.has(key));
+  if (missing.length === 0) return;
+
+  for (let i = 0; i < missing.length; i += 200) {
+    const { data, error } = await supabase
+      .from('competitor_image_cache_keys')
+      .select('lookup_key, public_url, content_hash, size_bytes')
+      .in('lookup_key', missing.slice(i, i + 200))
+      .not('content_hash', 'is', null);
+
+    if (error) {
+      console.warn(`[ImageCache] Failed to read lookup index: ${error.message}`);
+      return;
+    }
+
+    for (const row of data || []) {
+      rememberLookup(row.lookup_key, {
+        publicUrl: row.public_url,
+        sizeBytes: row.size_bytes ?? 0,
+        contentHash: row.content_hash,
+      });
+    }
+  }
+}
+
+async function saveLookupKeys(keys: string[], ref: CachedImageRef): Promise<void> {
+  const newKeys = keys.filter(key => !lookupMemo.has(key));
+  for (const key of keys) rememberLookup(key, ref);
+  if (newKeys.length === 0) return;
+
+  const { error } = await supabase
+    .from('competitor_image_cache_keys')
+    .upsert(
+      newKeys.map(key => ({
+        lookup_key: key,
+        public_url: ref.publicUrl,
+        content_hash: ref.contentHash,
+        size_bytes: ref.sizeBytes,
+      })),
+      { onConflict: 'lookup_key', ignoreDuplicates: true }
+    );
+
+  if (error) {
+    console.warn(`[ImageCache] Failed to save lookup keys: ${error.message}`);
+  }
+}
+
 /**
  * Скачивает изображение по URL и загружает в Supabase Storage
  * @param imageUrl - URL изображения (Facebook CDN или другой)
- * @param competitorId - ID конкурента (для организации папок)
+ * @param competitorId - ID конкурента (для логов)
+ * @param options.adArchiveId - ID объявления в Ads Library (ключ индекса)
  * @returns URL изображения в Supabase Storage или null при ошибке
  */
 export async function cacheImageToStorage(
   imageUrl: string,
-  competitorId: string
+  competitorId: string,
+  options: { adArchiveId?: string } = {}
 ): Promise<string | null> {
+  // Проверяем, нужно ли кэшировать (только Facebook/Instagram CDN)
+  if (!isFacebookCdnUrl(imageUrl)) {
+    return imageUrl; // Возвращаем оригинальный URL для других источников
+  }
+
+  const keys = getLookupKeys(imageUrl, options.adArchiveId);
+  // Один и тот же URL в одном обходе скачивается один раз
+  const flightKey = keys[keys.length - 1] || imageUrl;
+  const pending = inFlight.get(flightKey);
+  if (pending) return pending;
+
+  const promise = resolveCachedImage(imageUrl, competitorId, keys);
+  inFlight.set(flightKey, promise);
   try {
-    // Проверяем, нужно ли кэшировать (только Facebook/Instagram CDN)
-    if (!isFacebookCdnUrl(imageUrl)) {
-      return imageUrl; // Возвращаем оригинальный URL для других источников
+    return await promise;
+  } finally {
+    inFlight.delete(flightKey);
+  }
+}
+
+/**
+ * Пакетное кэширование: один запрос к индексу на все ключи,
+ * скачивания/загрузки идут параллельно (не более IMAGE_CACHE_CONCURRENCY).
+ * @returns URL в порядке items (null при ошибке)
+ */
+export async function cacheImagesToStorage(
+  items: Array<{ imageUrl: string; competitorId: string; adArchiveId?: string }>,
+  concurrency: number = IMAGE_CACHE_CONCURRENCY
+): Promise<Array<string | null>> {
+  const cdnItems = items.filter(item => isFacebookCdnUrl(item.imageUrl));
+  await prefetchLookupKeys(cdnItems.flatMap(item => getLookupKeys(item.imageUrl, item.adArchiveId)));
+
+  return withConcurrencyLimit(items, concurrency, item =>
+    cacheImageToStorage(item.imageUrl, item.competitorId, { adArchiveId: item.adArchiveId })
+  );
+}
+
+async function resolveCachedImage(
+  imageUrl: string,
+  competitorId: string,
+  keys: string[]
+): Promise<string | null> {
+  try {
+    // 1. Индекс: ad-ключ или fingerprint URL уже известны — не скачиваем
+    await prefetchLookupKeys(keys);
+    const knownKey = keys.find(key => lookupMemo.has(key));
+    if (knownKey) {
+      const ref = lookupMemo.get(knownKey)!;
+      stats.hits++;
+      stats.bytesSaved += ref.sizeBytes * 2;
+      // Дописываем недостающие ключи (например, новый URL для известного объявления)
+      await saveLookupKeys(keys, ref);
+      return ref.publicUrl;
     }
 
+    stats.misses++;
+
     // Ленивая инициализация bucket
     if (!bucketInitialized) {
       await ensureBucketExists();
@@ -55,6 +242,7 @@ export async function cacheImageToStorage(
 
     if (!response.ok) {
       console.warn(`[ImageCache] Failed to fetch image: ${response.status} for competitor ${competitorId}`);
+      stats.errors++;
       return null;
     }
 
@@ -62,6 +250,7 @@ export async function cacheImageToStorage(
     const contentLength = response.headers.get('content-length');
     if (contentLength && parseInt(contentLength, 10) > MAX_FILE_SIZE_BYTES) {
       console.warn(`[ImageCache] Image too large (${contentLength} bytes) for competitor ${competitorId}`);
+      stats.errors++;
       return null;
     }
 
@@ -69,21 +258,37 @@ export async function cacheImageToStorage(
     const contentType = response.headers.get('content-type') || 'image/jpeg';
     const extension = getExtensionFromContentType(contentType);
 
-    // Генерируем уникальное имя файла
-    const fileName = `${competitorId}/${randomUUID()}.${extension}`;
-
     // Получаем буфер изображения
     const arrayBuffer = await response.arrayBuffer();
+    stats.bytesDownloaded += arrayBuffer.byteLength;
 
     // Дополнительная проверка размера после загрузки
     if (arrayBuffer.byteLength > MAX_FILE_SIZE_BYTES) {
       console.warn(`[ImageCache] Image too large after download (${arrayBuffer.byteLength} bytes) for competitor ${competitorId}`);
+      stats.errors++;
       return null;
     }
 
     const buffer = Buffer.from(arrayBuffer);
+    const contentHash = createHash('sha256').update(buffer).digest('hex');
+
+    // 2. Такой контент уже в Storage (другой URL/объявление) — загрузку пропускаем
+    const { data: existing } = await supabase
+      .from('competitor_image_cache')
+      .select('public_url, size_bytes')
+      .eq('content_hash', contentHash)
+      .maybeSingle();
+
+    if (existing) {
+      stats.dedupedUploads++;
+      stats.bytesSaved += buffer.length;
+      const ref = { publicUrl: existing.public_url, sizeBytes: existing.size_bytes, contentHash };
+      await saveLookupKeys(keys, ref);
+      return ref.publicUrl;
+    }
 
-    // Загружаем в Supabase Storage
+    // 3. Загружаем в Supabase Storage по хешу содержимого
+    const fileName = `${HASH_DIR}/${contentHash.slice(0, 2)}/${contentHash}.${extension}`;
     const { error } = await supabase.storage
       .from(BUCKET_NAME)
       .upload(fileName, buffer, {
@@ -92,18 +297,45 @@ export async function cacheImageToStorage(
         upsert: false,
       });
 
-    if (error) {
+    // Файл с тем же хешем мог загрузить параллельный процесс — содержимое идентично
+    if (error && !/already exists|duplicate/i.test(error.message)) {
       console.warn(`[ImageCache] Failed to upload to storage for competitor ${competitorId}: ${error.message}`);
+      stats.errors++;
       return null;
     }
+    if (!error) {
+      stats.bytesUploaded += buffer.length;
+    }
 
     // Получаем публичный URL
     const { data: publicUrlData } = supabase.storage
       .from(BUCKET_NAME)
       .getPublicUrl(fileName);
 
-    return publicUrlData.publicUrl;
+    const ref = { publicUrl: publicUrlData.publicUrl, sizeBytes: buffer.length, contentHash };
+
+    const { error: indexError } = await supabase
+      .from('competitor_image_cache')
+      .upsert(
+        {
+          content_hash: contentHash,
+          storage_path: fileName,
+          public_url: ref.publicUrl,
+          content_type: contentType,
+          size_bytes: buffer.length,
+        },
+        { onConflict: 'content_hash', ignoreDuplicates: true }
+      );
+
+    if (indexError) {
+      console.warn(`[ImageCache] Failed to save content index: ${indexError.message}`);
+    } else {
+      await saveLookupKeys(keys, ref);
+    }
+
+    return ref.publicUrl;
   } catch (err) {
+    stats.errors++;
     if (err instanceof Error && err.name === 'AbortError') {
       console.warn(`[ImageCache] Fetch timeout for competitor ${competitorId}`);
     } else {
@@ -139,11 +371,28 @@ function getExtensionFromContentType(contentType: string): string {
 }
 
 /**
- * Удаляет кэшированные изображения конкурента
+ * Удаляет кэшированные изображения конкурента (старые файлы в папке конкурента).
+ * Файлы by-hash/ общие для всех конкурентов и здесь не удаляются.
+ * Ключи индекса, указывающие в папку конкурента, удаляются вместе с файлами,
+ * чтобы кэш не отдавал ссылки на удалённые файлы.
  * @param competitorId - ID конкурента
  */
 export async function deleteCompetitorImages(competitorId: string): Promise<void> {
   try {
+    const folderMarker = `/${BUCKET_NAME}/${competitorId}/`;
+    for (const [key, ref] of lookupMemo) {
+      if (ref.publicUrl.includes(folderMarker)) lookupMemo.delete(key);
+    }
+
+    const { error: keysError } = await supabase
+      .from('competitor_image_cache_keys')
+      .delete()
+      .like('public_url', `%${folderMarker}%`);
+
+    if (keysError) {
+      console.warn(`[ImageCache] Failed to delete lookup keys for ${competitorId}: ${keysError.message}`);
+    }
+
     const { data: files, error: listError } = await supabase.storage
       .from(BUCKET_NAME)
       .list(competitorId);
@@ -166,6 +415,50 @@ export async function deleteCompetitorImages(competitorId: string): Promise<void
   }
 }
 
+/**
+ * Удаляет файлы by-hash/, на которые не ссылаются ни ключи индекса, ни креативы.
+ * Выбор и удаление строк — в sweep_competitor_image_cache (migrations/265),
+ * здесь удаляются файлы из Storage и записи памяти процесса.
+ * @returns Количество удалённых файлов
+ */
+export async function sweepUnreferencedImages(): Promise<number> {
+  try {
+    const { data, error } = await supabase.rpc('sweep_competitor_image_cache');
+
+    if (error) {
+      console.warn(`[ImageCache] Failed to sweep image cache: ${error.message}`);
+      return 0;
+    }
+
+    const paths: string[] = (data || []).map((row: { storage_path: string }) => row.storage_path);
+    if (paths.length === 0) return 0;
+
+    const swept = new Set(paths.map(path => path.split('/').pop()!.split('.')[0]));
+    for (const [key, ref] of lookupMemo) {
+      if (swept.has(ref.contentHash)) lookupMemo.delete(key);
+    }
+
+    let removed = 0;
+    for (let i = 0; i < paths.length; i += 1000) {
+      const chunk = paths.slice(i, i + 1000);
+      const { error: removeError } = await supabase.storage
+        .from(BUCKET_NAME)
+        .remove(chunk);
+
+      if (removeError) {
+        console.warn(`[ImageCache] Failed to remove swept images: ${removeError.message}`);
+      } else {
+        removed += chunk.length;
+      }
+    }
+
+    return removed;
+  } catch (err) {
+    console.warn(`[ImageCache] Error sweeping image cache: ${err}`);
+    return 0;
+  }
+}
+
 /**
  * Создаёт bucket если он не существует
  */
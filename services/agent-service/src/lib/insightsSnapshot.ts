@@ -0,0 +1,414 @@
+/**
+ * Колоночный in-memory снапшот insights по ad account.
+ *
+ * anomalyDetector, burnoutAnalyzer и yearlyAnalyzer читают одни и те же
+ * таблицы (meta_insights_weekly, meta_weekly_results, meta_insights_daily,
+ * meta_ads, meta_adsets, ad_weekly_features). Вместо того чтобы каждый
+ * сервис заново выкачивал их постранично, таблица загружается один раз:
+ * - страницы по 1000 строк запрашиваются параллельно (волнами);
+ * - числовые колонки хранятся в Float64Array (null → NaN), строки интернируются;
+ * - строки сгруппированы по ключу (обычно fb_ad_id) через индексы;
+ * - снапшот живёт до следующего adInsightsSync / нормализации результатов
+ *   (invalidateInsightsSnapshot), но не дольше INSIGHTS_SNAPSHOT_TTL_MS;
+ * - общий размер ограничен INSIGHTS_SNAPSHOT_MAX_MB, при превышении
+ *   вытесняются давно не использованные аккаунты (LRU).
+ */
+
+import { supabase } from './supabaseClient.js';
+import { createLogger } from './logger.js';
+
+const log = createLogger({ module: 'insightsSnapshot' });
+
+// Supabase PostgREST имеет серверный лимит 1000 строк
+const SUPABASE_PAGE_SIZE = 1000;
+
+const PAGE_PARALLELISM = parseInt(process.env.INSIGHTS_SNAPSHOT_PAGE_PARALLELISM || '4', 10) || 4;
+const SNAPSHOT_TTL_MS = parseInt(process.env.INSIGHTS_SNAPSHOT_TTL_MS || String(6 * 60 * 60 * 1000), 10);
+const SNAPSHOT_MAX_BYTES = (parseInt(process.env.INSIGHTS_SNAPSHOT_MAX_MB || '256', 10) || 256) * 1024 * 1024;
+
+// ============================================================================
+// TYPES
+// ============================================================================
+
+export type SnapshotTableName =
+  | 'weeklyInsights'
+  | 'weeklyResults'
+  | 'dailyInsights'
+  | 'ads'
+  | 'adsets'
+  | 'features';
+
+export interface ColumnarTable {
+  table: string;
+  size: number;
+  /** Строковые колонки (null сохраняется как null) */
+  text: Record<string, Array<string | null>>;
+  /** Числовые колонки, пропуски = NaN */
+  num: Record<string, Float64Array>;
+  /** Индексы строк по ключу группировки, в порядке выборки */
+  groups: Map<string, Int32Array>;
+  /** Оценка занимаемой памяти */
+  bytes: number;
+  loadedAt: number;
+}
+
+interface TableSpec {
+  table: string;
+  groupBy: string;
+  text: string[];
+  num: string[];
+  order: Array<[string, boolean]>;
+  filter?: (query: any) => any;
+}
+
+interface AccountEntry {
+  createdAt: number;
+  tables: Map<SnapshotTableName, Promise<ColumnarTable>>;
+  bytes: Map<SnapshotTableName, number>;
+}
+
+// Порядок сортировки должен быть детерминированным (уникальным),
+// иначе страницы, запрошенные параллельно, могут пересекаться
+const TABLE_SPECS: Record<SnapshotTableName, TableSpec> = {
+  weeklyInsights: {
+    table: 'meta_insights_weekly',
+    groupBy: 'fb_ad_id',
+    text: ['fb_ad_id', 'week_start_date'],
+    num: [
+      'spend', 'frequency', 'ctr', 'cpc', 'cpm', 'reach', 'link_ctr',
+      'quality_rank_score', 'engagement_rank_score', 'conversion_rank_score',
+    ],
+    order: [['fb_ad_id', true], ['week_start_date', false]],
+  },
+  weeklyResults: {
+    table: 'meta_weekly_results',
+    groupBy: 'fb_ad_id',
+    text: ['fb_ad_id', 'week_start_date', 'result_family'],
+    num: ['result_count', 'spend', 'cpr'],
+    order: [['fb_ad_id', true], ['week_start_date', false], ['result_family', true]],
+  },
+  dailyInsights: {
+    table: 'meta_insights_daily',
+    groupBy: 'fb_ad_id',
+    text: ['fb_ad_id', 'date'],
+    num: ['impressions', 'spend'],
+    order: [['fb_ad_id', true], ['date', true]],
+  },
+  ads: {
+    table: 'meta_ads',
+    groupBy: 'fb_ad_id',
+    text: ['fb_ad_id', 'fb_adset_id', 'name', 'fb_creative_id'],
+    num: [],
+    order: [['fb_ad_id', true]],
+  },
+  adsets: {
+    table: 'meta_adsets',
+    groupBy: 'fb_adset_id',
+    text: ['fb_adset_id', 'optimization_goal'],
+    num: [],
+    order: [['fb_adset_id', true]],
+  },
+  features: {
+    table: 'ad_weekly_features',
+    groupBy: 'fb_ad_id',
+    text: ['fb_ad_id', 'week_start_date'],
+    num: [
+      'frequency', 'ctr', 'cpc', 'cpm', 'cpr',
+      'freq_delta_pct', 'ctr_delta_pct', 'cpc_delta_pct',
+      'freq_slope', 'ctr_slope', 'reach_growth_rate', 'spend_change_pct',
+    ],
+    order: [['fb_ad_id', true], ['week_start_date', true]],
+    filter: query => query.eq('min_results_met', true),
+  },
+};
+
+// ============================================================================
+// PARALLEL PAGINATION
+// ============================================================================
+
+/**
+ * Загружает все страницы запроса, по `parallel` страниц одновременно.
+ *
+ * Страницы запрашиваются волнами: как только в волне встречается неполная
+ * страница — данные закончились. queryFn должен задавать уникальный порядок.
+ * Ошибка любой страницы пробрасывается (частичные данные не кэшируются).
+ */
+export async function fetchAllPagesParallel<T>(
+  queryFn: () => any,
+  tableName: string,
+  parallel: number = PAGE_PARALLELISM
+): Promise<T[]> {
+  const pages: T[][] = [];
+  const wave = Math.max(1, parallel);
+  let firstPage = 0;
+
+  while (true) {
+    const results = await Promise.all(
+      Array.from({ length: wave }, (_, i) => {
+        const offset = (firstPage + i) * SUPABASE_PAGE_SIZE;
+        return queryFn().range(offset, offset + SUPABASE_PAGE_SIZE - 1);
+      })
+    );
+
+    let done = false;
+    for (let i = 0; i < results.length; i++) {
+      const { data: page, error } = results[i];
+      if (error) {
+        log.warn({ error, tableName, offset: (firstPage + i) * SUPABASE_PAGE_SIZE }, 'Failed to fetch page');
+        throw error;
+      }
+      if (done) continue;
+      if (page && page.length > 0) pages.push(page as T[]);
+      if (!page || page.length < SUPABASE_PAGE_SIZE) done = true;
+    }
+
+    if (done) break;
+    firstPage += wave;
+  }
+
+  return pages.length === 1 ? pages[0] : ([] as T[]).concat(...pages);
+}
+
+// ============================================================================
+// COLUMNAR BUILD
+// ============================================================================
+
+function parseNumber(value: unknown): number {
+  if (value === null || value === undefined || value === '') return NaN;
+  const n = typeof value === 'number' ? value : parseFloat(String(value));
+  return Number.isFinite(n) ? n : NaN;
+}
+
+/**
+ * Превращает строки выборки в колонки + индекс групп
+ */
+function buildColumnarTable(spec: TableSpec, rows: Record<string, unknown>[]): ColumnarTable {
+  const size = rows.length;
+  const interned = new Map<string, string>();
+  let stringBytes = 0;
+
+  const text: ColumnarTable['text'] = {};
+  for (const col of spec.text) {
+    const column = new Array<string | null>(size);
+    for (let i = 0; i < size; i++) {
+      const raw = rows[i][col];
+      if (raw === null || raw === undefined) {
+        column[i] = null;
+        continue;
+      }
+      const value = String(raw);
+      let shared = interned.get(value);
+      if (shared === undefined) {
+        shared = value;
+        interned.set(value, value);
+        stringBytes += value.length * 2 + 16;
+      }
+      column[i] = shared;
+    }
+    text[col] = column;
+  }
+
+  const num: ColumnarTable['num'] = {};
+  for (const col of spec.num) {
+    const column = new Float64Array(size);
+    for (let i = 0; i < size; i++) {
+      column[i] = parseNumber(rows[i][col]);
+    }
+    num[col] = column;
+  }
+
+  // Два прохода: считаем размер групп, затем раскладываем индексы
+  const keys = text[spec.groupBy];
+  const counts = new Map<string, number>();
+  for (let i = 0; i < size; i++) {
+    const key = keys[i];
+    if (key !== null) counts.set(key, (counts.get(key) || 0) + 1);
+  }
+  const groups = new Map<string, Int32Array>();
+  const fill = new Map<string, number>();
+  for (const [key, count] of counts) {
+    groups.set(key, new Int32Array(count));
+    fill.set(key, 0);
+  }
+  for (let i = 0; i < size; i++) {
+    const key = keys[i];
+    if (key === null) continue;
+    const pos = fill.get(key)!;
+    groups.get(key)![pos] = i;
+    fill.set(key, pos + 1);
+  }
+
+  const bytes = stringBytes
+    + size * 8 * spec.text.length  // ссылки на строки
+    + size * 8 * spec.num.length   // Float64Array
+    + size * 4                     // индексы групп
+    + groups.size * 64;
+
+  return { table: spec.table, size, text, num, groups, bytes, loadedAt: Date.now() };
+}
+
+async function loadTable(adAccountId: string, name: SnapshotTableName): Promise<ColumnarTable> {
+  const spec = TABLE_SPECS[name];
+  const startedAt = Date.now();
+  const select = [...spec.text, ...spec.num].join(', ');
+
+  const rows = await fetchAllPagesParallel<Record<string, unknown>>(() => {
+    let query = supabase.from(spec.table).select(select).eq('ad_account_id', adAccountId);
+    if (spec.filter) query = spec.filter(query);
+    for (const [column, ascending] of spec.order) {
+      query = query.order(column, { ascending });
+    }
+    return query;
+  }, spec.table);
+
+  const table = buildColumnarTable(spec, rows);
+
+  log.info({
+    adAccountId,
+    table: spec.table,
+    rows: table.size,
+    groups: table.groups.size,
+    kb: Math.round(table.bytes / 1024),
+    durationMs: Date.now() - startedAt,
+  }, 'Insights snapshot table loaded');
+
+  return table;
+}
+
+// ============================================================================
+// LRU CACHE
+// ============================================================================
+
+// Map сохраняет порядок вставки: первый ключ — давно не использованный аккаунт
+const accounts = new Map<string, AccountEntry>();
+const counters = { hits: 0, misses: 0, evictions: 0, invalidations: 0 };
+
+function totalBytes(): number {
+  let total = 0;
+  for (const entry of accounts.values()) {
+    for (const b of entry.bytes.values()) total += b;
+  }
+  return total;
+}
+
+function enforceMemoryBudget(currentAccountId: string): void {
+  let total = totalBytes();
+  for (const [accountId, entry] of accounts) {
+    if (total <= SNAPSHOT_MAX_BYTES) break;
+    if (accountId === currentAccountId) continue;
+    for (const b of entry.bytes.values()) total -= b;
+    accounts.delete(accountId);
+    counters.evictions++;
+    log.info({ adAccountId: accountId, totalMb: Math.round(total / 1024 / 1024) }, 'Insights snapshot evicted (LRU)');
+  }
+}
+
+/**
+ * Возвращает колоночную таблицу из снапшота аккаунта (загружает при первом обращении).
+ * Параллельные вызовы для одной таблицы разделяют одну загрузку.
+ */
+export async function getSnapshotTable(adAccountId: string, name: SnapshotTableName): Promise<ColumnarTable> {
+  let entry = accounts.get(adAccountId);
+  if (entry && Date.now() - entry.createdAt > SNAPSHOT_TTL_MS) {
+    accounts.delete(adAccountId);
+    entry = undefined;
+  }
+
+  if (!entry) {
+    entry = { createdAt: Date.now(), tables: new Map(), bytes: new Map() };
+  } else {
+    accounts.delete(adAccountId);
+  }
+  accounts.set(adAccountId, entry);
+
+  const cached = entry.tables.get(name);
+  if (cached) {
+    counters.hits++;
+    return cached;
+  }
+
+  counters.misses++;
+  const owner = entry;
+  const pending = loadTable(adAccountId, name).then(
+    table => {
+      // Снапшот мог быть инвалидирован, пока шла загрузка
+      if (accounts.get(adAccountId) === owner && owner.tables.get(name) === pending) {
+        owner.bytes.set(name, table.bytes);
+        enforceMemoryBudget(adAccountId);
+      }
+      return table;
+    },
+    err => {
+      if (owner.tables.get(name) === pending) owner.tables.delete(name);
+      throw err;
+    }
+  );
+  entry.tables.set(name, pending);
+  return pending;
+}
+
+/**
+ * Сбрасывает снапшот аккаунта (или всех аккаунтов, если adAccountId не указан).
+ * Вызывается после adInsightsSync и пересчёта производных таблиц.
+ */
+export function invalidateInsightsSnapshot(adAccountId?: string | null, tables?: SnapshotTableName[]): void {
+  if (!adAccountId) {
+    counters.invalidations += accounts.size;
+    accounts.clear();
+    return;
+  }
+
+  const entry = accounts.get(adAccountId);
+  if (!entry) return;
+  counters.invalidations++;
+
+  if (!tables) {
+    accounts.delete(adAccountId);
+    return;
+  }
+  for (const name of tables) {
+    entry.tables.delete(name);
+    entry.bytes.delete(name);
+  }
+}
+
+/**
+ * Статистика кэша (для мониторинга)
+ */
+export function getInsightsSnapshotStats(): {
+  accounts: number;
+  bytes: number;
+  maxBytes: number;
+  hits: number;
+  misses: number;
+  evictions: number;
+  invalidations: number;
+} {
+  return {
+    accounts: accounts.size,
+    bytes: totalBytes(),
+    maxBytes: SNAPSHOT_MAX_BYTES,
+    ...counters,
+  };
+}
+
+// ============================================================================
+// ACCESSORS
+// ============================================================================
+
+/**
+ * Число или null (NaN → null)
+ */
+export function valueOrNull(column: Float64Array, row: number): number | null {
+  const v = column[row];
+  return Number.isNaN(v) ? null : v;
+}
+
+const EMPTY_ROWS = new Int32Array(0);
+
+/**
+ * Индексы строк группы (пустой массив, если ключа нет)
+ */
+export function groupRows(table: ColumnarTable, key: string): Int32Array {
+  return table.groups.get(key) || EMPTY_ROWS;
+}
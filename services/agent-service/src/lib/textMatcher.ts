@@ -4,13 +4,44 @@ import { shouldFilterByAccountId } from './multiAccountHelper.js';
 
 const log = createLogger({ module: 'textMatcher' });
 
-interface MatchResult {
+export interface MatchResult {
   matched: boolean;
   similarity: number;
   directionId: string | null;
   directionName: string | null;
 }
 
+/**
+ * Предкомпилированный индекс направлений пользователя/аккаунта:
+ * вопросы нормализованы и разбиты на токены один раз при построении,
+ * инвертированный индекс token → вопросы считает пересечения слов для Jaccard.
+ */
+interface DirectionMatcherIndex {
+  userAccountId: string;
+  directions: Array<{ id: string; name: string }>;
+  directionIds: Set<string>;
+  // Параллельные массивы по вопросам
+  questionNorm: string[];
+  questionTokenCount: Int32Array;
+  questionDirection: Int32Array;
+  postings: Map<string, number[]>;
+}
+
+interface CachedIndex {
+  index: DirectionMatcherIndex;
+  expires: number;
+}
+
+// TTL страхует от изменений направлений в обход invalidateDirectionMatcher (другие сервисы)
+const INDEX_TTL_MS = parseInt(process.env.DIRECTION_MATCHER_TTL_MS || '300000', 10) || 300000;
+
+const indexCache = new Map<string, CachedIndex>();
+const inFlight = new Map<string, Promise<DirectionMatcherIndex | null>>();
+// Поколение ключа: индекс, построенный до инвалидации, не попадает в кэш
+const generations = new Map<string, number>();
+
+const NO_MATCH: MatchResult = { matched: false, similarity: 0, directionId: null, directionName: null };
+
 /**
  * Нормализует текст для сравнения
  * - приводит к нижнему регистру
@@ -29,9 +60,13 @@ function normalize(text: string): string {
  * Вычисляет Jaccard similarity между двумя текстами
  * Возвращает число от 0 до 1
  */
+function tokenize(text: string): Set<string> {
+  return new Set(text.split(' ').filter(w => w.length > 0));
+}
+
 function jaccardSimilarity(a: string, b: string): number {
-  const wordsA = new Set(a.split(' ').filter(w => w.length > 0));
-  const wordsB = new Set(b.split(' ').filter(w => w.length > 0));
+  const wordsA = tokenize(a);
+  const wordsB = tokenize(b);
 
   if (wordsA.size === 0 || wordsB.size === 0) {
     return 0;
@@ -51,6 +86,14 @@ export function calculateSimilarity(text1: string, text2: string): number {
   const norm1 = normalize(text1);
   const norm2 = normalize(text2);
 
+  return containmentSimilarity(norm1, norm2) ?? jaccardSimilarity(norm1, norm2);
+}
+
+/**
+ * Быстрые проверки схожести по нормализованным текстам (пустота, равенство, вхождение).
+ * null — нужно считать Jaccard по словам.
+ */
+function containmentSimilarity(norm1: string, norm2: string): number | null {
   // Если хотя бы один текст пустой — нет совпадения
   if (norm1.length === 0 || norm2.length === 0) {
     return 0;
@@ -73,26 +116,87 @@ export function calculateSimilarity(text1: string, text2: string): number {
     return Math.max(0.85, ratio);
   }
 
-  // Jaccard similarity по словам
-  return jaccardSimilarity(norm1, norm2);
+  return null;
+}
+
+
+function indexKey(userAccountId: string, accountId: string | null): string {
+  return `${userAccountId}:${accountId ?? '*'}`;
 }
 
 /**
- * Ищет направление по совпадению сообщения с client_question
- * Возвращает направление с наибольшим совпадением >= порога
- *
- * @param messageText - Текст сообщения для сравнения
- * @param userAccountId - UUID пользователя
- * @param accountId - UUID рекламного аккаунта для мультиаккаунтности (NULL для legacy)
- * @param threshold - Минимальный порог совпадения (0-1)
+ * Строит индекс из строк account_directions + default_ad_settings
  */
-export async function matchMessageToDirection(
-  messageText: string,
+function buildDirectionMatcherIndex(userAccountId: string, rows: any[]): DirectionMatcherIndex {
+  const directions: Array<{ id: string; name: string }> = [];
+  const questionNorm: string[] = [];
+  const tokenCounts: number[] = [];
+  const questionDirections: number[] = [];
+  const postings = new Map<string, number[]>();
+
+  for (const direction of rows) {
+    const settings = direction.default_ad_settings as any;
+    const allQuestions: string[] = (settings?.client_questions?.length
+      ? settings.client_questions
+      : [settings?.client_question]
+    ).filter(Boolean);
+
+    const directionIdx = directions.length;
+    directions.push({ id: direction.id, name: direction.name });
+
+    for (const question of allQuestions) {
+      const norm = normalize(question);
+      // Пустой после нормализации вопрос всегда даёт 0 — в индекс не кладём
+      if (norm.length === 0) continue;
+
+      const questionIdx = questionNorm.length;
+      const tokens = tokenize(norm);
+      questionNorm.push(norm);
+      tokenCounts.push(tokens.size);
+      questionDirections.push(directionIdx);
+
+      for (const token of tokens) {
+        const list = postings.get(token);
+        if (list) {
+          list.push(questionIdx);
+        } else {
+          postings.set(token, [questionIdx]);
+        }
+      }
+    }
+  }
+
+  return {
+    userAccountId,
+    directions,
+    directionIds: new Set(directions.map(d => d.id)),
+    questionNorm,
+    questionTokenCount: Int32Array.from(tokenCounts),
+    questionDirection: Int32Array.from(questionDirections),
+    postings,
+  };
+}
+
+async function loadDirectionMatcherIndex(
   userAccountId: string,
-  accountId: string | null,
-  threshold: number = 0.7
-): Promise<MatchResult> {
-  try {
+  accountId: string | null
+): Promise<DirectionMatcherIndex | null> {
+  // Фильтр по account_id ТОЛЬКО в multi-account режиме (см. MULTI_ACCOUNT_GUIDE.md)
+  // В legacy режиме индекс строится по всем направлениям пользователя
+  const filterAccountId = await shouldFilterByAccountId(supabase, userAccountId, accountId) ? accountId : null;
+  const key = indexKey(userAccountId, filterAccountId);
+
+  const cached = indexCache.get(key);
+  if (cached && cached.expires > Date.now()) {
+    return cached.index;
+  }
+
+  const pending = inFlight.get(key);
+  if (pending) return pending;
+
+  const generation = generations.get(key) ?? 0;
+
+  const promise = (async () => {
     // Получаем все активные направления пользователя с настройками
     let query = supabase
       .from('account_directions')
@@ -106,76 +210,193 @@ export async function matchMessageToDirection(
       .eq('is_active', true)
       .eq('objective', 'whatsapp');
 
-    // Фильтр по account_id ТОЛЬКО в multi-account режиме (см. MULTI_ACCOUNT_GUIDE.md)
-    // В legacy режиме возвращаем все направления пользователя
-    if (await shouldFilterByAccountId(supabase, userAccountId, accountId)) {
-      query = query.eq('account_id', accountId);
+    if (filterAccountId) {
+      query = query.eq('account_id', filterAccountId);
     }
 
     const { data: directions, error } = await query;
 
     if (error) {
       log.error({ error, userAccountId }, 'Failed to fetch directions');
-      return { matched: false, similarity: 0, directionId: null, directionName: null };
+      return null;
     }
 
-    if (!directions || directions.length === 0) {
-      log.debug({ userAccountId }, 'No whatsapp directions found');
-      return { matched: false, similarity: 0, directionId: null, directionName: null };
+    const index = buildDirectionMatcherIndex(userAccountId, directions || []);
+
+    if ((generations.get(key) ?? 0) === generation) {
+      indexCache.set(key, { index, expires: Date.now() + INDEX_TTL_MS });
     }
 
-    let bestMatch: MatchResult = {
-      matched: false,
-      similarity: 0,
-      directionId: null,
-      directionName: null
-    };
-
-    // Сравниваем сообщение с client_question каждого направления
-    for (const direction of directions) {
-      const settings = direction.default_ad_settings as any;
-      const allQuestions: string[] = (settings?.client_questions?.length
-        ? settings.client_questions
-        : [settings?.client_question]
-      ).filter(Boolean);
-
-      if (allQuestions.length === 0) {
-        continue;
-      }
+    log.debug({
+      userAccountId,
+      accountId: filterAccountId,
+      directions: index.directions.length,
+      questions: index.questionNorm.length,
+      tokens: index.postings.size
+    }, 'Direction matcher index built');
 
-      const maxSimilarity = Math.max(...allQuestions.map(q => calculateSimilarity(messageText, q)));
+    return index;
+  })();
 
-      log.debug({
-        directionId: direction.id,
-        directionName: direction.name,
-        allQuestions,
-        messageText: messageText.substring(0, 100),
-        maxSimilarity
-      }, 'Comparing message with direction');
-
-      if (maxSimilarity > bestMatch.similarity) {
-        bestMatch = {
-          matched: maxSimilarity >= threshold,
-          similarity: maxSimilarity,
-          directionId: direction.id,
-          directionName: direction.name
-        };
-      }
+  inFlight.set(key, promise);
+  try {
+    return await promise;
+  } finally {
+    inFlight.delete(key);
+  }
+}
+
+/**
+ * Сбросить кэш индексов после изменения направлений или их default_ad_settings.
+ * userAccountId — все индексы пользователя; directionId — индексы, содержащие направление.
+ * Без параметров — весь кэш.
+ */
+export function invalidateDirectionMatcher(params: { userAccountId?: string; directionId?: string } = {}): void {
+  const { userAccountId, directionId } = params;
+  const keys = new Set<string>([...indexCache.keys(), ...inFlight.keys()]);
+
+  for (const key of keys) {
+    const cached = indexCache.get(key);
+    const matchesUser = userAccountId !== undefined && key.startsWith(`${userAccountId}:`);
+    const matchesDirection = directionId !== undefined && !!cached?.index.directionIds.has(directionId);
+    // Строящийся индекс с неизвестным составом сбрасываем при любой инвалидации по направлению
+    const inFlightUnknown = directionId !== undefined && !cached && inFlight.has(key);
+
+    if ((!userAccountId && !directionId) || matchesUser || matchesDirection || inFlightUnknown) {
+      indexCache.delete(key);
+      generations.set(key, (generations.get(key) ?? 0) + 1);
     }
+  }
+}
 
-    if (bestMatch.matched) {
-      log.info({
+/**
+ * Сравнивает сообщение с вопросами индекса, у которых есть хотя бы одно общее
+ * слово (кандидаты из postings) — стоимость не зависит от общего числа вопросов.
+ * Вопрос без общих слов получает 0, в том числе при вхождении по части слова.
+ * intersections — переиспользуемый буфер размера questionNorm.length (обнулён на входе и выходе).
+ */
+function matchAgainstIndex(
+  index: DirectionMatcherIndex,
+  messageText: string,
+  threshold: number,
+  intersections: Int32Array
+): MatchResult {
+  const norm = normalize(messageText);
+  if (norm.length === 0 || index.questionNorm.length === 0) {
+    return { ...NO_MATCH };
+  }
+
+  // Пересечения по словам через инвертированный индекс (только вопросы с общими словами)
+  const messageTokens = tokenize(norm);
+  for (const token of messageTokens) {
+    const list = index.postings.get(token);
+    if (!list) continue;
+    for (const questionIdx of list) intersections[questionIdx]++;
+  }
+
+  // Максимальная схожесть по каждому направлению.
+  // Вхождение проверяется для всех вопросов: вопрос может входить в сообщение
+  // частью слова ('цена' в 'ценами') без общих слов; Jaccard — только при пересечении
+  const directionScores = new Float64Array(index.directions.length);
+  for (let q = 0; q < index.questionNorm.length; q++) {
+    const intersection = intersections[q];
+    intersections[q] = 0;
+    const score = containmentSimilarity(norm, index.questionNorm[q])
+      ?? (intersection > 0
+        ? intersection / (messageTokens.size + index.questionTokenCount[q] - intersection)
+        : 0);
+    const d = index.questionDirection[q];
+    if (score > directionScores[d]) directionScores[d] = score;
+  }
+
+  // Порядок направлений как в выборке: при равенстве побеждает первое
+  let bestMatch: MatchResult = { ...NO_MATCH };
+  for (let d = 0; d < index.directions.length; d++) {
+    if (directionScores[d] > bestMatch.similarity) {
+      bestMatch = {
+        matched: directionScores[d] >= threshold,
+        similarity: directionScores[d],
+        directionId: index.directions[d].id,
+        directionName: index.directions[d].name
+      };
+    }
+  }
+
+  return bestMatch;
+}
+
+/**
+ * Ищет направление по совпадению сообщения с client_question
+ * Возвращает направление с наибольшим совпадением >= порога
+ *
+ * @param messageText - Текст сообщения для сравнения
+ * @param userAccountId - UUID пользователя
+ * @param accountId - UUID рекламного аккаунта для мультиаккаунтности (NULL для legacy)
+ * @param threshold - Минимальный порог совпадения (0-1)
+ */
+export async function matchMessageToDirection(
+  messageText: string,
+  userAccountId: string,
+  accountId: string | null,
+  threshold: number = 0.7
+): Promise<MatchResult> {
+  const [result] = await matchMessagesToDirections([messageText], userAccountId, accountId, threshold);
+  return result;
+}
+
+/**
+ * Пакетный вариант matchMessageToDirection: индекс загружается один раз на все сообщения.
+ * Для ре-атрибуции истории (greenapi и т.п.), где тысячи сообщений одного пользователя.
+ *
+ * @returns результаты в порядке messages
+ */
+export async function matchMessagesToDirections(
+  messages: string[],
+  userAccountId: string,
+  accountId: string | null,
+  threshold: number = 0.7
+): Promise<MatchResult[]> {
+  try {
+    const index = await loadDirectionMatcherIndex(userAccountId, accountId);
+
+    if (!index || index.directions.length === 0) {
+      if (index) log.debug({ userAccountId }, 'No whatsapp directions found');
+      return messages.map(() => ({ ...NO_MATCH }));
+    }
+
+    const intersections = new Int32Array(index.questionNorm.length);
+    const results = messages.map(messageText => matchAgainstIndex(index, messageText, threshold, intersections));
+
+    if (messages.length === 1) {
+      const bestMatch = results[0];
+      log.debug({
         userAccountId,
-        accountId,
+        messageText: messages[0].substring(0, 100),
         directionId: bestMatch.directionId,
-        directionName: bestMatch.directionName,
         similarity: bestMatch.similarity
-      }, 'Message matched to direction via client_question');
+      }, 'Compared message with directions');
+
+      if (bestMatch.matched) {
+        log.info({
+          userAccountId,
+          accountId,
+          directionId: bestMatch.directionId,
+          directionName: bestMatch.directionName,
+          similarity: bestMatch.similarity
+        }, 'Message matched to direction via client_question');
+      }
+    } else {
+      log.info({
+        userAccountId,
+        accountId,
+        total: messages.length,
+        matched: results.filter(r => r.matched).length
+      }, 'Batch matched messages to directions');
     }
 
-    return bestMatch;
+    return results;
   } catch (error: any) {
     log.error({ error: error.message, userAccountId }, 'Error in matchMessageToDirection');
-    return { matched: false, similarity: 0, directionId: null, directionName: null };
+    return messages.map(() => ({ ...NO_MATCH }));
   }
 }
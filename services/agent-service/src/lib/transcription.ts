@@ -1,6 +1,6 @@
 import { OpenAI } from 'openai';
 import ffmpeg from 'fluent-ffmpeg';
-import { promises as fs } from 'fs';
+import { promises as fs, createReadStream } from 'fs';
 import { randomUUID } from 'crypto';
 import path from 'path';
 
@@ -35,11 +35,9 @@ export async function transcribeAudio(audioPath: string, language: string = 'ru'
   language: string;
   duration?: number;
 }> {
-  const audioFile = await fs.readFile(audioPath);
-  
-  // OpenAI API принимает File или Blob, создаем через toFile helper
+  // Файл отправляется потоком, без чтения в Buffer
   const transcription = await openai.audio.transcriptions.create({
-    file: await OpenAI.toFile(audioFile, 'audio.wav'),
+    file: createReadStream(audioPath),
     model: 'whisper-1',
     language: language,
     response_format: 'verbose_json'
@@ -79,26 +77,28 @@ export async function extractVideoThumbnail(videoPath: string): Promise<Buffer>
 }
 
 /**
- * Извлекает первый кадр видео для TikTok cover image.
- * TikTok принимает cover: 9:16, 1:1 или 16:9.
- * Для нестандартных пропорций (например 4:5) кропаем до ближайшего 9:16
- * с центрированием по высоте/ширине.
- * Минимальное разрешение: 720x1280 (9:16).
+ * Размеры видео и наличие аудиодорожки (ffprobe читает только заголовки)
  */
-export async function extractVideoThumbnail916(videoPath: string): Promise<Buffer> {
-  const thumbnailPath = path.join('/var/tmp', `thumbnail_tiktok_${randomUUID()}.jpg`);
-
-  // Определяем размеры видео
-  const probe = await new Promise<{ width: number; height: number }>((resolve, reject) => {
+export async function probeVideo(videoPath: string): Promise<{ width: number; height: number; hasAudio: boolean }> {
+  return new Promise((resolve, reject) => {
     ffmpeg.ffprobe(videoPath, (err, data) => {
       if (err) return reject(err);
       const stream = data.streams.find(s => s.codec_type === 'video');
       if (!stream || !stream.width || !stream.height) return reject(new Error('No video stream found'));
-      resolve({ width: stream.width, height: stream.height });
+      resolve({
+        width: stream.width,
+        height: stream.height,
+        hasAudio: data.streams.some(s => s.codec_type === 'audio')
+      });
     });
   });
+}
 
-  const ratio = probe.width / probe.height;
+/**
+ * Фильтры обложки TikTok: 9:16, 1:1 или 16:9 в зависимости от пропорций видео
+ */
+export function tiktokThumbnailFilters(width: number, height: number): string[] {
+  const ratio = width / height;
 
   // Определяем target: 9:16 (<= 0.625), 1:1 (0.625..1.333), 16:9 (>= 1.333)
   let targetW: number;
@@ -115,15 +115,30 @@ export async function extractVideoThumbnail916(videoPath: string): Promise<Buffe
     targetW = 1280; targetH = 720;
   }
 
+  return [
+    // Масштабируем чтобы покрыть target (crop, не pad), потом кропаем по центру
+    `scale=${targetW}:${targetH}:force_original_aspect_ratio=increase`,
+    `crop=${targetW}:${targetH}`
+  ];
+}
+
+/**
+ * Извлекает первый кадр видео для TikTok cover image.
+ * TikTok принимает cover: 9:16, 1:1 или 16:9.
+ * Для нестандартных пропорций (например 4:5) кропаем до ближайшего 9:16
+ * с центрированием по высоте/ширине.
+ * Минимальное разрешение: 720x1280 (9:16).
+ */
+export async function extractVideoThumbnail916(videoPath: string): Promise<Buffer> {
+  const thumbnailPath = path.join('/var/tmp', `thumbnail_tiktok_${randomUUID()}.jpg`);
+
+  const probe = await probeVideo(videoPath);
+
   return new Promise((resolve, reject) => {
     ffmpeg(videoPath)
       .seekInput(0.001)
       .frames(1)
-      .videoFilters([
-        // Масштабируем чтобы покрыть target (crop, не pad), потом кропаем по центру
-        `scale=${targetW}:${targetH}:force_original_aspect_ratio=increase`,
-        `crop=${targetW}:${targetH}`
-      ])
+      .videoFilters(tiktokThumbnailFilters(probe.width, probe.height))
       .output(thumbnailPath)
       .on('end', async () => {
         try {
@@ -139,6 +154,89 @@ export async function extractVideoThumbnail916(videoPath: string): Promise<Buffe
   });
 }
 
+export type VideoThumbnailFormat = 'facebook' | 'tiktok';
+
+export interface VideoAssets {
+  thumbnail: Buffer;
+  // null если в видео нет аудиодорожки
+  audioPath: string | null;
+}
+
+/**
+ * Один запуск ffmpeg: обложка и (если задан audioPath) WAV для транскрипции
+ */
+function runAssetsCommand(
+  videoPath: string,
+  format: VideoThumbnailFormat,
+  probe: { width: number; height: number },
+  thumbnailPath: string,
+  audioPath: string | null
+): Promise<void> {
+  const command = ffmpeg(videoPath)
+    .seekInput(0.001)
+    .output(thumbnailPath)
+    .noAudio()
+    .frames(1);
+
+  if (format === 'tiktok') {
+    command.videoFilters(tiktokThumbnailFilters(probe.width, probe.height));
+  } else {
+    command.size('1200x628'); // Оптимальный размер для Facebook
+  }
+
+  if (audioPath) {
+    command
+      .output(audioPath)
+      .noVideo()
+      .audioCodec('pcm_s16le')
+      .audioFrequency(16000)
+      .audioChannels(1);
+  }
+
+  return new Promise<void>((resolve, reject) => {
+    command
+      .on('end', () => resolve())
+      .on('error', (err: Error) => reject(new Error(`FFmpeg assets error: ${err.message}`)))
+      .run();
+  });
+}
+
+/**
+ * Извлекает обложку и аудио для транскрипции за один проход ffmpeg:
+ * видео читается и демультиплексируется один раз, оба output пишутся параллельно.
+ * Аудио остаётся на диске (WAV 16kHz mono, ~2 МБ/мин) — его удаляет вызывающий код.
+ * Если совместный проход упал (например, битая аудиодорожка), обложка извлекается
+ * повторно без аудио: ошибка аудио не должна ломать загрузку креатива.
+ */
+export async function extractVideoAssets(
+  videoPath: string,
+  format: VideoThumbnailFormat
+): Promise<VideoAssets> {
+  const probe = await probeVideo(videoPath);
+  const thumbnailPath = path.join('/var/tmp', `thumbnail_${randomUUID()}.jpg`);
+  let audioPath = probe.hasAudio ? path.join('/tmp', `audio_${randomUUID()}.wav`) : null;
+
+  try {
+    try {
+      await runAssetsCommand(videoPath, format, probe, thumbnailPath, audioPath);
+    } catch (err) {
+      if (!audioPath) throw err;
+      console.warn(`[extractVideoAssets] Combined pass failed, retrying thumbnail without audio: ${(err as Error).message}`);
+      await fs.unlink(audioPath).catch(() => {});
+      audioPath = null;
+      await runAssetsCommand(videoPath, format, probe, thumbnailPath, null);
+    }
+
+    const thumbnail = await fs.readFile(thumbnailPath);
+    return { thumbnail, audioPath };
+  } catch (err) {
+    if (audioPath) await fs.unlink(audioPath).catch(() => {});
+    throw err;
+  } finally {
+    await fs.unlink(thumbnailPath).catch(() => {});
+  }
+}
+
 /**
  * Обрабатывает видео: извлекает аудио и транскрибирует его
  */
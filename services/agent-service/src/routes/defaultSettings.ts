@@ -2,6 +2,7 @@ import { FastifyInstance, FastifyRequest, FastifyReply } from 'fastify';
 import { z } from 'zod';
 import { supabase } from '../lib/supabase.js';
 import { logErrorToAdmin } from '../lib/errorLogger.js';
+import { invalidateDirectionMatcher } from '../lib/textMatcher.js';
 
 // ========================================
 // VALIDATION SCHEMAS
@@ -268,6 +269,9 @@ export async function defaultSettingsRoutes(app: FastifyInstance) {
         result = data;
       }
 
+      // client_question(s) используются матчингом входящих сообщений
+      invalidateDirectionMatcher({ userAccountId: direction.user_account_id });
+
       return reply.code(existing ? 200 : 201).send({
         success: true,
         settings: result,
@@ -368,6 +372,10 @@ export async function defaultSettingsRoutes(app: FastifyInstance) {
         });
       }
 
+      if (data?.direction_id) {
+        invalidateDirectionMatcher({ directionId: data.direction_id });
+      }
+
       return reply.send({
         success: true,
         settings: data,
@@ -407,10 +415,11 @@ export async function defaultSettingsRoutes(app: FastifyInstance) {
         });
       }
 
-      const { error } = await supabase
+      const { data: deleted, error } = await supabase
         .from('default_ad_settings')
         .delete()
-        .eq('id', id);
+        .eq('id', id)
+        .select('direction_id');
 
       if (error) {
         app.log.error({ msg: 'Failed to delete settings', error });
@@ -420,6 +429,12 @@ export async function defaultSettingsRoutes(app: FastifyInstance) {
         });
       }
 
+      for (const row of deleted || []) {
+        if (row.direction_id) {
+          invalidateDirectionMatcher({ directionId: row.direction_id });
+        }
+      }
+
       return reply.send({
         success: true,
         message: 'Settings deleted successfully',
@@ -10,6 +10,7 @@ import { getPageAccessToken, subscribePageToLeadgen } from '../lib/facebookHelpe
 import { getTikTokCredentials, getTikTokObjectiveConfig } from '../lib/tiktokSettings.js';
 import { getAppInstallsConfig, getAppInstallsConfigEnvHints } from '../lib/appInstallsConfig.js';
 import { checkUploadEligibility } from '../lib/uploadEligibility.js';
+import { invalidateDirectionMatcher } from '../lib/textMatcher.js';
 import { tt } from '../adapters/tiktok.js';
 
 const log = createLogger({ module: 'directionsRoutes' });
@@ -1459,6 +1460,8 @@ export async function directionsRoutes(app: FastifyInstance) {
         });
       }
 
+      invalidateDirectionMatcher({ userAccountId: input.userAccountId });
+
       // Обновляем этап онбординга
       onDirectionCreated(input.userAccountId).catch(err => {
         log.warn({ err, userId: input.userAccountId }, 'Failed to update onboarding stage');
@@ -1878,6 +1881,8 @@ export async function directionsRoutes(app: FastifyInstance) {
         whatsapp_phone_number: updatedDirection.whatsapp_phone_number?.phone_number || null,
       };
 
+      invalidateDirectionMatcher({ userAccountId: existingDirection.user_account_id });
+
       log.info({ directionId: id }, 'Direction updated successfully');
 
       return reply.send({
@@ -2011,6 +2016,8 @@ export async function directionsRoutes(app: FastifyInstance) {
         });
       }
 
+      invalidateDirectionMatcher({ userAccountId: direction.user_account_id });
+
       log.info({ directionId: id }, 'Direction deleted successfully');
 
       return reply.send({
@@ -14,7 +14,7 @@ import path from 'path';
 import fs from 'fs/promises';
 import { randomUUID } from 'crypto';
 import { supabase } from '../lib/supabase.js';
-import { processVideoTranscription, extractVideoThumbnail, extractVideoThumbnail916 } from '../lib/transcription.js';
+import { transcribeAudio, extractVideoAssets, VideoAssets } from '../lib/transcription.js';
 import {
   graph,
   uploadVideo,
@@ -26,7 +26,7 @@ import {
   createLeadFormVideoCreative,
   createAppInstallsVideoCreative
 } from '../adapters/facebook.js';
-import { uploadVideo as uploadTikTokVideo } from '../adapters/tiktok.js';
+import { uploadVideoFile as uploadTikTokVideoFile } from '../adapters/tiktok.js';
 import { getTikTokCredentials } from '../lib/tiktokSettings.js';
 import { onCreativeCreated } from '../lib/onboardingHelper.js';
 import { logErrorToAdmin } from '../lib/errorLogger.js';
@@ -34,6 +34,7 @@ import { createLogger } from '../lib/logger.js';
 import { getAppInstallsConfig, getAppInstallsConfigEnvHints } from '../lib/appInstallsConfig.js';
 import { checkUploadEligibility } from '../lib/uploadEligibility.js';
 import { resolveAccountIdForWrite } from '../lib/multiAccountHelper.js';
+import { createConcurrencyLimiter, ConcurrencyLimitError } from '../lib/concurrency.js';
 
 const log = createLogger({ module: 'tusUpload' });
 
@@ -42,6 +43,18 @@ const MAX_TITLE_LENGTH = 500;
 const TRANSCRIPTION_TIMEOUT_MS = 120000; // 2 минуты
 const TIKTOK_UPLOAD_RETRY_DELAYS = [2000, 5000, 10000]; // Exponential backoff
 
+// Сколько загрузок обрабатывается одновременно (upload в FB/TikTok + ffmpeg).
+// Остальные ждут в очереди — пиковая память процесса не растёт с числом загрузок.
+const VIDEO_JOB_CONCURRENCY = parseInt(process.env.TUS_VIDEO_JOB_CONCURRENCY || '2', 10) || 2;
+// Очередь ограничена: каждая ждущая загрузка держит файл на диске.
+// Сверх лимита загрузка отклоняется с 503, слишком долго ждавшая — помечается ошибкой.
+const VIDEO_JOB_MAX_QUEUE = parseInt(process.env.TUS_VIDEO_JOB_MAX_QUEUE || '20', 10) || 20;
+const VIDEO_JOB_QUEUE_TIMEOUT_MS = parseInt(process.env.TUS_VIDEO_JOB_QUEUE_TIMEOUT_MS || '900000', 10) || 900000; // 15 минут
+const videoJobs = createConcurrencyLimiter(VIDEO_JOB_CONCURRENCY, {
+  maxQueue: VIDEO_JOB_MAX_QUEUE,
+  queueTimeoutMs: VIDEO_JOB_QUEUE_TIMEOUT_MS
+});
+
 // Валидация uploadId для защиты от path traversal
 const VALID_UPLOAD_ID_REGEX = /^[a-zA-Z0-9_-]+$/;
 
@@ -118,6 +131,17 @@ function normalizeAdAccountId(adAccountId: string): string {
   return id.startsWith('act_') ? id : `act_${id}`;
 }
 
+/**
+ * Удаляет аудио, извлечённое для транскрипции, если транскрипция не была запущена
+ */
+async function discardVideoAssets(assetsPromise: Promise<VideoAssets> | null) {
+  if (!assetsPromise) return;
+  const assets = await assetsPromise.catch(() => null);
+  if (assets?.audioPath) {
+    await fs.unlink(assets.audioPath).catch(() => {});
+  }
+}
+
 /**
  * Обработка TikTok upload - загрузка видео в TikTok Ads
  *
@@ -137,6 +161,7 @@ async function processTikTokUpload(
   const correlationId = randomUUID();
   const startTime = Date.now();
   let creativeId: string | null = null;
+  let assetsPromise: Promise<VideoAssets> | null = null;
   let backgroundTranscriptionStarted = false;
 
   // Валидация uploadId для защиты от path traversal
@@ -213,6 +238,10 @@ async function processTikTokUpload(
 
     log.info({ correlationId, uploadId, creativeId }, '[TUS-TikTok] Creative record created');
 
+    // 3. Обложка 9:16 и аудио для транскрипции — один проход ffmpeg параллельно с загрузкой в TikTok
+    assetsPromise = extractVideoAssets(videoPath, 'tiktok');
+    assetsPromise.catch(() => {}); // Ошибка обрабатывается при await ниже
+
     // 4. Загрузить видео в TikTok с retry
     log.info({
       correlationId,
@@ -220,12 +249,13 @@ async function processTikTokUpload(
       advertiserId: creds.advertiserId
     }, '[TUS-TikTok] Uploading video to TikTok Ads');
 
-    const videoBuffer = await fs.readFile(videoPath);
-    const fileSizeMB = Math.round(videoBuffer.length / 1024 / 1024);
-    log.info({ correlationId, uploadId, fileSizeMB }, '[TUS-TikTok] Read video file, starting upload');
+    // Файл отправляется потоком с диска, без чтения в память
+    const { size: fileSize } = await fs.stat(videoPath);
+    const fileSizeMB = Math.round(fileSize / 1024 / 1024);
+    log.info({ correlationId, uploadId, fileSizeMB }, '[TUS-TikTok] Streaming video file to TikTok');
 
     const uploadResult = await withRetry(
-      () => uploadTikTokVideo(creds.advertiserId, creds.accessToken, videoBuffer),
+      () => uploadTikTokVideoFile(creds.advertiserId, creds.accessToken, videoPath),
       TIKTOK_UPLOAD_RETRY_DELAYS,
       'TikTok video upload',
       correlationId
@@ -238,11 +268,14 @@ async function processTikTokUpload(
       tiktokVideoId
     }, '[TUS-TikTok] Video uploaded to TikTok successfully');
 
-    // 4.5. Извлечь thumbnail (9:16) и сохранить в Supabase Storage
+    // 4.5. Дождаться thumbnail (9:16) и сохранить в Supabase Storage
     let thumbnailUrl: string | null = null;
+    let audioPath: string | null = null;
     try {
-      log.info({ correlationId, uploadId }, '[TUS-TikTok] Extracting 9:16 thumbnail from video...');
-      const thumbnailBuffer = await extractVideoThumbnail916(videoPath);
+      log.info({ correlationId, uploadId }, '[TUS-TikTok] Waiting for 9:16 thumbnail extraction...');
+      const assets = await assetsPromise;
+      audioPath = assets.audioPath;
+      const thumbnailBuffer = assets.thumbnail;
       log.info({
         correlationId,
         uploadId,
@@ -347,15 +380,20 @@ async function processTikTokUpload(
       log.warn({ correlationId, err, userId }, '[TUS-TikTok] Failed to update onboarding');
     });
 
-    // Запускаем транскрипцию в фоне — не блокируем завершение основного потока
-    const bgVideoPath = videoPath;
+    // Запускаем транскрипцию в фоне — не блокируем завершение основного потока.
+    // Аудио уже извлечено, видеофайл фоновой задаче не нужен.
+    if (!audioPath) {
+      log.warn({ correlationId, uploadId }, '[TUS-TikTok] No audio extracted, skipping transcription');
+      return;
+    }
+    const bgAudioPath = audioPath;
     const bgCreativeId = creativeId;
     backgroundTranscriptionStarted = true;
     // Используем Promise.resolve().then() для fire-and-forget в следующем тике event loop
     Promise.resolve().then(() => {
       log.info({ correlationId, uploadId }, '[TUS-TikTok] Starting background transcription');
       return withTimeout(
-        processVideoTranscription(bgVideoPath, language),
+        transcribeAudio(bgAudioPath, language),
         TRANSCRIPTION_TIMEOUT_MS,
         'Transcription'
       )
@@ -376,8 +414,7 @@ async function processTikTokUpload(
           log.warn({ err, correlationId, uploadId }, '[TUS-TikTok] Background transcription failed');
         })
         .finally(async () => {
-          await fs.unlink(bgVideoPath).catch(() => {});
-          log.info({ correlationId, videoPath: bgVideoPath }, '[TUS-TikTok] Video file deleted after background transcription');
+          await fs.unlink(bgAudioPath).catch(() => {});
         });
     }).catch(() => {});
 
@@ -423,18 +460,52 @@ async function processTikTokUpload(
   } finally {
     // Удаляем .json метаданные TUS (всегда)
     await fs.unlink(`${videoPath}.json`).catch(() => {});
-    // Видеофайл удаляет фоновая транскрипция; если она не была запущена (ошибка до её старта) — удаляем здесь
+    // Аудио удаляет фоновая транскрипция; если она не была запущена — удаляем здесь
     if (!backgroundTranscriptionStarted) {
-      try {
-        await fs.unlink(videoPath);
-        log.info({ correlationId, videoPath }, '[TUS-TikTok] Temporary video file deleted (no background transcription)');
-      } catch (err) {
+      await discardVideoAssets(assetsPromise);
+    }
+    // Видео больше не нужно: загрузка завершена, аудио для транскрипции извлечено
+    try {
+      await fs.unlink(videoPath);
+      log.info({ correlationId, videoPath }, '[TUS-TikTok] Temporary video file deleted');
+    } catch (err: any) {
+      if (err?.code !== 'ENOENT') {
         log.warn({ correlationId, err, videoPath }, '[TUS-TikTok] Failed to delete temporary video file');
       }
     }
   }
 }
 
+/**
+ * Удаляет файлы загрузки, которая не дождалась обработки (переполнение/таймаут очереди).
+ * С errorText — создаёт строку с ошибкой, чтобы polling фронтенда показал причину.
+ */
+async function discardQueuedUpload(uploadId: string, metadata: Record<string, string>, errorText?: string) {
+  const videoPath = path.join(TUS_UPLOAD_DIR, uploadId);
+  await fs.unlink(`${videoPath}.json`).catch(() => {});
+  await fs.unlink(videoPath).catch(() => {});
+
+  if (!errorText || !metadata.user_id) return;
+
+  try {
+    const effectiveAccountId = await resolveAccountIdForWrite(supabase, metadata.user_id, metadata.account_id);
+    await supabase
+      .from('user_creatives')
+      .insert({
+        user_id: metadata.user_id,
+        account_id: effectiveAccountId,
+        title: metadata.title || metadata.filename || 'Untitled',
+        status: 'error',
+        direction_id: metadata.direction_id || null,
+        media_type: 'video',
+        tus_upload_id: uploadId,
+        error_text: errorText,
+      });
+  } catch (insertErr: any) {
+    log.warn({ uploadId, err: insertErr?.message }, '[TUS] Failed to insert error creative row');
+  }
+}
+
 /**
  * Обработка завершённого upload - аналогично /process-video
  */
@@ -442,6 +513,7 @@ async function processCompletedUpload(uploadId: string, metadata: Record<string,
   const videoPath = path.join(TUS_UPLOAD_DIR, uploadId);
   const startTime = Date.now();
   let creativeId: string | null = null;
+  let assetsPromise: Promise<VideoAssets> | null = null;
   let backgroundTranscriptionStarted = false;
 
   log.info({ uploadId, metadata }, '[TUS] Starting processing of completed upload');
@@ -617,6 +689,10 @@ async function processCompletedUpload(uploadId: string, metadata: Record<string,
     creativeId = creative.id;
     log.info({ uploadId, creativeId: creative.id }, '[TUS] Creative record created, uploading to Facebook...');
 
+    // Обложка и аудио для транскрипции — один проход ffmpeg параллельно с загрузкой в Facebook
+    assetsPromise = extractVideoAssets(videoPath, 'facebook');
+    assetsPromise.catch(() => {}); // Ошибка обрабатывается при await ниже
+
     // Upload на Facebook (streaming)
     log.info({ uploadId, adAccountId: normalizedAdAccountId }, '[TUS] Starting Facebook video upload...');
     const fbUploadStartTime = Date.now();
@@ -721,10 +797,11 @@ async function processCompletedUpload(uploadId: string, metadata: Record<string,
       return { description, clientQuestions, siteUrl, utm, leadFormId, appStoreUrl, objective, useInstagram, direction };
     };
 
-    const [thumbnailBuffer, directionSettings] = await Promise.all([
-      extractVideoThumbnail(videoPath),
+    const [videoAssets, directionSettings] = await Promise.all([
+      assetsPromise,
       loadDirectionSettings()
     ]);
+    const thumbnailBuffer = videoAssets.thumbnail;
 
     log.info({
       uploadId,
@@ -905,35 +982,39 @@ async function processCompletedUpload(uploadId: string, metadata: Record<string,
       totalDurationSec: Math.round(totalDurationMs / 1000)
     }, '[TUS] ✅ Upload processing completed successfully');
 
-    // Запускаем транскрипцию в фоне — не блокируем завершение основного потока
-    const bgVideoPath = videoPath;
+    // Запускаем транскрипцию в фоне — не блокируем завершение основного потока.
+    // Аудио уже извлечено, видеофайл фоновой задаче не нужен.
+    const bgAudioPath = videoAssets.audioPath;
     const bgCreativeId = creative.id;
-    backgroundTranscriptionStarted = true;
-    // Используем Promise.resolve().then() для fire-and-forget в следующем тике event loop
-    Promise.resolve().then(() => {
-      log.info({ uploadId }, '[TUS] Starting background transcription');
-      return processVideoTranscription(bgVideoPath, language)
-        .then(async (transcript) => {
-          await supabase
-            .from('creative_transcripts')
-            .insert({
-              creative_id: bgCreativeId,
-              lang: language,
-              source: 'whisper',
-              text: transcript.text,
-              duration_sec: transcript.duration ? Math.round(transcript.duration) : null,
-              status: 'ready'
-            });
-          log.info({ uploadId, creativeId: bgCreativeId }, '[TUS] Background transcription saved');
-        })
-        .catch((err: any) => {
-          log.warn({ err, uploadId }, '[TUS] Background transcription failed');
-        })
-        .finally(async () => {
-          await fs.unlink(bgVideoPath).catch(() => {});
-          log.info({ uploadId, videoPath: bgVideoPath }, '[TUS] Video file deleted after background transcription');
-        });
-    }).catch(() => {});
+    if (bgAudioPath) {
+      backgroundTranscriptionStarted = true;
+      // Используем Promise.resolve().then() для fire-and-forget в следующем тике event loop
+      Promise.resolve().then(() => {
+        log.info({ uploadId }, '[TUS] Starting background transcription');
+        return transcribeAudio(bgAudioPath, language)
+          .then(async (transcript) => {
+            await supabase
+              .from('creative_transcripts')
+              .insert({
+                creative_id: bgCreativeId,
+                lang: language,
+                source: 'whisper',
+                text: transcript.text,
+                duration_sec: transcript.duration ? Math.round(transcript.duration) : null,
+                status: 'ready'
+              });
+            log.info({ uploadId, creativeId: bgCreativeId }, '[TUS] Background transcription saved');
+          })
+          .catch((err: any) => {
+            log.warn({ err, uploadId }, '[TUS] Background transcription failed');
+          })
+          .finally(async () => {
+            await fs.unlink(bgAudioPath).catch(() => {});
+          });
+      }).catch(() => {});
+    } else {
+      log.warn({ uploadId }, '[TUS] Video has no audio track, skipping transcription');
+    }
 
     return {
       success: true,
@@ -983,12 +1064,16 @@ async function processCompletedUpload(uploadId: string, metadata: Record<string,
   } finally {
     // Удаляем .json метаданные TUS (всегда)
     await fs.unlink(`${videoPath}.json`).catch(() => {});
-    // Видеофайл удаляет фоновая транскрипция; если она не была запущена (ошибка до её старта) — удаляем здесь
+    // Аудио удаляет фоновая транскрипция; если она не была запущена — удаляем здесь
     if (!backgroundTranscriptionStarted) {
-      try {
-        await fs.unlink(videoPath);
-        log.info({ videoPath }, '[TUS] Temporary video file deleted (no background transcription)');
-      } catch (err) {
+      await discardVideoAssets(assetsPromise);
+    }
+    // Видео больше не нужно: загрузка завершена, аудио для транскрипции извлечено
+    try {
+      await fs.unlink(videoPath);
+      log.info({ videoPath }, '[TUS] Temporary video file deleted');
+    } catch (err: any) {
+      if (err?.code !== 'ENOENT') {
         log.warn({ err, videoPath }, '[TUS] Failed to delete temporary video file');
       }
     }
@@ -1051,9 +1136,34 @@ const tusServer = new Server({
   onUploadFinish: async (_req, upload) => {
     log.info({ uploadId: upload.id, size: upload.size }, 'TUS upload finished, starting processing');
 
-    // Запускаем обработку асинхронно
-    processCompletedUpload(upload.id, upload.metadata as Record<string, string>)
-      .catch(err => {
+    const metadata = upload.metadata as Record<string, string>;
+
+    // Очередь переполнена — не держим файл на диске, клиент повторит загрузку позже
+    if (!videoJobs.canAccept) {
+      log.warn({
+        uploadId: upload.id,
+        activeJobs: videoJobs.active,
+        queuedJobs: videoJobs.pending
+      }, 'Video processing queue is full, upload rejected');
+      await discardQueuedUpload(upload.id, metadata);
+      throw { status_code: 503, body: 'Video processing queue is full, please retry later\n' };
+    }
+
+    // Запускаем обработку асинхронно (не более VIDEO_JOB_CONCURRENCY одновременно)
+    if (videoJobs.active >= VIDEO_JOB_CONCURRENCY) {
+      log.info({
+        uploadId: upload.id,
+        activeJobs: videoJobs.active,
+        queuedJobs: videoJobs.pending + 1
+      }, 'Video processing slots are busy, upload queued');
+    }
+    videoJobs.run(() => processCompletedUpload(upload.id, metadata))
+      .catch(async err => {
+        if (err instanceof ConcurrencyLimitError) {
+          log.warn({ uploadId: upload.id, reason: err.reason }, 'Upload dropped from video processing queue');
+          await discardQueuedUpload(upload.id, metadata, 'Video processing queue timed out, please upload again');
+          return;
+        }
         log.error({ err, uploadId: upload.id }, 'Failed to process completed upload');
       });
 
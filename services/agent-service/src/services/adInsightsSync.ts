@@ -10,6 +10,7 @@
 import { graph } from '../adapters/facebook.js';
 import { supabase } from '../lib/supabaseClient.js';
 import { createLogger } from '../lib/logger.js';
+import { invalidateInsightsSnapshot } from '../lib/insightsSnapshot.js';
 import { getCredentials } from '../lib/adAccountHelper.js';
 
 const log = createLogger({ module: 'adInsightsSync' });
@@ -58,6 +59,8 @@ interface SyncContext {
   accessToken: string;
   fbAdAccountId: string;       // act_xxx
   isLegacy: boolean;
+  // Размер чанка для bulk upsert insights (по умолчанию INSIGHTS_UPSERT_CHUNK_SIZE)
+  upsertChunkSize?: number;
 }
 
 interface SyncJob {
@@ -496,12 +499,11 @@ async function pollAsyncJobStatus(accessToken: string, reportRunId: string): Pro
 }
 
 /**
- * Получает результаты async job
+ * Постранично читает результаты async job (по 500 строк за страницу)
+ * Позволяет обрабатывать отчёт потоком, не держа его целиком в памяти
  */
-async function fetchAsyncJobResults(accessToken: string, reportRunId: string): Promise<any[]> {
-  const results: any[] = [];
+export async function* iterateAsyncJobResults(accessToken: string, reportRunId: string): AsyncGenerator<any[]> {
   let cursor: string | undefined;
-  let lastCursor: string | undefined;
 
   do {
     const params: any = { limit: 500 };
@@ -510,20 +512,28 @@ async function fetchAsyncJobResults(accessToken: string, reportRunId: string): P
     const result = await graph('GET', `${reportRunId}/insights`, accessToken, params);
 
     if (result.data && result.data.length > 0) {
-      results.push(...result.data);
+      yield result.data;
     }
 
     const newCursor = result.paging?.cursors?.after;
 
     // Выходим если: нет cursor, пустые данные, или cursor не изменился (бесконечный цикл)
-    if (!newCursor || !result.data?.length || newCursor === lastCursor) {
+    if (!newCursor || !result.data?.length || newCursor === cursor) {
       break;
     }
 
-    lastCursor = cursor;
     cursor = newCursor;
   } while (cursor);
+}
 
+/**
+ * Получает результаты async job целиком
+ */
+async function fetchAsyncJobResults(accessToken: string, reportRunId: string): Promise<any[]> {
+  const results: any[] = [];
+  for await (const page of iterateAsyncJobResults(accessToken, reportRunId)) {
+    results.push(...page);
+  }
   return results;
 }
 
@@ -554,6 +564,209 @@ function extractVideoPercentWatched(actions: any[], percent: string): number {
   return action ? parseInt(action.value) || 0 : 0;
 }
 
+// ============================================================================
+// STREAMING BULK UPSERT PIPELINE
+// ============================================================================
+
+// Размер чанка для bulk upsert insights (строк в одном запросе к PostgREST)
+const UPSERT_CHUNK_SIZE = parseInt(process.env.INSIGHTS_UPSERT_CHUNK_SIZE || '500', 10) || 500;
+
+/**
+ * Статистика одной стадии синхронизации
+ */
+export interface StageStats {
+  rows: number;
+  failedRows: number;
+  chunks: number;
+  durationMs: number;
+  rowsPerSec: number;
+}
+
+export interface StreamUpsertOptions {
+  table: string;
+  onConflict: string;
+  conflictKeys: string[];
+  chunkSize?: number;
+  stage: string;
+}
+
+function buildStageStats(rows: number, failedRows: number, chunks: number, startedAt: number): StageStats {
+  const durationMs = Date.now() - startedAt;
+  return {
+    rows,
+    failedRows,
+    chunks,
+    durationMs,
+    rowsPerSec: durationMs > 0 ? Math.round((rows / durationMs) * 1000) : rows,
+  };
+}
+
+/**
+ * Ошибка в данных конкретной строки: SQLSTATE класса 22 (data exception)
+ * или 23 (integrity constraint violation). Остальные ошибки (PostgREST недоступен,
+ * нет колонки, statement timeout, RLS/права) одинаковы для любой части чанка.
+ */
+function isRowDataError(error: any): boolean {
+  return typeof error?.code === 'string' && /^2[23]/.test(error.code);
+}
+
+/**
+ * Upsert одного чанка с retry.
+ * Если чанк не записался из-за данных (например, одна битая строка), делим его пополам
+ * и повторяем только упавшие половины — остальные строки не теряются.
+ * При остальных ошибках чанк считается упавшим целиком: деление только умножило бы запросы.
+ * Возвращает количество записанных строк.
+ */
+async function upsertChunk(rows: any[], options: StreamUpsertOptions): Promise<number> {
+  try {
+    await withRetry(async () => {
+      const { error } = await supabase
+        .from(options.table)
+        .upsert(rows, { onConflict: options.onConflict, ignoreDuplicates: false });
+      if (error) throw error;
+    }, `${options.stage}: upsert chunk of ${rows.length}`);
+    return rows.length;
+  } catch (error: any) {
+    if (!isRowDataError(error)) {
+      log.error({ error, stage: options.stage, chunkSize: rows.length }, 'Chunk upsert failed');
+      return 0;
+    }
+
+    if (rows.length === 1) {
+      log.error({ error, stage: options.stage, row: options.conflictKeys.map(k => rows[0][k]) }, 'Failed to upsert insight row');
+      return 0;
+    }
+
+    log.warn({ stage: options.stage, chunkSize: rows.length, error: error?.message }, 'Chunk upsert failed, splitting');
+    const mid = Math.ceil(rows.length / 2);
+    return (await upsertChunk(rows.slice(0, mid), options)) + (await upsertChunk(rows.slice(mid), options));
+  }
+}
+
+/**
+ * Потоковый bulk upsert: читает страницы отчёта, нормализует строки и пишет чанками.
+ * В памяти одновременно не больше одной страницы и одного чанка.
+ */
+export async function streamUpsert(
+  pages: AsyncIterable<any[]>,
+  normalize: (row: any) => Record<string, any>,
+  options: StreamUpsertOptions
+): Promise<StageStats> {
+  const startedAt = Date.now();
+  const chunkSize = Math.max(1, options.chunkSize || UPSERT_CHUNK_SIZE);
+
+  // Ключ конфликта -> строка. Дубли внутри одного upsert PostgreSQL не принимает,
+  // поэтому оставляем последнюю версию (как при построчной записи)
+  let buffer = new Map<string, Record<string, any>>();
+  let rows = 0;
+  let submitted = 0;
+  let written = 0;
+  let chunks = 0;
+
+  const flush = async () => {
+    if (buffer.size === 0) return;
+    const chunk = Array.from(buffer.values());
+    buffer = new Map();
+    chunks++;
+    submitted += chunk.length;
+    written += await upsertChunk(chunk, options);
+  };
+
+  for await (const page of pages) {
+    for (const row of page) {
+      const record = normalize(row);
+      buffer.set(options.conflictKeys.map(k => record[k]).join('|'), record);
+      rows++;
+      if (buffer.size >= chunkSize) {
+        await flush();
+      }
+    }
+  }
+  await flush();
+
+  const stats = buildStageStats(written, submitted - written, chunks, startedAt);
+  log.info({ stage: options.stage, table: options.table, chunkSize, sourceRows: rows, ...stats }, 'Stream upsert completed');
+  return stats;
+}
+
+/**
+ * Нормализует строку ad-level weekly отчёта в запись meta_insights_weekly
+ */
+function normalizeWeeklyAdRow(row: any, accountIds: Record<string, string | null>): Record<string, any> {
+  const weekStart = getWeekStart(row.date_start);
+  const impressions = parseInt(row.impressions) || 0;
+  const linkClicks = extractLinkClicks(row.actions);
+  // Link CTR = link_clicks / impressions (CTR по ссылкам отдельно от общего CTR)
+  const linkCtr = impressions > 0 ? (linkClicks / impressions) * 100 : null;
+
+  return {
+    ...accountIds,
+    fb_ad_id: row.ad_id,
+    week_start_date: weekStart,
+    spend: parseFloat(row.spend) || 0,
+    impressions,
+    reach: parseInt(row.reach) || 0,
+    frequency: parseFloat(row.frequency) || 0,
+    cpm: parseFloat(row.cpm) || 0,
+    ctr: parseFloat(row.ctr) || 0,
+    cpc: parseFloat(row.cpc) || 0,
+    clicks: parseInt(row.clicks) || 0,
+    link_clicks: linkClicks,
+    link_ctr: linkCtr,
+    actions_json: row.actions || [],
+    cost_per_action_type_json: row.cost_per_action_type || [],
+    video_views: extractVideoViews(row.actions),
+    video_p25_watched: row.video_p25_watched_actions?.[0]?.value || 0,
+    video_p50_watched: row.video_p50_watched_actions?.[0]?.value || 0,
+    video_p75_watched: row.video_p75_watched_actions?.[0]?.value || 0,
+    video_p95_watched: row.video_p95_watched_actions?.[0]?.value || 0,
+    video_avg_time_watched_sec: row.video_avg_time_watched_actions?.[0]?.value || 0,
+    // Rankings (raw + normalized scores)
+    quality_ranking: row.quality_ranking,
+    engagement_rate_ranking: row.engagement_rate_ranking,
+    conversion_rate_ranking: row.conversion_rate_ranking,
+    quality_rank_score: rankingToScore(row.quality_ranking),
+    engagement_rank_score: rankingToScore(row.engagement_rate_ranking),
+    conversion_rank_score: rankingToScore(row.conversion_rate_ranking),
+    attribution_window: '7d_click_1d_view',
+    synced_at: new Date().toISOString(),
+  };
+}
+
+/**
+ * Нормализует строку ad-level daily отчёта в запись meta_insights_daily
+ */
+function normalizeDailyAdRow(row: any, accountIds: Record<string, string | null>): Record<string, any> {
+  const impressions = parseInt(row.impressions) || 0;
+  const clicks = parseInt(row.clicks) || 0;
+  const spend = parseFloat(row.spend) || 0;
+  const reach = parseInt(row.reach) || 0;
+
+  // Link clicks: приоритет outbound_clicks, иначе из actions
+  const linkClicks = row.outbound_clicks?.[0]?.value
+    ? parseInt(row.outbound_clicks[0].value)
+    : extractLinkClicks(row.actions);
+
+  return {
+    ...accountIds,
+    fb_ad_id: row.ad_id,
+    date: row.date_start,
+    impressions,
+    clicks,
+    spend,
+    reach,
+    ctr: impressions > 0 ? (clicks / impressions) * 100 : null,
+    cpm: impressions > 0 ? (spend / impressions) * 1000 : null,
+    cpc: clicks > 0 ? spend / clicks : null,
+    frequency: reach > 0 ? impressions / reach : null,
+    link_clicks: linkClicks,
+    link_ctr: impressions > 0 ? (linkClicks / impressions) * 100 : null,
+    actions_json: row.actions || null,
+    results_count: extractResultsCount(row.actions),
+    created_at: new Date().toISOString(),
+  };
+}
+
 /**
  * Синхронизирует weekly insights для ad account
  */
@@ -561,8 +774,9 @@ export async function syncWeeklyInsights(
   adAccountId: string,
   accessToken: string,
   fbAdAccountId: string,
-  months: number = 12
-): Promise<{ inserted: number; updated: number }> {
+  months: number = 12,
+  options: { upsertChunkSize?: number } = {}
+): Promise<{ inserted: number; updated: number; stats: StageStats }> {
   log.info({ adAccountId, fbAdAccountId, months }, 'Starting weekly insights sync');
 
   // 1. Проверяем rate limit
@@ -606,73 +820,28 @@ export async function syncWeeklyInsights(
     throw new Error(`Async job timeout after ${pollCount} polls`);
   }
 
-  // 4. Получаем результаты
-  const results = await fetchAsyncJobResults(accessToken, reportRunId);
-  log.info({ adAccountId, resultsCount: results.length }, 'Fetched async job results');
-
-  // 5. Сохраняем в БД
-  let inserted = 0;
-  let updated = 0;
-
-  for (const row of results) {
-    const weekStart = getWeekStart(row.date_start);
-
-    const impressions = parseInt(row.impressions) || 0;
-    const linkClicks = extractLinkClicks(row.actions);
-    // Link CTR = link_clicks / impressions (CTR по ссылкам отдельно от общего CTR)
-    const linkCtr = impressions > 0 ? (linkClicks / impressions) * 100 : null;
+  // 4-5. Потоково читаем результаты и сохраняем в БД чанками
+  const stats = await streamUpsert(
+    iterateAsyncJobResults(accessToken, reportRunId),
+    row => normalizeWeeklyAdRow(row, { ad_account_id: adAccountId }),
+    {
+      table: 'meta_insights_weekly',
+      onConflict: 'ad_account_id,fb_ad_id,week_start_date',
+      conflictKeys: ['ad_account_id', 'fb_ad_id', 'week_start_date'],
+      chunkSize: options.upsertChunkSize,
+      stage: 'weekly_insights',
+    }
+  );
 
-    const insight = {
-      ad_account_id: adAccountId,
-      fb_ad_id: row.ad_id,
-      week_start_date: weekStart,
-      spend: parseFloat(row.spend) || 0,
-      impressions,
-      reach: parseInt(row.reach) || 0,
-      frequency: parseFloat(row.frequency) || 0,
-      cpm: parseFloat(row.cpm) || 0,
-      ctr: parseFloat(row.ctr) || 0,
-      cpc: parseFloat(row.cpc) || 0,
-      clicks: parseInt(row.clicks) || 0,
-      link_clicks: linkClicks,
-      link_ctr: linkCtr,
-      actions_json: row.actions || [],
-      cost_per_action_type_json: row.cost_per_action_type || [],
-      video_views: extractVideoViews(row.actions),
-      video_p25_watched: row.video_p25_watched_actions?.[0]?.value || 0,
-      video_p50_watched: row.video_p50_watched_actions?.[0]?.value || 0,
-      video_p75_watched: row.video_p75_watched_actions?.[0]?.value || 0,
-      video_p95_watched: row.video_p95_watched_actions?.[0]?.value || 0,
-      video_avg_time_watched_sec: row.video_avg_time_watched_actions?.[0]?.value || 0,
-      // Rankings (raw + normalized scores)
-      quality_ranking: row.quality_ranking,
-      engagement_rate_ranking: row.engagement_rate_ranking,
-      conversion_rate_ranking: row.conversion_rate_ranking,
-      quality_rank_score: rankingToScore(row.quality_ranking),
-      engagement_rank_score: rankingToScore(row.engagement_rate_ranking),
-      conversion_rank_score: rankingToScore(row.conversion_rate_ranking),
-      attribution_window: '7d_click_1d_view',
-      synced_at: new Date().toISOString(),
-    };
+  // Upsert не различает вставку и обновление — inserted = записанные строки,
+  // updated всегда 0 (поле оставлено для ответа /admin API)
+  const inserted = stats.rows;
+  const updated = 0;
 
-    try {
-      await withRetry(async () => {
-        const { error } = await supabase
-          .from('meta_insights_weekly')
-          .upsert(insight, {
-            onConflict: 'ad_account_id,fb_ad_id,week_start_date',
-            ignoreDuplicates: false
-          });
-        if (error) throw error;
-      }, `upsert insight ad=${row.ad_id} week=${weekStart}`);
-      inserted++;
-    } catch (error) {
-      log.error({ error, adId: row.ad_id, weekStart }, 'Failed to upsert insight');
-    }
-  }
+  invalidateInsightsSnapshot(adAccountId, ['weeklyInsights']);
 
-  log.info({ adAccountId, inserted, updated }, 'Weekly insights synced');
-  return { inserted, updated };
+  log.info({ adAccountId, inserted, failed: stats.failedRows, rowsPerSec: stats.rowsPerSec }, 'Weekly insights synced');
+  return { inserted, updated, stats };
 }
 
 // ============================================================================
@@ -1079,7 +1248,7 @@ async function syncAdsWithContext(ctx: SyncContext): Promise<number> {
 /**
  * Синхронизирует weekly insights с поддержкой контекста
  */
-async function syncWeeklyInsightsWithContext(ctx: SyncContext, months: number = 12): Promise<{ inserted: number; updated: number }> {
+async function syncWeeklyInsightsWithContext(ctx: SyncContext, months: number = 12): Promise<{ inserted: number; updated: number; stats: StageStats }> {
   log.info({ userAccountId: ctx.userAccountId, fbAdAccountId: ctx.fbAdAccountId, months, isLegacy: ctx.isLegacy }, 'Starting weekly insights sync');
 
   // Для rate limit используем userAccountId (он всегда есть)
@@ -1120,69 +1289,26 @@ async function syncWeeklyInsightsWithContext(ctx: SyncContext, months: number =
     throw new Error(`Async job timeout after ${pollCount} polls`);
   }
 
-  const results = await fetchAsyncJobResults(ctx.accessToken, reportRunId);
-  log.info({ userAccountId: ctx.userAccountId, resultsCount: results.length }, 'Fetched async job results');
-
-  let inserted = 0;
-  const updated = 0;
   const accountIds = getAccountIds(ctx);
-
-  for (const row of results) {
-    const weekStart = getWeekStart(row.date_start);
-    const impressions = parseInt(row.impressions) || 0;
-    const linkClicks = extractLinkClicks(row.actions);
-    const linkCtr = impressions > 0 ? (linkClicks / impressions) * 100 : null;
-
-    const insight = {
-      ...accountIds,
-      fb_ad_id: row.ad_id,
-      week_start_date: weekStart,
-      spend: parseFloat(row.spend) || 0,
-      impressions,
-      reach: parseInt(row.reach) || 0,
-      frequency: parseFloat(row.frequency) || 0,
-      cpm: parseFloat(row.cpm) || 0,
-      ctr: parseFloat(row.ctr) || 0,
-      cpc: parseFloat(row.cpc) || 0,
-      clicks: parseInt(row.clicks) || 0,
-      link_clicks: linkClicks,
-      link_ctr: linkCtr,
-      actions_json: row.actions || [],
-      cost_per_action_type_json: row.cost_per_action_type || [],
-      video_views: extractVideoViews(row.actions),
-      video_p25_watched: row.video_p25_watched_actions?.[0]?.value || 0,
-      video_p50_watched: row.video_p50_watched_actions?.[0]?.value || 0,
-      video_p75_watched: row.video_p75_watched_actions?.[0]?.value || 0,
-      video_p95_watched: row.video_p95_watched_actions?.[0]?.value || 0,
-      video_avg_time_watched_sec: row.video_avg_time_watched_actions?.[0]?.value || 0,
-      quality_ranking: row.quality_ranking,
-      engagement_rate_ranking: row.engagement_rate_ranking,
-      conversion_rate_ranking: row.conversion_rate_ranking,
-      quality_rank_score: rankingToScore(row.quality_ranking),
-      engagement_rank_score: rankingToScore(row.engagement_rate_ranking),
-      conversion_rank_score: rankingToScore(row.conversion_rate_ranking),
-      attribution_window: '7d_click_1d_view',
-      synced_at: new Date().toISOString(),
-    };
-
-    try {
-      await withRetry(async () => {
-        const { error } = await supabase
-          .from('meta_insights_weekly')
-          .upsert(insight, {
-            onConflict: ctx.isLegacy ? 'user_account_id,fb_ad_id,week_start_date' : 'ad_account_id,fb_ad_id,week_start_date',
-            ignoreDuplicates: false
-          });
-        if (error) throw error;
-      }, `upsert insight ad=${row.ad_id} week=${weekStart}`);
-      inserted++;
-    } catch (error) {
-      log.error({ error, adId: row.ad_id, weekStart }, 'Failed to upsert insight');
+  const stats = await streamUpsert(
+    iterateAsyncJobResults(ctx.accessToken, reportRunId),
+    row => normalizeWeeklyAdRow(row, accountIds),
+    {
+      table: 'meta_insights_weekly',
+      onConflict: ctx.isLegacy ? 'user_account_id,fb_ad_id,week_start_date' : 'ad_account_id,fb_ad_id,week_start_date',
+      conflictKeys: [ctx.isLegacy ? 'user_account_id' : 'ad_account_id', 'fb_ad_id', 'week_start_date'],
+      chunkSize: ctx.upsertChunkSize,
+      stage: 'weekly_insights',
     }
-  }
+  );
 
-  log.info({ userAccountId: ctx.userAccountId, inserted, updated }, 'Weekly insights synced');
-  return { inserted, updated };
+  // Upsert не различает вставку и обновление — inserted = записанные строки,
+  // updated всегда 0 (поле оставлено для ответа /admin API)
+  const inserted = stats.rows;
+  const updated = 0;
+
+  log.info({ userAccountId: ctx.userAccountId, inserted, failed: stats.failedRows, rowsPerSec: stats.rowsPerSec }, 'Weekly insights synced');
+  return { inserted, updated, stats };
 }
 
 /**
@@ -1377,7 +1503,7 @@ async function syncWeeklyInsightsAdsetWithContext(ctx: SyncContext, months: numb
 /**
  * Синхронизирует daily insights с контекстом
  */
-async function syncDailyInsightsWithContext(ctx: SyncContext, months: number = 3): Promise<{ inserted: number }> {
+async function syncDailyInsightsWithContext(ctx: SyncContext, months: number = 3): Promise<{ inserted: number; stats: StageStats }> {
   log.info({ userAccountId: ctx.userAccountId, fbAdAccountId: ctx.fbAdAccountId, months }, 'Starting daily insights sync');
 
   const rateLimitKey = ctx.adAccountId || ctx.userAccountId;
@@ -1423,66 +1549,23 @@ async function syncDailyInsightsWithContext(ctx: SyncContext, months: number = 3
 
   if (status !== 'Job Completed') throw new Error(`Async daily job timeout after ${pollCount} polls`);
 
-  const results = await fetchAsyncJobResults(ctx.accessToken, reportRunId);
-  log.info({ userAccountId: ctx.userAccountId, resultsCount: results.length }, 'Fetched daily async job results');
-
-  let inserted = 0;
   const accountIds = getAccountIds(ctx);
-
-  for (const row of results) {
-    const date = row.date_start;
-    const impressions = parseInt(row.impressions) || 0;
-    const clicks = parseInt(row.clicks) || 0;
-    const spend = parseFloat(row.spend) || 0;
-    const reach = parseInt(row.reach) || 0;
-
-    const linkClicks = row.outbound_clicks?.[0]?.value
-      ? parseInt(row.outbound_clicks[0].value)
-      : extractLinkClicks(row.actions);
-
-    const ctr = impressions > 0 ? (clicks / impressions) * 100 : null;
-    const cpm = impressions > 0 ? (spend / impressions) * 1000 : null;
-    const cpc = clicks > 0 ? spend / clicks : null;
-    const frequency = reach > 0 ? impressions / reach : null;
-    const linkCtr = impressions > 0 ? (linkClicks / impressions) * 100 : null;
-
-    const insight = {
-      ...accountIds,
-      fb_ad_id: row.ad_id,
-      date,
-      impressions,
-      clicks,
-      spend,
-      reach,
-      ctr,
-      cpm,
-      cpc,
-      frequency,
-      link_clicks: linkClicks,
-      link_ctr: linkCtr,
-      actions_json: row.actions || null,
-      results_count: extractResultsCount(row.actions),
-      created_at: new Date().toISOString(),
-    };
-
-    try {
-      await withRetry(async () => {
-        const { error } = await supabase
-          .from('meta_insights_daily')
-          .upsert(insight, {
-            onConflict: ctx.isLegacy ? 'user_account_id,fb_ad_id,date' : 'ad_account_id,fb_ad_id,date',
-            ignoreDuplicates: false
-          });
-        if (error) throw error;
-      }, `upsert daily insight ad=${row.ad_id} date=${date}`);
-      inserted++;
-    } catch (error) {
-      log.error({ error, adId: row.ad_id, date }, 'Failed to upsert daily insight');
+  const stats = await streamUpsert(
+    iterateAsyncJobResults(ctx.accessToken, reportRunId),
+    row => normalizeDailyAdRow(row, accountIds),
+    {
+      table: 'meta_insights_daily',
+      onConflict: ctx.isLegacy ? 'user_account_id,fb_ad_id,date' : 'ad_account_id,fb_ad_id,date',
+      conflictKeys: [ctx.isLegacy ? 'user_account_id' : 'ad_account_id', 'fb_ad_id', 'date'],
+      chunkSize: ctx.upsertChunkSize,
+      stage: 'daily_insights',
     }
-  }
+  );
 
-  log.info({ userAccountId: ctx.userAccountId, inserted }, 'Daily insights synced');
-  return { inserted };
+  const inserted = stats.rows;
+
+  log.info({ userAccountId: ctx.userAccountId, inserted, failed: stats.failedRows, rowsPerSec: stats.rowsPerSec }, 'Daily insights synced');
+  return { inserted, stats };
 }
 
 // ============================================================================
@@ -1501,6 +1584,8 @@ export async function fullSync(accountUuid: string, options?: {
   accessToken?: string;
   fbAdAccountId?: string;
   isLegacy?: boolean;
+  // Размер чанка для bulk upsert insights
+  upsertChunkSize?: number;
 }): Promise<{
   campaigns: number;
   adsets: number;
@@ -1509,6 +1594,7 @@ export async function fullSync(accountUuid: string, options?: {
   campaignInsights?: { inserted: number };
   adsetInsights?: { inserted: number };
   dailyInsights?: { inserted: number };
+  stages: Record<string, StageStats>;
 }> {
   const {
     syncCampaignInsights = true,
@@ -1517,6 +1603,7 @@ export async function fullSync(accountUuid: string, options?: {
     accessToken: providedToken,
     fbAdAccountId: providedFbAccountId,
     isLegacy = false,
+    upsertChunkSize,
   } = options || {};
 
   let ctx: SyncContext;
@@ -1529,6 +1616,7 @@ export async function fullSync(accountUuid: string, options?: {
       accessToken: providedToken,
       fbAdAccountId: providedFbAccountId.replace('act_', ''),
       isLegacy: true,
+      upsertChunkSize,
     };
   } else {
     // Multi-account режим: получаем credentials из ad_accounts
@@ -1552,62 +1640,82 @@ export async function fullSync(accountUuid: string, options?: {
       accessToken: adAccount.access_token,
       fbAdAccountId: adAccount.ad_account_id.replace('act_', ''),
       isLegacy: false,
+      upsertChunkSize,
     };
   }
 
   log.info({ accountUuid, fbAdAccountId: ctx.fbAdAccountId, isLegacy: ctx.isLegacy }, 'Starting full sync');
 
-  // 2. Синхронизируем справочники
-  const campaigns = await syncCampaignsWithContext(ctx);
-  const adsets = await syncAdsetsWithContext(ctx);
-  const ads = await syncAdsWithContext(ctx);
-
-  // 3. Синхронизируем ad-level insights
-  const insights = await syncWeeklyInsightsWithContext(ctx, 12);
+  // Статистика по стадиям (rows/sec) для мониторинга производительности
+  const stages: Record<string, StageStats> = {};
+  const timed = async <T>(stage: string, fn: () => Promise<T>, rowsOf: (result: T) => number): Promise<T> => {
+    const startedAt = Date.now();
+    const result = await fn();
+    const stats = (result as any)?.stats as StageStats | undefined;
+    stages[stage] = stats || buildStageStats(rowsOf(result), 0, 0, startedAt);
+    return result;
+  };
 
-  // 4. Синхронизируем campaign-level insights (опционально)
-  let campaignInsights: { inserted: number } | undefined;
-  if (syncCampaignInsights) {
-    try {
-      campaignInsights = await syncWeeklyInsightsCampaignWithContext(ctx, 12);
-    } catch (err: any) {
-      log.error({ errorMessage: err?.message, errorStack: err?.stack, accountUuid }, 'Failed to sync campaign insights');
+  try {
+    // 2. Синхронизируем справочники
+    const campaigns = await timed('campaigns', () => syncCampaignsWithContext(ctx), n => n);
+    const adsets = await timed('adsets', () => syncAdsetsWithContext(ctx), n => n);
+    const ads = await timed('ads', () => syncAdsWithContext(ctx), n => n);
+
+    // 3. Синхронизируем ad-level insights
+    const weekly = await timed('weekly_insights', () => syncWeeklyInsightsWithContext(ctx, 12), r => r.inserted);
+    const insights = { inserted: weekly.inserted, updated: weekly.updated };
+
+    // 4. Синхронизируем campaign-level insights (опционально)
+    let campaignInsights: { inserted: number } | undefined;
+    if (syncCampaignInsights) {
+      try {
+        campaignInsights = await timed('campaign_insights', () => syncWeeklyInsightsCampaignWithContext(ctx, 12), r => r.inserted);
+      } catch (err: any) {
+        log.error({ errorMessage: err?.message, errorStack: err?.stack, accountUuid }, 'Failed to sync campaign insights');
+      }
     }
-  }
 
-  // 5. Синхронизируем adset-level insights (опционально)
-  let adsetInsights: { inserted: number } | undefined;
-  if (syncAdsetInsights) {
-    try {
-      adsetInsights = await syncWeeklyInsightsAdsetWithContext(ctx, 12);
-    } catch (err: any) {
-      log.error({ errorMessage: err?.message, errorStack: err?.stack, accountUuid }, 'Failed to sync adset insights');
+    // 5. Синхронизируем adset-level insights (опционально)
+    let adsetInsights: { inserted: number } | undefined;
+    if (syncAdsetInsights) {
+      try {
+        adsetInsights = await timed('adset_insights', () => syncWeeklyInsightsAdsetWithContext(ctx, 12), r => r.inserted);
+      } catch (err: any) {
+        log.error({ errorMessage: err?.message, errorStack: err?.stack, accountUuid }, 'Failed to sync adset insights');
+      }
     }
-  }
 
-  // 6. Синхронизируем daily insights (для детекции пауз)
-  let dailyInsights: { inserted: number } | undefined;
-  if (shouldSyncDaily) {
-    try {
-      dailyInsights = await syncDailyInsightsWithContext(ctx, 3);
-    } catch (err: any) {
-      log.error({ errorMessage: err?.message, errorStack: err?.stack, accountUuid }, 'Failed to sync daily insights');
+    // 6. Синхронизируем daily insights (для детекции пауз)
+    let dailyInsights: { inserted: number } | undefined;
+    if (shouldSyncDaily) {
+      try {
+        const daily = await timed('daily_insights', () => syncDailyInsightsWithContext(ctx, 3), r => r.inserted);
+        dailyInsights = { inserted: daily.inserted };
+      } catch (err: any) {
+        log.error({ errorMessage: err?.message, errorStack: err?.stack, accountUuid }, 'Failed to sync daily insights');
+      }
     }
-  }
 
-  log.info({
-    accountUuid,
-    isLegacy: ctx.isLegacy,
-    campaigns,
-    adsets,
-    ads,
-    insights,
-    campaignInsights,
-    adsetInsights,
-    dailyInsights,
-  }, 'Full sync completed');
-
-  return { campaigns, adsets, ads, insights, campaignInsights, adsetInsights, dailyInsights };
+    log.info({
+      accountUuid,
+      isLegacy: ctx.isLegacy,
+      campaigns,
+      adsets,
+      ads,
+      insights,
+      campaignInsights,
+      adsetInsights,
+      dailyInsights,
+      rowsPerSec: Object.fromEntries(Object.entries(stages).map(([stage, st]) => [stage, st.rowsPerSec])),
+    }, 'Full sync completed');
+
+    return { campaigns, adsets, ads, insights, campaignInsights, adsetInsights, dailyInsights, stages };
+  } finally {
+    // Данные аккаунта обновились (хотя бы частично, если стадия упала) — снапшот
+    // для анализаторов устарел (legacy: ad_account_id не используется, сбрасываем все снапшоты)
+    invalidateInsightsSnapshot(ctx.adAccountId);
+  }
 }
 
 /**
@@ -1799,6 +1907,8 @@ export async function syncDailyInsights(
     }
   }
 
+  invalidateInsightsSnapshot(adAccountId, ['dailyInsights']);
+
   log.info({ adAccountId, inserted }, 'Daily insights synced');
   return { inserted };
 }
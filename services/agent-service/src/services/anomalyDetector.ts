@@ -15,6 +15,12 @@
 
 import { supabase } from '../lib/supabaseClient.js';
 import { createLogger } from '../lib/logger.js';
+import { median, slope as calculateSlope } from '../lib/columnarStats.js';
+import {
+  getSnapshotTable,
+  invalidateInsightsSnapshot,
+  valueOrNull,
+} from '../lib/insightsSnapshot.js';
 
 const log = createLogger({ module: 'anomalyDetector' });
 
@@ -217,41 +223,7 @@ const BAD_DIRECTION: Record<MetricName, 'increase' | 'decrease'> = {
 // HELPER FUNCTIONS
 // ============================================================================
 
-/**
- * Вычисляет медиану массива
- */
-function median(values: number[]): number | null {
-  if (values.length === 0) return null;
-
-  const sorted = [...values].sort((a, b) => a - b);
-  const mid = Math.floor(sorted.length / 2);
-
-  return sorted.length % 2 !== 0
-    ? sorted[mid]
-    : (sorted[mid - 1] + sorted[mid]) / 2;
-}
-
-/**
- * Вычисляет slope (наклон тренда) методом линейной регрессии
- */
-function calculateSlope(values: number[]): number | null {
-  if (values.length < 2) return null;
-
-  const n = values.length;
-  let sumX = 0, sumY = 0, sumXY = 0, sumX2 = 0;
-
-  for (let i = 0; i < n; i++) {
-    sumX += i;
-    sumY += values[i];
-    sumXY += i * values[i];
-    sumX2 += i * i;
-  }
-
-  const denominator = n * sumX2 - sumX * sumX;
-  if (denominator === 0) return null;
-
-  return (n * sumXY - sumX * sumY) / denominator;
-}
+// median() и calculateSlope() — из lib/columnarStats (общие с burnout/yearly анализаторами)
 
 /**
  * Получает минимальное количество результатов для семейства
@@ -902,205 +874,122 @@ interface WeeklyResultRow {
 }
 type ResultsCache = Map<string, WeeklyResultRow[]>; // key = fb_ad_id
 
-// Supabase PostgREST имеет серверный лимит 1000 строк
-const SUPABASE_PAGE_SIZE = 1000;
-
-/**
- * Пагинированная загрузка данных из Supabase (обходит лимит 1000 строк)
- */
-async function fetchAllPaginated<T>(
-  queryFn: () => any,
-  tableName: string
-): Promise<T[]> {
-  let allData: T[] = [];
-  let offset = 0;
-  let hasMore = true;
-
-  while (hasMore) {
-    const { data: page, error } = await queryFn().range(offset, offset + SUPABASE_PAGE_SIZE - 1);
-
-    if (error) {
-      log.warn({ error, tableName, offset }, 'Failed to fetch page');
-      break;
-    }
-
-    if (page && page.length > 0) {
-      allData = allData.concat(page as T[]);
-      offset += SUPABASE_PAGE_SIZE;
-      hasMore = page.length === SUPABASE_PAGE_SIZE;
-    } else {
-      hasMore = false;
-    }
-  }
-
-  return allData;
-}
-
 /**
- * Загружает ВСЕ ads для аккаунта с пагинацией
+ * Загружает ВСЕ ads для аккаунта (из общего снапшота insights)
  */
 async function loadAllAds(adAccountId: string): Promise<AdsMap> {
-  log.info({ adAccountId }, 'Loading all ads...');
+  const ads = await getSnapshotTable(adAccountId, 'ads');
+  const ids = ads.text.fb_ad_id;
+  const adsetIds = ads.text.fb_adset_id;
 
-  const data = await fetchAllPaginated<{ fb_ad_id: string; fb_adset_id: string }>(
-    () => supabase
-      .from('meta_ads')
-      .select('fb_ad_id, fb_adset_id')
-      .eq('ad_account_id', adAccountId),
-    'meta_ads'
-  );
-
-  log.info({ adAccountId, count: data.length }, 'Loaded all ads');
   const map: AdsMap = new Map();
-  for (const row of data) {
-    map.set(row.fb_ad_id, { fb_adset_id: row.fb_adset_id });
+  for (let i = 0; i < ads.size; i++) {
+    map.set(ids[i]!, { fb_adset_id: adsetIds[i] });
   }
+  log.info({ adAccountId, count: ads.size }, 'Loaded all ads');
   return map;
 }
 
 /**
- * Загружает ВСЕ adsets для аккаунта с пагинацией
+ * Загружает ВСЕ adsets для аккаунта (из общего снапшота insights)
  */
 async function loadAllAdsets(adAccountId: string): Promise<AdsetsMap> {
-  log.info({ adAccountId }, 'Loading all adsets...');
-
-  const data = await fetchAllPaginated<{ fb_adset_id: string; optimization_goal: string | null }>(
-    () => supabase
-      .from('meta_adsets')
-      .select('fb_adset_id, optimization_goal')
-      .eq('ad_account_id', adAccountId),
-    'meta_adsets'
-  );
+  const adsets = await getSnapshotTable(adAccountId, 'adsets');
+  const ids = adsets.text.fb_adset_id;
+  const goals = adsets.text.optimization_goal;
 
-  log.info({ adAccountId, count: data.length }, 'Loaded all adsets');
   const map: AdsetsMap = new Map();
-  for (const row of data) {
-    map.set(row.fb_adset_id, { optimization_goal: row.optimization_goal });
+  for (let i = 0; i < adsets.size; i++) {
+    map.set(ids[i]!, { optimization_goal: goals[i] });
   }
+  log.info({ adAccountId, count: adsets.size }, 'Loaded all adsets');
   return map;
 }
 
 /**
- * Загружает ВСЕ weekly_results для аккаунта с пагинацией
+ * Загружает ВСЕ weekly_results для аккаунта (из общего снапшота insights)
  */
 async function loadAllWeeklyResults(adAccountId: string): Promise<WeeklyResultsMap> {
-  log.info({ adAccountId }, 'Loading all weekly results...');
-
-  const data = await fetchAllPaginated<{
-    fb_ad_id: string;
-    week_start_date: string;
-    result_family: string;
-    result_count: number;
-  }>(
-    () => supabase
-      .from('meta_weekly_results')
-      .select('fb_ad_id, week_start_date, result_family, result_count')
-      .eq('ad_account_id', adAccountId),
-    'meta_weekly_results'
-  );
-
-  log.info({ adAccountId, count: data.length }, 'Loaded all weekly results');
+  const results = await getSnapshotTable(adAccountId, 'weeklyResults');
+  const families = results.text.result_family;
+  const counts = results.num.result_count;
+
   // Группируем по fb_ad_id (для определения primary family)
   const map: WeeklyResultsMap = new Map();
-  for (const row of data) {
-    if (!map.has(row.fb_ad_id)) {
-      map.set(row.fb_ad_id, []);
+  for (const [fbAdId, rows] of results.groups) {
+    const list = new Array(rows.length);
+    for (let j = 0; j < rows.length; j++) {
+      const i = rows[j];
+      list[j] = { result_family: families[i]!, result_count: counts[i] || 0 };
     }
-    map.get(row.fb_ad_id)!.push({
-      result_family: row.result_family,
-      result_count: row.result_count || 0,
-    });
+    map.set(fbAdId, list);
   }
+  log.info({ adAccountId, count: results.size }, 'Loaded all weekly results');
   return map;
 }
 
 /**
- * Загружает ВСЕ weekly insights для computeFeatures с пагинацией
+ * Загружает ВСЕ weekly insights для computeFeatures (из общего снапшота insights).
+ * Внутри ad строки отсортированы по week_start_date desc.
  */
 async function loadAllInsightsForCompute(adAccountId: string): Promise<InsightsCache> {
-  log.info({ adAccountId }, 'Loading all insights for compute...');
-
-  const data = await fetchAllPaginated<{
-    fb_ad_id: string;
-    week_start_date: string;
-    spend: any;
-    frequency: any;
-    ctr: any;
-    cpc: any;
-    cpm: any;
-    reach: any;
-    link_ctr: any;
-    quality_rank_score: number | null;
-    engagement_rank_score: number | null;
-    conversion_rank_score: number | null;
-  }>(
-    () => supabase
-      .from('meta_insights_weekly')
-      .select('fb_ad_id, week_start_date, spend, frequency, ctr, cpc, cpm, reach, link_ctr, quality_rank_score, engagement_rank_score, conversion_rank_score')
-      .eq('ad_account_id', adAccountId)
-      .order('week_start_date', { ascending: false }),
-    'meta_insights_weekly'
-  );
+  const insights = await getSnapshotTable(adAccountId, 'weeklyInsights');
+  const weeks = insights.text.week_start_date;
+  const { spend, frequency, ctr, cpc, cpm, reach, link_ctr } = insights.num;
+  const { quality_rank_score, engagement_rank_score, conversion_rank_score } = insights.num;
 
-  log.info({ adAccountId, count: data.length }, 'Loaded all insights for compute');
   const map: InsightsCache = new Map();
-  for (const row of data) {
-    if (!map.has(row.fb_ad_id)) {
-      map.set(row.fb_ad_id, []);
+  for (const [fbAdId, rows] of insights.groups) {
+    const list: WeeklyInsightRow[] = new Array(rows.length);
+    for (let j = 0; j < rows.length; j++) {
+      const i = rows[j];
+      list[j] = {
+        fb_ad_id: fbAdId,
+        week_start_date: weeks[i]!,
+        spend: spend[i] || 0,
+        frequency: frequency[i] || 0,
+        ctr: ctr[i] || 0,
+        cpc: cpc[i] || 0,
+        cpm: cpm[i] || 0,
+        reach: Math.trunc(reach[i]) || 0,
+        link_ctr: link_ctr[i] || null,
+        quality_rank_score: valueOrNull(quality_rank_score, i),
+        engagement_rank_score: valueOrNull(engagement_rank_score, i),
+        conversion_rank_score: valueOrNull(conversion_rank_score, i),
+      };
     }
-    map.get(row.fb_ad_id)!.push({
-      fb_ad_id: row.fb_ad_id,
-      week_start_date: row.week_start_date,
-      spend: parseFloat(row.spend as any) || 0,
-      frequency: parseFloat(row.frequency as any) || 0,
-      ctr: parseFloat(row.ctr as any) || 0,
-      cpc: parseFloat(row.cpc as any) || 0,
-      cpm: parseFloat(row.cpm as any) || 0,
-      reach: parseInt(row.reach as any) || 0,
-      link_ctr: row.link_ctr ? parseFloat(row.link_ctr as any) : null,
-      quality_rank_score: row.quality_rank_score ?? null,
-      engagement_rank_score: row.engagement_rank_score ?? null,
-      conversion_rank_score: row.conversion_rank_score ?? null,
-    });
+    map.set(fbAdId, list);
   }
+  log.info({ adAccountId, count: insights.size }, 'Loaded all insights for compute');
   return map;
 }
 
 /**
- * Загружает ВСЕ weekly results для computeFeatures с пагинацией
+ * Загружает ВСЕ weekly results для computeFeatures (из общего снапшота insights).
+ * Внутри ad строки отсортированы по week_start_date desc.
  */
 async function loadAllResultsForCompute(adAccountId: string): Promise<ResultsCache> {
-  log.info({ adAccountId }, 'Loading all results for compute...');
-
-  const data = await fetchAllPaginated<{
-    fb_ad_id: string;
-    week_start_date: string;
-    result_family: string;
-    result_count: number;
-    cpr: any;
-  }>(
-    () => supabase
-      .from('meta_weekly_results')
-      .select('fb_ad_id, week_start_date, result_family, result_count, cpr')
-      .eq('ad_account_id', adAccountId)
-      .order('week_start_date', { ascending: false }),
-    'meta_weekly_results'
-  );
+  const results = await getSnapshotTable(adAccountId, 'weeklyResults');
+  const weeks = results.text.week_start_date;
+  const families = results.text.result_family;
+  const { result_count, cpr } = results.num;
 
-  log.info({ adAccountId, count: data.length }, 'Loaded all results for compute');
   const map: ResultsCache = new Map();
-  for (const row of data) {
-    if (!map.has(row.fb_ad_id)) {
-      map.set(row.fb_ad_id, []);
+  for (const [fbAdId, rows] of results.groups) {
+    const list: WeeklyResultRow[] = new Array(rows.length);
+    for (let j = 0; j < rows.length; j++) {
+      const i = rows[j];
+      list[j] = {
+        fb_ad_id: fbAdId,
+        week_start_date: weeks[i]!,
+        result_family: families[i]!,
+        result_count: result_count[i] || 0,
+        cpr: cpr[i] || null,
+      };
     }
-    map.get(row.fb_ad_id)!.push({
-      fb_ad_id: row.fb_ad_id,
-      week_start_date: row.week_start_date,
-      result_family: row.result_family,
-      result_count: row.result_count || 0,
-      cpr: row.cpr ? parseFloat(row.cpr as any) : null,
-    });
+    map.set(fbAdId, list);
   }
+  log.info({ adAccountId, count: results.size }, 'Loaded all results for compute');
   return map;
 }
 
@@ -1147,48 +1036,43 @@ function determinePrimaryFamilyFromCache(
 }
 
 /**
- * Загружает ВСЕ daily insights для аккаунта с пагинацией
+ * Загружает ВСЕ daily insights для аккаунта (из общего снапшота insights)
  * Возвращает Map с ключом "fb_ad_id|week_start"
  */
 async function loadAllDailyInsights(adAccountId: string): Promise<DailyInsightsMap> {
-  const data = await fetchAllPaginated<{
-    fb_ad_id: string;
-    date: string;
-    impressions: number;
-    spend: number;
-  }>(
-    () => supabase
-      .from('meta_insights_daily')
-      .select('fb_ad_id, date, impressions, spend')
-      .eq('ad_account_id', adAccountId)
-      .order('date', { ascending: true }),
-    'meta_insights_daily'
-  );
+  const daily = await getSnapshotTable(adAccountId, 'dailyInsights');
+  const dates = daily.text.date;
+  const { impressions, spend } = daily.num;
 
   // Группируем по ad_id + week_start
   const map: DailyInsightsMap = new Map();
 
-  for (const row of data) {
-    // Вычисляем week_start для этой даты
-    const date = new Date(row.date);
-    const dayOfWeek = date.getDay();
-    const mondayOffset = dayOfWeek === 0 ? -6 : 1 - dayOfWeek;
-    const weekStart = new Date(date);
-    weekStart.setDate(date.getDate() + mondayOffset);
-    const weekStartStr = weekStart.toISOString().split('T')[0];
-
-    const key = `${row.fb_ad_id}|${weekStartStr}`;
-    if (!map.has(key)) {
-      map.set(key, []);
+  for (const [fbAdId, rows] of daily.groups) {
+    for (let j = 0; j < rows.length; j++) {
+      const i = rows[j];
+      const dateStr = dates[i]!;
+
+      // Вычисляем week_start для этой даты
+      const date = new Date(dateStr);
+      const dayOfWeek = date.getDay();
+      const mondayOffset = dayOfWeek === 0 ? -6 : 1 - dayOfWeek;
+      const weekStart = new Date(date);
+      weekStart.setDate(date.getDate() + mondayOffset);
+      const weekStartStr = weekStart.toISOString().split('T')[0];
+
+      const key = `${fbAdId}|${weekStartStr}`;
+      if (!map.has(key)) {
+        map.set(key, []);
+      }
+      map.get(key)!.push({
+        date: dateStr,
+        impressions: impressions[i] || 0,
+        spend: spend[i] || 0,
+      });
     }
-    map.get(key)!.push({
-      date: row.date,
-      impressions: row.impressions || 0,
-      spend: row.spend || 0,
-    });
   }
 
-  log.info({ adAccountId, totalDays: data.length, uniqueWeeks: map.size }, 'Loaded daily insights for pause detection');
+  log.info({ adAccountId, totalDays: daily.size, uniqueWeeks: map.size }, 'Loaded daily insights for pause detection');
   return map;
 }
 
@@ -1538,35 +1422,18 @@ export async function processAdAccount(adAccountId: string): Promise<{
     resultsCacheAds: resultsCache.size
   }, 'Batch data loaded');
 
-  // Получаем все уникальные пары (ad_id, week_start_date) с пагинацией
-  // Supabase PostgREST имеет серверный лимит 1000 строк, поэтому используем пагинацию
-  const PAGE_SIZE = 1000;
-  let allInsights: { fb_ad_id: string; week_start_date: string }[] = [];
-  let offset = 0;
-  let hasMore = true;
-
-  while (hasMore) {
-    const { data: page, error } = await supabase
-      .from('meta_insights_weekly')
-      .select('fb_ad_id, week_start_date')
-      .eq('ad_account_id', adAccountId)
-      .gt('spend', 0)
-      .order('week_start_date', { ascending: false })
-      .range(offset, offset + PAGE_SIZE - 1);
-
-    if (error) {
-      log.error({ error, adAccountId, offset }, 'Failed to fetch insights page');
-      throw error;
-    }
-
-    if (page && page.length > 0) {
-      allInsights = allInsights.concat(page);
-      offset += PAGE_SIZE;
-      hasMore = page.length === PAGE_SIZE;
-    } else {
-      hasMore = false;
+  // Все пары (ad_id, week_start_date) со spend > 0 — из того же снапшота meta_insights_weekly
+  const weeklyTable = await getSnapshotTable(adAccountId, 'weeklyInsights');
+  const weeklyAdIds = weeklyTable.text.fb_ad_id;
+  const weeklyWeeks = weeklyTable.text.week_start_date;
+  const weeklySpend = weeklyTable.num.spend;
+  const allInsights: { fb_ad_id: string; week_start_date: string }[] = [];
+  for (let i = 0; i < weeklyTable.size; i++) {
+    if (weeklySpend[i] > 0) {
+      allInsights.push({ fb_ad_id: weeklyAdIds[i]!, week_start_date: weeklyWeeks[i]! });
     }
   }
+  allInsights.sort((a, b) => (a.week_start_date < b.week_start_date ? 1 : a.week_start_date > b.week_start_date ? -1 : 0));
 
   const insights = allInsights;
   log.info({ adAccountId, insightsCount: insights.length }, 'Starting anomaly processing');
@@ -1700,6 +1567,9 @@ export async function processAdAccount(adAccountId: string): Promise<{
   await flushFeatures();
   await flushAnomalies();
 
+  // ad_weekly_features пересчитаны — burnoutAnalyzer должен перечитать их
+  invalidateInsightsSnapshot(adAccountId, ['features']);
+
   log.info({ adAccountId, adsProcessed, anomaliesDetected }, 'Ad account processed');
 
   return { adsProcessed, anomaliesDetected };
@@ -9,52 +9,54 @@
 
 import { supabase } from '../lib/supabaseClient.js';
 import { createLogger } from '../lib/logger.js';
+import { getSnapshotTable } from '../lib/insightsSnapshot.js';
+import { pearsonCorrelation, quantiles } from '../lib/columnarStats.js';
 
 const log = createLogger({ module: 'burnoutAnalyzer' });
 
 // Типы
-interface FeatureRow {
-  fb_ad_id: string;
-  week_start_date: string;
-  primary_family: string;
-  spend: number;
-  frequency: number;
-  ctr: number;
-  cpc: number;
-  cpm: number;
-  reach: number;
-  cpr: number | null;
-  baseline_cpr: number | null;
-  freq_delta_pct: number | null;
-  ctr_delta_pct: number | null;
-  cpc_delta_pct: number | null;
-  freq_slope: number | null;
-  ctr_slope: number | null;
-  reach_growth_rate: number | null;
-  spend_change_pct: number | null;
-  weeks_with_data: number;
-  min_results_met: boolean;
-}
+// Lead indicators (неделя t)
+type LeadLagMetric =
+  | 'freq_t'
+  | 'freq_delta_t'
+  | 'ctr_t'
+  | 'ctr_delta_t'
+  | 'cpc_t'
+  | 'cpc_delta_t'
+  | 'cpm_t'
+  | 'reach_growth_t'
+  | 'spend_change_t'
+  | 'freq_slope_t'
+  | 'ctr_slope_t';
+
+// Колонка lead-метрики ← колонка ad_weekly_features
+const LEAD_COLUMNS: Record<LeadLagMetric, string> = {
+  freq_t: 'frequency',
+  freq_delta_t: 'freq_delta_pct',
+  ctr_t: 'ctr',
+  ctr_delta_t: 'ctr_delta_pct',
+  cpc_t: 'cpc',
+  cpc_delta_t: 'cpc_delta_pct',
+  cpm_t: 'cpm',
+  reach_growth_t: 'reach_growth_rate',
+  spend_change_t: 'spend_change_pct',
+  freq_slope_t: 'freq_slope',
+  ctr_slope_t: 'ctr_slope',
+};
 
-interface LeadLagRow {
-  // Lead indicators (неделя t)
-  freq_t: number;
-  freq_delta_t: number | null;
-  ctr_t: number;
-  ctr_delta_t: number | null;
-  cpc_t: number;
-  cpc_delta_t: number | null;
-  cpm_t: number;
-  reach_growth_t: number | null;
-  spend_change_t: number | null;
-  freq_slope_t: number | null;
-  ctr_slope_t: number | null;
+/**
+ * Колоночный датасет lead→lag: строка i — пара (t, t+1, t+2) одного ad.
+ * Пропуски (null) = NaN.
+ */
+interface LeadLagDataset {
+  size: number;
+  metrics: Record<LeadLagMetric, Float64Array>;
 
   // Lag (target): был ли CPR spike через 1 или 2 недели
-  cpr_spike_t1: boolean;  // через 1 неделю
-  cpr_spike_t2: boolean;  // через 2 недели
-  cpr_delta_t1: number | null;  // % изменения CPR через 1 неделю
-  cpr_delta_t2: number | null;  // % изменения CPR через 2 недели
+  cpr_spike_t1: Uint8Array;  // через 1 неделю
+  cpr_spike_t2: Uint8Array;  // через 2 недели
+  cpr_delta_t1: Float64Array;  // % изменения CPR через 1 неделю
+  cpr_delta_t2: Float64Array;  // % изменения CPR через 2 недели
 }
 
 interface QuantileAnalysis {
@@ -104,79 +106,81 @@ const MIN_DATA_POINTS = 50;  // минимум данных для анализ
 /**
  * Строит датасет lead→lag для анализа зависимостей
  */
-async function buildLeadLagDataset(adAccountId: string): Promise<LeadLagRow[]> {
-  // Получаем все features отсортированные по ad и дате
-  const { data: features, error } = await supabase
-    .from('ad_weekly_features')
-    .select('*')
-    .eq('ad_account_id', adAccountId)
-    .eq('min_results_met', true)
-    .order('fb_ad_id')
-    .order('week_start_date');
-
-  if (error) {
+async function buildLeadLagDataset(adAccountId: string): Promise<LeadLagDataset> {
+  // Features из общего снапшота (отсортированы по ad и дате, min_results_met = true)
+  let features;
+  try {
+    features = await getSnapshotTable(adAccountId, 'features');
+  } catch (error) {
     log.error({ error, adAccountId }, 'Failed to fetch features for lead-lag');
     throw error;
   }
 
-  if (!features || features.length < MIN_DATA_POINTS) {
-    log.warn({ adAccountId, count: features?.length }, 'Not enough data for lead-lag analysis');
-    return [];
-  }
+  const metricNames = Object.keys(LEAD_COLUMNS) as LeadLagMetric[];
+  const emptyDataset = (capacity: number): LeadLagDataset => ({
+    size: 0,
+    metrics: Object.fromEntries(metricNames.map(m => [m, new Float64Array(capacity)])) as Record<LeadLagMetric, Float64Array>,
+    cpr_spike_t1: new Uint8Array(capacity),
+    cpr_spike_t2: new Uint8Array(capacity),
+    cpr_delta_t1: new Float64Array(capacity),
+    cpr_delta_t2: new Float64Array(capacity),
+  });
 
-  // Группируем по ad
-  const adGroups = new Map<string, FeatureRow[]>();
-  for (const f of features) {
-    const existing = adGroups.get(f.fb_ad_id) || [];
-    existing.push(f as FeatureRow);
-    adGroups.set(f.fb_ad_id, existing);
+  if (features.size < MIN_DATA_POINTS) {
+    log.warn({ adAccountId, count: features.size }, 'Not enough data for lead-lag analysis');
+    return emptyDataset(0);
   }
 
-  const dataset: LeadLagRow[] = [];
+  const WEEK_MS = 7 * 24 * 60 * 60 * 1000;
+  const weeks = features.text.week_start_date;
+  const cpr = features.num.cpr;
+  const sourceColumns = metricNames.map(m => features.num[LEAD_COLUMNS[m]]);
 
-  // Для каждого ad строим пары (t, t+1) и (t, t+2)
-  for (const [adId, weeks] of adGroups) {
-    // Сортируем по дате
-    weeks.sort((a, b) => new Date(a.week_start_date).getTime() - new Date(b.week_start_date).getTime());
+  const dataset = emptyDataset(features.size);
+  const targetColumns = metricNames.map(m => dataset.metrics[m]);
+  let n = 0;
 
-    for (let i = 0; i < weeks.length - 2; i++) {
-      const t = weeks[i];
-      const t1 = weeks[i + 1];
-      const t2 = weeks[i + 2];
+  // Для каждого ad строим пары (t, t+1) и (t, t+2); строки группы уже отсортированы по дате
+  for (const rows of features.groups.values()) {
+    for (let k = 0; k + 2 < rows.length; k++) {
+      const t = rows[k];
+      const t1 = rows[k + 1];
+      const t2 = rows[k + 2];
 
       // Проверяем что недели последовательные (разница 7 дней)
-      const diff1 = (new Date(t1.week_start_date).getTime() - new Date(t.week_start_date).getTime()) / (7 * 24 * 60 * 60 * 1000);
-      const diff2 = (new Date(t2.week_start_date).getTime() - new Date(t.week_start_date).getTime()) / (14 * 24 * 60 * 60 * 1000);
+      const tMs = Date.parse(weeks[t]!);
+      const diff1 = (Date.parse(weeks[t1]!) - tMs) / WEEK_MS;
+      const diff2 = (Date.parse(weeks[t2]!) - tMs) / (2 * WEEK_MS);
 
       if (Math.abs(diff1 - 1) > 0.1 || Math.abs(diff2 - 1) > 0.1) {
         continue; // Пропускаем если недели не последовательные
       }
 
-      // CPR spike detection
-      const cpr_delta_t1 = t.cpr && t1.cpr ? ((t1.cpr - t.cpr) / t.cpr) * 100 : null;
-      const cpr_delta_t2 = t.cpr && t2.cpr ? ((t2.cpr - t.cpr) / t.cpr) * 100 : null;
-
-      dataset.push({
-        freq_t: t.frequency,
-        freq_delta_t: t.freq_delta_pct,
-        ctr_t: t.ctr,
-        ctr_delta_t: t.ctr_delta_pct,
-        cpc_t: t.cpc,
-        cpc_delta_t: t.cpc_delta_pct,
-        cpm_t: t.cpm,
-        reach_growth_t: t.reach_growth_rate,
-        spend_change_t: t.spend_change_pct,
-        freq_slope_t: t.freq_slope,
-        ctr_slope_t: t.ctr_slope,
-        cpr_spike_t1: cpr_delta_t1 !== null && cpr_delta_t1 >= CPR_SPIKE_THRESHOLD,
-        cpr_spike_t2: cpr_delta_t2 !== null && cpr_delta_t2 >= CPR_SPIKE_THRESHOLD,
-        cpr_delta_t1,
-        cpr_delta_t2,
-      });
+      for (let m = 0; m < sourceColumns.length; m++) {
+        targetColumns[m][n] = sourceColumns[m][t];
+      }
+
+      // CPR spike detection (NaN и 0 — нет данных)
+      const delta1 = cpr[t] && cpr[t1] ? ((cpr[t1] - cpr[t]) / cpr[t]) * 100 : NaN;
+      const delta2 = cpr[t] && cpr[t2] ? ((cpr[t2] - cpr[t]) / cpr[t]) * 100 : NaN;
+
+      dataset.cpr_delta_t1[n] = delta1;
+      dataset.cpr_delta_t2[n] = delta2;
+      dataset.cpr_spike_t1[n] = delta1 >= CPR_SPIKE_THRESHOLD ? 1 : 0;
+      dataset.cpr_spike_t2[n] = delta2 >= CPR_SPIKE_THRESHOLD ? 1 : 0;
+      n++;
     }
   }
 
-  log.info({ adAccountId, datasetSize: dataset.length }, 'Lead-lag dataset built');
+  // Обрезаем колонки до фактического размера (subarray без копирования)
+  dataset.size = n;
+  for (const m of metricNames) dataset.metrics[m] = dataset.metrics[m].subarray(0, n);
+  dataset.cpr_spike_t1 = dataset.cpr_spike_t1.subarray(0, n);
+  dataset.cpr_spike_t2 = dataset.cpr_spike_t2.subarray(0, n);
+  dataset.cpr_delta_t1 = dataset.cpr_delta_t1.subarray(0, n);
+  dataset.cpr_delta_t2 = dataset.cpr_delta_t2.subarray(0, n);
+
+  log.info({ adAccountId, datasetSize: n }, 'Lead-lag dataset built');
   return dataset;
 }
 
@@ -185,77 +189,75 @@ async function buildLeadLagDataset(adAccountId: string): Promise<LeadLagRow[]> {
 // ============================================================================
 
 /**
- * Вычисляет квантили для массива чисел
- */
-function quantiles(values: number[], probs: number[]): number[] {
-  const sorted = [...values].sort((a, b) => a - b);
-  return probs.map(p => {
-    const idx = p * (sorted.length - 1);
-    const lower = Math.floor(idx);
-    const upper = Math.ceil(idx);
-    if (lower === upper) return sorted[lower];
-    return sorted[lower] * (upper - idx) + sorted[upper] * (idx - lower);
-  });
-}
-
-/**
- * Квантильный анализ: как метрика влияет на будущий CPR
+ * Квантильный анализ: как метрика влияет на будущий CPR.
+ * Один проход по колонке: каждая строка попадает в свой квантиль,
+ * суммы CPR-дельт и spike-счётчики накапливаются по квантилям.
  */
 async function analyzeMetricQuantiles(
-  dataset: LeadLagRow[],
-  metricName: keyof LeadLagRow,
+  dataset: LeadLagDataset,
+  metricName: LeadLagMetric,
   numQuantiles: number = 4
 ): Promise<QuantileAnalysis[]> {
-  // Фильтруем null значения
-  const validRows = dataset.filter(r => r[metricName] !== null && r[metricName] !== undefined);
+  const column = dataset.metrics[metricName];
+
+  // null значения = NaN
+  let validCount = 0;
+  for (let i = 0; i < dataset.size; i++) {
+    if (!Number.isNaN(column[i])) validCount++;
+  }
 
-  if (validRows.length < MIN_DATA_POINTS) {
+  if (validCount < MIN_DATA_POINTS) {
     return [];
   }
 
-  const values = validRows.map(r => r[metricName] as number);
   const probs = Array.from({ length: numQuantiles + 1 }, (_, i) => i / numQuantiles);
-  const boundaries = quantiles(values, probs);
+  const boundaries = quantiles(column, probs);
+
+  const sampleSize = new Float64Array(numQuantiles);
+  const delta1Sum = new Float64Array(numQuantiles);
+  const delta1Count = new Float64Array(numQuantiles);
+  const delta2Sum = new Float64Array(numQuantiles);
+  const delta2Count = new Float64Array(numQuantiles);
+  const spikes1w = new Float64Array(numQuantiles);
+  const spikes2w = new Float64Array(numQuantiles);
+
+  for (let i = 0; i < dataset.size; i++) {
+    const v = column[i];
+    if (Number.isNaN(v)) continue;
+
+    // Q1 = [min, b1], Qn = (b(n-1), bn]
+    let q = -1;
+    for (let b = 0; b < numQuantiles; b++) {
+      const inRange = b === 0
+        ? v >= boundaries[0] && v <= boundaries[1]
+        : v > boundaries[b] && v <= boundaries[b + 1];
+      if (inRange) { q = b; break; }
+    }
+    if (q === -1) continue;
+
+    sampleSize[q]++;
+    const d1 = dataset.cpr_delta_t1[i];
+    const d2 = dataset.cpr_delta_t2[i];
+    if (!Number.isNaN(d1)) { delta1Sum[q] += d1; delta1Count[q]++; }
+    if (!Number.isNaN(d2)) { delta2Sum[q] += d2; delta2Count[q]++; }
+    spikes1w[q] += dataset.cpr_spike_t1[i];
+    spikes2w[q] += dataset.cpr_spike_t2[i];
+  }
 
   const results: QuantileAnalysis[] = [];
 
   for (let q = 0; q < numQuantiles; q++) {
-    const min = boundaries[q];
-    const max = boundaries[q + 1];
-
-    const quantileRows = validRows.filter(r => {
-      const v = r[metricName] as number;
-      if (q === 0) return v >= min && v <= max;
-      return v > min && v <= max;
-    });
-
-    if (quantileRows.length === 0) continue;
-
-    // Считаем средний рост CPR и spike rate
-    const cprDeltas1w = quantileRows
-      .map(r => r.cpr_delta_t1)
-      .filter((v): v is number => v !== null);
-
-    const cprDeltas2w = quantileRows
-      .map(r => r.cpr_delta_t2)
-      .filter((v): v is number => v !== null);
-
-    const spikeCount1w = quantileRows.filter(r => r.cpr_spike_t1).length;
-    const spikeCount2w = quantileRows.filter(r => r.cpr_spike_t2).length;
+    if (sampleSize[q] === 0) continue;
 
     results.push({
-      metric: String(metricName),
+      metric: metricName,
       quantile: `Q${q + 1}`,
-      range: { min, max },
-      sampleSize: quantileRows.length,
-      avgCprGrowth1w: cprDeltas1w.length > 0
-        ? cprDeltas1w.reduce((a, b) => a + b, 0) / cprDeltas1w.length
-        : 0,
-      avgCprGrowth2w: cprDeltas2w.length > 0
-        ? cprDeltas2w.reduce((a, b) => a + b, 0) / cprDeltas2w.length
-        : 0,
-      spikeRate1w: spikeCount1w / quantileRows.length,
-      spikeRate2w: spikeCount2w / quantileRows.length,
+      range: { min: boundaries[q], max: boundaries[q + 1] },
+      sampleSize: sampleSize[q],
+      avgCprGrowth1w: delta1Count[q] > 0 ? delta1Sum[q] / delta1Count[q] : 0,
+      avgCprGrowth2w: delta2Count[q] > 0 ? delta2Sum[q] / delta2Count[q] : 0,
+      spikeRate1w: spikes1w[q] / sampleSize[q],
+      spikeRate2w: spikes2w[q] / sampleSize[q],
     });
   }
 
@@ -273,11 +275,11 @@ export async function runQuantileAnalysis(adAccountId: string): Promise<{
 
   const dataset = await buildLeadLagDataset(adAccountId);
 
-  if (dataset.length < MIN_DATA_POINTS) {
+  if (dataset.size < MIN_DATA_POINTS) {
     return { metrics: new Map(), insights: [] };
   }
 
-  const metricsToAnalyze: (keyof LeadLagRow)[] = [
+  const metricsToAnalyze: LeadLagMetric[] = [
     'freq_t',
     'freq_delta_t',
     'ctr_t',
@@ -326,7 +328,7 @@ export async function runQuantileAnalysis(adAccountId: string): Promise<{
 
   log.info({
     adAccountId,
-    datasetSize: dataset.length,
+    datasetSize: dataset.size,
     insightsCount: insights.length
   }, 'Quantile analysis completed');
 
@@ -482,33 +484,36 @@ export async function predictBurnout(
   };
 }
 
+/**
+ * Последняя неделя с features (min_results_met) для каждого ad — из общего снапшота
+ */
+async function loadLatestFeatureWeeks(adAccountId: string): Promise<Map<string, string>> {
+  const features = await getSnapshotTable(adAccountId, 'features');
+  const weeks = features.text.week_start_date;
+
+  const latestByAd = new Map<string, string>();
+  for (const [fbAdId, rows] of features.groups) {
+    // Строки группы отсортированы по week_start_date asc
+    latestByAd.set(fbAdId, weeks[rows[rows.length - 1]]!);
+  }
+  return latestByAd;
+}
+
 /**
  * Predict для всех активных ads в аккаунте (последняя неделя)
  */
 export async function predictAllAds(adAccountId: string): Promise<PredictionResult[]> {
   log.info({ adAccountId }, 'Predicting burnout for all ads');
 
-  // Получаем последнюю неделю для каждого ad
-  const { data: latestWeeks, error } = await supabase
-    .from('ad_weekly_features')
-    .select('fb_ad_id, week_start_date')
-    .eq('ad_account_id', adAccountId)
-    .eq('min_results_met', true)
-    .order('week_start_date', { ascending: false });
-
-  if (error) {
+  // Последняя неделя для каждого ad
+  let latestByAd: Map<string, string>;
+  try {
+    latestByAd = await loadLatestFeatureWeeks(adAccountId);
+  } catch (error) {
     log.error({ error, adAccountId }, 'Failed to fetch latest weeks');
     throw error;
   }
 
-  // Группируем и берём последнюю неделю для каждого ad
-  const latestByAd = new Map<string, string>();
-  for (const row of latestWeeks || []) {
-    if (!latestByAd.has(row.fb_ad_id)) {
-      latestByAd.set(row.fb_ad_id, row.week_start_date);
-    }
-  }
-
   const predictions: PredictionResult[] = [];
 
   for (const [fbAdId, weekStartDate] of latestByAd) {
@@ -564,11 +569,11 @@ export async function computeCorrelations(adAccountId: string): Promise<{
 }> {
   const dataset = await buildLeadLagDataset(adAccountId);
 
-  if (dataset.length < MIN_DATA_POINTS) {
+  if (dataset.size < MIN_DATA_POINTS) {
     return { correlations: [] };
   }
 
-  const metrics: (keyof LeadLagRow)[] = [
+  const metrics: LeadLagMetric[] = [
     'freq_t',
     'freq_delta_t',
     'ctr_t',
@@ -581,19 +586,12 @@ export async function computeCorrelations(adAccountId: string): Promise<{
 
   const correlations: { metric: string; corr1w: number; corr2w: number }[] = [];
 
+  // Pearson по колонкам: пары с NaN пропускаются, нужно > 10 валидных пар
   for (const metric of metrics) {
-    const pairs1w = dataset
-      .filter(r => r[metric] !== null && r.cpr_delta_t1 !== null)
-      .map(r => [r[metric] as number, r.cpr_delta_t1 as number] as [number, number]);
-
-    const pairs2w = dataset
-      .filter(r => r[metric] !== null && r.cpr_delta_t2 !== null)
-      .map(r => [r[metric] as number, r.cpr_delta_t2 as number] as [number, number]);
-
     correlations.push({
-      metric: String(metric),
-      corr1w: pairs1w.length > 10 ? pearsonCorrelation(pairs1w) : 0,
-      corr2w: pairs2w.length > 10 ? pearsonCorrelation(pairs2w) : 0,
+      metric,
+      corr1w: pearsonCorrelation(dataset.metrics[metric], dataset.cpr_delta_t1, 11),
+      corr2w: pearsonCorrelation(dataset.metrics[metric], dataset.cpr_delta_t2, 11),
     });
   }
 
@@ -603,30 +601,6 @@ export async function computeCorrelations(adAccountId: string): Promise<{
   return { correlations };
 }
 
-/**
- * Вычисляет коэффициент корреляции Пирсона
- */
-function pearsonCorrelation(pairs: [number, number][]): number {
-  const n = pairs.length;
-  if (n < 3) return 0;
-
-  let sumX = 0, sumY = 0, sumXY = 0, sumX2 = 0, sumY2 = 0;
-
-  for (const [x, y] of pairs) {
-    sumX += x;
-    sumY += y;
-    sumXY += x * y;
-    sumX2 += x * x;
-    sumY2 += y * y;
-  }
-
-  const numerator = n * sumXY - sumX * sumY;
-  const denominator = Math.sqrt((n * sumX2 - sumX * sumX) * (n * sumY2 - sumY * sumY));
-
-  if (denominator === 0) return 0;
-  return numerator / denominator;
-}
-
 // ============================================================================
 // RECOVERY PREDICTOR (Iteration 2)
 // ============================================================================
@@ -804,27 +778,15 @@ export async function predictRecovery(
 export async function predictAllRecovery(adAccountId: string): Promise<RecoveryPrediction[]> {
   log.info({ adAccountId }, 'Predicting recovery for degraded/burned ads');
 
-  // Получаем последнюю неделю для каждого ad
-  const { data: latestWeeks, error } = await supabase
-    .from('ad_weekly_features')
-    .select('fb_ad_id, week_start_date')
-    .eq('ad_account_id', adAccountId)
-    .eq('min_results_met', true)
-    .order('week_start_date', { ascending: false });
-
-  if (error) {
+  // Последняя неделя для каждого ad
+  let latestByAd: Map<string, string>;
+  try {
+    latestByAd = await loadLatestFeatureWeeks(adAccountId);
+  } catch (error) {
     log.error({ error, adAccountId }, 'Failed to fetch latest weeks for recovery');
     throw error;
   }
 
-  // Группируем и берём последнюю неделю для каждого ad
-  const latestByAd = new Map<string, string>();
-  for (const row of latestWeeks || []) {
-    if (!latestByAd.has(row.fb_ad_id)) {
-      latestByAd.set(row.fb_ad_id, row.week_start_date);
-    }
-  }
-
   const predictions: RecoveryPrediction[] = [];
 
   for (const [fbAdId, weekStartDate] of latestByAd) {
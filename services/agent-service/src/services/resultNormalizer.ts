@@ -13,6 +13,7 @@
 
 import { supabase } from '../lib/supabaseClient.js';
 import { createLogger } from '../lib/logger.js';
+import { invalidateInsightsSnapshot } from '../lib/insightsSnapshot.js';
 
 const log = createLogger({ module: 'resultNormalizer' });
 
@@ -405,6 +406,9 @@ export async function normalizeAllResults(adAccountId: string): Promise<{
 
   log.info({ adAccountId, processed, families: Object.fromEntries(familyCounts) }, 'Results normalization completed');
 
+  // meta_weekly_results пересчитаны
+  invalidateInsightsSnapshot(adAccountId, ['weeklyResults']);
+
   return { processed, families: familyCounts };
 }
 
@@ -461,6 +465,10 @@ export async function ensureClickFamily(adAccountId: string): Promise<number> {
     }
   }
 
+  if (added > 0) {
+    invalidateInsightsSnapshot(adAccountId, ['weeklyResults']);
+  }
+
   log.info({ adAccountId, added }, 'Click family ensured');
   return added;
 }
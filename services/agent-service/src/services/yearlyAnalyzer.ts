@@ -11,6 +11,12 @@
 
 import { supabase } from '../lib/supabaseClient.js';
 import { createLogger } from '../lib/logger.js';
+import { median as columnMedian, coefficientOfVariation } from '../lib/columnarStats.js';
+import {
+  ColumnarTable,
+  getSnapshotTable,
+  groupRows,
+} from '../lib/insightsSnapshot.js';
 
 const log = createLogger({ module: 'yearlyAnalyzer' });
 
@@ -119,19 +125,44 @@ interface WasteFinderResult {
 // HELPERS
 // ============================================================================
 
-function median(arr: number[]): number {
-  if (arr.length === 0) return 0;
-  const sorted = [...arr].sort((a, b) => a - b);
-  const mid = Math.floor(sorted.length / 2);
-  return sorted.length % 2 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2;
+function median(values: ArrayLike<number>): number {
+  return columnMedian(values) ?? 0;
 }
 
-function coefficientOfVariation(arr: number[]): number {
-  if (arr.length < 2) return 0;
-  const mean = arr.reduce((a, b) => a + b, 0) / arr.length;
-  if (mean === 0) return 0;
-  const variance = arr.reduce((sum, val) => sum + Math.pow(val - mean, 2), 0) / arr.length;
-  return Math.sqrt(variance) / mean;
+/**
+ * Индексы строк meta_weekly_results (из общего снапшота) для family и периода,
+ * отсортированные по week_start_date asc
+ */
+async function loadFamilyResultRows(
+  adAccountId: string,
+  resultFamily: string,
+  start: string,
+  end: string
+): Promise<{ results: ColumnarTable; rows: Int32Array }> {
+  const results = await getSnapshotTable(adAccountId, 'weeklyResults');
+  const families = results.text.result_family;
+  const weeks = results.text.week_start_date;
+
+  const selected: number[] = [];
+  for (let i = 0; i < results.size; i++) {
+    const week = weeks[i]!;
+    if (families[i] === resultFamily && week >= start && week <= end) {
+      selected.push(i);
+    }
+  }
+
+  const rows = Int32Array.from(selected);
+  // Стабильная сортировка: внутри ad сохраняется порядок недель
+  rows.sort((a, b) => (weeks[a]! < weeks[b]! ? -1 : weeks[a]! > weeks[b]! ? 1 : 0));
+  return { results, rows };
+}
+
+/**
+ * Значение строковой колонки meta_ads для ad (из снапшота)
+ */
+function adText(ads: ColumnarTable, fbAdId: string, column: string): string | null {
+  const rows = groupRows(ads, fbAdId);
+  return rows.length > 0 ? ads.text[column][rows[0]] : null;
 }
 
 // ============================================================================
@@ -157,68 +188,64 @@ export async function runYearlyAudit(
     return d.toISOString().split('T')[0];
   })();
 
-  // 1. Получаем все weekly results для этого family
-  const { data: results, error } = await supabase
-    .from('meta_weekly_results')
-    .select(`
-      fb_ad_id,
-      week_start_date,
-      spend,
-      result_count,
-      cpr
-    `)
-    .eq('ad_account_id', adAccountId)
-    .eq('result_family', resultFamily)
-    .gte('week_start_date', start)
-    .lte('week_start_date', end)
-    .order('week_start_date', { ascending: true });
-
-  if (error) {
+  // 1. Weekly results этого family за период (из общего снапшота insights)
+  let snapshot;
+  try {
+    snapshot = await loadFamilyResultRows(adAccountId, resultFamily, start, end);
+  } catch (error) {
     log.error({ error, adAccountId }, 'Failed to fetch results for yearly audit');
     throw error;
   }
+  const { results, rows } = snapshot;
 
-  if (!results || results.length === 0) {
+  if (rows.length === 0) {
     throw new Error(`No data found for family ${resultFamily} in period ${start} - ${end}`);
   }
 
-  // 2. Получаем названия ads
-  const adIds = [...new Set(results.map(r => r.fb_ad_id))];
-  const { data: ads } = await supabase
-    .from('meta_ads')
-    .select('fb_ad_id, name')
-    .eq('ad_account_id', adAccountId)
-    .in('fb_ad_id', adIds);
+  const adIdCol = results.text.fb_ad_id;
+  const weekCol = results.text.week_start_date;
+  const spendCol = results.num.spend;
+  const countCol = results.num.result_count;
+  const cprCol = results.num.cpr;
 
-  const adNames = new Map((ads || []).map(a => [a.fb_ad_id, a.name]));
+  // 2. Названия ads
+  const ads = await getSnapshotTable(adAccountId, 'ads');
 
-  // 3. Агрегируем по ads
-  const adStats = new Map<string, { spend: number; results: number; cprs: number[] }>();
+  // 3. Агрегируем по ads и неделям
+  const adStats = new Map<string, { spend: number; results: number }>();
   const weekStats = new Map<string, { spend: number; results: number }>();
+  const allCprs = new Float64Array(rows.length).fill(NaN);
+
+  for (let j = 0; j < rows.length; j++) {
+    const i = rows[j];
+    const spend = spendCol[i] || 0;
+    const resultCount = countCol[i] || 0;
 
-  for (const row of results) {
     // По ad
-    if (!adStats.has(row.fb_ad_id)) {
-      adStats.set(row.fb_ad_id, { spend: 0, results: 0, cprs: [] });
+    const adId = adIdCol[i]!;
+    let ad = adStats.get(adId);
+    if (!ad) {
+      ad = { spend: 0, results: 0 };
+      adStats.set(adId, ad);
     }
-    const ad = adStats.get(row.fb_ad_id)!;
-    ad.spend += parseFloat(row.spend) || 0;
-    ad.results += row.result_count || 0;
-    if (row.cpr) ad.cprs.push(parseFloat(row.cpr));
+    ad.spend += spend;
+    ad.results += resultCount;
+    if (cprCol[i]) allCprs[j] = cprCol[i];
 
     // По неделям
-    if (!weekStats.has(row.week_start_date)) {
-      weekStats.set(row.week_start_date, { spend: 0, results: 0 });
+    const weekKey = weekCol[i]!;
+    let week = weekStats.get(weekKey);
+    if (!week) {
+      week = { spend: 0, results: 0 };
+      weekStats.set(weekKey, week);
     }
-    const week = weekStats.get(row.week_start_date)!;
-    week.spend += parseFloat(row.spend) || 0;
-    week.results += row.result_count || 0;
+    week.spend += spend;
+    week.results += resultCount;
   }
 
   // 4. Считаем totals
   const totalSpend = [...adStats.values()].reduce((s, a) => s + a.spend, 0);
   const totalResults = [...adStats.values()].reduce((s, a) => s + a.results, 0);
-  const allCprs = results.filter(r => r.cpr).map(r => parseFloat(r.cpr));
   const avgCpr = totalResults > 0 ? totalSpend / totalResults : 0;
   const medianCpr = median(allCprs);
 
@@ -226,7 +253,7 @@ export async function runYearlyAudit(
   const sortedBySpend = [...adStats.entries()]
     .map(([adId, stats]) => ({
       ad_id: adId,
-      name: adNames.get(adId) || adId,
+      name: adText(ads, adId, 'name') || adId,
       spend: stats.spend,
       results: stats.results,
       cpr: stats.results > 0 ? stats.spend / stats.results : 0,
@@ -262,10 +289,20 @@ export async function runYearlyAudit(
   const worstWeeks = weekPerformance.slice(-5).reverse();
 
   // 7. Waste analysis
-  const zeroResultRows = results.filter(r => (r.result_count || 0) === 0 && (parseFloat(r.spend) || 0) > 0);
-  const zeroResultSpend = zeroResultRows.reduce((s, r) => s + (parseFloat(r.spend) || 0), 0);
-  const zeroResultWeeks = new Set(zeroResultRows.map(r => r.week_start_date)).size;
-  const zeroResultAds = [...new Set(zeroResultRows.map(r => r.fb_ad_id))];
+  let zeroResultSpend = 0;
+  const zeroResultWeekSet = new Set<string>();
+  const zeroResultAdSet = new Set<string>();
+  for (let j = 0; j < rows.length; j++) {
+    const i = rows[j];
+    const spend = spendCol[i] || 0;
+    if ((countCol[i] || 0) === 0 && spend > 0) {
+      zeroResultSpend += spend;
+      zeroResultWeekSet.add(weekCol[i]!);
+      zeroResultAdSet.add(adIdCol[i]!);
+    }
+  }
+  const zeroResultWeeks = zeroResultWeekSet.size;
+  const zeroResultAds = [...zeroResultAdSet];
 
   // 8. Stability (аномалии)
   const { data: anomalies } = await supabase
@@ -284,23 +321,29 @@ export async function runYearlyAudit(
   const spikePcts = (anomalies || []).filter(a => a.spike_pct).map(a => a.spike_pct);
   const avgSpikePct = spikePcts.length > 0 ? spikePcts.reduce((a, b) => a + b, 0) / spikePcts.length : 0;
 
-  // 9. Rankings (из insights)
-  const { data: insights } = await supabase
-    .from('meta_insights_weekly')
-    .select('quality_rank_score, engagement_rank_score, conversion_rank_score')
-    .eq('ad_account_id', adAccountId)
-    .gte('week_start_date', start)
-    .lte('week_start_date', end)
-    .not('quality_rank_score', 'is', null);
-
-  const qualityScores = (insights || []).map(i => i.quality_rank_score).filter(s => s !== null);
-  const engagementScores = (insights || []).map(i => i.engagement_rank_score).filter(s => s !== null);
-  const conversionScores = (insights || []).map(i => i.conversion_rank_score).filter(s => s !== null);
+  // 9. Rankings (из insights, только недели с quality_rank_score)
+  const insights = await getSnapshotTable(adAccountId, 'weeklyInsights');
+  const insightWeeks = insights.text.week_start_date;
+  const { quality_rank_score: qualityCol, engagement_rank_score: engagementCol, conversion_rank_score: conversionCol } = insights.num;
+
+  const rankSums = { quality: 0, engagement: 0, conversion: 0 };
+  const rankCounts = { quality: 0, engagement: 0, conversion: 0 };
+  let belowAverageWeeks = 0;
+  for (let i = 0; i < insights.size; i++) {
+    const week = insightWeeks[i]!;
+    const quality = qualityCol[i];
+    if (week < start || week > end || Number.isNaN(quality)) continue;
+
+    rankSums.quality += quality;
+    rankCounts.quality++;
+    if (quality < 0) belowAverageWeeks++;
+    if (!Number.isNaN(engagementCol[i])) { rankSums.engagement += engagementCol[i]; rankCounts.engagement++; }
+    if (!Number.isNaN(conversionCol[i])) { rankSums.conversion += conversionCol[i]; rankCounts.conversion++; }
+  }
 
-  const avgQualityScore = qualityScores.length > 0 ? qualityScores.reduce((a, b) => a + b, 0) / qualityScores.length : 0;
-  const avgEngagementScore = engagementScores.length > 0 ? engagementScores.reduce((a, b) => a + b, 0) / engagementScores.length : 0;
-  const avgConversionScore = conversionScores.length > 0 ? conversionScores.reduce((a, b) => a + b, 0) / conversionScores.length : 0;
-  const belowAverageWeeks = qualityScores.filter(s => s < 0).length;
+  const avgQualityScore = rankCounts.quality > 0 ? rankSums.quality / rankCounts.quality : 0;
+  const avgEngagementScore = rankCounts.engagement > 0 ? rankSums.engagement / rankCounts.engagement : 0;
+  const avgConversionScore = rankCounts.conversion > 0 ? rankSums.conversion / rankCounts.conversion : 0;
 
   const auditResult: YearlyAuditResult = {
     period: { start, end },
@@ -407,20 +450,15 @@ export async function analyzeCreativeLifecycle(
     return d.toISOString().split('T')[0];
   })();
 
-  // 1. Получаем все weekly results
-  const { data: results, error } = await supabase
-    .from('meta_weekly_results')
-    .select('fb_ad_id, week_start_date, spend, result_count, cpr')
-    .eq('ad_account_id', adAccountId)
-    .eq('result_family', resultFamily)
-    .gte('week_start_date', start)
-    .lte('week_start_date', end)
-    .order('week_start_date', { ascending: true });
-
-  if (error) {
+  // 1. Weekly results этого family за период (из общего снапшота insights)
+  let snapshot;
+  try {
+    snapshot = await loadFamilyResultRows(adAccountId, resultFamily, start, end);
+  } catch (error) {
     log.error({ error }, 'Failed to fetch results for creative lifecycle');
     throw error;
   }
+  const { results, rows } = snapshot;
 
   // 2. Получаем anomalies для определения "смерти"
   const { data: anomalies } = await supabase
@@ -432,17 +470,10 @@ export async function analyzeCreativeLifecycle(
     .lte('week_start_date', end)
     .order('week_start_date', { ascending: true });
 
-  // 3. Получаем названия ads и creative fingerprints
-  const adIds = [...new Set((results || []).map(r => r.fb_ad_id))];
-  const { data: ads } = await supabase
-    .from('meta_ads')
-    .select('fb_ad_id, name, fb_creative_id')
-    .eq('ad_account_id', adAccountId)
-    .in('fb_ad_id', adIds);
-
-  const adInfo = new Map((ads || []).map(a => [a.fb_ad_id, { name: a.name, creativeId: a.fb_creative_id }]));
+  // 3. Названия ads и creative fingerprints
+  const ads = await getSnapshotTable(adAccountId, 'ads');
 
-  // 4. Группируем по ads
+  // 4. Группируем по ads (строки уже в порядке week_start_date asc)
   const adLifecycle = new Map<string, {
     weeks: string[];
     cprs: number[];
@@ -451,21 +482,28 @@ export async function analyzeCreativeLifecycle(
     firstAnomaly: string | null;
   }>();
 
-  for (const row of results || []) {
-    if (!adLifecycle.has(row.fb_ad_id)) {
-      adLifecycle.set(row.fb_ad_id, {
+  const adIdCol = results.text.fb_ad_id;
+  const weekCol = results.text.week_start_date;
+  const { spend: spendCol, result_count: countCol, cpr: cprCol } = results.num;
+
+  for (let j = 0; j < rows.length; j++) {
+    const i = rows[j];
+    const adId = adIdCol[i]!;
+    let ad = adLifecycle.get(adId);
+    if (!ad) {
+      ad = {
         weeks: [],
         cprs: [],
         spend: 0,
         results: 0,
         firstAnomaly: null,
-      });
+      };
+      adLifecycle.set(adId, ad);
     }
-    const ad = adLifecycle.get(row.fb_ad_id)!;
-    ad.weeks.push(row.week_start_date);
-    if (row.cpr) ad.cprs.push(parseFloat(row.cpr));
-    ad.spend += parseFloat(row.spend) || 0;
-    ad.results += row.result_count || 0;
+    ad.weeks.push(weekCol[i]!);
+    if (cprCol[i]) ad.cprs.push(cprCol[i]);
+    ad.spend += spendCol[i] || 0;
+    ad.results += countCol[i] || 0;
   }
 
   // Добавляем первую аномалию
@@ -481,8 +519,7 @@ export async function analyzeCreativeLifecycle(
   const deathCauses: Record<string, number> = {};
 
   for (const [adId, data] of adLifecycle) {
-    const info = adInfo.get(adId);
-    const creativeFingerprint = info?.creativeId || adId;
+    const creativeFingerprint = adText(ads, adId, 'fb_creative_id') || adId;
     const firstWeek = data.weeks[0];
     const deathWeek = data.firstAnomaly;
     const isAlive = !deathWeek;
@@ -500,7 +537,7 @@ export async function analyzeCreativeLifecycle(
     creatives.push({
       creativeFingerprint,
       adId,
-      name: info?.name || adId,
+      name: adText(ads, adId, 'name') || adId,
       firstWeek,
       deathWeek,
       lifetimeWeeks,
@@ -561,33 +598,28 @@ export async function findWaste(
     return d.toISOString().split('T')[0];
   })();
 
-  // 1. Получаем weekly results
-  const { data: results, error } = await supabase
-    .from('meta_weekly_results')
-    .select('fb_ad_id, week_start_date, spend, result_count, cpr')
-    .eq('ad_account_id', adAccountId)
-    .eq('result_family', resultFamily)
-    .gte('week_start_date', start)
-    .lte('week_start_date', end);
-
-  if (error) throw error;
-
-  // 2. Получаем baseline CPR (медиана)
-  const cprs = (results || []).filter(r => r.cpr).map(r => parseFloat(r.cpr));
+  // 1. Weekly results этого family за период (из общего снапшота insights)
+  const [{ results, rows }, ads] = await Promise.all([
+    loadFamilyResultRows(adAccountId, resultFamily, start, end),
+    getSnapshotTable(adAccountId, 'ads'),
+  ]);
+
+  const adIdCol = results.text.fb_ad_id;
+  const weekCol = results.text.week_start_date;
+  const { spend: spendCol, result_count: countCol, cpr: cprCol } = results.num;
+
+  // 2. Baseline CPR (медиана) — один проход по колонке
+  const cprs = new Float64Array(rows.length).fill(NaN);
+  let totalSpend = 0;
+  for (let j = 0; j < rows.length; j++) {
+    const i = rows[j];
+    if (cprCol[i]) cprs[j] = cprCol[i];
+    totalSpend += spendCol[i] || 0;
+  }
   const medianCpr = median(cprs);
   const highCprThreshold = medianCpr * 2; // 2x медианы = высокий CPR
 
-  // 3. Получаем названия ads
-  const adIds = [...new Set((results || []).map(r => r.fb_ad_id))];
-  const { data: ads } = await supabase
-    .from('meta_ads')
-    .select('fb_ad_id, name')
-    .eq('ad_account_id', adAccountId)
-    .in('fb_ad_id', adIds);
-
-  const adNames = new Map((ads || []).map(a => [a.fb_ad_id, a.name]));
-
-  // 4. Находим waste
+  // 3. Находим waste
   const wasteDetails: WasteItem[] = [];
   const wasteByReason: Record<string, number> = {
     zero_results: 0,
@@ -595,12 +627,11 @@ export async function findWaste(
     low_volume: 0,
   };
 
-  const totalSpend = (results || []).reduce((s, r) => s + (parseFloat(r.spend) || 0), 0);
-
-  for (const row of results || []) {
-    const spend = parseFloat(row.spend) || 0;
-    const resultCount = row.result_count || 0;
-    const cpr = parseFloat(row.cpr) || 0;
+  for (let j = 0; j < rows.length; j++) {
+    const i = rows[j];
+    const spend = spendCol[i] || 0;
+    const resultCount = countCol[i] || 0;
+    const cpr = cprCol[i] || 0;
 
     let reason = '';
 
@@ -624,10 +655,11 @@ export async function findWaste(
     }
 
     if (reason) {
+      const adId = adIdCol[i]!;
       wasteDetails.push({
-        week: row.week_start_date,
-        adId: row.fb_ad_id,
-        name: adNames.get(row.fb_ad_id) || row.fb_ad_id,
+        week: weekCol[i]!,
+        adId,
+        name: adText(ads, adId, 'name') || adId,
         spend,
         results: resultCount,
         reason,
@@ -701,22 +733,19 @@ export async function analyzeResponseCurve(
   let weeklyData: Array<{ week: string; spend: number; results: number }> = [];
 
   if (level === 'account') {
-    const { data } = await supabase
-      .from('meta_weekly_results')
-      .select('week_start_date, spend, result_count')
-      .eq('ad_account_id', adAccountId)
-      .eq('result_family', resultFamily)
-      .gte('week_start_date', start)
-      .lte('week_start_date', end);
+    const { results, rows } = await loadFamilyResultRows(adAccountId, resultFamily, start, end);
+    const weekCol = results.text.week_start_date;
+    const { spend: spendCol, result_count: countCol } = results.num;
 
     // Агрегируем по неделям
     const weekMap = new Map<string, { spend: number; results: number }>();
-    for (const row of data || []) {
-      const key = row.week_start_date;
+    for (let j = 0; j < rows.length; j++) {
+      const i = rows[j];
+      const key = weekCol[i]!;
       if (!weekMap.has(key)) weekMap.set(key, { spend: 0, results: 0 });
       const w = weekMap.get(key)!;
-      w.spend += parseFloat(row.spend) || 0;
-      w.results += row.result_count || 0;
+      w.spend += spendCol[i] || 0;
+      w.results += countCol[i] || 0;
     }
     weeklyData = [...weekMap.entries()].map(([week, data]) => ({ week, ...data }));
   } else if (level === 'campaign' && entityId) {
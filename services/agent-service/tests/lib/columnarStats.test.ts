@@ -0,0 +1,87 @@
+/**
+ * columnarStats Tests
+ * Tests for typed-array statistics and NaN (missing value) handling
+ */
+
+import { describe, it, expect } from 'vitest';
+import {
+  median,
+  quantiles,
+  slope,
+  pearsonCorrelation,
+  mean,
+  coefficientOfVariation
+} from '../../src/lib/columnarStats.js';
+
+const col = (...values: number[]) => Float64Array.from(values);
+
+describe('columnarStats', () => {
+  describe('median', () => {
+    it('handles odd and even lengths', () => {
+      expect(median(col(3, 1, 2))).toBe(2);
+      expect(median(col(4, 1, 3, 2))).toBe(2.5);
+    });
+
+    it('skips NaN and returns null for an empty set', () => {
+      expect(median(col(NaN, 5, NaN, 1))).toBe(3);
+      expect(median(col(NaN, NaN))).toBeNull();
+      expect(median(col())).toBeNull();
+    });
+  });
+
+  describe('quantiles', () => {
+    it('interpolates between neighbours', () => {
+      expect(quantiles(col(10, 20, 30, 40, 50), [0, 0.25, 0.5, 1])).toEqual([10, 20, 30, 50]);
+      expect(quantiles(col(0, 10), [0.3])[0]).toBeCloseTo(3);
+    });
+
+    it('skips NaN and returns NaN for an empty set', () => {
+      expect(quantiles(col(NaN, 1, 3, NaN), [0.5])).toEqual([2]);
+      expect(Number.isNaN(quantiles(col(NaN), [0.5])[0])).toBe(true);
+    });
+  });
+
+  describe('slope', () => {
+    it('fits a linear trend over the index', () => {
+      expect(slope(col(1, 3, 5, 7))).toBeCloseTo(2);
+      expect(slope(col(5, 5, 5))).toBeCloseTo(0);
+    });
+
+    it('skips missing days without shifting the time axis', () => {
+      expect(slope(col(1, NaN, 5, 7))).toBeCloseTo(2);
+      expect(slope(col(NaN, 2, NaN, 6))).toBeCloseTo(2);
+    });
+
+    it('returns null with fewer than two points', () => {
+      expect(slope(col(1))).toBeNull();
+      expect(slope(col(NaN, 4, NaN))).toBeNull();
+    });
+  });
+
+  describe('coefficientOfVariation', () => {
+    it('computes std / mean with population variance', () => {
+      expect(coefficientOfVariation(col(2, 4, 4, 4, 5, 5, 7, 9))).toBeCloseTo(0.4);
+    });
+
+    it('skips NaN', () => {
+      expect(coefficientOfVariation(col(2, NaN, 4, 4, 4, 5, 5, 7, 9, NaN))).toBeCloseTo(0.4);
+      expect(coefficientOfVariation(col(NaN, 3))).toBe(0);
+    });
+
+    it('returns 0 for a zero mean', () => {
+      expect(coefficientOfVariation(col(-1, 1))).toBe(0);
+    });
+  });
+
+  describe('pearsonCorrelation / mean', () => {
+    it('skips pairs with NaN', () => {
+      expect(pearsonCorrelation(col(1, 2, NaN, 3, 4), col(2, 4, 100, 6, 8))).toBeCloseTo(1);
+      expect(pearsonCorrelation(col(1, NaN, 3), col(1, 2, 3))).toBe(0);
+    });
+
+    it('averages non-NaN values', () => {
+      expect(mean(col(1, NaN, 3))).toBe(2);
+      expect(mean(col(NaN))).toBe(0);
+    });
+  });
+});
@@ -0,0 +1,122 @@
+/**
+ * concurrency Tests
+ * Tests for array concurrency limit and the bounded job limiter
+ */
+
+import { describe, it, expect, afterEach, vi } from 'vitest';
+import { withConcurrencyLimit, createConcurrencyLimiter, ConcurrencyLimitError } from '../../src/lib/concurrency.js';
+
+function deferred<T = void>() {
+  let resolve!: (value: T) => void;
+  const promise = new Promise<T>(r => { resolve = r; });
+  return { promise, resolve };
+}
+
+const flush = () => new Promise(resolve => setImmediate(resolve));
+
+describe('withConcurrencyLimit', () => {
+  it('keeps result order and never exceeds the limit', async () => {
+    let active = 0;
+    let maxActive = 0;
+
+    const results = await withConcurrencyLimit([30, 10, 20, 5], 2, async (ms, i) => {
+      active++;
+      maxActive = Math.max(maxActive, active);
+      await new Promise(resolve => setTimeout(resolve, ms));
+      active--;
+      return i;
+    });
+
+    expect(results).toEqual([0, 1, 2, 3]);
+    expect(maxActive).toBe(2);
+  });
+});
+
+describe('createConcurrencyLimiter', () => {
+  afterEach(() => {
+    vi.useRealTimers();
+  });
+
+  it('runs at most `limit` jobs and starts queued jobs in FIFO order', async () => {
+    const limiter = createConcurrencyLimiter(1);
+    const first = deferred();
+    const started: string[] = [];
+
+    const a = limiter.run(async () => { started.push('a'); await first.promise; return 'a'; });
+    const b = limiter.run(async () => { started.push('b'); return 'b'; });
+    const c = limiter.run(async () => { started.push('c'); return 'c'; });
+    await flush();
+
+    expect(started).toEqual(['a']);
+    expect(limiter.active).toBe(1);
+    expect(limiter.pending).toBe(2);
+
+    first.resolve();
+    expect(await Promise.all([a, b, c])).toEqual(['a', 'b', 'c']);
+    expect(started).toEqual(['a', 'b', 'c']);
+    expect(limiter.active).toBe(0);
+  });
+
+  it('frees the slot when a job fails', async () => {
+    const limiter = createConcurrencyLimiter(1);
+
+    await expect(limiter.run(async () => { throw new Error('boom'); })).rejects.toThrow('boom');
+    expect(await limiter.run(async () => 'next')).toBe('next');
+  });
+
+  it('rejects with 503 when the queue is full', async () => {
+    const limiter = createConcurrencyLimiter(1, { maxQueue: 1 });
+    const gate = deferred();
+
+    const running = limiter.run(() => gate.promise);
+    const queued = limiter.run(async () => 'queued');
+    expect(limiter.canAccept).toBe(false);
+
+    const rejected = limiter.run(async () => 'never');
+    await expect(rejected).rejects.toBeInstanceOf(ConcurrencyLimitError);
+    await expect(rejected).rejects.toMatchObject({ statusCode: 503, reason: 'queue_full' });
+
+    gate.resolve();
+    await running;
+    expect(await queued).toBe('queued');
+    expect(limiter.canAccept).toBe(true);
+  });
+
+  it('drops a job that waited longer than queueTimeoutMs', async () => {
+    vi.useFakeTimers();
+    const limiter = createConcurrencyLimiter(1, { queueTimeoutMs: 1000 });
+    const gate = deferred();
+    const fn = vi.fn(async () => 'late');
+
+    const running = limiter.run(() => gate.promise);
+    const waiting = limiter.run(fn);
+    const outcome = waiting.catch(err => err);
+
+    await vi.advanceTimersByTimeAsync(1000);
+    const err = await outcome;
+
+    expect(err).toBeInstanceOf(ConcurrencyLimitError);
+    expect(err).toMatchObject({ statusCode: 503, reason: 'queue_timeout' });
+    expect(limiter.pending).toBe(0);
+
+    gate.resolve();
+    await running;
+    expect(fn).not.toHaveBeenCalled();
+  });
+
+  it('does not time out a job that got a slot in time', async () => {
+    vi.useFakeTimers();
+    const limiter = createConcurrencyLimiter(1, { queueTimeoutMs: 1000 });
+    const gate = deferred();
+
+    const running = limiter.run(() => gate.promise);
+    const waiting = limiter.run(async () => 'ok');
+
+    await vi.advanceTimersByTimeAsync(500);
+    gate.resolve();
+    await running;
+    await vi.advanceTimersByTimeAsync(1000);
+
+    expect(await waiting).toBe('ok');
+  });
+});
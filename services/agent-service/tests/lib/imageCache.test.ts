@@ -0,0 +1,291 @@
+/**
+ * imageCache Tests
+ * Tests for lookup keys, index hits/misses, content dedupe and in-flight dedupe
+ */
+
+import { describe, it, expect, beforeEach, afterEach, vi } from 'vitest';
+
+const { db, storage, supabase } = vi.hoisted(() => {
+  const db: Record<string, Map<string, any>> = {
+    competitor_image_cache: new Map(),
+    competitor_image_cache_keys: new Map()
+  };
+  const storage = new Map<string, Buffer>();
+  const primaryKey: Record<string, string> = {
+    competitor_image_cache: 'content_hash',
+    competitor_image_cache_keys: 'lookup_key'
+  };
+
+  // Минимальный in-memory query builder для используемых imageCache вызовов
+  function query(table: string) {
+    const filters: Array<(row: any) => boolean> = [];
+    let action: 'select' | 'delete' = 'select';
+    const run = () => {
+      const rows = [...db[table].values()].filter(row => filters.every(f => f(row)));
+      if (action === 'delete') {
+        for (const row of rows) db[table].delete(row[primaryKey[table]]);
+      }
+      return { data: rows, error: null };
+    };
+    const builder: any = {
+      select: () => builder,
+      delete: () => { action = 'delete'; return builder; },
+      in: (col: string, values: string[]) => { filters.push(row => values.includes(row[col])); return builder; },
+      eq: (col: string, value: unknown) => { filters.push(row => row[col] === value); return builder; },
+      not: (col: string, _op: string, _value: null) => { filters.push(row => row[col] != null); return builder; },
+      like: (col: string, pattern: string) => {
+        const needle = pattern.replace(/^%|%$/g, '');
+        filters.push(row => String(row[col]).includes(needle));
+        return builder;
+      },
+      maybeSingle: async () => ({ data: run().data[0] ?? null, error: null }),
+      upsert: async (input: any, _options: unknown) => {
+        for (const row of Array.isArray(input) ? input : [input]) {
+          const key = row[primaryKey[table]];
+          if (!db[table].has(key)) db[table].set(key, row);
+        }
+        return { error: null };
+      },
+      then: (resolve: (value: unknown) => unknown, reject: (reason: unknown) => unknown) =>
+        Promise.resolve().then(run).then(resolve, reject)
+    };
+    return builder;
+  }
+
+  const bucket = {
+    upload: vi.fn(async (path: string, buffer: Buffer) => {
+      if (storage.has(path)) return { error: { message: 'The resource already exists' } };
+      storage.set(path, buffer);
+      return { error: null };
+    }),
+    getPublicUrl: (path: string) => ({
+      data: { publicUrl: `https://db.example.com/storage/v1/object/public/competitor-creatives/${path}` }
+    }),
+    list: async (folder: string) => ({
+      data: [...storage.keys()]
+        .filter(path => path.startsWith(`${folder}/`))
+        .map(path => ({ name: path.slice(folder.length + 1) })),
+      error: null
+    }),
+    remove: async (paths: string[]) => {
+      for (const path of paths) storage.delete(path);
+      return { error: null };
+    }
+  };
+
+  const supabase = {
+    from: vi.fn((table: string) => query(table)),
+    rpc: vi.fn(),
+    storage: {
+      from: () => bucket,
+      listBuckets: async () => ({ data: [{ name: 'competitor-creatives' }], error: null }),
+      createBucket: async () => ({ error: null })
+    }
+  };
+
+  return { db, storage, supabase };
+});
+
+vi.mock('../../src/lib/supabase.js', () => ({ supabase }));
+
+import {
+  cacheImageToStorage,
+  cacheImagesToStorage,
+  deleteCompetitorImages,
+  getImageCacheStats,
+  getLookupKeys,
+  sweepUnreferencedImages,
+  urlFingerprint
+} from '../../src/lib/imageCache.js';
+
+const fetchMock = vi.fn();
+let seq = 0;
+
+// Уникальный путь на тест: индекс в памяти модуля живёт между тестами
+const cdnUrl = (path = `img_${++seq}.jpg`, query = 'oh=1&oe=2') =>
+  `https://scontent.xx.fbcdn.net/v/t45/${path}?${query}`;
+
+function imageResponse(body: string) {
+  const bytes = new TextEncoder().encode(body);
+  return {
+    ok: true,
+    status: 200,
+    headers: new Headers({ 'content-type': 'image/jpeg', 'content-length': String(bytes.length) }),
+    arrayBuffer: async () => bytes.buffer
+  };
+}
+
+function statsDelta(before: ReturnType<typeof getImageCacheStats>) {
+  const after = getImageCacheStats();
+  return Object.fromEntries(
+    Object.entries(after).map(([key, value]) => [key, value - before[key as keyof typeof before]])
+  );
+}
+
+describe('imageCache', () => {
+  beforeEach(() => {
+    fetchMock.mockReset();
+    fetchMock.mockImplementation(async (url: string) => imageResponse(`body of ${new URL(url).pathname}`));
+    vi.stubGlobal('fetch', fetchMock);
+  });
+
+  afterEach(() => {
+    vi.unstubAllGlobals();
+  });
+
+  describe('getLookupKeys', () => {
+    it('builds ad and url keys, fingerprint ignores host and query', () => {
+      const a = cdnUrl('same.jpg', 'oh=1&oe=2');
+      const b = 'https://scontent-ams2.xx.fbcdn.net/v/t45/same.jpg?oh=9&oe=8';
+
+      expect(getLookupKeys(a, '123')).toEqual(['ad:123', `url:${urlFingerprint(a)}`]);
+      expect(urlFingerprint(a)).toBe(urlFingerprint(b));
+      expect(urlFingerprint(a)).not.toBe(urlFingerprint(cdnUrl('other.jpg')));
+    });
+
+    it('skips the url key for unparseable or root URLs', () => {
+      expect(getLookupKeys('not a url', '1')).toEqual(['ad:1']);
+      expect(getLookupKeys('https://fbcdn.net/')).toEqual([]);
+    });
+  });
+
+  it('returns non-CDN URLs as is', async () => {
+    const url = 'https://example.com/picture.jpg';
+
+    expect(await cacheImageToStorage(url, 'comp')).toBe(url);
+    expect(fetchMock).not.toHaveBeenCalled();
+  });
+
+  it('uploads a miss by content hash and indexes both keys', async () => {
+    const before = getImageCacheStats();
+    const url = cdnUrl();
+
+    const publicUrl = await cacheImageToStorage(url, 'comp', { adArchiveId: 'miss_1' });
+
+    expect(publicUrl).toMatch(/\/competitor-creatives\/by-hash\/[0-9a-f]{2}\/[0-9a-f]{64}\.jpg$/);
+    expect(fetchMock).toHaveBeenCalledTimes(1);
+    for (const key of getLookupKeys(url, 'miss_1')) {
+      expect(db.competitor_image_cache_keys.get(key)).toMatchObject({ public_url: publicUrl });
+      expect(db.competitor_image_cache_keys.get(key).content_hash).toMatch(/^[0-9a-f]{64}$/);
+    }
+    expect(statsDelta(before)).toMatchObject({ misses: 1, hits: 0, dedupedUploads: 0 });
+  });
+
+  it('serves a re-signed URL of a known ad from the index without downloading', async () => {
+    const first = await cacheImageToStorage(cdnUrl('hit.jpg', 'oh=1'), 'comp', { adArchiveId: 'hit_1' });
+    const size = db.competitor_image_cache_keys.get('ad:hit_1').size_bytes;
+    const before = getImageCacheStats();
+    fetchMock.mockClear();
+
+    const renamed = cdnUrl('hit_renamed.jpg', 'oh=2');
+    const second = await cacheImageToStorage(renamed, 'comp', { adArchiveId: 'hit_1' });
+
+    expect(second).toBe(first);
+    expect(fetchMock).not.toHaveBeenCalled();
+    expect(statsDelta(before)).toMatchObject({ hits: 1, misses: 0, bytesSaved: size * 2 });
+    // Новый URL дописан в индекс с тем же хешем и размером
+    expect(db.competitor_image_cache_keys.get(`url:${urlFingerprint(renamed)}`)).toMatchObject({
+      public_url: first,
+      content_hash: db.competitor_image_cache_keys.get('ad:hit_1').content_hash,
+      size_bytes: size
+    });
+  });
+
+  it('skips the upload when the same content is already stored under another URL', async () => {
+    fetchMock.mockImplementation(async () => imageResponse('identical bytes'));
+    const first = await cacheImageToStorage(cdnUrl(), 'comp');
+    const uploads = storage.size;
+    const before = getImageCacheStats();
+
+    const second = await cacheImageToStorage(cdnUrl(), 'comp');
+
+    expect(second).toBe(first);
+    expect(storage.size).toBe(uploads);
+    expect(statsDelta(before)).toMatchObject({ misses: 1, dedupedUploads: 1, bytesUploaded: 0 });
+  });
+
+  it('downloads the same URL once for concurrent callers', async () => {
+    let release!: () => void;
+    const gate = new Promise<void>(resolve => { release = resolve; });
+    fetchMock.mockImplementation(async (url: string) => {
+      await gate;
+      return imageResponse(`body of ${url}`);
+    });
+    const url = cdnUrl();
+
+    const pending = Promise.all([cacheImageToStorage(url, 'comp'), cacheImageToStorage(url, 'comp')]);
+    await new Promise(resolve => setTimeout(resolve, 0));
+    release();
+    const [a, b] = await pending;
+
+    expect(a).toBe(b);
+    expect(fetchMock).toHaveBeenCalledTimes(1);
+  });
+
+  it('ignores index rows without content hash', async () => {
+    db.competitor_image_cache_keys.set('ad:legacy_1', {
+      lookup_key: 'ad:legacy_1',
+      public_url: 'https://db.example.com/storage/v1/object/public/competitor-creatives/comp/old.jpg',
+      content_hash: null,
+      size_bytes: null
+    });
+
+    const [publicUrl] = await cacheImagesToStorage([
+      { imageUrl: cdnUrl(), competitorId: 'comp', adArchiveId: 'legacy_1' }
+    ]);
+
+    expect(fetchMock).toHaveBeenCalledTimes(1);
+    expect(publicUrl).toContain('/by-hash/');
+  });
+
+  it('drops index rows and memo entries pointing into a deleted competitor folder', async () => {
+    const legacyUrl = 'https://db.example.com/storage/v1/object/public/competitor-creatives/comp_del/old.jpg';
+    storage.set('comp_del/old.jpg', Buffer.from('old'));
+    db.competitor_image_cache_keys.set('ad:del_1', {
+      lookup_key: 'ad:del_1',
+      public_url: legacyUrl,
+      content_hash: 'f'.repeat(64),
+      size_bytes: 3
+    });
+    // Ключ попадает в память процесса
+    expect(await cacheImageToStorage(cdnUrl(), 'comp_del', { adArchiveId: 'del_1' })).toBe(legacyUrl);
+
+    await deleteCompetitorImages('comp_del');
+
+    expect(storage.has('comp_del/old.jpg')).toBe(false);
+    expect(db.competitor_image_cache_keys.has('ad:del_1')).toBe(false);
+    fetchMock.mockClear();
+    const publicUrl = await cacheImageToStorage(cdnUrl(), 'comp_del', { adArchiveId: 'del_1' });
+    expect(fetchMock).toHaveBeenCalledTimes(1);
+    expect(publicUrl).toContain('/by-hash/');
+  });
+
+  it('removes swept files from storage and forgets their keys', async () => {
+    fetchMock.mockImplementation(async () => imageResponse('swept bytes'));
+    const url = cdnUrl();
+    const publicUrl = await cacheImageToStorage(url, 'comp', { adArchiveId: 'sweep_1' });
+    const storagePath = publicUrl!.split('/competitor-creatives/')[1];
+    // Функция в БД уже удалила строки — возвращает пути файлов
+    const contentHash = db.competitor_image_cache_keys.get('ad:sweep_1').content_hash;
+    for (const key of getLookupKeys(url, 'sweep_1')) db.competitor_image_cache_keys.delete(key);
+    db.competitor_image_cache.delete(contentHash);
+    supabase.rpc.mockResolvedValueOnce({ data: [{ storage_path: storagePath }], error: null });
+
+    expect(await sweepUnreferencedImages()).toBe(1);
+
+    expect(supabase.rpc).toHaveBeenCalledWith('sweep_competitor_image_cache');
+    expect(storage.has(storagePath)).toBe(false);
+    fetchMock.mockClear();
+    expect(await cacheImageToStorage(cdnUrl(), 'comp', { adArchiveId: 'sweep_1' })).toBe(publicUrl);
+    expect(fetchMock).toHaveBeenCalledTimes(1);
+    expect(storage.has(storagePath)).toBe(true);
+  });
+
+  it('keeps storage untouched when the sweep query fails', async () => {
+    const files = storage.size;
+    supabase.rpc.mockResolvedValueOnce({ data: null, error: { message: 'timeout' } });
+
+    expect(await sweepUnreferencedImages()).toBe(0);
+    expect(storage.size).toBe(files);
+  });
+});
@@ -0,0 +1,148 @@
+/**
+ * insightsSnapshot Tests
+ * Tests for columnar loading, shared loads, invalidation and LRU eviction
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest';
+
+const { rowsByTable, loads } = vi.hoisted(() => {
+  // Минимальный бюджет, чтобы LRU срабатывал на небольших фикстурах
+  process.env.INSIGHTS_SNAPSHOT_MAX_MB = '1';
+  return { rowsByTable: new Map<string, any[]>(), loads: [] as string[] };
+});
+
+vi.mock('../../src/lib/supabaseClient.js', () => ({
+  supabase: {
+    from: (table: string) => {
+      let accountId = '';
+      const query: any = {
+        select: () => query,
+        eq: (column: string, value: string) => {
+          if (column === 'ad_account_id') accountId = value;
+          return query;
+        },
+        order: () => query,
+        range: (from: number, to: number) => {
+          // Страницы запрашиваются волнами — загрузку считаем по первой странице
+          if (from === 0) loads.push(`${table}:${accountId}`);
+          const rows = rowsByTable.get(`${table}:${accountId}`) || [];
+          return Promise.resolve({ data: rows.slice(from, to + 1), error: null });
+        }
+      };
+      return query;
+    }
+  }
+}));
+
+import {
+  getSnapshotTable,
+  invalidateInsightsSnapshot,
+  getInsightsSnapshotStats,
+  groupRows,
+  valueOrNull
+} from '../../src/lib/insightsSnapshot.js';
+
+// ~420 KB на аккаунт: два помещаются в 1 MB, три — нет
+function seedLargeAccount(accountId: string) {
+  rowsByTable.set(`meta_insights_weekly:${accountId}`, Array.from({ length: 200 }, (_, i) => ({
+    fb_ad_id: `${accountId}-${String(i).padStart(1000, '0')}`,
+    week_start_date: '2026-01-05',
+    spend: i
+  })));
+}
+
+const loadsOf = (key: string) => loads.filter(call => call === key).length;
+
+describe('insightsSnapshot', () => {
+  beforeEach(() => {
+    invalidateInsightsSnapshot();
+    rowsByTable.clear();
+    loads.length = 0;
+  });
+
+  it('builds columns and groups, encoding nulls as NaN', async () => {
+    rowsByTable.set('meta_insights_weekly:acc1', [
+      { fb_ad_id: 'ad1', week_start_date: '2026-01-12', spend: '10.5', ctr: null },
+      { fb_ad_id: 'ad2', week_start_date: '2026-01-12', spend: 3, ctr: 1.2 },
+      { fb_ad_id: 'ad1', week_start_date: '2026-01-05', spend: 7, ctr: 0.8 }
+    ]);
+
+    const table = await getSnapshotTable('acc1', 'weeklyInsights');
+
+    expect(table.size).toBe(3);
+    expect(Array.from(groupRows(table, 'ad1'))).toEqual([0, 2]);
+    expect(groupRows(table, 'missing')).toHaveLength(0);
+    expect(table.num.spend[0]).toBe(10.5);
+    expect(valueOrNull(table.num.ctr, 0)).toBeNull();
+    expect(valueOrNull(table.num.ctr, 1)).toBe(1.2);
+  });
+
+  it('shares one load between concurrent readers', async () => {
+    rowsByTable.set('meta_ads:acc1', [{ fb_ad_id: 'ad1' }]);
+    const before = getInsightsSnapshotStats();
+
+    const [a, b] = await Promise.all([
+      getSnapshotTable('acc1', 'ads'),
+      getSnapshotTable('acc1', 'ads')
+    ]);
+
+    expect(a).toBe(b);
+    expect(loadsOf('meta_ads:acc1')).toBe(1);
+    const after = getInsightsSnapshotStats();
+    expect(after.misses - before.misses).toBe(1);
+    expect(after.hits - before.hits).toBe(1);
+  });
+
+  it('reloads after invalidation of the account or a single table', async () => {
+    rowsByTable.set('meta_ads:acc1', [{ fb_ad_id: 'ad1' }]);
+    rowsByTable.set('meta_adsets:acc1', [{ fb_adset_id: 'set1' }]);
+
+    await getSnapshotTable('acc1', 'ads');
+    await getSnapshotTable('acc1', 'adsets');
+
+    invalidateInsightsSnapshot('acc1', ['ads']);
+    rowsByTable.set('meta_ads:acc1', [{ fb_ad_id: 'ad1' }, { fb_ad_id: 'ad2' }]);
+
+    expect((await getSnapshotTable('acc1', 'ads')).size).toBe(2);
+    await getSnapshotTable('acc1', 'adsets');
+    expect(loadsOf('meta_ads:acc1')).toBe(2);
+    expect(loadsOf('meta_adsets:acc1')).toBe(1);
+
+    invalidateInsightsSnapshot('acc1');
+    await getSnapshotTable('acc1', 'adsets');
+    expect(loadsOf('meta_adsets:acc1')).toBe(2);
+  });
+
+  it('does not cache a table whose load finished after invalidation', async () => {
+    rowsByTable.set('meta_ads:acc1', [{ fb_ad_id: 'stale' }]);
+
+    const pending = getSnapshotTable('acc1', 'ads');
+    invalidateInsightsSnapshot('acc1');
+    await pending;
+
+    rowsByTable.set('meta_ads:acc1', [{ fb_ad_id: 'fresh' }]);
+    const table = await getSnapshotTable('acc1', 'ads');
+    expect(table.text.fb_ad_id).toEqual(['fresh']);
+  });
+
+  it('evicts the least recently used account when over the memory budget', async () => {
+    for (const id of ['lruA', 'lruB', 'lruC']) seedLargeAccount(id);
+    const before = getInsightsSnapshotStats();
+
+    await getSnapshotTable('lruA', 'weeklyInsights');
+    await getSnapshotTable('lruB', 'weeklyInsights');
+    // Обращение к A делает B самым давно использованным
+    await getSnapshotTable('lruA', 'weeklyInsights');
+    await getSnapshotTable('lruC', 'weeklyInsights');
+
+    const after = getInsightsSnapshotStats();
+    expect(after.evictions - before.evictions).toBe(1);
+    expect(after.accounts).toBe(2);
+    expect(after.bytes).toBeLessThanOrEqual(after.maxBytes);
+
+    await getSnapshotTable('lruA', 'weeklyInsights');
+    await getSnapshotTable('lruB', 'weeklyInsights');
+    expect(loadsOf('meta_insights_weekly:lruA')).toBe(1);
+    expect(loadsOf('meta_insights_weekly:lruB')).toBe(2);
+  });
+});
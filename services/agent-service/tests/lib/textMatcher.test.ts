@@ -0,0 +1,175 @@
+/**
+ * textMatcher Tests
+ * Tests for direction matching, index caching and invalidation
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest';
+
+const { directionsByUser, queries, gate } = vi.hoisted(() => ({
+  directionsByUser: new Map<string, any[]>(),
+  queries: [] as string[],
+  gate: { wait: null as Promise<void> | null }
+}));
+
+vi.mock('../../src/lib/supabaseClient.js', () => ({
+  supabase: {
+    from: () => {
+      let userAccountId = '';
+      const query: any = {
+        select: () => query,
+        eq: (column: string, value: string) => {
+          if (column === 'user_account_id') userAccountId = value;
+          return query;
+        },
+        then: async (resolve: any, reject: any) => {
+          queries.push(userAccountId);
+          const data = directionsByUser.get(userAccountId) || [];
+          if (gate.wait) await gate.wait;
+          return Promise.resolve({ data, error: null }).then(resolve, reject);
+        }
+      };
+      return query;
+    }
+  }
+}));
+
+vi.mock('../../src/lib/multiAccountHelper.js', () => ({
+  shouldFilterByAccountId: vi.fn(async () => false)
+}));
+
+import {
+  matchMessageToDirection,
+  matchMessagesToDirections,
+  invalidateDirectionMatcher,
+  calculateSimilarity
+} from '../../src/lib/textMatcher.js';
+
+const direction = (id: string, questions: string[]) => ({
+  id,
+  name: `Direction ${id}`,
+  objective: 'whatsapp',
+  default_ad_settings: { client_questions: questions }
+});
+
+const queriesFor = (userAccountId: string) => queries.filter(q => q === userAccountId).length;
+
+describe('textMatcher', () => {
+  beforeEach(() => {
+    invalidateDirectionMatcher();
+    directionsByUser.clear();
+    queries.length = 0;
+    gate.wait = null;
+  });
+
+  describe('matching', () => {
+    it('picks the direction with the best matching question', async () => {
+      directionsByUser.set('u1', [
+        direction('d1', ['Сколько стоит курс английского?']),
+        direction('d2', ['Хочу записаться на консультацию', 'Есть свободное время на этой неделе?'])
+      ]);
+
+      const [exact, contained, partial, none] = await matchMessagesToDirections([
+        'хочу записаться на консультацию!',
+        'Здравствуйте! Сколько стоит курс английского? Интересно',
+        'есть время на неделе',
+        'добрый вечер'
+      ], 'u1', null);
+
+      expect(exact).toMatchObject({ matched: true, similarity: 1, directionId: 'd2' });
+      expect(contained).toMatchObject({ matched: true, directionId: 'd1' });
+      expect(contained.similarity).toBeGreaterThanOrEqual(0.85);
+      expect(partial.directionId).toBe('d2');
+      expect(partial.matched).toBe(false);
+      expect(partial.similarity).toBeCloseTo(calculateSimilarity('есть время на неделе', 'Есть свободное время на этой неделе?'));
+      expect(none).toEqual({ matched: false, similarity: 0, directionId: null, directionName: null });
+    });
+
+    it('matches a question contained in the message as part of a word', async () => {
+      directionsByUser.set('u1', [direction('d1', ['цена']), direction('d2', ['доставка'])]);
+
+      const partWord = await matchMessageToDirection('ценами', 'u1', null);
+      expect(partWord).toMatchObject({ matched: true, directionId: 'd1' });
+      expect(partWord.similarity).toBe(calculateSimilarity('ценами', 'цена'));
+      expect((await matchMessageToDirection('какая цена', 'u1', null)).directionId).toBe('d1');
+    });
+  });
+
+  describe('index cache', () => {
+    it('loads the index once and reuses it', async () => {
+      directionsByUser.set('u1', [direction('d1', ['привет'])]);
+
+      await matchMessageToDirection('привет', 'u1', null);
+      await matchMessageToDirection('привет', 'u1', null);
+      await matchMessagesToDirections(['привет', 'пока'], 'u1', null);
+
+      expect(queriesFor('u1')).toBe(1);
+    });
+
+    it('shares one in-flight load between concurrent callers', async () => {
+      directionsByUser.set('u1', [direction('d1', ['привет'])]);
+      let release!: () => void;
+      gate.wait = new Promise(resolve => { release = resolve; });
+
+      const pending = Promise.all([
+        matchMessageToDirection('привет', 'u1', null),
+        matchMessageToDirection('привет', 'u1', null)
+      ]);
+      await new Promise(resolve => setTimeout(resolve, 0));
+      release();
+      const results = await pending;
+
+      expect(results.every(r => r.matched)).toBe(true);
+      expect(queriesFor('u1')).toBe(1);
+    });
+  });
+
+  describe('invalidateDirectionMatcher', () => {
+    it('drops indexes of the given user only', async () => {
+      directionsByUser.set('u1', [direction('d1', ['привет'])]);
+      directionsByUser.set('u2', [direction('d2', ['привет'])]);
+      await matchMessageToDirection('привет', 'u1', null);
+      await matchMessageToDirection('привет', 'u2', null);
+
+      directionsByUser.set('u1', [direction('d1', ['пока'])]);
+      invalidateDirectionMatcher({ userAccountId: 'u1' });
+
+      expect((await matchMessageToDirection('пока', 'u1', null)).matched).toBe(true);
+      await matchMessageToDirection('привет', 'u2', null);
+      expect(queriesFor('u1')).toBe(2);
+      expect(queriesFor('u2')).toBe(1);
+    });
+
+    it('drops indexes that contain the given direction', async () => {
+      directionsByUser.set('u1', [direction('d1', ['привет'])]);
+      directionsByUser.set('u2', [direction('d2', ['привет'])]);
+      await matchMessageToDirection('привет', 'u1', null);
+      await matchMessageToDirection('привет', 'u2', null);
+
+      invalidateDirectionMatcher({ directionId: 'd2' });
+      await matchMessageToDirection('привет', 'u1', null);
+      await matchMessageToDirection('привет', 'u2', null);
+
+      expect(queriesFor('u1')).toBe(1);
+      expect(queriesFor('u2')).toBe(2);
+    });
+
+    it('does not cache an index that was being built during invalidation', async () => {
+      directionsByUser.set('u1', [direction('d1', ['привет'])]);
+      let release!: () => void;
+      gate.wait = new Promise(resolve => { release = resolve; });
+
+      const pending = matchMessageToDirection('привет', 'u1', null);
+      await new Promise(resolve => setTimeout(resolve, 0));
+
+      directionsByUser.set('u1', [direction('d1', ['пока'])]);
+      invalidateDirectionMatcher({ userAccountId: 'u1' });
+      release();
+
+      // Загрузка, начатая до инвалидации, отдаёт старый индекс, но не кэширует его
+      expect((await pending).matched).toBe(true);
+      gate.wait = null;
+      expect((await matchMessageToDirection('пока', 'u1', null)).matched).toBe(true);
+      expect(queriesFor('u1')).toBe(2);
+    });
+  });
+});
@@ -0,0 +1,145 @@
+/**
+ * transcription Tests
+ * Tests for ffprobe metadata parsing, TikTok cover filters and video assets extraction
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest';
+import { promises as fs } from 'fs';
+
+const { ffprobe, ffmpeg, runs } = vi.hoisted(() => ({
+  ffprobe: vi.fn(),
+  ffmpeg: vi.fn(),
+  runs: [] as string[][]
+}));
+
+vi.mock('fluent-ffmpeg', () => ({ default: Object.assign(ffmpeg, { ffprobe }) }));
+vi.mock('openai', () => ({ OpenAI: class {} }));
+
+import { probeVideo, tiktokThumbnailFilters, extractVideoAssets } from '../../src/lib/transcription.js';
+
+/**
+ * Цепочка команд fluent-ffmpeg: run() пишет все output-файлы
+ * или падает, если среди output есть WAV и failAudio = true
+ */
+function fakeFfmpeg({ failAudio }: { failAudio: boolean }) {
+  ffmpeg.mockImplementation(() => {
+    const outputs: string[] = [];
+    const handlers: Record<string, Function> = {};
+    const command: any = new Proxy({}, {
+      get: (_target, prop: string) => {
+        if (prop === 'output') return (file: string) => { outputs.push(file); return command; };
+        if (prop === 'on') return (event: string, cb: Function) => { handlers[event] = cb; return command; };
+        if (prop === 'run') return () => {
+          runs.push([...outputs]);
+          if (failAudio && outputs.some(file => file.endsWith('.wav'))) {
+            handlers.error(new Error('Error while decoding stream #0:1'));
+            return;
+          }
+          Promise.all(outputs.map(file => fs.writeFile(file, 'data'))).then(() => handlers.end());
+        };
+        return () => command;
+      }
+    });
+    return command;
+  });
+}
+
+describe('probeVideo', () => {
+  beforeEach(() => {
+    ffprobe.mockReset();
+  });
+
+  it('returns video dimensions and audio presence', async () => {
+    ffprobe.mockImplementation((_path: string, cb: Function) => cb(null, {
+      streams: [
+        { codec_type: 'audio' },
+        { codec_type: 'video', width: 1080, height: 1920 }
+      ]
+    }));
+
+    await expect(probeVideo('/tmp/video.mp4')).resolves.toEqual({ width: 1080, height: 1920, hasAudio: true });
+    expect(ffprobe.mock.calls[0][0]).toBe('/tmp/video.mp4');
+  });
+
+  it('reports a silent video', async () => {
+    ffprobe.mockImplementation((_path: string, cb: Function) => cb(null, {
+      streams: [{ codec_type: 'video', width: 640, height: 640 }]
+    }));
+
+    await expect(probeVideo('/tmp/video.mp4')).resolves.toMatchObject({ hasAudio: false });
+  });
+
+  it('rejects when there is no usable video stream', async () => {
+    ffprobe.mockImplementation((_path: string, cb: Function) => cb(null, {
+      streams: [{ codec_type: 'audio' }, { codec_type: 'video', width: 0, height: 0 }]
+    }));
+
+    await expect(probeVideo('/tmp/audio.mp4')).rejects.toThrow('No video stream found');
+  });
+
+  it('passes ffprobe errors through', async () => {
+    ffprobe.mockImplementation((_path: string, cb: Function) => cb(new Error('ffprobe exited with code 1')));
+
+    await expect(probeVideo('/tmp/broken.mp4')).rejects.toThrow('ffprobe exited with code 1');
+  });
+});
+
+describe('tiktokThumbnailFilters', () => {
+  const target = (width: number, height: number) => tiktokThumbnailFilters(width, height)[1];
+
+  it('crops vertical videos (9:16, 4:5) to 720x1280', () => {
+    expect(target(1080, 1920)).toBe('crop=720:1280');
+    expect(target(1080, 1350)).toBe('crop=720:1280');
+  });
+
+  it('crops near-square videos to 640x640', () => {
+    expect(target(1080, 1080)).toBe('crop=640:640');
+    expect(target(1200, 1000)).toBe('crop=640:640');
+  });
+
+  it('crops horizontal videos to 1280x720', () => {
+    expect(target(1920, 1080)).toBe('crop=1280:720');
+  });
+
+  it('scales to cover the target before cropping', () => {
+    expect(tiktokThumbnailFilters(1080, 1920)).toEqual([
+      'scale=720:1280:force_original_aspect_ratio=increase',
+      'crop=720:1280'
+    ]);
+  });
+});
+
+describe('extractVideoAssets', () => {
+  beforeEach(() => {
+    ffprobe.mockReset();
+    ffmpeg.mockReset();
+    runs.length = 0;
+    ffprobe.mockImplementation((_path: string, cb: Function) => cb(null, {
+      streams: [{ codec_type: 'video', width: 1080, height: 1920 }, { codec_type: 'audio' }]
+    }));
+  });
+
+  it('writes the thumbnail and audio in one ffmpeg run', async () => {
+    fakeFfmpeg({ failAudio: false });
+
+    const assets = await extractVideoAssets('/tmp/video.mp4', 'facebook');
+
+    expect(runs).toHaveLength(1);
+    expect(runs[0]).toHaveLength(2);
+    expect(assets.thumbnail.toString()).toBe('data');
+    expect(assets.audioPath).toMatch(/\.wav$/);
+    await fs.unlink(assets.audioPath!);
+  });
+
+  it('falls back to a thumbnail-only run when the audio output fails', async () => {
+    fakeFfmpeg({ failAudio: true });
+
+    const assets = await extractVideoAssets('/tmp/video.mp4', 'tiktok');
+
+    expect(runs).toHaveLength(2);
+    expect(runs[1]).toEqual([runs[0][0]]);
+    expect(assets.thumbnail.toString()).toBe('data');
+    expect(assets.audioPath).toBeNull();
+    await expect(fs.access(runs[0][1])).rejects.toThrow();
+  });
+});
@@ -0,0 +1,147 @@
+/**
+ * adInsightsSync Tests
+ * Tests for chunked streaming upsert and async report pagination
+ */
+
+import { describe, it, expect, beforeEach, afterEach, vi } from 'vitest';
+
+const { upsert, graph } = vi.hoisted(() => ({
+  upsert: vi.fn(),
+  graph: vi.fn()
+}));
+
+vi.mock('../../src/lib/supabaseClient.js', () => ({
+  supabase: { from: vi.fn(() => ({ upsert })) }
+}));
+vi.mock('../../src/adapters/facebook.js', () => ({ graph }));
+vi.mock('../../src/lib/insightsSnapshot.js', () => ({ invalidateInsightsSnapshot: vi.fn() }));
+vi.mock('../../src/lib/adAccountHelper.js', () => ({ getCredentials: vi.fn() }));
+
+import { streamUpsert, iterateAsyncJobResults } from '../../src/services/adInsightsSync.js';
+
+const options = {
+  table: 'meta_insights_weekly',
+  onConflict: 'ad_account_id,fb_ad_id,week_start_date',
+  conflictKeys: ['fb_ad_id'],
+  stage: 'test'
+};
+
+async function* pagesOf(...pages: any[][]) {
+  for (const page of pages) yield page;
+}
+
+const rows = (...ids: string[]) => ids.map(id => ({ fb_ad_id: id }));
+const upsertedIds = () => upsert.mock.calls.map(([chunk]) => chunk.map((r: any) => r.fb_ad_id));
+
+describe('adInsightsSync', () => {
+  beforeEach(() => {
+    upsert.mockReset();
+    graph.mockReset();
+    upsert.mockResolvedValue({ error: null });
+  });
+
+  afterEach(() => {
+    vi.useRealTimers();
+  });
+
+  describe('streamUpsert', () => {
+    it('writes pages in chunks of chunkSize', async () => {
+      const stats = await streamUpsert(pagesOf(rows('a', 'b', 'c'), rows('d', 'e')), r => r, { ...options, chunkSize: 2 });
+
+      expect(upsertedIds()).toEqual([['a', 'b'], ['c', 'd'], ['e']]);
+      expect(stats).toMatchObject({ rows: 5, failedRows: 0, chunks: 3 });
+    });
+
+    it('keeps the last row for a duplicate conflict key inside a chunk', async () => {
+      await streamUpsert(
+        pagesOf([{ fb_ad_id: 'a', spend: 1 }, { fb_ad_id: 'a', spend: 2 }]),
+        r => r,
+        { ...options, chunkSize: 10 }
+      );
+
+      expect(upsert.mock.calls[0][0]).toEqual([{ fb_ad_id: 'a', spend: 2 }]);
+    });
+
+    it('splits a failing chunk in half and retries only the failing halves', async () => {
+      upsert.mockImplementation(async (chunk: any[]) => ({
+        error: chunk.some(r => r.fb_ad_id === 'bad') ? { code: '22P02', message: 'invalid input syntax' } : null
+      }));
+
+      const stats = await streamUpsert(pagesOf(rows('a', 'b', 'bad', 'c')), r => r, { ...options, chunkSize: 4 });
+
+      expect(upsertedIds()).toEqual([
+        ['a', 'b', 'bad', 'c'],
+        ['a', 'b'],
+        ['bad', 'c'],
+        ['bad'],
+        ['c']
+      ]);
+      expect(stats).toMatchObject({ rows: 3, failedRows: 1, chunks: 1 });
+    });
+
+    it('fails the whole chunk without splitting on non-data errors', async () => {
+      upsert.mockResolvedValue({ error: { code: 'PGRST204', message: "Could not find the 'spend' column" } });
+
+      const stats = await streamUpsert(pagesOf(rows('a', 'b', 'c', 'd')), r => r, { ...options, chunkSize: 4 });
+
+      expect(upsertedIds()).toEqual([['a', 'b', 'c', 'd']]);
+      expect(stats).toMatchObject({ rows: 0, failedRows: 4, chunks: 1 });
+    });
+
+    it('retries a chunk on network errors before splitting', async () => {
+      vi.useFakeTimers();
+      upsert
+        .mockResolvedValueOnce({ error: { message: 'TypeError: fetch failed' } })
+        .mockResolvedValue({ error: null });
+
+      const pending = streamUpsert(pagesOf(rows('a', 'b')), r => r, { ...options, chunkSize: 2 });
+      await vi.advanceTimersByTimeAsync(2000);
+      const stats = await pending;
+
+      expect(upsertedIds()).toEqual([['a', 'b'], ['a', 'b']]);
+      expect(stats).toMatchObject({ rows: 2, failedRows: 0 });
+    });
+  });
+
+  describe('iterateAsyncJobResults', () => {
+    async function collect(reportRunId: string) {
+      const pages: any[][] = [];
+      for await (const page of iterateAsyncJobResults('token', reportRunId)) pages.push(page);
+      return pages;
+    }
+
+    it('follows cursors until a page without next cursor', async () => {
+      graph
+        .mockResolvedValueOnce({ data: [{ ad_id: '1' }], paging: { cursors: { after: 'c1' } } })
+        .mockResolvedValueOnce({ data: [{ ad_id: '2' }], paging: { cursors: { after: 'c2' } } })
+        .mockResolvedValueOnce({ data: [{ ad_id: '3' }] });
+
+      const pages = await collect('run_1');
+
+      expect(pages).toEqual([[{ ad_id: '1' }], [{ ad_id: '2' }], [{ ad_id: '3' }]]);
+      expect(graph.mock.calls.map(([, path, , params]) => [path, params.after])).toEqual([
+        ['run_1/insights', undefined],
+        ['run_1/insights', 'c1'],
+        ['run_1/insights', 'c2']
+      ]);
+    });
+
+    it('stops on an empty page', async () => {
+      graph
+        .mockResolvedValueOnce({ data: [{ ad_id: '1' }], paging: { cursors: { after: 'c1' } } })
+        .mockResolvedValueOnce({ data: [], paging: { cursors: { after: 'c2' } } });
+
+      expect(await collect('run_1')).toEqual([[{ ad_id: '1' }]]);
+      expect(graph).toHaveBeenCalledTimes(2);
+    });
+
+    it('stops when the cursor does not advance', async () => {
+      graph
+        .mockResolvedValueOnce({ data: [{ ad_id: '1' }], paging: { cursors: { after: 'c1' } } })
+        .mockResolvedValue({ data: [{ ad_id: '2' }], paging: { cursors: { after: 'c1' } } });
+
+      expect(await collect('run_1')).toEqual([[{ ad_id: '1' }], [{ ad_id: '2' }]]);
+      expect(graph).toHaveBeenCalledTimes(2);
+    });
+  });
+});
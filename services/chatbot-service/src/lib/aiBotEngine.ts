@@ -77,6 +77,12 @@ import {
   cancelPendingFollowUps,
   scheduleFirstFollowUp
 } from './delayedFollowUps.js';
+import {
+  appendDialogMessages,
+  loadRecentDialogMessages,
+  estimateTokens,
+  DialogLogMessage
+} from './messageLog.js';
 
 const baseLog = createLogger({ module: 'aiBotEngine' });
 
@@ -1174,26 +1180,18 @@ async function processAIBotResponse(
     ctxLog.debug({}, '[processAIBotResponse] Saving messages to history', ['db']);
 
     try {
-      // Получить текущую историю и счётчики
+      // Получить счётчики (сама история в JSONB больше не читается)
       const { data: currentLead } = await supabase
         .from('dialog_analysis')
-        .select('messages, incoming_count, outgoing_count, last_consultant_message_at')
+        .select('incoming_count, outgoing_count, last_consultant_message_at')
         .eq('id', lead.id)
         .single();
 
-      const currentMessages = Array.isArray(currentLead?.messages) ? currentLead.messages : [];
       const currentIncoming = currentLead?.incoming_count || 0;
       const currentOutgoing = currentLead?.outgoing_count || 0;
       const now = new Date().toISOString();
 
-      // Добавить входящее сообщение пользователя
-      currentMessages.push({
-        sender: 'user',
-        content: messageText,
-        timestamp: now
-      });
-
-      // Добавить ответ бота (с debug info если есть)
+      // Ответ бота (с debug info если есть)
       const botMessage: { sender: string; content: string; timestamp: string; debug?: AIDebugInfo } = {
         sender: 'bot',
         content: finalText,
@@ -1202,14 +1200,24 @@ async function processAIBotResponse(
       if (response.debug) {
         botMessage.debug = response.debug;
       }
-      currentMessages.push(botMessage);
 
-      // Ограничить историю по количеству (последние 100 сообщений)
-      const trimmedMessages = currentMessages.slice(-LIMITS.MAX_HISTORY_MESSAGES);
+      // Append входящего сообщения и ответа в лог диалога
+      // (JSONB-зеркало последних LIMITS.MAX_HISTORY_MESSAGES обновляется в БД).
+      // Ошибка RPC не должна отменять обновление счётчиков и has_unread ниже
+      let appended: DialogLogMessage[] = [];
+      try {
+        appended = await appendDialogMessages(lead.id, [
+          { sender: 'user', content: messageText, timestamp: now },
+          botMessage
+        ]);
+      } catch (appendError) {
+        ctxLog.warn({
+          error: (appendError as any)?.message
+        }, '[processAIBotResponse] Failed to append messages to dialog log (non-fatal)', ['db']);
+      }
 
       // Подготовить данные для обновления
       const updateData: any = {
-        messages: trimmedMessages,
         incoming_count: currentIncoming + 1,  // +1 за входящее сообщение
         outgoing_count: currentOutgoing + 1,  // +1 за ответ бота
         last_client_message_at: now // Время последнего сообщения клиента
@@ -1232,7 +1240,7 @@ async function processAIBotResponse(
         }, '[processAIBotResponse] Not marking as unread - consultant never messaged this lead');
       }
 
-      // Сохранить обновлённую историю и инкрементировать счётчики
+      // Инкрементировать счётчики
       const { error: historyError } = await supabase
         .from('dialog_analysis')
         .update(updateData)
@@ -1244,8 +1252,7 @@ async function processAIBotResponse(
         }, '[processAIBotResponse] Failed to save message history (non-fatal)', ['db']);
       } else {
         ctxLog.debug({
-          totalMessages: trimmedMessages.length,
-          addedMessages: 2
+          addedMessages: appended.length
         }, '[processAIBotResponse] Message history saved', ['db']);
       }
     } catch (histError) {
@@ -1347,9 +1354,48 @@ async function processAIBotResponse(
   }
 }
 
+/**
+ * Legacy: история из JSONB поля dialog_analysis.messages
+ * (используется только если лог dialog_messages недоступен)
+ */
+async function loadMessagesFromJsonb(
+  leadId: string,
+  log: ContextLogger
+): Promise<DialogLogMessage[]> {
+  const { data: lead, error } = await supabase
+    .from('dialog_analysis')
+    .select('messages')
+    .eq('id', leadId)
+    .single();
+
+  if (error) {
+    log.warn({
+      errorCode: error.code
+    }, '[loadMessageHistory] Error fetching messages from database', ['db']);
+    return [];
+  }
+
+  // messages - это JSONB массив [{sender, content, timestamp}, ...]
+  const rawMessages = Array.isArray(lead?.messages) ? lead.messages : [];
+
+  return rawMessages.map((msg: any, idx: number) => {
+    const content = msg.content || msg.text || '';
+    // Определить роль: bot/assistant = assistant, остальное = user
+    const sender = (msg.sender || msg.from || 'user').toLowerCase();
+    return {
+      id: idx,
+      role: (sender === 'bot' || sender === 'assistant') ? 'assistant' : 'user',
+      content,
+      tokens: estimateTokens(content),
+      timestamp: msg.timestamp || msg.created_at || new Date(0).toISOString()
+    } as DialogLogMessage;
+  });
+}
+
 /**
  * Загрузить историю сообщений из базы данных
- * Сообщения хранятся в JSONB поле 'messages' таблицы dialog_analysis
+ * Сообщения читаются из append-only лога dialog_messages (окно последних сообщений
+ * в Redis ring buffer); token_count каждого сообщения посчитан при записи
  */
 async function loadMessageHistory(
   leadId: string,
@@ -1365,30 +1411,21 @@ async function loadMessageHistory(
   }, '[loadMessageHistory] Starting to load message history', ['db']);
 
   try {
-    // Получить messages из dialog_analysis
-    const { data: lead, error } = await supabase
-      .from('dialog_analysis')
-      .select('messages')
-      .eq('id', leadId)
-      .single();
-
-    if (error) {
-      log.warn({
-        errorCode: error.code
-      }, '[loadMessageHistory] Error fetching messages from database', ['db']);
-      return [];
+    let rawMessages = await loadRecentDialogMessages(leadId);
+    const source = rawMessages ? 'log' : 'jsonb';
+    if (!rawMessages) {
+      rawMessages = await loadMessagesFromJsonb(leadId, log);
     }
 
-    if (!lead?.messages) {
-      log.debug({}, '[loadMessageHistory] No message history found in database', ['db']);
+    if (rawMessages.length === 0) {
+      log.debug({ source }, '[loadMessageHistory] No message history found in database', ['db']);
       return [];
     }
 
-    // messages - это JSONB массив [{sender, content, timestamp}, ...]
-    const rawMessages = Array.isArray(lead.messages) ? lead.messages : [];
     log.debug({
-      rawCount: rawMessages.length
-    }, '[loadMessageHistory] Raw messages loaded from JSONB', ['db']);
+      rawCount: rawMessages.length,
+      source
+    }, '[loadMessageHistory] Raw messages loaded', ['db']);
 
     // Фильтровать по времени если задано
     const now = new Date();
@@ -1397,10 +1434,7 @@ async function loadMessageHistory(
     if (config.history_time_limit_hours) {
       const cutoff = new Date(now.getTime() - config.history_time_limit_hours * 60 * 60 * 1000);
       const beforeCount = filteredMessages.length;
-      filteredMessages = rawMessages.filter((msg: any) => {
-        const msgTime = new Date(msg.timestamp || msg.created_at || 0);
-        return msgTime >= cutoff;
-      });
+      filteredMessages = rawMessages.filter(msg => new Date(msg.timestamp) >= cutoff);
       log.debug({
         timeLimitH: config.history_time_limit_hours,
         beforeCount,
@@ -1429,27 +1463,22 @@ async function loadMessageHistory(
     let skippedDueToTokens = 0;
 
     for (const msg of reversedMessages) {
-      const content = msg.content || msg.text || '';
-      const estimatedTokens = Math.ceil(content.length / 4);
-
-      if (totalTokens + estimatedTokens > tokenLimit) {
+      // token_count посчитан при записи в лог
+      if (totalTokens + msg.tokens > tokenLimit) {
         skippedDueToTokens++;
         continue;
       }
 
-      // Определить роль: bot/assistant = assistant, остальное = user
-      const sender = (msg.sender || msg.from || 'user').toLowerCase();
-      const role = (sender === 'bot' || sender === 'assistant') ? 'assistant' : 'user';
-
       history.unshift({
-        role,
-        content
+        role: msg.role,
+        content: msg.content
       });
 
-      totalTokens += estimatedTokens;
+      totalTokens += msg.tokens;
     }
 
     log.info({
+      source,
       rawCount: rawMessages.length,
       filteredCount: filteredMessages.length,
       finalCount: history.length,
@@ -0,0 +1,195 @@
+/**
+ * Append-only лог сообщений диалога (dialog_messages) + Redis ring buffer
+ *
+ * Вместо чтения и перезаписи всего dialog_analysis.messages на каждое сообщение:
+ * - appendDialogMessages: RPC append_dialog_messages добавляет строки в лог
+ *   (и обновляет JSONB-зеркало последних сообщений на стороне БД),
+ *   затем новые сообщения дописываются в ring buffer, если он уже прогрет;
+ * - loadRecentDialogMessages: последние RING_SIZE сообщений из Redis;
+ *   актуальность проверяется по id последней строки лога (один index lookup),
+ *   при расхождении окно перечитывается из таблицы и ring перезаполняется;
+ * - диалоги без записей в логе лениво переносятся из JSONB (backfill_dialog_messages).
+ *
+ * Каждое сообщение хранит token_count, посчитанный один раз при записи.
+ * См. migrations/261_dialog_messages_log.sql
+ */
+
+import { supabase } from './supabase.js';
+import { redis } from './redis.js';
+import { createLogger } from './logger.js';
+import { LIMITS } from './logUtils.js';
+
+const log = createLogger({ module: 'messageLog' });
+
+// Размер окна в Redis (раньше JSONB тоже обрезался до MAX_HISTORY_MESSAGES)
+const RING_SIZE = parseInt(process.env.DIALOG_LOG_RING_SIZE || String(LIMITS.MAX_HISTORY_MESSAGES), 10)
+  || LIMITS.MAX_HISTORY_MESSAGES;
+const RING_TTL_SECONDS = 24 * 60 * 60;
+
+export interface DialogLogMessage {
+  id: number;
+  role: 'user' | 'assistant';
+  content: string;
+  tokens: number;
+  timestamp: string;
+}
+
+interface DialogMessageRow {
+  id: number | string;
+  role: 'user' | 'assistant';
+  content: string | null;
+  token_count: number | null;
+  created_at: string;
+}
+
+function ringKey(dialogAnalysisId: string): string {
+  return `dialog_log:${dialogAnalysisId}`;
+}
+
+function fromRow(row: DialogMessageRow): DialogLogMessage {
+  return {
+    id: Number(row.id),
+    role: row.role,
+    content: row.content || '',
+    tokens: row.token_count ?? estimateTokens(row.content || ''),
+    timestamp: row.created_at,
+  };
+}
+
+function isStrictlyOrdered(messages: DialogLogMessage[]): boolean {
+  for (let i = 1; i < messages.length; i++) {
+    if (messages[i].id <= messages[i - 1].id) return false;
+  }
+  return true;
+}
+
+/**
+ * Грубая оценка токенов (та же формула, что в migration 261)
+ */
+export function estimateTokens(content: string): number {
+  return Math.ceil(content.length / 4);
+}
+
+/**
+ * Добавить сообщения в лог диалога.
+ * Сообщения в формате JSONB истории: { sender, content, timestamp, ... }.
+ *
+ * @throws ошибка RPC — вызывающий код решает, фатальна ли она
+ */
+export async function appendDialogMessages(
+  dialogAnalysisId: string,
+  messages: Array<Record<string, unknown>>
+): Promise<DialogLogMessage[]> {
+  if (messages.length === 0) return [];
+
+  const { data, error } = await supabase.rpc('append_dialog_messages', {
+    p_dialog_analysis_id: dialogAnalysisId,
+    p_messages: messages,
+    p_mirror_limit: LIMITS.MAX_HISTORY_MESSAGES,
+  });
+
+  if (error) throw error;
+
+  const appended = ((data || []) as DialogMessageRow[]).map(fromRow).sort((a, b) => a.id - b.id);
+
+  // Дописываем в ring только если он уже прогрет (RPUSHX), иначе его заполнит следующее чтение
+  if (appended.length > 0) {
+    try {
+      const key = ringKey(dialogAnalysisId);
+      const pushed = await redis.rpushx(key, ...appended.map(m => JSON.stringify(m)));
+      if (pushed > 0) {
+        await redis.pipeline()
+          .ltrim(key, -RING_SIZE, -1)
+          .expire(key, RING_TTL_SECONDS)
+          .exec();
+      }
+    } catch (err: any) {
+      // Ring buffer — только кэш; при расхождении чтение перечитает таблицу
+      log.warn({ dialogAnalysisId, error: err?.message }, 'Failed to append to dialog ring buffer');
+    }
+  }
+
+  return appended;
+}
+
+/**
+ * Последние сообщения диалога в хронологическом порядке (не больше RING_SIZE).
+ *
+ * @returns null если лог недоступен (например, миграция не применена)
+ */
+export async function loadRecentDialogMessages(dialogAnalysisId: string): Promise<DialogLogMessage[] | null> {
+  const key = ringKey(dialogAnalysisId);
+
+  const [ringResult, headResult] = await Promise.all([
+    redis.lrange(key, -RING_SIZE, -1).catch((err: any) => {
+      log.warn({ dialogAnalysisId, error: err?.message }, 'Failed to read dialog ring buffer');
+      return [] as string[];
+    }),
+    supabase
+      .from('dialog_messages')
+      .select('id')
+      .eq('dialog_analysis_id', dialogAnalysisId)
+      .order('id', { ascending: false })
+      .limit(1),
+  ]);
+
+  if (headResult.error) {
+    log.warn({ dialogAnalysisId, errorCode: headResult.error.code }, 'Failed to read dialog log head');
+    return null;
+  }
+
+  const headId = headResult.data?.[0] ? Number(headResult.data[0].id) : null;
+
+  // Ring актуален: последний элемент совпадает с последней строкой лога
+  // и id строго возрастают. RPUSHX конкурентной записи может попасть в ring
+  // сразу после перезаполнения, уже содержащего это сообщение, — тогда
+  // в ring будет дубль, и окно перечитывается из таблицы.
+  if (headId !== null && ringResult.length > 0) {
+    const ring = ringResult.map(item => JSON.parse(item) as DialogLogMessage);
+    if (ring[ring.length - 1].id === headId && isStrictlyOrdered(ring)) {
+      return ring;
+    }
+  }
+
+  // Лог пуст — диалог ещё не перенесён из JSONB
+  if (headId === null) {
+    const { data: backfilled, error } = await supabase.rpc('backfill_dialog_messages', {
+      p_dialog_analysis_id: dialogAnalysisId,
+    });
+    if (error) {
+      log.warn({ dialogAnalysisId, errorCode: error.code }, 'Failed to backfill dialog log');
+      return null;
+    }
+    if (!backfilled) return [];
+    log.info({ dialogAnalysisId, backfilled }, 'Dialog history backfilled from JSONB');
+  }
+
+  // Перечитываем окно из таблицы и прогреваем ring
+  const { data: rows, error } = await supabase
+    .from('dialog_messages')
+    .select('id, role, content, token_count, created_at')
+    .eq('dialog_analysis_id', dialogAnalysisId)
+    .order('id', { ascending: false })
+    .limit(RING_SIZE);
+
+  if (error) {
+    log.warn({ dialogAnalysisId, errorCode: error.code }, 'Failed to read dialog log window');
+    return null;
+  }
+
+  const messages = ((rows || []) as DialogMessageRow[]).map(fromRow).reverse();
+
+  if (messages.length > 0) {
+    try {
+      await redis.multi()
+        .del(key)
+        .rpush(key, ...messages.map(m => JSON.stringify(m)))
+        .expire(key, RING_TTL_SECONDS)
+        .exec();
+    } catch (err: any) {
+      log.warn({ dialogAnalysisId, error: err?.message }, 'Failed to fill dialog ring buffer');
+    }
+  }
+
+  return messages;
+}
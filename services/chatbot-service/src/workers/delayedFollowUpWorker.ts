@@ -22,6 +22,7 @@ import {
   scheduleNextFollowUp,
   calculateScheduledTime
 } from '../lib/delayedFollowUps.js';
+import { appendDialogMessages } from '../lib/messageLog.js';
 
 const log = createLogger({ module: 'delayedFollowUpWorker' });
 
@@ -268,40 +269,27 @@ async function checkDialogState(
 }
 
 /**
- * Сохранить сообщение в историю (в JSONB поле dialog_analysis.messages)
+ * Сохранить сообщение в историю (append в лог dialog_messages,
+ * JSONB-зеркало dialog_analysis.messages обновляется в БД)
  */
 async function saveMessageToHistory(
   dialogAnalysisId: string,
   message: string
 ): Promise<void> {
   try {
-    // Получаем текущую историю
-    const { data: lead } = await supabase
-      .from('dialog_analysis')
-      .select('messages')
-      .eq('id', dialogAnalysisId)
-      .single();
-
-    const currentMessages = Array.isArray(lead?.messages) ? lead.messages : [];
+    const now = new Date().toISOString();
 
     // Добавляем follow-up сообщение
-    currentMessages.push({
+    await appendDialogMessages(dialogAnalysisId, [{
       sender: 'bot',
       content: message,
-      timestamp: new Date().toISOString(),
+      timestamp: now,
       type: 'follow_up'
-    });
+    }]);
 
-    // Ограничиваем историю (последние 100 сообщений)
-    const trimmedMessages = currentMessages.slice(-100);
-
-    // Сохраняем
     await supabase
       .from('dialog_analysis')
-      .update({
-        messages: trimmedMessages,
-        last_bot_message_at: new Date().toISOString()
-      })
+      .update({ last_bot_message_at: now })
       .eq('id', dialogAnalysisId);
 
   } catch (error) {
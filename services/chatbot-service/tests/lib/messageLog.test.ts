@@ -0,0 +1,232 @@
+/**
+ * messageLog Tests
+ * Tests for the dialog_messages log, Redis ring buffer refill and JSONB backfill
+ */
+
+import { describe, it, expect, beforeEach, vi } from 'vitest';
+
+const { db, lists, redis, supabase } = vi.hoisted(() => {
+  const db = {
+    rows: [] as Array<{ id: number; dialog_analysis_id: string; role: string; content: string; token_count: number; created_at: string }>,
+    jsonb: new Map<string, Array<Record<string, any>>>(),
+    nextId: 1,
+    windowReads: 0,
+    backfills: 0,
+  };
+
+  const insertRows = (dialogId: string, messages: Array<Record<string, any>>) => messages.map(m => {
+    const content = m.content ?? m.text ?? '';
+    const row = {
+      id: db.nextId++,
+      dialog_analysis_id: dialogId,
+      role: m.sender === 'bot' ? 'assistant' : 'user',
+      content,
+      token_count: Math.ceil(content.length / 4),
+      created_at: m.timestamp || '2026-01-01T00:00:00.000Z',
+    };
+    db.rows.push(row);
+    return row;
+  });
+
+  const supabase = {
+    from: (_table: string) => {
+      let dialogId = '';
+      let columns = '';
+      let limit = Infinity;
+      const query: any = {
+        select: (cols: string) => { columns = cols; return query; },
+        eq: (_column: string, value: string) => { dialogId = value; return query; },
+        order: () => query,
+        limit: (n: number) => { limit = n; return query; },
+        then: (resolve: any, reject: any) => {
+          if (columns !== 'id') db.windowReads++;
+          const data = db.rows
+            .filter(r => r.dialog_analysis_id === dialogId)
+            .sort((a, b) => b.id - a.id)
+            .slice(0, limit)
+            .map(r => (columns === 'id' ? { id: r.id } : { ...r }));
+          return Promise.resolve({ data, error: null }).then(resolve, reject);
+        },
+      };
+      return query;
+    },
+    rpc: async (name: string, args: any) => {
+      if (name === 'append_dialog_messages') {
+        return { data: insertRows(args.p_dialog_analysis_id, args.p_messages), error: null };
+      }
+      if (name === 'backfill_dialog_messages') {
+        db.backfills++;
+        const dialogId = args.p_dialog_analysis_id;
+        if (db.rows.some(r => r.dialog_analysis_id === dialogId)) return { data: 0, error: null };
+        return { data: insertRows(dialogId, db.jsonb.get(dialogId) || []).length, error: null };
+      }
+      return { data: null, error: { message: `unknown rpc ${name}` } };
+    },
+  };
+
+  // Подмножество Redis-списков с семантикой индексов LRANGE/LTRIM
+  const lists = new Map<string, string[]>();
+  const slice = (list: string[], start: number, stop: number) => {
+    const len = list.length;
+    const from = Math.max(0, start < 0 ? len + start : start);
+    const to = Math.min(len - 1, stop < 0 ? len + stop : stop);
+    return from > to ? [] : list.slice(from, to + 1);
+  };
+  const ops = {
+    del: (key: string) => { lists.delete(key); },
+    rpush: (key: string, ...items: string[]) => { lists.set(key, [...(lists.get(key) || []), ...items]); },
+    ltrim: (key: string, start: number, stop: number) => { lists.set(key, slice(lists.get(key) || [], start, stop)); },
+    expire: () => {},
+  };
+  const chain = () => {
+    const queued: Array<() => void> = [];
+    const builder: any = { exec: async () => queued.forEach(fn => fn()) };
+    for (const [name, fn] of Object.entries(ops)) {
+      builder[name] = (...args: any[]) => { queued.push(() => (fn as any)(...args)); return builder; };
+    }
+    return builder;
+  };
+  const redis = {
+    lrange: async (key: string, start: number, stop: number) => slice(lists.get(key) || [], start, stop),
+    rpushx: async (key: string, ...items: string[]) => {
+      if (!lists.has(key)) return 0;
+      ops.rpush(key, ...items);
+      return lists.get(key)!.length;
+    },
+    multi: chain,
+    pipeline: chain,
+  };
+
+  return { db, lists, redis, supabase };
+});
+
+vi.mock('../../src/lib/supabase.js', () => ({ supabase }));
+vi.mock('../../src/lib/redis.js', () => ({ redis }));
+
+import { appendDialogMessages, loadRecentDialogMessages } from '../../src/lib/messageLog.js';
+
+const DIALOG = 'dialog-1';
+const RING_KEY = `dialog_log:${DIALOG}`;
+
+const contents = (messages: Array<{ content: string }> | null) => (messages || []).map(m => m.content);
+const ringIds = () => (lists.get(RING_KEY) || []).map(item => JSON.parse(item).id);
+
+// Запись в лог в обход ring buffer (как CRM через RPC append_dialog_messages)
+const appendBypassingRing = (content: string) => supabase.rpc('append_dialog_messages', {
+  p_dialog_analysis_id: DIALOG,
+  p_messages: [{ text: content, from_me: true }],
+});
+
+describe('messageLog', () => {
+  beforeEach(() => {
+    db.rows = [];
+    db.jsonb.clear();
+    db.nextId = 1;
+    db.windowReads = 0;
+    db.backfills = 0;
+    lists.clear();
+  });
+
+  describe('backfill', () => {
+    it('moves JSONB history into the log on first read and warms the ring', async () => {
+      db.jsonb.set(DIALOG, [
+        { sender: 'user', content: 'hello', timestamp: '2026-01-01T10:00:00.000Z' },
+        { sender: 'bot', content: 'hi there', timestamp: '2026-01-01T10:00:05.000Z' },
+      ]);
+
+      const messages = await loadRecentDialogMessages(DIALOG);
+
+      expect(db.backfills).toBe(1);
+      expect(messages).toMatchObject([
+        { role: 'user', content: 'hello', tokens: 2 },
+        { role: 'assistant', content: 'hi there', tokens: 2 },
+      ]);
+      expect(ringIds()).toEqual([1, 2]);
+
+      // Второе чтение — из ring, без backfill и без чтения окна
+      expect(contents(await loadRecentDialogMessages(DIALOG))).toEqual(['hello', 'hi there']);
+      expect(db.backfills).toBe(1);
+      expect(db.windowReads).toBe(1);
+    });
+
+    it('returns an empty history for a dialog without messages', async () => {
+      expect(await loadRecentDialogMessages(DIALOG)).toEqual([]);
+      expect(lists.has(RING_KEY)).toBe(false);
+    });
+
+    it('does not backfill again once the log has rows', async () => {
+      db.jsonb.set(DIALOG, [{ sender: 'user', content: 'old' }]);
+      await appendDialogMessages(DIALOG, [{ sender: 'user', content: 'new' }]);
+
+      expect(contents(await loadRecentDialogMessages(DIALOG))).toEqual(['new']);
+      expect(db.backfills).toBe(0);
+    });
+  });
+
+  describe('ring buffer', () => {
+    it('appends to a warm ring without re-reading the table', async () => {
+      await appendDialogMessages(DIALOG, [{ sender: 'user', content: 'one' }]);
+      await loadRecentDialogMessages(DIALOG);
+      const readsAfterWarmup = db.windowReads;
+
+      await appendDialogMessages(DIALOG, [
+        { sender: 'bot', content: 'two' },
+        { sender: 'user', content: 'three' },
+      ]);
+
+      expect(ringIds()).toEqual([1, 2, 3]);
+      expect(contents(await loadRecentDialogMessages(DIALOG))).toEqual(['one', 'two', 'three']);
+      expect(db.windowReads).toBe(readsAfterWarmup);
+    });
+
+    it('does not create a cold ring on append', async () => {
+      await appendDialogMessages(DIALOG, [{ sender: 'user', content: 'one' }]);
+
+      expect(lists.has(RING_KEY)).toBe(false);
+      expect(contents(await loadRecentDialogMessages(DIALOG))).toEqual(['one']);
+      expect(db.windowReads).toBe(1);
+    });
+
+    it('refills when the log has messages written outside the ring', async () => {
+      await appendDialogMessages(DIALOG, [{ sender: 'user', content: 'question' }]);
+      await loadRecentDialogMessages(DIALOG);
+
+      await appendBypassingRing('consultant reply');
+
+      expect(contents(await loadRecentDialogMessages(DIALOG))).toEqual(['question', 'consultant reply']);
+      expect(db.windowReads).toBe(2);
+      expect(ringIds()).toEqual([1, 2]);
+    });
+
+    it('refills instead of serving a duplicate pushed after a concurrent refill', async () => {
+      await appendDialogMessages(DIALOG, [{ sender: 'user', content: 'one' }]);
+      await loadRecentDialogMessages(DIALOG);
+
+      // Сообщение записано в лог, ring перезаполнен уже с ним,
+      // и только потом запоздавший RPUSHX дописывает его ещё раз
+      const { data } = await appendBypassingRing('two');
+      await loadRecentDialogMessages(DIALOG);
+      await redis.rpushx(RING_KEY, JSON.stringify({ id: data[0].id, role: 'user', content: 'two', tokens: 1, timestamp: data[0].created_at }));
+      expect(ringIds()).toEqual([1, 2, 2]);
+
+      const messages = await loadRecentDialogMessages(DIALOG);
+
+      expect(contents(messages)).toEqual(['one', 'two']);
+      expect(ringIds()).toEqual([1, 2]);
+    });
+
+    it('refills when concurrent appends land in the ring out of order', async () => {
+      await appendDialogMessages(DIALOG, [{ sender: 'user', content: 'one' }]);
+      await loadRecentDialogMessages(DIALOG);
+
+      const { data: second } = await appendBypassingRing('two');
+      const { data: third } = await appendBypassingRing('three');
+      const asRing = (row: any) => JSON.stringify({ id: row.id, role: row.role, content: row.content, tokens: 1, timestamp: row.created_at });
+      await redis.rpushx(RING_KEY, asRing(third[0]));
+      await redis.rpushx(RING_KEY, asRing(second[0]));
+
+      expect(contents(await loadRecentDialogMessages(DIALOG))).toEqual(['one', 'two', 'three']);
+      expect(ringIds()).toEqual([1, 2, 3]);
+    });
+  });
+});
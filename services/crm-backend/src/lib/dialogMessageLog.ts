@@ -0,0 +1,29 @@
+import { supabase } from './supabase.js';
+
+// Размер JSONB-зеркала dialog_analysis.messages (как MAX_HISTORY_MESSAGES в chatbot-service)
+const DIALOG_MIRROR_LIMIT = 100;
+
+/**
+ * Добавляет сообщения в лог диалога (dialog_messages) через RPC append_dialog_messages.
+ * Функция также дописывает их в зеркало dialog_analysis.messages,
+ * поэтому messages напрямую не обновляем — иначе chatbot-service
+ * не увидит сообщения консультанта в истории (см. migrations/261, 263).
+ *
+ * @param dialogAnalysisId - ID лида в dialog_analysis
+ * @param messages - Сообщения в формате JSONB истории ({ text, timestamp, from_me, ... })
+ * @throws ошибка RPC
+ */
+export async function appendDialogMessages(
+  dialogAnalysisId: string,
+  messages: Array<Record<string, unknown>>
+): Promise<void> {
+  if (messages.length === 0) return;
+
+  const { error } = await supabase.rpc('append_dialog_messages', {
+    p_dialog_analysis_id: dialogAnalysisId,
+    p_messages: messages,
+    p_mirror_limit: DIALOG_MIRROR_LIMIT
+  });
+
+  if (error) throw error;
+}
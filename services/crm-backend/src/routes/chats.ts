@@ -3,6 +3,7 @@ import { z } from 'zod';
 import { evolutionQuery } from '../lib/evolutionDb.js';
 import { sendWhatsAppMessage } from '../lib/evolutionApi.js';
 import { supabase } from '../lib/supabase.js';
+import { appendDialogMessages } from '../lib/dialogMessageLog.js';
 import {
   generateCorrelationId,
   shortCorrelationId,
@@ -254,7 +255,7 @@ async function appendOutgoingToDialogHistory(
 
   const { data: existing } = await supabase
     .from('dialog_analysis')
-    .select('id, user_account_id, account_id, messages, outgoing_count')
+    .select('id, user_account_id, account_id, outgoing_count')
     .eq('instance_name', instanceName)
     .in('contact_phone', phoneVariants)
     .maybeSingle();
@@ -269,13 +270,21 @@ async function appendOutgoingToDialogHistory(
   };
 
   if (existing) {
-    const currentMessages = Array.isArray(existing.messages) ? existing.messages : [];
-    const nextMessages = [...currentMessages, outgoingMessage].slice(-100);
+    // Лог диалога + зеркало dialog_analysis.messages (последние 100) — одним RPC
+    try {
+      await appendDialogMessages(existing.id, [outgoingMessage]);
+    } catch (appendError: any) {
+      app.log.warn({
+        instanceName,
+        phone,
+        leadId: existing.id,
+        error: appendError?.message
+      }, '[Chats] Failed to append outgoing message to dialog log');
+    }
 
     const { error: updateError } = await supabase
       .from('dialog_analysis')
       .update({
-        messages: nextMessages,
         last_message: nowIso,
         outgoing_count: (existing.outgoing_count || 0) + 1,
         assigned_to_human: true,
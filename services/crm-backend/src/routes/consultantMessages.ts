@@ -3,6 +3,7 @@ import { supabase } from '../lib/supabase.js';
 import { sendWhatsAppMessage } from '../lib/evolutionApi.js';
 import { consultantAuthMiddleware, ConsultantAuthRequest } from '../middleware/consultantAuth.js';
 import { getInstanceName } from '../lib/consultantNotifications.js';
+import { appendDialogMessages } from '../lib/dialogMessageLog.js';
 
 /**
  * Routes для отправки сообщений консультантами
@@ -126,15 +127,27 @@ export async function consultantMessagesRoutes(app: FastifyInstance) {
         consultant_id: consultantId || null
       };
 
-      // Обновляем историю сообщений в dialog_analysis
-      const updatedMessages = [...(lead.messages || []), newMessage];
+      // Добавляем сообщение в лог диалога (зеркало dialog_analysis.messages обновляет RPC)
+      try {
+        await appendDialogMessages(leadId, [newMessage]);
+      } catch (appendError: any) {
+        app.log.error({
+          leadId,
+          consultantId,
+          error: appendError
+        }, 'Failed to append message to dialog log');
+
+        return reply.status(500).send({
+          error: 'Failed to update message history',
+          details: appendError?.message
+        });
+      }
 
       const now = new Date().toISOString();
 
       const { error: updateError } = await supabase
         .from('dialog_analysis')
         .update({
-          messages: updatedMessages,
           last_message: now,
           outgoing_count: (lead.outgoing_count || 0) + 1,
           assigned_to_human: true, // Устанавливаем флаг вмешательства консультанта
@@ -1,6 +1,7 @@
 import { FastifyInstance } from 'fastify';
 import { z } from 'zod';
 import { supabase } from '../lib/supabase.js';
+import { appendDialogMessages } from '../lib/dialogMessageLog.js';
 import { analyzeDialogs, reanalyzeSingleLead } from '../scripts/analyzeDialogs.js';
 import { transcribeAudio, validateAudioFile } from '../lib/whisperTranscription.js';
 import { reanalyzeWithAudioContext, reanalyzeWithNotes } from '../lib/reanalyzeWithContext.js';
@@ -1007,12 +1008,17 @@ export async function dialogsRoutes(app: FastifyInstance) {
         is_system: false,
       };
 
-      const updatedMessages = [...(lead.messages || []), newMessage];
+      // Сообщение уже отправлено — ошибку записи истории только логируем
+      // (зеркало dialog_analysis.messages обновляется внутри RPC)
+      try {
+        await appendDialogMessages(id, [newMessage]);
+      } catch (appendError: any) {
+        app.log.error({ leadId: id, error: appendError?.message }, 'Failed to append message to dialog log');
+      }
 
       await supabase
         .from('dialog_analysis')
         .update({
-          messages: updatedMessages,
           last_message: new Date().toISOString(),
           outgoing_count: lead.outgoing_count + 1,
           updated_at: new Date().toISOString(),